@@ -60,8 +60,11 @@ for file in cmvn.scp feats.scp reco2file_and_channel; do
   rm -f $dest_dir/$file
 done
 
+# the noises are repeated to the duration of the recordings
+utils/data/get_reco2dur.sh $src_dir
+
 python local/multi_condition/reverberate_wavs.py \
-  --snrs $snrs --random-seed $random_seed \
+  --snrs $snrs --random-seed $random_seed --reco2dur $src_dir/reco2dur \
 $src_dir/wav.scp $log_dir/corrupted_${random_seed}.list $impnoise_dir \
 $dest_dir/wav.scp || exit 1;
 
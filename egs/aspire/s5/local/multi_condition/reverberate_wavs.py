@@ -2,7 +2,10 @@
 # Copyright 2014  Johns Hopkins University (Authors: Vijayaditya Peddinti).  Apache 2.0.
 #           2015  Tom Ko
 # script to generate multicondition training data / dev data / test data
-import argparse, glob, math, os, random, scipy.io.wavfile, sys
+# It writes a wav.scp in which each recording is piped through wav-reverberate,
+# which convolves it with the impulse response (FFT-based block convolution)
+# and adds the noise when the features are extracted.
+import argparse, glob, math, os, random, sys
 
 class list_cyclic_iterator(object):
   def __init__(self, list, random_seed = 0):
@@ -26,11 +29,27 @@ def return_nonempty_lines(lines):
 
   return new_lines
 
+def get_noise_io(noise_file, duration):
+  # extends the noise to the duration of the recording by repeating it, as
+  # wav-reverberate adds the additive signals only once
+  if duration is None:
+    return noise_file
+  if len(noise_file.split()) == 1:
+    return "wav-reverberate --duration={1} {0} - |".format(noise_file, duration)
+  return "{0} wav-reverberate --duration={1} - - |".format(noise_file, duration)
+
+def get_reverberate_command(wav_file, reverberate_opts):
+  # the recording can be a file or a piped command
+  if len(wav_file.split()) == 1:
+    return "wav-reverberate {1}{0} - |".format(wav_file, reverberate_opts)
+  return "{0} wav-reverberate {1}- - |".format(wav_file, reverberate_opts)
+
 if __name__ == "__main__":
   parser = argparse.ArgumentParser()
   parser.add_argument('--snrs', type=str, default = '20:10:0', help='snrs to be used for corruption')
   parser.add_argument('--check-output-exists', type = str, default = 'True', help = 'process file only if output file does not exist', choices = ['True', 'true', 'False', 'false'])
   parser.add_argument('--random-seed', type = int, default = 0, help = 'seed to be used in the randomization of impulses')
+  parser.add_argument('--reco2dur', type = str, default = None, help = 'file with the durations of the recordings (see utils/data/get_reco2dur.sh); if given, the noises are repeated to the duration of the recordings, otherwise they are added once')
   parser.add_argument('wav_file_list', type=str, help='wav.scp file to corrupt')
   parser.add_argument('output_wav_file_list', type=str, help='wav.scp file to write corrupted output')
   parser.add_argument('impulses_noises_dir', type=str, help='directory with impulses and noises and info directory (created by local/prep_rirs.sh)')
@@ -54,7 +73,7 @@ if __name__ == "__main__":
   noises_impulses_files = glob.glob(params.impulses_noises_dir+'/info/noise_impulse_*')
   impulse_noise_index = []
   for file in noises_impulses_files:
-    noises_list = []
+    noises_list = None
     impulses_set = set([])
     for line in return_nonempty_lines(open(file).readlines()):
       line = line.strip()
@@ -67,34 +86,43 @@ if __name__ == "__main__":
         impulses_set = set(parts[1].split())
       else:
         raise Exception('Unknown format of ' + file)
-      impulse_noise_index.append([impulses_set, noises_list])
+    impulse_noise_index.append([impulses_set, noises_list])
+  # the noises of an impulse are those of the first noise_impulse_* file
+  # which lists it
+  impulse_noises = {}
+  for impulses_set, noises_list in impulse_noise_index:
+    if noises_list is None:
+      continue
+    for impulse_file in impulses_set:
+      if impulse_file not in impulse_noises:
+        impulse_noises[impulse_file] = noises_list
+
+  durations = {}
+  if params.reco2dur is not None:
+    for line in return_nonempty_lines(open(params.reco2dur).readlines()):
+      parts = line.split()
+      durations[parts[0]] = float(parts[1])
 
   command_list = []
   for i in range(len(wav_files)):
+    wav_id = wav_files[i].split()[0]
     wav_file = " ".join(wav_files[i].split()[1:])
     output_wav_file = wav_out_files[i]
     impulse_file = next(impulses)
-    noise_file = ''
-    snr = ''
-    found_impulse = False
-    if add_noise:
-      for i in range(len(impulse_noise_index)):
-        if impulse_file in impulse_noise_index[i][0]:
-          noise_file = next(impulse_noise_index[i][1])
-          snr = next(snrs)
-          assert(len(wav_file.strip()) > 0)
-          assert(len(impulse_file.strip()) > 0)
-          assert(len(noise_file.strip()) > 0)
-          assert(len(snr.strip()) > 0)
-          assert(len(output_wav_file.strip()) > 0)
-          command_list.append("{4} {0} wav-reverberate --noise-file={2} --snr-db={3} - {1} - |\n".format(wav_file, impulse_file, noise_file, snr, output_wav_file))
-          found_impulse = True
-          break
-    if not found_impulse:
-      assert(len(wav_file.strip()) > 0)
-      assert(len(impulse_file.strip()) > 0)
-      assert(len(output_wav_file.strip()) > 0)
-      command_list.append("{2} {0} wav-reverberate - {1} - |\n".format(wav_file, impulse_file, output_wav_file))
+    assert(len(wav_file.strip()) > 0)
+    assert(len(impulse_file.strip()) > 0)
+    assert(len(output_wav_file.strip()) > 0)
+    reverberate_opts = "--impulse-response={0} ".format(impulse_file)
+    if add_noise and impulse_file in impulse_noises:
+      noise_file = next(impulse_noises[impulse_file])
+      snr = next(snrs)
+      assert(len(noise_file.strip()) > 0)
+      assert(len(snr.strip()) > 0)
+      if params.reco2dur is not None and wav_id not in durations:
+        raise Exception('No duration for recording ' + wav_id + ' in ' + params.reco2dur)
+      reverberate_opts += "--additive-signals='{0}' --snrs={1} --start-times=0 ".format(
+          get_noise_io(noise_file, durations.get(wav_id)), snr)
+    command_list.append("{0} {1}\n".format(output_wav_file, get_reverberate_command(wav_file, reverberate_opts)))
   file_handle = open(params.output_command_file, 'w')
   file_handle.write("".join(command_list))
   file_handle.close()
@@ -227,7 +227,10 @@ def get_word_list(input_file):
 def baseform2unicode(baseforms):
     '''
         Convert each baseform in the list, baseforms, to a parsed unicode
-        description stored as a list of lists of dictionaries.
+        description stored as a list of lists of dictionaries. The
+        description of each distinct grapheme is worked out only once, and
+        all its occurrences share the same dictionary, so the dictionaries
+        should not be modified.
     
         unicode_transcription = [
             [{'NAME':'word1_grapheme1','FIELD1':'FIELD1_VAL',...},
@@ -258,45 +261,22 @@ def baseform2unicode(baseforms):
 
     # For each graphemic baseform generate a parsed unicode description
     unicode_transcription = []
+    # Parsed descriptions of the graphemes seen so far (None for whitespace)
+    descriptions = {}
     for w, bf in baseforms:
         # Initialize empty list of words
         baseform_transcription = []
         # For each grapheme parse the unicode description
         for graph in bf:
-            unicode_desc = unicodedata.name(graph)
-            # Use the canonical unicode decomposition
-            tags = unicodedata.normalize('NFD', graph)
-            match_obj = pattern.match(unicode_desc)
-      
-            # Grapheme's unicode description is non-standard
-            if(not match_obj):
-                # Underscore, dash, hastag have special meaning
-                if(graph in ("_", "-", "#")):
-                    graph_dict = {
-                                  'CHAR_TYPE': 'LINK',
-                                  'SYMBOL': graph,
-                                  'NAME': graph
-                                 }
-                # The grapheme is whitespace
-                elif(unicode_desc in ("ZERO WIDTH SPACE",
-                                      "ZERO WIDTH NON-JOINER",
-                                      "ZERO WIDTH JOINER",
-                                      "SPACE")):
-                    # Ignore whitespace
-                    continue
-                else:
-                    graph_dict = {'SYMBOL': graph, 'NAME': 'NOT_FOUND'}
-     
-            # Grapheme's unicode description is standard
-            else:
-                graph_dict = match_obj.groupdict()
-                graph_dict["SYMBOL"] = graph
-            # Add tags to dictionary (The first element of tags is actually
-            # the base grapheme, so we only check all tags after the first.
-            if(len(tags) > 1):
-                for i, t in enumerate(tags[1:]):
-                    graph_dict["TAG" + str(i)] = unicodedata.name(t)
-    
+            try:
+                graph_dict = descriptions[graph]
+            except KeyError:
+                graph_dict = _parse_grapheme(graph, pattern)
+                descriptions[graph] = graph_dict
+            # Ignore whitespace
+            if graph_dict is None:
+                continue
+
             # Add grapheme unicode description dictionary to baseform list
             baseform_transcription.append(graph_dict)
         # Add baseform transcription to unicode transcription list
@@ -304,6 +284,46 @@ def baseform2unicode(baseforms):
     return unicode_transcription
 
 
+def _parse_grapheme(graph, pattern):
+    '''
+        Returns the parsed unicode description of a grapheme (see
+        baseform2unicode), or None if the grapheme is whitespace.
+    '''
+    unicode_desc = unicodedata.name(graph)
+    # Use the canonical unicode decomposition
+    tags = unicodedata.normalize('NFD', graph)
+    match_obj = pattern.match(unicode_desc)
+
+    # Grapheme's unicode description is non-standard
+    if(not match_obj):
+        # Underscore, dash, hastag have special meaning
+        if(graph in ("_", "-", "#")):
+            graph_dict = {
+                          'CHAR_TYPE': 'LINK',
+                          'SYMBOL': graph,
+                          'NAME': graph
+                         }
+        # The grapheme is whitespace
+        elif(unicode_desc in ("ZERO WIDTH SPACE",
+                              "ZERO WIDTH NON-JOINER",
+                              "ZERO WIDTH JOINER",
+                              "SPACE")):
+            return None
+        else:
+            graph_dict = {'SYMBOL': graph, 'NAME': 'NOT_FOUND'}
+
+    # Grapheme's unicode description is standard
+    else:
+        graph_dict = match_obj.groupdict()
+        graph_dict["SYMBOL"] = graph
+    # Add tags to dictionary (The first element of tags is actually
+    # the base grapheme, so we only check all tags after the first.
+    if(len(tags) > 1):
+        for i, t in enumerate(tags[1:]):
+            graph_dict["TAG" + str(i)] = unicodedata.name(t)
+    return graph_dict
+
+
 def encode(unicode_transcription, tag_percentage, log=False):
     '''
         Arguments:
@@ -324,7 +344,7 @@ def encode(unicode_transcription, tag_percentage, log=False):
     SKIP = "/()"
 
     table = []
-    graphemes = []
+    graphemes = set()
     encoded_transcription = []
     # Accumulate grapheme statistics over corpus at some point. For now just
     # use the lexicon word list. For estimating grapheme frequency this is
@@ -365,81 +385,69 @@ def encode(unicode_transcription, tag_percentage, log=False):
                           " %.6f\n" % graph_counts[g])
                 fp.write("%s -" % (g) + weight)
 
-    # Find a new baseform for each word
+    # Find a new baseform for each word. The units of the letters and
+    # syllables depend only on the grapheme, so they are cached.
+    letter_units = {}
+    syllable_units = {}
     for w in unicode_transcription:
         word_transcription = ""
 
-        # Find a "pronunciation" for each grapheme in the word
+        # Find a "pronunciation" for each grapheme in the word; the units are
+        # stored in graph_maps, as the grapheme dictionaries are shared
         for graph in w:
+            graph_maps = {}
             # Case 1: Check that the grapheme has a unicode description type
             # ---------------------------------------------------------------
-            if("CHAR_TYPE" not in [k.strip() for k in graph.keys()]):
-                if(graph["SYMBOL"] == "."):        
+            if("CHAR_TYPE" not in graph):
+                if(graph["SYMBOL"] == "."):
                     try:
-                        graph["MAP0"] = "\t"
+                        graph_maps["MAP0"] = "\t"
                         if word_transcription[-1] == " ":
                             word_transcription = word_transcription[:-1] + "\t"
                     except IndexError:
                         print("Word starting with . detected")
-                        graph["MAP0"] = "."
+                        graph_maps["MAP0"] = "."
                         word_transcription = ". "
 
                 elif(graph["SYMBOL"] not in SKIP):
-                    graph["MAP0"] = graph["SYMBOL"].lower()
-                    word_transcription += graph["MAP0"] + " "
+                    graph_maps["MAP0"] = graph["SYMBOL"].lower()
+                    word_transcription += graph_maps["MAP0"] + " "
 
             # Case 2: Standard Grapheme
             # ---------------------------------------------------------------
             elif(graph["CHAR_TYPE"].strip() in
                     ("LETTER", "VOWEL", "VOWEL SIGN", "SIGN")):
-                # Backoff diacritics
-                base_grapheme = graph["NAME"].strip().replace(" ", "-").lower()
-                graph["MAP0"] = _backoff_diacritics(graph["SYMBOL"].lower(),
-                                                   base_grapheme,
-                                                   graph_counts,
-                                                   count_thresh)
+                try:
+                    graph_maps["MAP0"] = letter_units[graph["SYMBOL"]]
+                except KeyError:
+                    # Backoff diacritics
+                    base_grapheme = graph["NAME"].strip().replace(" ", "-").lower()
+                    graph_maps["MAP0"] = _backoff_diacritics(graph["SYMBOL"].lower(),
+                                                            base_grapheme,
+                                                            graph_counts,
+                                                            count_thresh)
+                    letter_units[graph["SYMBOL"]] = graph_maps["MAP0"]
                 # Add final space
-                word_transcription += graph["MAP0"] + " "
-      
+                word_transcription += graph_maps["MAP0"] + " "
+
             # Case 3: Syllable (Assume consonant vowel pattern)
             # At some point we will make it (cvc), but for now
             # this is basically just here for Amharic
             # ----------------------------------------------------------------
             elif(graph["CHAR_TYPE"].strip() == "SYLLABLE"):
-                # Multi-word description
-                if(len(graph["NAME"].strip().split(' ')) > 1):
-                    g_name = graph["NAME"].strip().replace(" ", "-").lower()
-                    graph["MAP0"] = g_name + "\t"
-                    word_transcription += graph["MAP0"]
-
-                # Consonant Vowel Pattern
-                else:
-                    cv_pattern = (r"(?P<CONSONANT>[^%s]*)(?P<VOWEL>[%s]+)" %
-                                  (VOWELS, VOWELS))
-                    parsed_graph = re.match(cv_pattern, graph["NAME"])
-                    if(not parsed_graph):
-                        sys.exit("Syllable did not obey"
-                                 "consonant-vowel pattern.")
-
-                    graph_dict = parsed_graph.groupdict()
-          
-                    # Get consonant if it exists
-                    if("CONSONANT" in graph_dict.keys() and
-                            graph_dict["CONSONANT"]):
-                        graph["MAP0"] = graph_dict["CONSONANT"].lower()
-                        word_transcription += graph["MAP0"] + " "
-          
-                    # Get vowel if it exists
-                    if("VOWEL" in graph_dict.keys() and graph_dict["VOWEL"]):
-                        graph["MAP1"] = graph_dict["VOWEL"].lower() + "\t"
-                        word_transcription += graph["MAP1"]
+                if graph["SYMBOL"] not in syllable_units:
+                    syllable_units[graph["SYMBOL"]] = _syllable_units(
+                        graph["NAME"], VOWELS)
+                for g_field, g_val, g_sep in syllable_units[graph["SYMBOL"]]:
+                    graph_maps[g_field] = g_val
+                    word_transcription += g_val + g_sep
 
             # Case 4: Commonly occurring symbols
             # ----------------------------------------------------------------
             elif(graph["CHAR_TYPE"].strip() == "LINK"):
                 # Add tab for underscores (kaldi lexicon format)
                 if(graph["SYMBOL"] in ("_", "#")):
-                    graph["MAP0"] = "\t"
+                    graph_maps["MAP0"] = "\t"
                     if(len(word_transcription) >= 3 and
                             word_transcription[-2] == "\t"):
                         word_transcription = word_transcription[:-3] + "\t"
@@ -448,16 +456,18 @@ def encode(unicode_transcription, tag_percentage, log=False):
                     else:
                         sys.exit("Unknown rule for initial underscore")
                 elif(graph["SYMBOL"] == "-"):
-                    graph["MAP0"] = "\t"
+                    graph_maps["MAP0"] = "\t"
                 else:
                     sys.exit("Unknown linking symbol found.")
                     sys.exit(1)
 
             # Update table of observed graphemes
             if(graph["SYMBOL"] not in graphemes):
-                table.append(graph)
-                graphemes.append(graph["SYMBOL"])
-          
+                table_entry = dict(graph)
+                table_entry.update(graph_maps)
+                table.append(table_entry)
+                graphemes.add(graph["SYMBOL"])
+
         # Append the newly transcribed word
         encoded_transcription.append(word_transcription.strip())
 
@@ -476,6 +486,43 @@ def encode(unicode_transcription, tag_percentage, log=False):
     return encoded_transcription, table, grapheme_map
 
 
+def _syllable_units(name, vowels):
+    '''
+        Returns the graphemic acoustic units of a syllable with the unicode
+        name, name, as a list of tuples (field, unit, separator) where field
+        is MAP0 and MAP1 for the first and second unit, and separator is what
+        follows the unit in the word's transcription.
+
+        Arguments:
+            name   -- the NAME field of the parsed unicode description
+            vowels -- the letters that are vowels
+    '''
+    # Multi-word description
+    if(len(name.strip().split(' ')) > 1):
+        g_name = name.strip().replace(" ", "-").lower()
+        return [("MAP0", g_name + "\t", "")]
+
+    # Consonant Vowel Pattern
+    cv_pattern = (r"(?P<CONSONANT>[^%s]*)(?P<VOWEL>[%s]+)" %
+                  (vowels, vowels))
+    parsed_graph = re.match(cv_pattern, name)
+    if(not parsed_graph):
+        sys.exit("Syllable did not obey"
+                 "consonant-vowel pattern.")
+
+    graph_dict = parsed_graph.groupdict()
+    units = []
+    # Get consonant if it exists
+    if("CONSONANT" in graph_dict.keys() and
+            graph_dict["CONSONANT"]):
+        units.append(("MAP0", graph_dict["CONSONANT"].lower(), " "))
+
+    # Get vowel if it exists
+    if("VOWEL" in graph_dict.keys() and graph_dict["VOWEL"]):
+        units.append(("MAP1", graph_dict["VOWEL"].lower() + "\t", ""))
+    return units
+
+
 def _backoff_diacritics(grapheme, base_grapheme, graph_counts, count_thresh):
     '''
         Add diacritics as tags if the grapheme with diacritics occurs
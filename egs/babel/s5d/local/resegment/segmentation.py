@@ -5,13 +5,15 @@
 
 from __future__ import division
 import os, glob, argparse, sys, re, time
+import multiprocessing
 from argparse import ArgumentParser
 
-use_numpy = True
 try:
-  import numpy as np
+  from StringIO import StringIO
 except ImportError:
-  use_numpy = False
+  from io import StringIO
+
+import numpy as np
 
 # Global stats for analysis taking RTTM file as reference
 global_analysis_get_initial_segments = None
@@ -23,6 +25,13 @@ def mean(l):
     return float(sum(l))/len(l)
   return 0
 
+def percentile(l, q):
+  try:
+    return np.percentile(l, q)
+  except (ValueError, IndexError):
+    # Empty list. (Newer versions of numpy raise IndexError for this.)
+    return 0
+
 # Analysis class
 # Stores statistics like the confusion matrix, length of the segments etc.
 class Analysis(object):
@@ -50,6 +59,20 @@ class Analysis(object):
       self.confusion_matrix[i] += a.confusion_matrix[i]
       self.state_count[i] += a.state_count[i]
 
+  # Accumulate the stats of the frame-level confusion classes C (an int array
+  # with values 0...8, one per frame): the confusion matrix and, for every
+  # maximal run of frames of the same class except the last one, its length,
+  # start frame and the set of predicted phones P (a list) in it.
+  def add_frame_stats(self, C, P):
+    self.confusion_matrix = np.bincount(C, minlength = 9)[0:9].tolist()
+    run_ends = (np.nonzero(C[1:] != C[:-1])[0] + 1).tolist()
+    run_starts = [0] + run_ends
+    classes = C[np.array(run_ends, dtype=int) - 1].tolist()
+    for start, end, c in zip(run_starts, run_ends, classes):
+      self.state_count[c].append(end - start)
+      self.markers[c].append(start)
+      self.phones[c].append(' '.join(set(P[start:end])))
+
   # Print the confusion matrix
   # The interpretation of 'speech', 'noise' and 'silence' are bound to change
   # through the different post-processing stages. e.g at the end, speech and silence
@@ -150,7 +173,9 @@ class Analysis(object):
 
   # Print detailed stats of lengths of each of the 3 types of frames
   # in 8 kinds of segments
-  def write_type_stats(self, file_handle = sys.stderr):
+  def write_type_stats(self, file_handle = None):
+    if file_handle is None:
+      file_handle = sys.stderr
     for j in range(0,3):
       # 3 types of frames. Silence, noise, speech.
       # Typically, we store the number of frames of each type here.
@@ -162,19 +187,9 @@ class Analysis(object):
         max_length    = max([0]+self.type_counts[j][i])
         min_length    = min([10000]+self.type_counts[j][i])
         mean_length   = mean(self.type_counts[j][i])
-        if use_numpy:
-          try:
-            percentile25  = np.percentile(self.type_counts[j][i], 25)
-          except ValueError:
-            percentile25 = 0
-          try:
-            percentile50  = np.percentile(self.type_counts[j][i], 50)
-          except ValueError:
-            percentile50 = 0
-          try:
-            percentile75  = np.percentile(self.type_counts[j][i], 75)
-          except ValueError:
-            percentile75 = 0
+        percentile25  = percentile(self.type_counts[j][i], 25)
+        percentile50  = percentile(self.type_counts[j][i], 50)
+        percentile75  = percentile(self.type_counts[j][i], 75)
 
         file_handle.write("File %s: %s : TypeStats: Type %d %d: Min: %4d Max: %4d Mean: %4d percentile25: %4d percentile50: %4d percentile75: %4d\n" % (self.file_id, self.prefix, j, i,  min_length, max_length, mean_length, percentile25, percentile50, percentile75))
       # End for loop over 9 different kinds of segments
@@ -184,24 +199,16 @@ class Analysis(object):
   # The stats include different statistical measures like mean, max, min
   # and median of the length of continuous regions of frames in
   # each of the 9 cells of the confusion matrix
-  def write_length_stats(self, file_handle = sys.stderr):
+  def write_length_stats(self, file_handle = None):
+    if file_handle is None:
+      file_handle = sys.stderr
     for i in range(0,9):
       self.max_length[i]    = max([0]+self.state_count[i])
       self.min_length[i]    = min([10000]+self.state_count[i])
       self.mean_length[i]   = mean(self.state_count[i])
-      if use_numpy:
-        try:
-          self.percentile25[i]  = np.percentile(self.state_count[i], 25)
-        except ValueError:
-          self.percentile25[i] = 0
-        try:
-          self.percentile50[i]  = np.percentile(self.state_count[i], 50)
-        except ValueError:
-          self.percentile50[i] = 0
-        try:
-          self.percentile75[i]  = np.percentile(self.state_count[i], 75)
-        except ValueError:
-          self.percentile75[i] = 0
+      self.percentile25[i]  = percentile(self.state_count[i], 25)
+      self.percentile50[i]  = percentile(self.state_count[i], 50)
+      self.percentile75[i]  = percentile(self.state_count[i], 75)
 
       file_handle.write("File %s: %s : Length: Type %d: Min: %4d Max: %4d Mean: %4d percentile25: %4d percentile50: %4d percentile75: %4d\n" % (self.file_id, self.prefix, i,  self.min_length[i], self.max_length[i], self.mean_length[i], self.percentile25[i], self.percentile50[i], self.percentile75[i]))
     # End for loop over 9 cells
@@ -212,7 +219,9 @@ class Analysis(object):
   # Markers: Type <type>: <start_frame> (<num_of_frames>) (<hypothesized_phones>)
   # The hypothesized_phones can be looked at to see what phones are
   # present in the hypothesis from start_frame for num_of_frames frames.
-  def write_markers(self, file_handle = sys.stderr):
+  def write_markers(self, file_handle = None):
+    if file_handle is None:
+      file_handle = sys.stderr
     file_handle.write("Start frames of different segments:\n")
     for j in range(0,9):
       if self.phones[j] == []:
@@ -322,28 +331,48 @@ class Stats(object):
     self.noise_only = 0
 
 # Timer class to time functions
+# (time.clock() does not exist in python 3.8 and later)
+clock = getattr(time, 'perf_counter', None) or time.clock
 class Timer(object):
   def __enter__(self):
-    self.start = time.clock()
+    self.start = clock()
     return self
   def __exit__(self, *args):
-    self.end = time.clock()
+    self.end = clock()
     self.interval = self.end - self.start
 
+# View a bytearray of segment start or end markers as a numpy bool array
+# (without copying) for vectorized operations.
+def marks(x):
+  return np.frombuffer(x, dtype=np.bool_)
+
+# Return the first index p in [start, stop) with x[p] set, or
+# max(start, stop) if there is none.  This is what the loops
+# "p = start; while p < stop and not x[p]: p += 1" compute.
+def find_mark(x, start, stop):
+  p = x.find(b'\x01', start, stop)
+  if p == -1:
+    return max(start, stop)
+  return p
+
 # The main class for post-processing a file.
 # This does the segmentation either looking at the file isolated
-# or by looking at both classes simultaneously
+# or by looking at both classes simultaneously.
+# The predicted classes and the reference are numpy int arrays with one
+# element per frame. The segment start and end markers are bytearrays, so that
+# single markers can be changed cheaply and the next or previous marker can be
+# found with find() and rfind(); marks() gives a numpy view of them.
 class JointResegmenter(object):
   def __init__(self, P, A, f, options, phone_map, stats = None, reference = None):
 
     # Pointers to prediction arrays and Initialization
     self.P = P                    # Predicted phones
-    self.B = [ i for i in A ]     # Original predicted classes
-    self.A = A                    # Predicted classes
+    self.B = np.array(A, dtype=np.int8)  # Original predicted classes
+    self.A = np.array(A, dtype=np.int8)  # Predicted classes
     self.file_id = f              # File name
     self.N = len(A)               # Length of the prediction (= Num of frames in the audio file)
-    self.S = [False] * self.N     # Array of Start boundary markers
-    self.E = [False] * (self.N+1) # Array of End boundary markers
+    self.S = bytearray(self.N)    # Array of Start boundary markers
+    self.E = bytearray(self.N+1)  # Array of End boundary markers
 
     self.phone_map = phone_map
     self.options = options
@@ -363,18 +392,18 @@ class JointResegmenter(object):
     # End of Configuration
 
     # Define Frame Type Constants
-    self.THIS_SILENCE = ("0","1","2")
-    self.THIS_NOISE = ("3","4","5")
-    self.THIS_SPEECH = ("6", "7", "8")
-    self.THIS_SPEECH_THAT_SIL = ("6",)
-    self.THIS_SPEECH_THAT_NOISE = ("7",)
-    self.THIS_SIL_CONVERT_THAT_SIL = ("9",)
-    self.THIS_SIL_CONVERT_THAT_NOISE = ("10",)
-    self.THIS_SIL_CONVERT = ("9","10","11")
-    self.THIS_SILENCE_CONVERT = ("9","10","11")
-    self.THIS_NOISE_CONVERT_THAT_SIL = ("12",)
-    self.THIS_NOISE_CONVERT_THAT_NOISE = ("13",)
-    self.THIS_NOISE_CONVERT = ("12","13","14")
+    self.THIS_SILENCE = (0,1,2)
+    self.THIS_NOISE = (3,4,5)
+    self.THIS_SPEECH = (6,7,8)
+    self.THIS_SPEECH_THAT_SIL = (6,)
+    self.THIS_SPEECH_THAT_NOISE = (7,)
+    self.THIS_SIL_CONVERT_THAT_SIL = (9,)
+    self.THIS_SIL_CONVERT_THAT_NOISE = (10,)
+    self.THIS_SIL_CONVERT = (9,10,11)
+    self.THIS_SILENCE_CONVERT = (9,10,11)
+    self.THIS_NOISE_CONVERT_THAT_SIL = (12,)
+    self.THIS_NOISE_CONVERT_THAT_NOISE = (13,)
+    self.THIS_NOISE_CONVERT = (12,13,14)
     self.THIS_NOISE_OR_SILENCE = self.THIS_NOISE + self.THIS_SILENCE
     self.THIS_SILENCE_OR_NOISE = self.THIS_NOISE + self.THIS_SILENCE
     self.THIS_CONVERT = self.THIS_SILENCE_CONVERT + self.THIS_NOISE_CONVERT
@@ -385,13 +414,20 @@ class JointResegmenter(object):
     if stats != None:
       self.stats = stats
 
+    # The analyses of this file to be added to the global analyses, as a
+    # list of (name, Analysis)
+    self.analyses = []
+
+    # The reference classes are 0, 1 and 2 (silence, noise and speech), and
+    # -1 for anything else; a reference shorter than the prediction is
+    # padded with silence.
     self.reference = None
     if reference != None:
-      if len(reference) < self.N:
-        self.reference = reference + ["0"] * (self.N - len(reference))
-        assert (len(self.reference) == self.N)
-      else:
-        self.reference = reference
+      reference = np.array(reference, dtype=str)
+      self.reference = np.zeros(max(len(reference), self.N), dtype=np.int8)
+      self.reference[0:len(reference)] = -1
+      for c in (0, 1, 2):
+        self.reference[0:len(reference)][reference == str(c)] = c
 
   # This function restricts the output to length N
   def restrict(self, N):
@@ -399,10 +435,18 @@ class JointResegmenter(object):
     self.A = self.A[0:N]
     self.S = self.S[0:N]
     self.E = self.E[0:N+1]
-    if sum(self.S) == sum(self.E) + 1:
+    if self.S.count(b'\x01') == self.E.count(b'\x01') + 1:
       self.E[N] = True
     self.N = N
 
+  # Return the frame-level classes 0...8 of the confusion matrix, which are
+  # 3 * reference + predicted for frames whose reference and predicted
+  # classes (0, 1 or 2) are known, and 0 for the others.
+  def confusion_classes(self, predicted):
+    reference = self.reference[0:self.N]
+    return np.where((reference >= 0) & (predicted >= 0),
+                    3 * reference + predicted, 0)
+
   # Main resegment function that calls other functions
   def resegment(self):
     with Timer() as t:
@@ -437,104 +481,60 @@ class JointResegmenter(object):
       self.stats.reset()
 
   def get_initial_segments(self):
-    for i in range(0, self.N):
-      if (i > 0) and self.A[i-1] != self.A[i]:
-        # This frame is different from the previous frame.
-        if self.A[i] in self.THIS_SPEECH:
-          # This frame is speech.
-          if self.A[i-1] in self.THIS_SPEECH:
-            # Both this and the previous frames are speech
-            # But they are different. e.g. "8 7"
-            # So this is the end of the previous region and
-            # the beginning of the next region
-            self.S[i] = True
-            self.E[i] = True
-          else:
-            # The previous frame is non-speech, but not this one.
-            # So this frame is the beginning of a new segment
-            self.S[i] = True
-        else:
-          # This frame is non-speech
-          if self.A[i-1] in self.THIS_SPEECH:
-            # Previous frame is speech, but this one is not.
-            # So this frame is the end of the previous segment
-            self.E[i] = True
-      elif i == 0 and self.A[i] in self.THIS_SPEECH:
-        # The frame is speech. So this is the start of a new segment.
-        self.S[i] = True
-    if self.A[self.N-1] in self.THIS_SPEECH:
-      # Handle the special case where the last frame of file is not nonspeech
-      self.E[self.N] = True
-    assert(sum(self.S) == sum(self.E))
+    N = self.N
+    is_speech = (self.A >= 6) & (self.A <= 8)
+    # is_change[i-1] is true if frame i is different from frame i-1
+    is_change = self.A[1:] != self.A[:-1]
+    S = is_speech.copy()
+    E = np.zeros(N + 1, dtype=np.bool_)
+    # A segment starts at a speech frame that is different from the
+    # previous frame (e.g. "0 8" or "8 7") or at the start of the file,
+    S[1:] &= is_change
+    # and ends at a frame that is different from the previous frame, if the
+    # previous frame is speech (e.g. "8 0" or "8 7"), or at the end of the
+    # file if the last frame is speech.
+    E[1:N] = is_change & is_speech[:-1]
+    E[N] = is_speech[N-1]
+    self.S = bytearray(S.tobytes())
+    self.E = bytearray(E.tobytes())
+    assert(self.S.count(b'\x01') == self.E.count(b'\x01'))
 
     ###########################################################################
     # Analysis section
-    self.C = ["0"] * self.N
-    C = self.C
-    a = Analysis(self.file_id, self.frame_shift,"Analysis after get_initial_segments")
-
-    if self.reference != None:
-      count = 0
-      for i in range(0,self.N):
-        if   self.reference[i] == "0" and self.A[i] in self.THIS_SILENCE:
-          C[i] = "0"
-        elif self.reference[i] == "0" and self.A[i] in self.THIS_NOISE:
-          C[i] = "1"
-        elif self.reference[i] == "0" and self.A[i] in self.THIS_SPEECH:
-          C[i] = "2"
-        elif self.reference[i] == "1" and self.A[i] in self.THIS_SILENCE:
-          C[i] = "3"
-        elif self.reference[i] == "1" and self.A[i] in self.THIS_NOISE:
-          C[i] = "4"
-        elif self.reference[i] == "1" and self.A[i] in self.THIS_SPEECH:
-          C[i] = "5"
-        elif self.reference[i] == "2" and self.A[i] in self.THIS_SILENCE:
-          C[i] = "6"
-        elif self.reference[i] == "2" and self.A[i] in self.THIS_NOISE:
-          C[i] = "7"
-        elif self.reference[i] == "2" and self.A[i] in self.THIS_SPEECH:
-          C[i] = "8"
-        if i > 0 and C[i-1] != C[i]:
-          a.state_count[int(C[i-1])].append(count)
-          a.markers[int(C[i-1])].append(i - count)
-          a.phones[int(C[i-1])].append(' '.join(set(self.P[i-count:i])))
-          count = 1
-        else:
-          count += 1
+    if self.reference is not None:
+      a = Analysis(self.file_id, self.frame_shift,"Analysis after get_initial_segments")
+      # predicted classes: silence, noise or speech
+      predicted = np.select([self.A <= 2, self.A <= 5, self.A <= 8], [0, 1, 2], -1)
+      self.C = self.confusion_classes(predicted)
+      a.add_frame_stats(self.C, self.P)
 
-      for j in range(0,9):
-        a.confusion_matrix[j] = sum([C[i] == str(j) for i in range(0,self.N)])
+      self.analyses.append(("get_initial_segments", a))
 
-      global_analysis_get_initial_segments.add(a)
-
-      if self.reference != None and self.options.verbose > 0:
+      if self.reference is not None and self.options.verbose > 0:
         a.write_confusion_matrix()
         a.write_length_stats()
-        if self.reference != None and self.options.verbose > 1:
+        if self.reference is not None and self.options.verbose > 1:
           a.write_markers()
     ###########################################################################
 
   def set_nonspeech_proportion(self):
-    num_speech_frames = 0
-    in_segment = False
+    # The frame-level loop below works on python lists and bytearrays, which
+    # are much faster to index than numpy arrays.
+    A = self.A.tolist()
+    B = self.B.tolist()
+    S = self.S
+    E = self.E
 
     # Active frames are the frames that are either segment starts
-    # or segment ends
-    active_frames = []
-    for n in range(0, self.N + 1):
-      if self.E[n]:
-        assert(in_segment)
-        in_segment = False
-        active_frames.append(n)
-      if n < self.N and self.S[n]:
-        assert(not in_segment)
-        in_segment = True
-        active_frames.append(n)
-      if n < self.N:
-        if in_segment:
-          # Count the number of speech frames
-          num_speech_frames += 1
-    assert (not in_segment)
+    # or segment ends; a frame that is both is listed twice, first as a
+    # segment end.
+    segment_starts = np.nonzero(marks(S))[0]
+    segment_ends = np.nonzero(marks(E))[0]
+    assert (len(segment_starts) == len(segment_ends))
+    assert (np.all(segment_starts < segment_ends))
+    assert (np.all(segment_starts[1:] >= segment_ends[:-1]))
+    active_frames = (np.sort(np.concatenate((2 * segment_ends, 2 * segment_starts + 1))) // 2).tolist()
+    num_speech_frames = int(np.sum(segment_ends - segment_starts))
     if num_speech_frames == 0:
       sys.stderr.write("%s: Warning: no speech found for recording %s\n" % (sys.argv[0], self.file_id))
 
@@ -557,42 +557,42 @@ class JointResegmenter(object):
         # labelled 9...14 depending on whether they were originally
         # 0...5 respectively
         n = active_frames[i]
-        if self.E[n] and n < self.N and not self.S[n]:
+        if E[n] and n < self.N and not S[n]:
           # This must be the beginning of a non-speech region.
           # Include some of this non-speech in the segments
-          assert (self.A[n] not in self.THIS_SPEECH)
+          assert (A[n] not in self.THIS_SPEECH)
 
           # Convert the non-speech frame to be included in segment
-          self.A[n] = str(int(self.B[n]) + 9)
-          if self.B[n-1] != self.B[n]:
+          A[n] = B[n] + 9
+          if B[n-1] != B[n]:
             # In this frame there is a transition from
             # one type of non-speech (0, 1 ... 5) to another
             # So its the start of a segment. Also add it to the
             # end of the active frames list
-            self.S[n] = True
+            S[n] = True
             active_frames.append(n+1)
           else:
             # We need to extend the segment end since we have
             # included a non-speeech frame. Remove the current segment end mark
             # and one to the next frame
-            self.E[n] = False
+            E[n] = False
             active_frames[i] = n + 1
-          self.E[n+1] = True
+          E[n+1] = True
           # Increment the number of frames in the segments
           num_segment_frames += 1
           changed = True
-        if n < self.N and self.S[n] and n > 0 and not self.E[n]:
+        if n < self.N and S[n] and n > 0 and not E[n]:
           # This must be the beginning of a speech region.
           # Include some non-speech before it into the segments
-          assert (self.A[n-1] not in self.THIS_SPEECH)
-          self.A[n-1] = str(int(self.B[n-1]) + 9)
-          if self.B[n-1] != self.B[n]:
-            self.E[n] = True
+          assert (A[n-1] not in self.THIS_SPEECH)
+          A[n-1] = B[n-1] + 9
+          if B[n-1] != B[n]:
+            E[n] = True
             active_frames.append(n-1)
           else:
-            self.S[n] = False
+            S[n] = False
             active_frames[i] = n - 1
-          self.S[n-1] = True
+          S[n-1] = True
           num_segment_frames += 1
           changed = True
         if num_segment_frames >= target_segment_frames:
@@ -602,77 +602,49 @@ class JointResegmenter(object):
     if num_segment_frames < target_segment_frames:
       proportion = float(num_segment_frames - num_speech_frames)/ num_segment_frames
       sys.stderr.write("%s: Warning: for recording %s, only got a proportion %f of non-speech frames, versus target %f\n" % (sys.argv[0], self.file_id, proportion, self.options.silence_proportion))
+    self.A = np.array(A, dtype=np.int8)
 
     ###########################################################################
     # Analysis section
-    self.C = ["0"] * self.N
-    C = self.C
-    a = Analysis(self.file_id, self.frame_shift,"Analysis after set_nonspeech_proportion")
-
-    if self.reference != None:
-      count = 0
-      for i in range(0,self.N):
-        if   self.reference[i] == "0" and self.A[i] in (self.THIS_SILENCE + self.THIS_NOISE):
-          C[i] = "0"
-        elif self.reference[i] == "0" and self.A[i] in self.THIS_CONVERT:
-          C[i] = "1"
-        elif self.reference[i] == "0" and self.A[i] in self.THIS_SPEECH:
-          C[i] = "2"
-        elif self.reference[i] == "1" and self.A[i] in (self.THIS_SILENCE + self.THIS_NOISE):
-          C[i] = "3"
-        elif self.reference[i] == "1" and self.A[i] in self.THIS_CONVERT:
-          C[i] = "4"
-        elif self.reference[i] == "1" and self.A[i] in self.THIS_SPEECH:
-          C[i] = "5"
-        elif self.reference[i] == "2" and self.A[i] in (self.THIS_SILENCE + self.THIS_NOISE):
-          C[i] = "6"
-        elif self.reference[i] == "2" and self.A[i] in self.THIS_CONVERT:
-          C[i] = "7"
-        elif self.reference[i] == "2" and self.A[i] in self.THIS_SPEECH:
-          C[i] = "8"
-        if i > 0 and C[i-1] != C[i]:
-          a.state_count[int(C[i-1])].append(count)
-          a.markers[int(C[i-1])].append(i - count)
-          a.phones[int(C[i-1])].append(' '.join(set(self.P[i-count:i])))
-          count = 1
-        else:
-          count += 1
-
-      for j in range(0,9):
-        a.confusion_matrix[j] = sum([C[i] == str(j) for i in range(0,self.N)])
+    if self.reference is not None:
+      a = Analysis(self.file_id, self.frame_shift,"Analysis after set_nonspeech_proportion")
+      # predicted classes: silence or noise, converted silence or noise, and
+      # speech
+      predicted = np.select([self.A <= 5, self.A <= 8, self.A <= 14], [0, 2, 1], -1)
+      self.C = self.confusion_classes(predicted)
+      a.add_frame_stats(self.C, self.P)
 
-      global_analysis_set_nonspeech_proportion.add(a)
+      self.analyses.append(("set_nonspeech_proportion", a))
 
-      if self.reference != None and self.options.verbose > 0:
+      if self.reference is not None and self.options.verbose > 0:
         a.write_confusion_matrix()
         a.write_length_stats()
-        if self.reference != None and self.options.verbose > 1:
+        if self.reference is not None and self.options.verbose > 1:
           a.write_markers()
     ###########################################################################
 
   def merge_segments(self):
-    # Get list of frames which have segment start and segment end
-    # markers into separate lists
-    segment_starts = [i for i, val in enumerate(self.S) if val]
-    segment_ends = [i for i, val in enumerate(self.E) if val]
-    assert (sum(self.S) == sum(self.E))
+    S = self.S
+    E = self.E
+
+    # Get the frames which have segment start and segment end
+    # markers into separate arrays
+    segment_starts = np.nonzero(marks(S))[0]
+    segment_ends = np.nonzero(marks(E))[0]
+    assert (len(segment_starts) == len(segment_ends))
 
     if self.options.verbose > 3:
       sys.stderr.write("Length of segment starts before non-speech adding: %d\n" % len(segment_starts))
 
     if self.min_inter_utt_nonspeech_length > 0.0:
-      segment_starts = list(set([0] + segment_starts + segment_ends + [self.N]))
-      segment_starts.sort()
-      segment_starts.pop()
-      segment_ends= list(set([0] + segment_starts + segment_ends + [self.N]))
-      segment_ends.sort()
-      segment_ends.pop(0)
+      # Make the non-speech regions between the segments into segments too
+      boundaries = np.union1d(np.union1d(segment_starts, segment_ends), [0, self.N])
+      segment_starts = boundaries[:-1]
+      segment_ends = boundaries[1:]
       if self.options.verbose > 3:
         sys.stderr.write("Length of segment starts after non-speech adding: %d\n" % len(segment_starts))
-      for i in segment_starts:
-        self.S[i] = True
-      for i in segment_ends:
-        self.E[i] = True
+      marks(S)[segment_starts] = True
+      marks(E)[segment_ends] = True
 
     # Just a check. There must always be equal number of segment starts
     # and segment ends
@@ -682,48 +654,23 @@ class JointResegmenter(object):
     # The list of boundaries is obtained in the following step along with
     # a few statistics like the type of segment on either side of the boundary
     # and the length of the segment on either side of it
-    boundaries = []
-    i = 0
-    j = 0
-    while i < len(segment_starts) and j < len(segment_ends):
-      if segment_ends[j] < segment_starts[i]:
-        # The segment end marker is before the segment start marker.
-        # This means that this segment end marker corresponds to a segment
-        # that is before the one indicated by the segment start marker.
-        # So advance the segment end pointer to the next segment end to
-        # check if that is a 'boundary'
-        j += 1
-      elif segment_ends[j] > segment_starts[i]:
-        # The segment end marker is after the segment start marker.
-        # This means that this segment end marker would corresponds
-        # to segment indicated by the segment start marker.
-        # So advance the segment start pointer to the next segment start to
-        # check if that is a 'boundary'
-        i += 1
-      else:
-        assert(i < len(segment_starts) and j < len(segment_ends))
-        # A boundary:
-        # Find the segment score as the min of lengths of the segments
-        # to the left and to the right.
-        # This segment score will be used to prioritize merging of
-        # the segment with its neighbor
-        assert ((j + 1) < len(segment_ends))
-        segment_score = min(segment_starts[i] - segment_starts[i-1], \
-            segment_ends[j+1] - segment_ends[j])
-        # Also find the type of tranisition of the segments at the boundary.
-        # This is also used to prioritize the merging of the segment
-        boundaries.append((segment_ends[j], segment_score, \
-            self.transition_type(segment_ends[j])))
-
-        # Sort the boundaries based on segment score
-        boundaries.sort(key = lambda x: x[1])
-        # Then sort based on the type of transition by keeping it still
-        # sorted within each transition type  based on segment score
-        boundaries.sort(key = lambda x: x[2])
-        i += 1
-        j += 1
-      # End if
-    # End while loop
+    boundary_frames, i, j = np.intersect1d(segment_starts, segment_ends,
+                                           assume_unique = True, return_indices = True)
+    assert (np.all(j + 1 < len(segment_ends)))
+    # Find the segment score as the min of lengths of the segments
+    # to the left and to the right.
+    # This segment score will be used to prioritize merging of
+    # the segment with its neighbor
+    segment_scores = np.minimum(segment_starts[i] - segment_starts[i-1],
+                                segment_ends[j+1] - segment_ends[j])
+    # Also find the type of tranisition of the segments at the boundary.
+    # This is also used to prioritize the merging of the segment
+    boundaries = [ (b, score, self.transition_type(b)) for b, score in
+                   zip(boundary_frames.tolist(), segment_scores.tolist()) ]
+
+    # Sort the boundaries based on the type of transition and then,
+    # within each transition type, based on segment score
+    boundaries.sort(key = lambda x: (x[2], x[1]))
 
     # Begin merging of segments by removing the start and end mark
     # at the boundary to be merged
@@ -732,7 +679,7 @@ class JointResegmenter(object):
       count += 1
       segment_length = 0
 
-      if self.min_inter_utt_nonspeech_length > 0.0 and not self.E[b[0]]:
+      if self.min_inter_utt_nonspeech_length > 0.0 and not E[b[0]]:
         # This will happen only if the boundary is at the end of
         # a non-speech region that has already been merged or removed
         # b[0] will then not be an end mark.
@@ -740,24 +687,14 @@ class JointResegmenter(object):
 
       # Count the number of frames in the segment to the
       # left of the boundary
-      p = b[0] - 1
-      while p >= 0:
-        if self.S[p]:
-          break
-        p -= 1
-        # End if
-      # End while loop
+      p = S.rfind(b'\x01', 0, b[0])
       p_left = p
       segment_length += b[0] - p
 
       # Count the number of frames in the segment to the
       # right of the boundary
-      p = b[0] + 1
-      while p <= self.N:
-        if self.E[p]:
-          break
-        p += 1
-      assert (self.min_inter_utt_nonspeech_length == 0 or p == self.N or self.S[p] or self.A[p] in self.THIS_SILENCE_OR_NOISE)
+      p = find_mark(E, b[0] + 1, self.N + 1)
+      assert (self.min_inter_utt_nonspeech_length == 0 or p == self.N or S[p] or self.A[p] in self.THIS_SILENCE_OR_NOISE)
 
       if self.min_inter_utt_nonspeech_length > 0 and self.A[b[0]] in self.THIS_SILENCE_OR_NOISE:
         assert(b[2] == 6 or b[2] == 7)
@@ -766,8 +703,8 @@ class JointResegmenter(object):
           # inter-utterance non-speech length.
           # Therefore treat this non-speech as inter-utterance non-speech and
           # remove it from the segments
-          self.S[b[0]] = False
-          self.E[p] = False
+          S[b[0]] = False
+          E[p] = False
 
           # Count the number of times inter utt non-speech
           # length is greater than the set threshold
@@ -785,12 +722,7 @@ class JointResegmenter(object):
         # with the adjacent ones as long as the length of the
         # segment after merging to see if its within limits.
         p_temp = p
-        p += 1
-        while p <= self.N:
-          if self.E[p]:
-            break
-          p += 1
-        # End while loop
+        p = find_mark(E, p + 1, self.N + 1)
         segment_length += p - b[0]
         if segment_length < self.max_frames:
           # Merge the non-speech segment with the segments
@@ -800,24 +732,24 @@ class JointResegmenter(object):
           self.stats.merge_nonspeech_segment += 1
 
           if p_temp < self.N:
-            self.S[p_temp] = False
-            self.E[p_temp] = False
-          self.S[b[0]] = False
-          self.E[b[0]] = False
+            S[p_temp] = False
+            E[p_temp] = False
+          S[b[0]] = False
+          E[b[0]] = False
           continue
         else:
           # The merged segment length is longer than max_frames.
           # Therefore treat this non-speech as inter-utterance non-speech and
           # remove it from the segments
-          self.S[b[0]] = False
-          self.E[p_temp] = False
+          S[b[0]] = False
+          E[p_temp] = False
           continue
         # End if
       elif self.min_inter_utt_nonspeech_length > 0 and (b[2] == 8 or b[2] == 9):
         assert(p_left == 0)
         if b[0] - p_left > self.min_inter_utt_nonspeech_length:
-          self.S[p_left] = False
-          self.E[b[0]] = False
+          S[p_left] = False
+          E[b[0]] = False
           continue
         # End if
       # End if
@@ -825,25 +757,25 @@ class JointResegmenter(object):
 
       if segment_length < self.max_frames:
         self.stats.merge_segments += 1
-        self.S[b[0]] = False
-        self.E[b[0]] = False
+        S[b[0]] = False
+        E[b[0]] = False
       # End if
     # End for loop over boundaries
 
-    assert (sum(self.S) == sum(self.E))
+    assert (S.count(b'\x01') == E.count(b'\x01'))
 
     ###########################################################################
     # Analysis section
 
-    if self.reference != None and self.options.verbose > 3:
+    if self.reference is not None and self.options.verbose > 3:
       a = self.segmentation_analysis("Analysis after merge_segments")
       a.write_confusion_matrix()
 
-      if self.reference != None and self.options.verbose > 4:
+      if self.reference is not None and self.options.verbose > 4:
         a.write_type_stats()
       # End if
 
-      if self.reference != None and self.options.verbose > 4:
+      if self.reference is not None and self.options.verbose > 4:
         a.write_markers()
       # End if
     # End if
@@ -851,114 +783,91 @@ class JointResegmenter(object):
   # End function merge_segments
 
   def split_long_segments(self):
-    assert (sum(self.S) == sum(self.E))
-    for n in range(0, self.N):
-      if self.S[n]:
-        p = n + 1
-        while p <= self.N:
-          if self.E[p]:
-            break
-          p += 1
-        segment_length = p - n
-        if segment_length > self.hard_max_frames:
-          # Count the number of times long segments are split
-          self.stats.split_segments += 1
-
-          num_pieces = int((float(segment_length)/self.hard_max_frames) + 0.99999)
-          sys.stderr.write("%s: Warning: for recording %s, " \
-              % (sys.argv[0], self.file_id) \
-              + "splitting segment of length %f seconds into %d pieces " \
-              % (segment_length * self.frame_shift, num_pieces) \
-              + "(--hard-max-segment-length %f)\n" \
-              % self.options.hard_max_segment_length)
-          frames_per_piece = int(segment_length/num_pieces)
-          for i in range(1,num_pieces):
-            q = n + i * frames_per_piece
-            self.S[q] = True
-            self.E[q] = True
-        if p - 1 > n:
-          n = p - 1
-    assert (sum(self.S) == sum(self.E))
+    assert (self.S.count(b'\x01') == self.E.count(b'\x01'))
+    # Go through the segment starts in order, including the ones added
+    # by splitting.
+    n = self.S.find(b'\x01', 0, self.N)
+    while n != -1:
+      p = find_mark(self.E, n + 1, self.N + 1)
+      segment_length = p - n
+      if segment_length > self.hard_max_frames:
+        # Count the number of times long segments are split
+        self.stats.split_segments += 1
+
+        num_pieces = int((float(segment_length)/self.hard_max_frames) + 0.99999)
+        sys.stderr.write("%s: Warning: for recording %s, " \
+            % (sys.argv[0], self.file_id) \
+            + "splitting segment of length %f seconds into %d pieces " \
+            % (segment_length * self.frame_shift, num_pieces) \
+            + "(--hard-max-segment-length %f)\n" \
+            % self.options.hard_max_segment_length)
+        frames_per_piece = int(segment_length/num_pieces)
+        for i in range(1,num_pieces):
+          q = n + i * frames_per_piece
+          self.S[q] = True
+          self.E[q] = True
+      n = self.S.find(b'\x01', n + 1, self.N)
+    assert (self.S.count(b'\x01') == self.E.count(b'\x01'))
   # End function split_long_segments
 
   def remove_silence_only_segments(self):
-    for n in range(0, self.N):
-      # Run through to find a segment start
-      if self.S[n]:
-        p = n
-        saw_nonsilence = False
-        # From the segment start, go till the segment end to see
-        # if there is speech in it
-        while p <= self.N:
-          if self.E[p] and p != n:
-            break
-          if p < self.N and self.A[p] not in self.THIS_SILENCE:
-            saw_nonsilence = True
-          p += 1
-        # End of while loop through the segment
-        assert (p > self.N or self.E[p])
-        if not saw_nonsilence:
-          # Count the number of silence only segments
-          self.stats.silence_only += 1
-
-          self.S[n] = False
-          self.E[p] = False
-        # End if
-        if p - 1 > n:
-          # Go to the end of the segment since that segment is
-          # already processed
-          n = p - 1
-        # End if
-    if self.reference != None and self.options.verbose > 3:
+    # Run through to find the segment starts
+    n = self.S.find(b'\x01', 0, self.N)
+    while n != -1:
+      # From the segment start, go till the segment end to see
+      # if there is speech in it
+      p = find_mark(self.E, n + 1, self.N + 1)
+      saw_nonsilence = bool(np.any(self.A[n:p] > 2))
+      assert (p > self.N or self.E[p])
+      if not saw_nonsilence:
+        # Count the number of silence only segments
+        self.stats.silence_only += 1
+
+        self.S[n] = False
+        self.E[p] = False
+      # End if
+      n = self.S.find(b'\x01', n + 1, self.N)
+    if self.reference is not None and self.options.verbose > 3:
       a = self.segmentation_analysis("Analysis after remove_silence_only_segments")
       a.write_confusion_matrix()
 
-      if self.reference != None and self.options.verbose > 4:
+      if self.reference is not None and self.options.verbose > 4:
         a.write_type_stats()
       # End if
 
-      if self.reference != None and self.options.verbose > 4:
+      if self.reference is not None and self.options.verbose > 4:
         a.write_markers()
       # End if
     # End if
   # End function remove_silence_only_segments
 
   def remove_noise_only_segments(self):
-    for n in range(0, self.N):
-      if self.S[n]:
-        p = n
-        saw_speech = False
-        while p <= self.N:
-          if self.E[p] and p != n:
-            break
-          if self.A[p] in self.THIS_SPEECH:
-            saw_speech = True
-          p += 1
-        assert (self.E[p])
-        if not saw_speech:
-          # Count the number of segments with no speech
-          self.stats.noise_only += 1
-          self.S[n] = False
-          self.E[p] = False
-        # End if
-        if p - 1 > n:
-          n = p - 1
-        # End if
+    n = self.S.find(b'\x01', 0, self.N)
+    while n != -1:
+      p = find_mark(self.E, n + 1, self.N + 1)
+      assert (p <= self.N and self.E[p])
+      saw_speech = bool(np.any((self.A[n:p] >= 6) & (self.A[n:p] <= 8)))
+      if not saw_speech:
+        # Count the number of segments with no speech
+        self.stats.noise_only += 1
+        self.S[n] = False
+        self.E[p] = False
       # End if
-    # End for loop over frames
+      n = self.S.find(b'\x01', n + 1, self.N)
+    # End loop over segment starts
 
     ###########################################################################
     # Analysis section
 
-    if self.reference != None and self.options.verbose > 3:
+    if self.reference is not None and self.options.verbose > 3:
       a = self.segmentation_analysis("Analysis after remove_noise_only_segments")
       a.write_confusion_matrix()
 
-      if self.reference != None and self.options.verbose > 4:
+      if self.reference is not None and self.options.verbose > 4:
         a.write_type_stats()
       # End if
 
-      if self.reference != None and self.options.verbose > 4:
+      if self.reference is not None and self.options.verbose > 4:
         a.write_markers()
       # End if
     # End if
@@ -994,73 +903,41 @@ class JointResegmenter(object):
   # Output the final segments
   def print_segments(self, out_file_handle = sys.stdout):
     # We also do some sanity checking here.
-    segments = []
-
     assert (self.N == len(self.S))
     assert (self.N + 1 == len(self.E))
 
-    max_end_time = 0
-    n = 0
-    while n < self.N:
-      if self.E[n] and not self.S[n]:
-        sys.stderr.write("%s: Error: Ending segment before starting it: n=%d\n" % (sys.argv[0], n))
-      if self.S[n]:
-        p = n + 1
-        while p < self.N and not self.E[p]:
-          assert (not self.S[p])
-          p += 1
-        assert (p == self.N or self.E[p])
-        segments.append((n,p))
-        max_end_time = p
-        if p < self.N and self.S[p]:
-          n = p - 1
-        else:
-          n = p
-      n += 1
+    S = marks(self.S)
+    E = marks(self.E)[0:self.N]
 
+    # A segment goes from a segment start to the next segment end
+    # (or to the end of the file), and must not contain another segment start.
+    segment_starts = np.nonzero(S)[0]
+    end_marks = np.nonzero(E)[0]
+    k = np.searchsorted(end_marks, segment_starts, side = 'right')
+    segment_ends = np.append(end_marks, self.N)[k]
+    assert (np.all(segment_starts[1:] >= segment_ends[:-1]))
+
+    # Segment ends that are not at the end of a segment
+    for n in np.setdiff1d(np.nonzero(E & ~S)[0], segment_ends).tolist():
+      sys.stderr.write("%s: Error: Ending segment before starting it: n=%d\n" % (sys.argv[0], n))
+
+    segments = list(zip(segment_starts.tolist(), segment_ends.tolist()))
     if len(segments) == 0:
       sys.stderr.write("%s: Warning: no segments for recording %s\n" % (sys.argv[0], self.file_id))
       sys.exit(1)
+    max_end_time = segments[-1][1]
 
     ############################################################################
     # Analysis section
 
-    self.C = ["0"] * self.N
-    C = self.C
-    a = Analysis(self.file_id, self.frame_shift,"Analysis final")
-
-    if self.reference != None:
-      count = 0
-      in_seg = False
-      for i in range(0,self.N):
-        if in_seg and self.E[i]:
-          in_seg = False
-        if i == 0 and self.S[i]:
-          in_seg = True
-        if not in_seg and self.S[i]:
-          in_seg = True
-        if   self.reference[i] == "0" and not in_seg:
-          C[i] = "0"
-        elif self.reference[i] == "0" and in_seg:
-          C[i] = "2"
-        elif self.reference[i] == "1" and not in_seg:
-          C[i] = "3"
-        elif self.reference[i] == "1" and in_seg:
-          C[i] = "5"
-        elif self.reference[i] == "2" and not in_seg:
-          C[i] = "6"
-        elif self.reference[i] == "2" and in_seg:
-          C[i] = "8"
-        if i > 0 and C[i-1] != C[i]:
-          a.state_count[int(C[i-1])].append(count)
-          a.markers[int(C[i-1])].append(i - count)
-          a.phones[int(C[i-1])].append(' '.join(set(self.P[i-count:i])))
-          count = 1
-        else:
-          count += 1
-
-      for j in range(0,9):
-        a.confusion_matrix[j] = sum([C[i] == str(j) for i in range(0,self.N)])
+    if self.reference is not None:
+      a = Analysis(self.file_id, self.frame_shift,"Analysis final")
+      # A frame is in a segment if the last segment start or end at or
+      # before it is a segment start.
+      last_mark = np.maximum.accumulate(np.where(S | E, np.arange(self.N), -1))
+      in_seg = (last_mark >= 0) & S[np.maximum(last_mark, 0)]
+      self.C = self.confusion_classes(np.where(in_seg, 2, 0))
+      a.add_frame_stats(self.C, self.P)
 
       if self.options.verbose > 0:
         a.write_confusion_matrix()
@@ -1068,7 +945,7 @@ class JointResegmenter(object):
         if self.options.verbose > 1:
           a.write_markers()
 
-      global_analysis_final.add(a)
+      self.analyses.append(("final", a))
     ############################################################################
 
     # we'll be printing the times out in hundredths of a second (regardless of the
@@ -1082,6 +959,7 @@ class JointResegmenter(object):
       num_digits += 1
     format_str = r"%0" + "%d" % num_digits + "d" # e.g. "%05d"
 
+    lines = []
     for start, end in segments:
       assert (end > start)
       start_seconds = "%.2f" % (self.frame_shift * start)
@@ -1090,7 +968,8 @@ class JointResegmenter(object):
       end_str = format_str % (end * self.frame_shift * 100.0)
       utterance_id = "%s%s%s%s%s" % (self.file_id, self.options.first_separator, start_str, self.options.second_separator, end_str)
       # Output:
-      out_file_handle.write("%s %s %s %s\n" % (utterance_id, self.file_id, start_seconds, end_seconds))
+      lines.append("%s %s %s %s\n" % (utterance_id, self.file_id, start_seconds, end_seconds))
+    out_file_handle.write(''.join(lines))
 
   # Some intermediate stage analysis of the segmentation
   def segmentation_analysis(self, title = "Analysis"):
@@ -1100,25 +979,21 @@ class JointResegmenter(object):
 
     # First get the segment start and segment ends
     # Note that they are in sync by construction
-    segment_starts = [i for i in range(0,self.N) if self.S[i]]
-    segment_ends = [i for i in range(0,self.N+1) if self.E[i]]
-
-    D = {}
-    for i,st in enumerate(segment_starts):
-      en = segment_ends[i]
-      types = {}
-      for val in self.reference[st:en]:
-        # The segment is defined by the indices st:en
-        # Count the number of frames in the segment that
-        # are silence, speech and noise in the reference.
-        types[val] = types.get(val,0) + 1
-      # End for loop over a particular segment
-      # Make a tuple out of the counts of the types of frames
-      D[st] = (en, types.get("0",0), types.get("1", 0), types.get("2", 0))
-    # End for loop over all segments
+    segment_starts = np.nonzero(marks(self.S))[0]
+    segment_ends = np.nonzero(marks(self.E))[0][0:len(segment_starts)]
+
+    # Count the number of frames in each segment (defined by the indices
+    # st:en) that are silence, noise and speech in the reference, using
+    # cumulative counts of each type.
+    counts = []
+    for c in (0, 1, 2):
+      cumulative = np.concatenate(([0], np.cumsum(self.reference == c)))
+      counts.append((cumulative[segment_ends] - cumulative[segment_starts]).tolist())
+    D = [ (st, (en, n0, n1, n2)) for st, en, n0, n1, n2 in
+          zip(segment_starts.tolist(), segment_ends.tolist(), *counts) ]
 
     a = Analysis(self.file_id, None, title)
-    for st, info in D.items():
+    for st, info in D:
       en = info[0]
 
       if info[1] > 0 and info[2] == 0 and info[3] == 0:
@@ -1185,93 +1060,161 @@ class JointResegmenter(object):
     return a
   # End function segmentation_analysis
 
+# Return the classes (phone_map[phone]) of the phones in the list A as an int
+# array, with -1 for classes other than 0, 1 and 2 (silence, noise and speech).
+def phone_classes(A, phone_map):
+  phones, index = np.unique(np.array(A, dtype=str), return_inverse = True)
+  classes = [ int(phone_map[x]) if phone_map[x] in ("0", "1", "2") else -1
+              for x in phones.tolist() ]
+  return np.array(classes, dtype=np.int8)[index]
+
 def map_prediction(A1, A2, phone_map, speech_cap = None, f = None):
   if A2 == None:
-    B = []
     # Isolated segmentation
-    prev_x = None
-    len_x = 0
-    i = 0
-    for x in A1:
-      if prev_x == None or x == prev_x:
-        len_x += 1
+    if len(A1) == 0:
+      sys.stderr.write("In file %s\n" % f)
+      sys.exit(1)
+    # Map each run of the same phone to class 0 (silence), 4 (noise) or 8
+    # (speech); speech runs longer than speech_cap are taken as noise.
+    phones = np.array(A1, dtype=str)
+    run_starts = np.concatenate(([0], np.nonzero(phones[1:] != phones[:-1])[0] + 1))
+    run_lengths = np.diff(np.append(run_starts, len(phones)))
+    run_classes = []
+    for x, len_x in zip(phones[run_starts].tolist(), run_lengths.tolist()):
+      #sys.stderr.write("PHONE_LENGTH %s %d %s %d\n" % (x, len_x, f, i))
+      if phone_map[x] == "0":
+        run_classes.append(0)
+      elif (speech_cap != None and len_x > speech_cap) or phone_map[x] == "1":
+        run_classes.append(4)
+      elif phone_map[x] == "2":
+        run_classes.append(8)
       else:
-        assert (len_x > 0)
-        #sys.stderr.write("PHONE_LENGTH %s %d %s %d\n" % (prev_x, len_x, f, i - len_x))
-        if phone_map[prev_x] == "0":
-          B.extend(["0"] * len_x)
-        elif (speech_cap != None and len_x > speech_cap) or phone_map[prev_x] == "1":
-          B.extend(["4"] * len_x)
-        elif phone_map[prev_x] == "2":
-          B.extend(["8"] * len_x)
-        # End if
-        len_x = 1
+        # The frames of phones of other classes are left out.
+        run_classes.append(-1)
       # End if
-      prev_x = x
-      i += 1
     # End for
-    try:
-      assert (len_x > 0)
-    except AssertionError as e:
-      repr(e)
-      sys.stderr.write("In file %s\n" % f)
-      sys.exit(1)
-
-    if phone_map[prev_x] == "0":
-      B.extend(["0"] * len_x)
-    elif (speech_cap != None and len_x > speech_cap) or phone_map[prev_x] == "1":
-      B.extend(["4"] * len_x)
-    elif phone_map[prev_x] == "2":
-      B.extend(["8"] * len_x)
-    # End if
-    return B
+    B = np.repeat(np.array(run_classes, dtype=np.int8), run_lengths)
+    return B[B >= 0]
   # End if (isolated segmentation)
 
   # Assuming len(A1) > len(A2)
   # Otherwise A1 and A2 must be interchanged before
   # passing to this function
-  B1 = []
-  B2 = []
-  for i in range(0, len(A2)):
-    if phone_map[A1[i]] == "0" and phone_map[A2[i]] == "0":
-      B1.append("0")
-      B2.append("0")
-    if phone_map[A1[i]] == "0" and phone_map[A2[i]] == "1":
-      B1.append("1")
-      B2.append("3")
-    if phone_map[A1[i]] == "0" and phone_map[A2[i]] == "2":
-      B1.append("2")
-      B2.append("6")
-    if phone_map[A1[i]] == "1" and phone_map[A2[i]] == "0":
-      B1.append("3")
-      B2.append("1")
-    if phone_map[A1[i]] == "1" and phone_map[A2[i]] == "1":
-      B1.append("4")
-      B2.append("4")
-    if phone_map[A1[i]] == "1" and phone_map[A2[i]] == "2":
-      B1.append("5")
-      B2.append("7")
-    if phone_map[A1[i]] == "2" and phone_map[A2[i]] == "0":
-      B1.append("6")
-      B2.append("2")
-    if phone_map[A1[i]] == "2" and phone_map[A2[i]] == "1":
-      B1.append("7")
-      B2.append("5")
-    if phone_map[A1[i]] == "2" and phone_map[A2[i]] == "2":
-      B1.append("8")
-      B2.append("8")
-  for i in range(len(A2), len(A1)):
-    if phone_map[A1[i]] == "0":
-      B1.append("0")
-      B2.append("0")
-    if phone_map[A1[i]] == "1":
-      B1.append("3")
-      B2.append("1")
-    if phone_map[A1[i]] == "2":
-      B1.append("6")
-      B2.append("2")
+  # The joint classes are 3 * (class of this channel) + (class of the other
+  # channel); e.g. 5 in B1 is noise in channel 1 and speech in channel 2.
+  # Beyond the end of A2, the other channel is taken as silence.
+  C1 = phone_classes(A1, phone_map)
+  C2 = phone_classes(A2, phone_map)
+  both = C1[0:len(A2)]
+  valid = (both >= 0) & (C2 >= 0)
+  rest = C1[len(A2):]
+  rest = rest[rest >= 0]
+  B1 = np.concatenate(((3 * both + C2)[valid], 3 * rest)).astype(np.int8)
+  B2 = np.concatenate(((3 * C2 + both)[valid], rest)).astype(np.int8)
   return (B1, B2)
 
+# Global variables of the processes that resegment the recordings, set by
+# init_resegmentation(); see resegment_recordings().
+options = None
+phone_map = None
+speech_cap = None
+temp_dir = None
+
+def init_resegmentation(this_options, this_phone_map, this_speech_cap, this_temp_dir):
+  global options, phone_map, speech_cap, temp_dir
+  options = this_options
+  phone_map = this_phone_map
+  speech_cap = this_speech_cap
+  temp_dir = this_temp_dir
+
+def read_prediction(f):
+  try:
+    return open(os.path.join(options.prediction_dir, f+".pred")).readline().strip().split()[1:]
+  except IndexError:
+    sys.stderr.write("Incorrect format of file %s/%s.pred\n" % (options.prediction_dir, f))
+    sys.exit(1)
+
+def read_reference(f):
+  if temp_dir != None:
+    try:
+      return open(os.path.join(temp_dir, f+".ref")).readline().strip().split()[1:]
+    except IOError:
+      return None
+  return None
+
+# Resegment the recording f (if f2 is None) or the two channels f and f2 of a
+# conversation, and return (segments, log, analyses, exit_code), where
+# 'segments' and 'log' are what would be written to the output segments file
+# and to the standard error, 'analyses' is a list of (name, Analysis) to be
+# added to the global analyses and 'exit_code' is None, or the argument of
+# sys.exit() if we exited with an error.  This is run in parallel (with
+# the global variables set by init_resegmentation()), and the results are
+# written out in the original order.
+def resegment_recordings(files):
+  f, f2 = files
+  out_file = StringIO()
+  stderr = sys.stderr
+  sys.stderr = StringIO()
+  analyses = []
+  exit_code = None
+  try:
+    stats = Stats()
+    if f2 is None:
+      A = read_prediction(f)
+
+      B = map_prediction(A, None, phone_map, speech_cap, f)
+
+      reference = read_reference(f)
+      r = JointResegmenter(A, B, f, options, phone_map, stats, reference)
+      r.resegment()
+      r.print_segments(out_file)
+      analyses += r.analyses
+    else:
+      f1 = f
+      A1 = read_prediction(f1)
+      A2 = read_prediction(f2)
+
+      if len(A1) < len(A2):
+        A3 = A1
+        A1 = A2
+        A2 = A3
+
+        f3 = f1
+        f1 = f2
+        f2 = f3
+      # End if
+
+      if (len(A1) - len(A2)) > options.max_length_diff/options.frame_shift:
+        sys.stderr.write( \
+            "%s: Warning: Lengths of %s and %s differ by more than %f. " \
+            % (sys.argv[0], f1,f2, options.max_length_diff) \
+            + "So using isolated resegmentation\n")
+        B1 = map_prediction(A1, None, phone_map, speech_cap)
+        B2 = map_prediction(A2, None, phone_map, speech_cap)
+      else:
+        B1,B2 = map_prediction(A1, A2, phone_map, speech_cap)
+      # End if
+
+      reference1 = read_reference(f1)
+      r1 = JointResegmenter(A1, B1, f1, options, phone_map, stats, reference1)
+      r1.resegment()
+      r1.print_segments(out_file)
+      analyses += r1.analyses
+
+      reference2 = read_reference(f2)
+      r2 = JointResegmenter(A1, B2, f2, options, phone_map, stats, reference2)
+      r2.resegment()
+      r2.restrict(len(A2))
+      r2.print_segments(out_file)
+      analyses += r2.analyses
+    # End if
+  except SystemExit as e:
+    exit_code = e.code
+  finally:
+    log = sys.stderr.getvalue()
+    sys.stderr = stderr
+  return (out_file.getvalue(), log, analyses, exit_code)
+
 def main():
   parser = ArgumentParser(description='Get segmentation arguments')
   parser.add_argument('--verbose', type=int, \
@@ -1321,6 +1264,10 @@ def main():
   parser.add_argument('--speech-cap-length', type=float, default=None, \
       help="Maximum length in seconds of a particular speech phone prediction." \
       + "\nAny length above this will be considered as noise")
+  parser.add_argument('--num-jobs', type=int, \
+      dest='num_jobs', default=1, \
+      help="Number of recordings (or pairs of channels for joint " \
+      + "segmentation) to resegment in parallel (default: %(default)s)")
   parser.add_argument('prediction_dir', \
       help='Directory where the predicted phones (.pred files) are found')
   parser.add_argument('phone_map', \
@@ -1373,8 +1320,6 @@ def main():
   else:
     temp_dir = None
 
-  stats = Stats()
-
   pred_files = dict([ (f.split('/')[-1][0:-5], False) \
     for f in glob.glob(os.path.join(prediction_dir, "*.pred")) ])
 
@@ -1387,11 +1332,18 @@ def main():
   global global_analysis_final
   global_analysis_final= Analysis("TOTAL_Final", options.frame_shift, "Global Analysis Final")
 
+  global_analyses = { "get_initial_segments": global_analysis_get_initial_segments,
+                      "set_nonspeech_proportion": global_analysis_set_nonspeech_proportion,
+                      "final": global_analysis_final }
+
   speech_cap = None
   if options.speech_cap_length != None:
     speech_cap = int(options.speech_cap_length/options.frame_shift)
   # End if
 
+  # The list of recordings to be resegmented in isolation, as (f, None),
+  # and of pairs of channels to be resegmented jointly, as (f1, f2)
+  recordings = []
   for f in pred_files:
     if pred_files[f]:
       continue
@@ -1411,86 +1363,42 @@ def main():
 
     if options.isolated_resegmentation or f2 not in pred_files or f1 not in pred_files:
       pred_files[f] = True
-      try:
-        A = open(os.path.join(prediction_dir, f+".pred")).readline().strip().split()[1:]
-      except IndexError:
-        sys.stderr.write("Incorrect format of file %s/%s.pred\n" % (prediction_dir, f))
-        sys.exit(1)
-
-      B = map_prediction(A, None, phone_map, speech_cap, f)
-
-      if temp_dir != None:
-        try:
-          reference = open(os.path.join(temp_dir, f+".ref")).readline().strip().split()[1:]
-        except IOError:
-          reference = None
-      else:
-        reference = None
-      r = JointResegmenter(A, B, f, options, phone_map, stats, reference)
-      r.resegment()
-      r.print_segments(out_file)
+      recordings.append((f, None))
     else:
       if pred_files[f1] and pred_files[f2]:
         continue
       pred_files[f1] = True
       pred_files[f2] = True
-      try:
-        A1 = open(os.path.join(prediction_dir, f1+".pred")).readline().strip().split()[1:]
-      except IndexError:
-        sys.stderr.write("Incorrect format of file %s/%s.pred\n" % (prediction_dir, f1))
-        sys.exit(1)
-      try:
-        A2 = open(os.path.join(prediction_dir, f2+".pred")).readline().strip().split()[1:]
-      except IndexError:
-        sys.stderr.write("Incorrect format of file %s/%s.pred\n" % (prediction_dir, f2))
-        sys.exit(1)
-
-      if len(A1) < len(A2):
-        A3 = A1
-        A1 = A2
-        A2 = A3
-
-        f3 = f1
-        f1 = f2
-        f2 = f3
-      # End if
-
-      if (len(A1) - len(A2)) > options.max_length_diff/options.frame_shift:
-        sys.stderr.write( \
-            "%s: Warning: Lengths of %s and %s differ by more than %f. " \
-            % (sys.argv[0], f1,f2, options.max_length_diff) \
-            + "So using isolated resegmentation\n")
-        B1 = map_prediction(A1, None, phone_map, speech_cap)
-        B2 = map_prediction(A2, None, phone_map, speech_cap)
-      else:
-        B1,B2 = map_prediction(A1, A2, phone_map, speech_cap)
-      # End if
-
-      if temp_dir != None:
-        try:
-          reference1 = open(os.path.join(temp_dir, f1+".ref")).readline().strip().split()[1:]
-        except IOError:
-          reference1 = None
-      else:
-        reference1 = None
-      r1 = JointResegmenter(A1, B1, f1, options, phone_map, stats, reference1)
-      r1.resegment()
-      r1.print_segments(out_file)
-
-      if temp_dir != None:
-        try:
-          reference2 = open(os.path.join(temp_dir, f2+".ref")).readline().strip().split()[1:]
-        except IOError:
-          reference2= None
-      else:
-        reference2 = None
-      r2 = JointResegmenter(A1, B2, f2, options, phone_map, stats, reference2)
-      r2.resegment()
-      r2.restrict(len(A2))
-      r2.print_segments(out_file)
+      recordings.append((f1, f2))
     # End if
   # End for loop over files
 
+  # Resegment the recordings, in parallel if --num-jobs > 1, and write out
+  # the segments, logs and analyses in the original order
+  init_args = (options, phone_map, speech_cap, temp_dir)
+  if options.num_jobs > 1:
+    pool = multiprocessing.Pool(options.num_jobs, \
+        initializer = init_resegmentation, initargs = init_args)
+    results = pool.imap(resegment_recordings, recordings)
+  else:
+    pool = None
+    init_resegmentation(*init_args)
+    results = ( resegment_recordings(x) for x in recordings )
+
+  try:
+    for segments, log, analyses, exit_code in results:
+      out_file.write(segments)
+      sys.stderr.write(log)
+      if exit_code is not None:
+        sys.exit(exit_code)
+      for name, a in analyses:
+        global_analyses[name].add(a)
+    # End for loop over recordings
+  finally:
+    if pool is not None:
+      pool.terminate()
+  out_file.flush()
+
   if options.reference_rttm != None:
     global_analysis_get_initial_segments.write_confusion_matrix(True)
     global_analysis_get_initial_segments.write_total_stats(True)
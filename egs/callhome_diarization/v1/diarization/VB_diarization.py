@@ -32,7 +32,9 @@ def VB_diarization(X, m, iE, w, V, sp=None, q=None,
                    maxSpeakers = 10, maxIters = 10,
                    epsilon = 1e-4, loopProb = 0.99, statScale = 1.0,
                    alphaQInit = 1.0, downsample = None, VtiEV = None, ref=None,
-                   plot=False, sparsityThr=0.001, llScale=1.0, minDur=1):
+                   plot=False, sparsityThr=0.001, llScale=1.0, minDur=1,
+                   dtype=np.float64, chunkSize=None, qDownsampled=False,
+                   upsampleQ=True, verbose=False):
 
   """
   This a generalized version of speaker diarization described in:
@@ -53,7 +55,9 @@ def VB_diarization(X, m, iE, w, V, sp=None, q=None,
   the paper above).
 
   Inputs:
-  X  - T x D array, where columns are D dimensional feature vectors for T frames
+  X  - T x D array, where columns are D dimensional feature vectors for T frames,
+       or an iterable of such arrays with consecutive blocks of frames (e.g.
+       read from disk one at a time; see compute_stats)
   m  - C x D array of GMM component means
   iE - C x D array of GMM component inverse covariance matrix diagonals
   w  - C dimensional column vector of GMM component weights
@@ -78,6 +82,19 @@ def VB_diarization(X, m, iE, w, V, sp=None, q=None,
   ref         - T dim. integer vector with reference speaker ID (0:maxSpeakers)
                 per frame
   plot        - if set to True, plot per-frame speaker posteriors.
+  dtype       - floating point type (np.float64 or np.float32) used for the
+                UBM statistics and the speaker model updates. The HMM
+                forward-backward is always done in double precision.
+  chunkSize   - if not None, the UBM statistics are collected in blocks of
+                this many frames, so that the dense T x C matrix of UBM
+                log-likelihoods is never held in memory for the whole input.
+                The statistics are downsampled block by block.
+  qDownsampled - if set to True, q is given already downsampled, i.e. with
+                one row per 'downsample' frames, e.g. by
+                frame_labels2posterior_mx(labels, maxSpeakers, downsample)
+  upsampleQ   - if set to False, the output q is not upsampled to the frame
+                rate of the input, but has one row per 'downsample' frames
+  verbose     - if set to True, print the sparsity of the zero-order stats.
 
    Outputs:
    q  - S x T matrix of posteriors attribution each frame to one of S possible
@@ -93,60 +110,42 @@ def VB_diarization(X, m, iE, w, V, sp=None, q=None,
   # Kenny, P. Bayesian Analysis of Speaker Diarization with Eigenvoice Priors,
   # Montreal, CRIM, May 2008.
 
-  D=X.shape[1]  # feature dimensionality
-  C=len(w)      # number of mixture components
-  R=V.shape[0]  # subspace rank
-  nframes=X.shape[0]
+  m, iE, w, V = [np.asarray(a, dtype=dtype) for a in (m, iE, w, V)]
 
   if VtiEV is None:
     VtiEV = precalculate_VtiEV(V, iE)
-
-  V = V.reshape(V.shape[0],-1)
+  VtiEV = VtiEV.astype(dtype, copy=False)
 
   if sp is None:
     sp = np.ones(maxSpeakers)/maxSpeakers
   else:
     maxSpeakers = len(sp)
 
+  # calculate UBM mixture frame posteriors (i.e. per-frame zero order statistics)
+  # and per-frame first order statistics projected into the R-dim. subspace.
+  # If downsample is not None, they are summed over 'downsample' frames as they
+  # are collected. This speeds-up diarization for the price of lowering its
+  # frame resolution
+  NN, VtiEF, G, nframes = compute_stats(X, m, iE, w, V, llScale=llScale,
+                                        statScale=statScale,
+                                        sparsityThr=sparsityThr,
+                                        chunkSize=chunkSize,
+                                        downsample=downsample)
+  if verbose:
+    print('Sparsity: ', NN.nnz, float(NN.nnz)/np.prod(NN.shape))
+  LL = np.sum(G) # total log-likelihod as calculated using UBM
+
   if q is None:
     # initialize q from flat Dirichlet prior with concentrsaion parameter alphaQInit
     q = np.random.gamma(alphaQInit, size=(nframes, maxSpeakers))
     q = q / q.sum(1, keepdims=True)
-
-  # calculate UBM mixture frame posteriors (i.e. per-frame zero order statistics)
-  ll = (X**2).dot(-0.5*iE.T) + X.dot(iE.T*m.T)-0.5*((iE * m**2 - np.log(iE)).sum(1) - 2*np.log(w) + D*np.log(2*np.pi))
-  ll *= llScale
-  G = logsumexp(ll, axis=1)
-  NN =  np.exp(ll - G[:,np.newaxis]) * statScale
-  NN[NN<sparsityThr] = 0.0
-
-  #Kx = np.sum(NN * (np.log(w) - np.log(NN)), 1)
-  NN = coo_matrix(NN) # represent zero-order stats using sparse matrix
-  print('Sparsity: ', len(NN.row), float(len(NN.row))/np.prod(NN.shape))
-  LL = np.sum(G) # total log-likelihod as calculated using UBM
-
-  mixture_sum = coo_matrix((np.ones(C*D), (np.repeat(range(C),D), range(C*D))), shape=(C, C*D))
-
-  #G = np.sum((NN.multiply(ll - np.log(w))).toarray(), 1) + Kx  # eq. (15) # Aleready calculated above
-
-  # Calculate per-frame first order statistics projected into the R-dim. subspace
-  # V^T \Sigma^{-1} F_m
-  F_s = coo_matrix((((X[NN.row]-m[NN.col])*NN.data[:,np.newaxis]).flat,
-                   (NN.row.repeat(D), NN.col.repeat(D)*D+np.tile(range(D), len(NN.col)))), shape=(nframes, D*C))
-  VtiEF = F_s.tocsr().dot((iE.flat * V).T) ; del F_s
-  ## The code above is only efficient implementation of the following comented code
-  #VtiEF = 0;
-  #for ii in range(C):
-  #  VtiEF = VtiEF + V[ii*D:(ii+1)*D,:].T.dot(NN[ii,:] * np.sqrt(iE[:,[ii]]) *  (X - m[:,[ii]]))
+    qDownsampled = False
 
   if downsample is not None:
-    # Downsample NN, VtiEF, G and q by summing the statistic over 'downsample' frames
-    # This speeds-up diarization for the price of lowering its frame resolution
-    downsampler = coo_matrix((np.ones(nframes, dtype=np.int64), ((np.ceil(np.arange(nframes)/downsample)).astype(int), np.arange(nframes))), shape=(int(np.ceil((nframes - 1.0) / downsample)) + 1, nframes))
-    NN    = downsampler.dot(NN)
-    VtiEF = downsampler.dot(VtiEF)
-    G     = downsampler.dot(G)
-    q     = downsampler.dot(q) / downsample
+    # Downsample q by summing it over 'downsample' frames, as the statistics
+    downsampler = get_downsampler(nframes, downsample)
+    if not qDownsampled:
+      q = downsampler.dot(q) / downsample
   else:
     downsampler=np.array(1)
 
@@ -154,23 +153,12 @@ def VB_diarization(X, m, iE, w, V, sp=None, q=None,
   if ref is not None:
     Li[-1] += [DER(downsampler.T.dot(q), ref), DER(downsampler.T.dot(q), ref, xentropy=True)]
 
-  lls = np.zeros_like(q)
   tr = np.eye(minDur*maxSpeakers, k=1)
   ip = np.zeros(minDur*maxSpeakers)
   for ii in range(maxIters):
-    L = 0 # objective function (37) (i.e. VB lower-bound on the evidence)
-    Ns =   NN.T.dot(q).T                             # bracket in eq. (34) for all 's'
-    VtNsiEV_flat = Ns.astype(VtiEV.dtype).dot(VtiEV) # eq. (34) except for 'I' for all 's'
-    VtiEFs = q.T.dot(VtiEF)                          # eq. (35) except for \Lambda_s^{-1} for all 's'
-    for sid in range(maxSpeakers):
-        invL = np.linalg.inv(np.eye(R) + tril_to_sym(VtNsiEV_flat[sid])) # eq. (34) inverse
-        a = invL.dot(VtiEFs[sid])                                        # eq. (35)
-        # eq. (29) except for the prior term \ln \pi_s. Our prior is given by HMM
-        # trasition probability matrix. Instead of eq. (30), we need to use
-        # forward-backwar algorithm to calculate per-frame speaker posteriors,
-        # where 'lls' plays role of HMM output log-probabilities
-        lls[:,sid] = G + VtiEF.dot(a) - 0.5 * NN.dot(mixture_sum.dot(((invL+np.outer(a,a)).astype(V.dtype).dot(V) * (iE.flat * V)).sum(0)))
-        L += 0.5 * (logdet(invL) - np.sum(np.diag(invL) + a**2, 0) + R)
+    # 'lls' plays role of HMM output log-probabilities (eq. (29) except for the
+    # prior term), L is -KL{q(Y)||p(Y)} part of the objective function (37)
+    lls, L = update_speakers(NN, VtiEF, G, q.astype(dtype), VtiEV)
 
     # Construct transition probability matrix with linear chain of 'minDur'
     # states for each of 'maxSpeaker' speaker. The last state in each chain has
@@ -182,6 +170,7 @@ def VB_diarization(X, m, iE, w, V, sp=None, q=None,
     ip[::minDur]=sp
     # per-frame HMM state posteriors. Note that we can have linear chain of minDur states
     # for each speaker.
+    lls = lls.astype(np.float64)
     q, tll, lf, lb = forward_backward(lls.repeat(minDur,axis=1), tr, ip) #, np.arange(1,maxSpeakers+1)*minDur-1)
 
     # Right after updating q(Z), tll is E{log p(X|,Y,Z)} - KL{q(Z)||p(Z)}.
@@ -218,13 +207,150 @@ def VB_diarization(X, m, iE, w, V, sp=None, q=None,
       if L - Li[-1][0] < 0: print('WARNING: Value of auxiliary function has decreased!')
       break
 
-  if downsample is not None:
+  if downsample is not None and upsampleQ:
     #upsample resulting q to match number of frames in the input utterance
     q = downsampler.T.dot(q)
 
   return q, sp, Li
 
 
+def compute_stats(X, m, iE, w, V, llScale=1.0, statScale=1.0,
+                  sparsityThr=0.001, chunkSize=None, downsample=None):
+    """
+    Collects the per-frame UBM statistics used by VB_diarization, optionally
+    in blocks of chunkSize frames to bound the memory used by the dense
+    block x C matrix of UBM log-likelihoods.
+
+    X can also be an iterable of blocks of consecutive frames, which are then
+    processed one at a time, so that the features of the whole input need not
+    be in memory either. If downsample is not None, the statistics of each
+    block are summed over groups of 'downsample' frames (as by the downsampler
+    of VB_diarization) right away, so only those of the groups are kept.
+
+    Inputs:
+    X, m, iE, w, V - as in VB_diarization (V is R x C x D)
+    Outputs:
+    NN      - T' x C sparse (CSR) matrix of zero-order statistics, where T' is
+              T, or the number of groups of frames if downsample is not None
+    VtiEF   - T' x R matrix of first-order statistics projected into the
+              subspace, i.e. V^T \\Sigma^{-1} F_m
+    G       - T' dim. vector of per-frame UBM log-likelihoods
+    nframes - number of frames T
+    """
+    D = m.shape[1]
+    C = len(w)
+    if isinstance(X, np.ndarray):
+      if chunkSize is None or chunkSize <= 0:
+        chunkSize = max(X.shape[0], 1)
+      blocks = [X[start:start+chunkSize] for start in range(0, X.shape[0], chunkSize)]
+    else:
+      blocks = X
+    if downsample is None:
+      downsample = 1
+
+    iEV = (iE.reshape(1, -1) * V.reshape(V.shape[0], -1)).T # C*D x R
+    ll_const = -0.5*((iE * m**2 - np.log(iE)).sum(1) - 2*np.log(w) + D*np.log(2*np.pi))
+    iEm = (iE*m).T
+
+    NN_rows, NN_cols, NN_data = [], [], []
+    VtiEF_blocks, G_blocks = [], []
+    nframes = 0 # number of frames processed so far
+    nrows = 0   # number of rows of the statistics so far
+    for Xc in blocks:
+      Xc = np.asarray(Xc, dtype=m.dtype)
+      n = Xc.shape[0]
+      if n == 0:
+        continue
+      ll = (Xc**2).dot(-0.5*iE.T) + Xc.dot(iEm) + ll_const
+      ll *= llScale
+      Gc = logsumexp(ll, axis=1)
+      NNc = np.exp(ll - Gc[:,np.newaxis]) * statScale
+      del ll
+      NNc[NNc<sparsityThr] = 0.0
+      NNc = coo_matrix(NNc) # represent zero-order stats using sparse matrix
+
+      F_s = coo_matrix((((Xc[NNc.row]-m[NNc.col])*NNc.data[:,np.newaxis]).flat,
+                       (NNc.row.repeat(D), NNc.col.repeat(D)*D+np.tile(range(D), len(NNc.col)))), shape=(n, D*C))
+      VtiEFc = F_s.tocsr().dot(iEV) ; del F_s
+      ## The code above is only efficient implementation of the following comented code
+      #VtiEF = 0;
+      #for ii in range(C):
+      #  VtiEF = VtiEF + V[ii*D:(ii+1)*D,:].T.dot(NN[ii,:] * np.sqrt(iE[:,[ii]]) *  (X - m[:,[ii]]))
+
+      # the frames of the block belong to the groups (rows of the statistics)
+      # first_row, first_row+1, ..., of which the first one may have started
+      # in the previous block
+      rows = np.ceil(np.arange(nframes, nframes + n)/downsample).astype(int)
+      first_row = rows[0]
+      if downsample > 1:
+        downsampler = coo_matrix((np.ones(n, dtype=m.dtype), (rows - first_row, np.arange(n))),
+                                 shape=(rows[-1] - first_row + 1, n)).tocsr()
+        NNc = downsampler.dot(NNc.tocsr()).tocoo()
+        VtiEFc = downsampler.dot(VtiEFc)
+        Gc = downsampler.dot(Gc)
+      # the zero-order stats of a group that is split between two blocks are
+      # summed when NN is converted to CSR below
+      NN_rows.append(NNc.row + first_row)
+      NN_cols.append(NNc.col)
+      NN_data.append(NNc.data)
+      if first_row < nrows:
+        VtiEF_blocks[-1][-1] += VtiEFc[0]
+        G_blocks[-1][-1] += Gc[0]
+        VtiEFc, Gc = VtiEFc[1:], Gc[1:]
+      if len(Gc) > 0:
+        VtiEF_blocks.append(VtiEFc)
+        G_blocks.append(Gc)
+      nframes += n
+      nrows += len(Gc)
+
+    if nframes == 0:
+      raise ValueError("No frames to collect the statistics from")
+    NN = coo_matrix((np.concatenate(NN_data),
+                     (np.concatenate(NN_rows), np.concatenate(NN_cols))),
+                    shape=(nrows, C)).tocsr()
+    VtiEF = np.vstack(VtiEF_blocks)
+    G = np.concatenate(G_blocks)
+    return NN, VtiEF, G, nframes
+
+
+def get_downsampler(nframes, downsample):
+    """
+    Returns the T' x T sparse matrix that sums the rows of a T x K matrix over
+    groups of 'downsample' frames (the first frame is a group on its own).
+    """
+    return coo_matrix((np.ones(nframes, dtype=np.int64), ((np.ceil(np.arange(nframes)/downsample)).astype(int), np.arange(nframes))), shape=(int(np.ceil((nframes - 1.0) / downsample)) + 1, nframes))
+
+
+def update_speakers(NN, VtiEF, G, q, VtiEV):
+    """
+    Updates the speaker models for all speakers at once, i.e. eqs. (34)
+    and (35), and returns the per-frame speaker log-likelihoods (eq. (29)
+    except for the prior term) together with the -KL{q(Y)||p(Y)} term of
+    the objective function. The S x R x R precision matrices are inverted
+    with a single stacked call, and the expected quadratic term is computed
+    from VtiEV instead of from the full C*D eigenvoice matrix.
+    """
+    R = VtiEF.shape[1]
+    tril_ind = np.tril_indices(R)
+    Ns = NN.T.dot(q).T                      # bracket in eq. (34) for all 's'
+    VtNsiEV_flat = Ns.dot(VtiEV)            # eq. (34) except for 'I' for all 's'
+    VtiEFs = q.T.dot(VtiEF)                 # eq. (35) except for \Lambda_s^{-1} for all 's'
+    invL = np.linalg.inv(np.eye(R, dtype=VtiEV.dtype) + tril_to_sym(VtNsiEV_flat)) # eq. (34) inverse
+    a = np.einsum('srk,sk->sr', invL, VtiEFs)                                       # eq. (35)
+
+    # E[y y^T] = invL + a a^T; since it is symmetric, its contraction with the
+    # (symmetric) V^T \Sigma^{-1} V of each component only needs the lower
+    # triangle, with the off-diagonal elements counted twice.
+    Eyy = invL + a[:,:,np.newaxis] * a[:,np.newaxis,:]
+    Eyy_tril = Eyy[:, tril_ind[0], tril_ind[1]]
+    Eyy_tril[:, tril_ind[0] != tril_ind[1]] *= 2
+    lls = G[:,np.newaxis] + VtiEF.dot(a.T) - 0.5 * NN.dot(Eyy_tril.dot(VtiEV.T).T)
+
+    L = 0.5 * np.sum(np.linalg.slogdet(invL)[1]
+                     - np.trace(invL, axis1=1, axis2=2) - np.sum(a**2, 1) + R)
+    return lls, L
+
+
 def precalculate_VtiEV(V, iE):
     tril_ind = np.tril_indices(V.shape[0])
     VtiEV = np.empty((V.shape[1],len(tril_ind[0])), V.dtype)
@@ -234,10 +360,17 @@ def precalculate_VtiEV(V, iE):
 
 
 # Initialize q (per-frame speaker posteriors) from a reference
-# (vector of per-frame zero based integer speaker IDs)
-def frame_labels2posterior_mx(labels, maxSpeakers):
+# (vector of per-frame zero based integer speaker IDs). If downsample is not
+# None, q is returned downsampled as in VB_diarization, without creating the
+# per-frame posteriors first.
+def frame_labels2posterior_mx(labels, maxSpeakers, downsample=None):
     #initialize from reference
     #pmx = np.zeros((len(labels), labels.max()+1))
+    if downsample is not None:
+      rows = np.ceil(np.arange(len(labels))/downsample).astype(int)
+      pmx = np.zeros((rows[-1] + 1, maxSpeakers))
+      np.add.at(pmx, (rows, labels), 1)
+      return pmx / downsample
     pmx = np.zeros((len(labels), maxSpeakers))
     pmx[np.arange(len(labels)), labels] = 1
     return pmx
@@ -308,13 +441,15 @@ def exp_ne(x, out=None):
     return ne.evaluate("exp(x)", out=None)
 
 
-# Convert vector with lower-triangular coefficients into symetric matrix
+# Convert vector with lower-triangular coefficients into symetric matrix.
+# If tril is 2-dimensional, each of its rows is converted and a stack of
+# matrices is returned.
 def tril_to_sym(tril):
-    R = np.sqrt(len(tril)*2).astype(int)
+    R = np.sqrt(tril.shape[-1]*2).astype(int)
     tril_ind = np.tril_indices(R)
-    S = np.empty((R,R))
-    S[tril_ind]       = tril
-    S[tril_ind[::-1]] = tril
+    S = np.empty(tril.shape[:-1] + (R,R), dtype=tril.dtype)
+    S[..., tril_ind[0], tril_ind[1]] = tril
+    S[..., tril_ind[1], tril_ind[0]] = tril
     return S
 
 
@@ -6,12 +6,21 @@
 # inputs for the VB system and creates the output RTTM file. The inputs include data directory
 # (data_dir), the rttm file to initialize the VB system(init_rttm_filename), the directory to
 # output the rttm prediction(output_dir), path to diagonal UBM model(dubm_model) and path to 
-# i-vector extractor model(ie_model).
+# i-vector extractor model(ie_model). With --num-workers > 1 the recordings are
+# resegmented in parallel by a pool of worker processes that share the models.
+# With --chunk-size > 0 the features are read and the UBM statistics collected
+# (and downsampled) in blocks of that many frames, so the memory needed does not
+# grow with the length of the recordings by more than the downsampled statistics.
+# This holds for binary features, compressed or not; compressed features (CM,
+# the default of the feature extraction) read from a pipe rather than from an
+# archive still need one byte per element of the whole matrix.
 
 import numpy as np
 import VB_diarization
 import kaldi_io
 import argparse
+import multiprocessing
+import struct
 from convert_VB_model import load_dubm, load_ivector_extractor 
 
 def get_utt_list(utt2spk_filename):
@@ -32,7 +41,124 @@ def get_utt2num_frames(utt2num_frames_filename):
         utt2num_frames[line_split[0]] = int(line_split[1])
     return utt2num_frames
 
-def create_ref(uttname, utt2num_frames, full_rttm_filename):
+# prepare utt2feats dictionary, mapping each utterance to the rxfilename of its
+# features, so the features can be read one recording at a time.
+def get_utt2feats(feats_scp_filename):
+    utt2feats = {}
+    with open(feats_scp_filename, 'r') as fh:
+        for line in fh:
+            line_split = line.strip().split(None, 1)
+            utt2feats[line_split[0]] = line_split[1]
+    return utt2feats
+
+# read the rttm file once, returning a dictionary mapping each utterance to its
+# list of (start_time, duration, spkname) segments
+def get_utt2segments(rttm_filename):
+    utt2segments = {}
+    with open(rttm_filename, 'r') as fh:
+        for line in fh:
+            line_split = line.split()
+            utt2segments.setdefault(line_split[1], []).append(
+                (line_split[3], line_split[4], line_split[7]))
+    return utt2segments
+
+# Converts the uint8 block 'data' of a compressed matrix in the 'CM' format to
+# float32, given the column percentiles 'p0', 'p25', 'p75' and 'p100' (as in
+# CompressedMatrix::CharToFloat() in Kaldi).
+def uncompress_cm_block(data, p0, p25, p75, p100):
+    data = data.astype(np.float32)
+    return np.where(data <= 64, p0 + (p25 - p0) * data * np.float32(1 / 64.0),
+                    np.where(data <= 192,
+                             p25 + (p75 - p25) * (data - 64) * np.float32(1 / 128.0),
+                             p75 + (p100 - p75) * (data - 192) * np.float32(1 / 63.0)))
+
+# Yields the rows of the compressed matrix in the format 'fmt' ('CM', 'CM2' or
+# 'CM3') whose global header follows in the file object 'fd', in blocks of
+# 'block_size' rows.  The 'CM2' and 'CM3' formats are stored row by row; the
+# 'CM' format (the default of Kaldi's feature extraction) is stored column by
+# column, so each block is read column by column if 'fd' is seekable, and
+# otherwise the bytes of the whole matrix (one per element) are read first.
+def read_compressed_mat_blocks(fd, fmt, block_size):
+    min_value, value_range, rows, cols = struct.unpack('<ffii', fd.read(16))
+    if fmt in ('CM2', 'CM3'):
+        dtype, scale = ((np.dtype('<u2'), 1 / 65535.0) if fmt == 'CM2'
+                        else (np.dtype(np.uint8), 1 / 255.0))
+        for start in range(0, rows, block_size):
+            n = min(block_size, rows - start)
+            data = np.frombuffer(fd.read(n * cols * dtype.itemsize),
+                                 dtype=dtype).reshape(n, cols)
+            yield (np.float32(min_value) + np.float32(value_range)
+                   * np.float32(scale) * data.astype(np.float32))
+        return
+    percentiles = np.frombuffer(fd.read(cols * 8), dtype='<u2').reshape(cols, 4)
+    p0, p25, p75, p100 = (np.float32(min_value) + np.float32(value_range)
+                          * np.float32(1.52590218966964e-05)
+                          * percentiles.astype(np.float32)).T
+    try:
+        data_start = fd.tell()
+        fd.seek(data_start)
+        seekable = True
+    except (AttributeError, IOError, OSError):
+        seekable = False
+    if not seekable:
+        print("Warning: reading all the {} x {} bytes of a compressed matrix "
+              "from a pipe before uncompressing it in blocks".format(rows, cols))
+        data = np.frombuffer(fd.read(rows * cols), dtype=np.uint8).reshape(cols, rows)
+    for start in range(0, rows, block_size):
+        n = min(block_size, rows - start)
+        if seekable:
+            block = np.empty((cols, n), dtype=np.uint8)
+            for col in range(cols):
+                fd.seek(data_start + col * rows + start)
+                block[col] = np.frombuffer(fd.read(n), dtype=np.uint8)
+        else:
+            block = data[:, start:start+n]
+        yield uncompress_cm_block(block.T, p0, p25, p75, p100)
+
+# Yields the rows of the matrix 'rxfilename' in blocks of 'block_size' rows.
+# Binary matrices, uncompressed or compressed, are read one block at a time
+# (see read_compressed_mat_blocks()); a text matrix is read whole first.
+def read_mat_blocks(rxfilename, block_size):
+    fd = kaldi_io.open_or_fd(rxfilename)
+    try:
+        header = fd.read(5)
+        if header in (b'\0BFM ', b'\0BDM '):
+            dtype = np.float32 if header == b'\0BFM ' else np.float64
+            _, rows, _, cols = struct.unpack('<bibi', fd.read(10))
+            for start in range(0, rows, block_size):
+                n = min(block_size, rows - start)
+                buf = fd.read(n * cols * np.dtype(dtype).itemsize)
+                yield np.frombuffer(buf, dtype=dtype).reshape(n, cols)
+            return
+        if header == b'\0BCM ':
+            fmt = 'CM'
+        elif header in (b'\0BCM2', b'\0BCM3'):
+            fmt = header[2:].decode()
+            assert fd.read(1) == b' '
+        else:
+            fmt = None
+        if fmt is not None:
+            for block in read_compressed_mat_blocks(fd, fmt, block_size):
+                yield block
+            return
+    finally:
+        fd.close()
+    print("Warning: reading the whole of the text matrix {}".format(rxfilename))
+    mat = kaldi_io.read_mat(rxfilename)
+    for start in range(0, len(mat), block_size):
+        yield mat[start:start+block_size]
+
+# Yields the voiced frames (those for which 'mask' is True) of the blocks of
+# frames 'blocks', as 'dtype'.
+def get_voiced_blocks(blocks, mask, dtype):
+    start = 0
+    for block in blocks:
+        end = start + len(block)
+        yield block[mask[start:end]].astype(dtype)
+        start = end
+    assert start == len(mask)
+
+def create_ref(uttname, utt2num_frames, utt2segments):
     num_frames = utt2num_frames[uttname]
 
     # We use 0 to denote silence frames and 1 to denote overlapping frames.
@@ -40,17 +166,9 @@ def create_ref(uttname, utt2num_frames, full_rttm_filename):
     speaker_dict = {}
     num_spk = 0
 
-    with open(full_rttm_filename, 'r') as fh:
-        content = fh.readlines()
-    for line in content:
-        line = line.strip('\n')
-        line_split = line.split()
-        uttname_line = line_split[1]
-        if uttname != uttname_line:
-            continue
-        start_time, duration = int(float(line_split[3]) * 100), int(float(line_split[4]) * 100)
+    for start_time, duration, spkname in utt2segments.get(uttname, []):
+        start_time, duration = int(float(start_time) * 100), int(float(duration) * 100)
         end_time = start_time + duration
-        spkname = line_split[7]
         if spkname not in speaker_dict.keys():
             spk_idx = num_spk + 2
             speaker_dict[spkname] = spk_idx
@@ -134,12 +252,24 @@ def main():
                         help='Channel information in the rttm file')
     parser.add_argument('--initialize', type=int, default=1,
                         help='Whether to initalize the speaker posterior')
+    parser.add_argument('--num-workers', type=int, default=1,
+                        help='Number of worker processes resegmenting recordings in parallel')
+    parser.add_argument('--use-float32', type=int, default=0,
+                        help='Whether to compute the statistics and speaker models in \
+                        single precision (halves the memory, slightly less accurate)')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='If > 0, read the features and collect the UBM statistics in \
+                        blocks of this many frames to bound memory usage on long recordings \
+                        (compressed features read from a pipe are kept whole, at one byte per \
+                        element)')
 
     args = parser.parse_args()
     print(args)
 
     utt_list = get_utt_list("{}/utt2spk".format(args.data_dir))
     utt2num_frames = get_utt2num_frames("{}/utt2num_frames".format(args.data_dir))
+    utt2feats = get_utt2feats("{}/feats.scp".format(args.data_dir))
+    utt2segments = get_utt2segments(args.init_rttm_filename)
     
     # Load the diagonal UBM and i-vector extractor
     dubm_para = load_dubm(args.dubm_model)
@@ -151,62 +281,110 @@ def main():
     assert 'M' in ie_para
     IE_M = np.transpose(ie_para['M'], (2, 0, 1))
     
-    m = DUBM_MEANS_INVVARS / DUBM_INV_VARS
-    iE = DUBM_INV_VARS
-    w = DUBM_WEIGHTS
-    V = IE_M
-
-    # Load the MFCC features
-    feats_dict = {}
-    for key,mat in kaldi_io.read_mat_scp("{}/feats.scp".format(args.data_dir)):
-        feats_dict[key] = mat
-
-    for utt in utt_list:
-        # Get the alignments from the clustering result.
-        # In init_ref, 0 denotes the silence silence frames
-        # 1 denotes the overlapping speech frames, the speaker
-        # label starts from 2.
-        init_ref = create_ref(utt, utt2num_frames, args.init_rttm_filename)
-
-        # load MFCC features
-        X = (feats_dict[utt]).astype(np.float64)
+    dtype = np.float32 if args.use_float32 else np.float64
+    m = (DUBM_MEANS_INVVARS / DUBM_INV_VARS).astype(dtype)
+    iE = DUBM_INV_VARS.astype(dtype)
+    w = DUBM_WEIGHTS.astype(dtype)
+    V = IE_M.astype(dtype)
+    # VtiEV only depends on the models, so compute it once and share it
+    # across all recordings (and worker processes).
+    VtiEV = VB_diarization.precalculate_VtiEV(V, iE)
+
+    worker_args = (args, utt2num_frames, utt2feats, utt2segments, (m, iE, w, V, VtiEV))
+    if args.num_workers > 1:
+        pool = multiprocessing.Pool(args.num_workers, initializer=init_worker,
+                                    initargs=worker_args)
+        for message in pool.imap(resegment_utt, utt_list):
+            if message is not None:
+                print(message)
+        pool.close()
+        pool.join()
+    else:
+        init_worker(*worker_args)
+        for utt in utt_list:
+            message = resegment_utt(utt)
+            if message is not None:
+                print(message)
+    return 0
+
+# State shared by all the calls of resegment_utt() in a process; it is set by
+# init_worker(), which is the initializer of the worker pool.
+_worker_state = {}
+
+def init_worker(args, utt2num_frames, utt2feats, utt2segments, models):
+    _worker_state['args'] = args
+    _worker_state['utt2num_frames'] = utt2num_frames
+    _worker_state['utt2feats'] = utt2feats
+    _worker_state['utt2segments'] = utt2segments
+    _worker_state['models'] = models
+
+# Resegments one recording and writes its rttm file. Returns a warning message
+# to be printed by the main process, or None.
+def resegment_utt(utt):
+    args = _worker_state['args']
+    m, iE, w, V, VtiEV = _worker_state['models']
+
+    # Get the alignments from the clustering result.
+    # In init_ref, 0 denotes the silence silence frames
+    # 1 denotes the overlapping speech frames, the speaker
+    # label starts from 2.
+    init_ref = create_ref(utt, _worker_state['utt2num_frames'],
+                          _worker_state['utt2segments'])
+
+    # Keep only the voiced frames (0 denotes the silence 
+    # frames, 1 denotes the overlapping speech frames).
+    mask = (init_ref >= 2)
+    init_ref_voiced = init_ref[mask] - 2
+
+    if len(init_ref_voiced) == 0:
+        return "Warning: {} has no voiced frames in the initialization file".format(utt)
+
+    # load MFCC features, all at once or in blocks as they are needed
+    if args.chunk_size > 0:
+        X_voiced = get_voiced_blocks(
+            read_mat_blocks(_worker_state['utt2feats'][utt], args.chunk_size),
+            mask, V.dtype)
+    else:
+        X = kaldi_io.read_mat(_worker_state['utt2feats'][utt])
         assert len(init_ref) == len(X)
+        X_voiced = X[mask].astype(V.dtype)
+        del X
 
-        # Keep only the voiced frames (0 denotes the silence 
-        # frames, 1 denotes the overlapping speech frames).
-        mask = (init_ref >= 2)
-        X_voiced = X[mask]
-        init_ref_voiced = init_ref[mask] - 2
+    # Initialize the posterior of each speaker based on the clustering result.
+    # It is created already downsampled, as VB_diarization would downsample it.
+    downsample = args.downsample if args.downsample > 1 else None
+    if args.initialize:
+        q = VB_diarization.frame_labels2posterior_mx(init_ref_voiced, args.max_speakers,
+                                                     downsample=downsample)
+    else:
+        q = None
+    
+    # VB resegmentation
 
-        if X_voiced.shape[0] == 0:
-            print("Warning: {} has no voiced frames in the initialization file".format(utt))
-            continue
+    # q  - S x T matrix of posteriors attribution each frame to one of S possible
+    #      speakers, where S is given by opts.maxSpeakers
+    # sp - S dimensional column vector of ML learned speaker priors. Ideally, these
+    #      should allow to estimate # of speaker in the utterance as the
+    #      probabilities of the redundant speaker should converge to zero.
+    # Li - values of auxiliary function (and DER and frame cross-entropy between q
+    #      and reference if 'ref' is provided) over iterations.
+    q_out, sp_out, L_out = VB_diarization.VB_diarization(X_voiced, m, iE, w, V, sp=None, q=q, maxSpeakers=args.max_speakers, maxIters=args.max_iters, VtiEV=VtiEV,
+                              downsample=downsample, alphaQInit=args.alphaQInit, sparsityThr=args.sparsityThr, epsilon=args.epsilon, minDur=args.minDur,
+                              loopProb=args.loopProb, statScale=args.statScale, llScale=args.llScale, ref=None, plot=False,
+                              dtype=V.dtype, chunkSize=args.chunk_size if args.chunk_size > 0 else None,
+                              qDownsampled=True, upsampleQ=False)
+    # q_out has one row per 'downsample' voiced frames; it is not upsampled
+    # to the frame rate, only the labels are.
+    predicted_label_voiced = np.argmax(q_out, 1) + 2
+    if downsample is not None:
+        predicted_label_voiced = predicted_label_voiced[
+            np.ceil(np.arange(len(init_ref_voiced)) / downsample).astype(int)]
+    predicted_label = (np.zeros(len(mask))).astype(int)
+    predicted_label[mask] = predicted_label_voiced
 
-        # Initialize the posterior of each speaker based on the clustering result.
-        if args.initialize:
-            q = VB_diarization.frame_labels2posterior_mx(init_ref_voiced, args.max_speakers)
-        else:
-            q = None
-        
-        # VB resegmentation
-
-        # q  - S x T matrix of posteriors attribution each frame to one of S possible
-        #      speakers, where S is given by opts.maxSpeakers
-        # sp - S dimensional column vector of ML learned speaker priors. Ideally, these
-        #      should allow to estimate # of speaker in the utterance as the
-        #      probabilities of the redundant speaker should converge to zero.
-        # Li - values of auxiliary function (and DER and frame cross-entropy between q
-        #      and reference if 'ref' is provided) over iterations.
-        q_out, sp_out, L_out = VB_diarization.VB_diarization(X_voiced, m, iE, w, V, sp=None, q=q, maxSpeakers=args.max_speakers, maxIters=args.max_iters, VtiEV=None,
-                                  downsample=args.downsample, alphaQInit=args.alphaQInit, sparsityThr=args.sparsityThr, epsilon=args.epsilon, minDur=args.minDur,
-                                  loopProb=args.loopProb, statScale=args.statScale, llScale=args.llScale, ref=None, plot=False)
-        predicted_label_voiced = np.argmax(q_out, 1) + 2
-        predicted_label = (np.zeros(len(mask))).astype(int)
-        predicted_label[mask] = predicted_label_voiced
-
-        # Create the output rttm file
-        create_rttm_output(utt, predicted_label, args.output_dir, args.channel)
-    return 0
+    # Create the output rttm file
+    create_rttm_output(utt, predicted_label, args.output_dir, args.channel)
+    return None
 
 if __name__ == "__main__":
     main()
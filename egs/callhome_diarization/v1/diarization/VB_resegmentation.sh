@@ -22,6 +22,10 @@ statScale=0.2
 llScale=1.0
 channel=0
 initialize=1
+num_workers=1   # number of worker processes per job; each job reserves this
+                # many slots through --num-threads.
+use_float32=0
+chunk_size=0
 # End configuration section.
 
 echo "$0 $@"  # Print the command line for logging
@@ -72,6 +76,13 @@ if [ $# != 5 ]; then
   echo "                                                   # speaker posterior (if not)"
   echo "                                                   # the speaker posterior will be"
   echo "                                                   # randomly initilized"
+  echo "  --num-workers <n|1>                              # Number of recordings resegmented"
+  echo "                                                   # in parallel by each job"
+  echo "  --use-float32 <n|0>                              # Whether to use single precision"
+  echo "                                                   # statistics and speaker models"
+  echo "  --chunk-size <n|0>                               # If > 0, read the features and collect the"
+  echo "                                                   # UBM statistics in blocks of this many frames;"
+  echo "                                                   # recommended for long recordings"
 
   exit 1;
 fi
@@ -103,12 +114,13 @@ fi
 
 if [ $stage -le 1 ]; then
     # VB resegmentation
-    $cmd JOB=1:$nj $output_dir/log/VB_resegmentation.JOB.log \
+    $cmd --num-threads $num_workers JOB=1:$nj $output_dir/log/VB_resegmentation.JOB.log \
       python3 diarization/VB_resegmentation.py --max-speakers $max_speakers \
         --max-iters $max_iters --downsample $downsample --alphaQInit $alphaQInit \
 	--sparsityThr $sparsityThr --epsilon $epsilon --minDur $minDur \
 	--loopProb $loopProb --statScale $statScale --llScale $llScale \
 	--channel $channel --initialize $initialize \
+	--num-workers $num_workers --use-float32 $use_float32 --chunk-size $chunk_size \
         $sdata/JOB $init_rttm_filename $output_dir/tmp $output_dir/tmp/dubm.tmp $output_dir/tmp/ie.tmp || exit 1;
 
     cat $output_dir/tmp/*.rttm > $output_dir/rttm/VB_rttm
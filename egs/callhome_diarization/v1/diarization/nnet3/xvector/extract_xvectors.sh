@@ -100,13 +100,22 @@ if [ $stage -le 0 ]; then
   else
     segments=$data/segments
   fi
+  # The feature ranges of the subsegments are worked out together with the
+  # subsegments, so that subsegment_data_dir.sh does not have to.
+  utils/data/get_utt2num_frames.sh --cmd "$cmd" --nj $nj $data
+  frame_shift=$(utils/data/get_frame_shift.sh $data) || exit 1
   utils/data/get_uniform_subsegments.py \
       --max-segment-duration=$window \
       --overlap-duration=$(perl -e "print ($window-$period);") \
       --max-remaining-duration=$min_segment \
       --constant-duration=True \
+      --feats-scp=$data/feats.scp \
+      --utt2num-frames=$data/utt2num_frames \
+      --frame-shift=$frame_shift \
+      --output-feats-scp=$dir/subsegments_feats.scp \
       $segments > $dir/subsegments
-  utils/data/subsegment_data_dir.sh $data \
+  utils/data/subsegment_data_dir.sh \
+      --subsegment-feats-scp $dir/subsegments_feats.scp $data \
       $dir/subsegments $sub_data
 fi
 
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# Copyright 2018 Johns Hopkins University
+# Apache 2.0
+# Works with both python2 and python3
+# Like local/run_wpe.py, this needs the python with nara_wpe installed.
+#
+# This script dereverberates a multi-channel recording with local/run_wpe.py in
+# the offline mode and in the block-online mode with each of the given block
+# lengths, and reports the real-time factor of each mode and the
+# signal-to-difference ratio of the block-online outputs with respect to the
+# offline ones.  E.g.:
+#  $HOME/miniconda3/bin/python local/benchmark_wpe.py --block-lengths 10,30 \
+#    /export/corpora4/CHiME5/audio/dev/S02_U01.CH{1,2,3,4}.wav
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+from run_wpe import dereverberate
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Reports the real-time factor of the offline and "
+        "block-online WPE of local/run_wpe.py and the difference between "
+        "their outputs.")
+    parser.add_argument('--block-lengths', type=str, default='10,30',
+                        help="Comma-separated list of block lengths in "
+                        "seconds to benchmark")
+    parser.add_argument('--block-context', type=float, default=2.0,
+                        help="Seconds of context on each side of the blocks")
+    parser.add_argument('input_files', nargs='+',
+                        help="The channels of the recording")
+    args = parser.parse_args()
+    args.block_lengths = [float(x) for x in args.block_lengths.split(',')]
+    return args
+
+
+def run(input_files, out_dir, block_length, block_context):
+    output_files = [os.path.join(out_dir, os.path.basename(f))
+                    for f in input_files]
+    start = time.time()
+    duration = dereverberate(input_files, output_files, block_length,
+                             block_context)
+    return output_files, (time.time() - start) / duration
+
+
+def signal_to_difference_ratio(reference_files, files):
+    """Returns the ratio in dB of the energy of the signals in
+    reference_files to that of their difference to the signals in files."""
+    energy = 0.0
+    difference = 0.0
+    for f, g in zip(reference_files, files):
+        x = sf.read(f)[0]
+        y = sf.read(g)[0]
+        energy += np.sum(x ** 2)
+        difference += np.sum((x - y) ** 2)
+    if difference == 0:
+        return float('inf')
+    return 10 * np.log10(energy / difference)
+
+
+def main():
+    args = get_args()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        offline_files, rtf = run(args.input_files,
+                                 os.path.join(tmp_dir, 'offline'), 0.0, 0.0)
+        print("offline: real-time factor {0:.3f}".format(rtf))
+        for block_length in args.block_lengths:
+            out_dir = os.path.join(tmp_dir, 'block{0}'.format(block_length))
+            block_files, rtf = run(args.input_files, out_dir, block_length,
+                                   args.block_context)
+            print("block-online, {0} s blocks with {1} s context: real-time "
+                  "factor {2:.3f}, {3:.1f} dB signal-to-difference ratio to "
+                  "the offline output".format(
+                      block_length, args.block_context, rtf,
+                      signal_to_difference_ratio(offline_files,
+                                                 block_files)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
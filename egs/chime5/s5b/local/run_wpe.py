@@ -7,30 +7,26 @@
 # needs to be run and this script needs to be launched run with that version of
 # python.
 # See local/run_wpe.sh for example.
+#
+# By default (--block-length 0) WPE is run on the STFT of the whole file, as
+# before.  With --block-length > 0 the file is read, dereverberated and written
+# block by block: WPE is run on blocks of that many seconds of STFT frames, plus
+# --block-context seconds of frames on each side that are only used for the
+# estimation, and the output is overlap-added as the blocks come in.  The
+# frames are the same as those of the whole-file STFT, so the output differs
+# from the offline one only through the per-block filter estimate, and memory
+# no longer grows with the length of the (hours long) sessions.
 
 import numpy as np
 import soundfile as sf
 import time
 import os, errno
-from tqdm import tqdm
+import sys
 import argparse
+import multiprocessing
 
 from nara_wpe.wpe import wpe
 from nara_wpe.utils import stft, istft
-from nara_wpe import project_root
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--files', '-f', nargs='+')
-args = parser.parse_args()
-
-input_files = args.files[:len(args.files)//2]
-output_files = args.files[len(args.files)//2:]
-out_dir = os.path.dirname(output_files[0])
-try:
-    os.makedirs(out_dir)
-except OSError as e:
-    if e.errno != errno.EEXIST:
-        raise
 
 stft_options = dict(
     size=512,
@@ -46,14 +42,175 @@ delay = 3
 iterations = 5
 taps = 10
 
-signal_list = [
-    sf.read(f)[0]
-    for f in input_files
-]
-y = np.stack(signal_list, axis=0)
-Y = stft(y, **stft_options).transpose(2, 0, 1)
-Z = wpe(Y, iterations=iterations, statistics_mode='full').transpose(1, 2, 0)
-z = istft(Z, size=stft_options['size'], shift=stft_options['shift'])
-
-for d in range(len(signal_list)):
-    sf.write(output_files[d], z[d,:], sampling_rate)
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Dereverberates the channels of a multi-channel recording "
+        "with WPE (nara_wpe). The channels are given with --files (the input "
+        "files followed by the same number of output files), or, one "
+        "recording per line in the same format, with --file-list.")
+    parser.add_argument('--files', '-f', nargs='+',
+                        help="Input files followed by the output files")
+    parser.add_argument('--file-list', type=str,
+                        help="File with one recording per line, in the "
+                        "format of --files")
+    parser.add_argument('--block-length', type=float, default=0.0,
+                        help="Length in seconds of the blocks WPE is run on; "
+                        "0 means the whole file (offline mode)")
+    parser.add_argument('--block-context', type=float, default=2.0,
+                        help="Seconds of context on each side of the blocks "
+                        "used for estimating the WPE filter (if "
+                        "--block-length > 0)")
+    parser.add_argument('--num-jobs', type=int, default=1,
+                        help="Number of recordings to process in parallel")
+    args = parser.parse_args()
+
+    if (args.files is None) == (args.file_list is None):
+        raise ValueError("Exactly one of --files and --file-list must be "
+                         "specified")
+    if args.block_length < 0 or args.block_context < 0:
+        raise ValueError("--block-length and --block-context must be >= 0")
+    return args
+
+
+def split_files(files):
+    """Splits the list of input files followed by output files into
+    (input_files, output_files)."""
+    if len(files) == 0 or len(files) % 2 != 0:
+        raise ValueError("Expected the same number of input and output "
+                         "files, got {0}".format(' '.join(files)))
+    return files[:len(files)//2], files[len(files)//2:]
+
+
+def read_padded(sound_files, num_samples, start, end):
+    """Returns the samples [start, end) of the channels in sound_files, where
+    sample 0 is the first one of the files and samples outside
+    [0, num_samples) are zeros, as a (channels, end - start) array."""
+    y = np.zeros((len(sound_files), end - start))
+    begin = max(start, 0)
+    stop = min(end, num_samples)
+    if begin < stop:
+        for d, f in enumerate(sound_files):
+            f.seek(begin)
+            y[d, begin - start:stop - start] = f.read(stop - begin,
+                                                      dtype='float64')
+    return y
+
+
+def dereverberate(input_files, output_files, block_length=0.0,
+                  block_context=2.0):
+    """Runs WPE on the channels input_files and writes them to output_files.
+    If block_length > 0, WPE is run on blocks of block_length seconds
+    with block_context seconds of context on each side, and only one block
+    is kept in memory at a time.  Returns the duration of the recording in
+    seconds."""
+    size = stft_options['size']
+    shift = stft_options['shift']
+    # the STFT pads (size - shift) zeros on both sides of the signal (fading),
+    # which are removed again after the overlap-add.
+    fading = size - shift
+
+    inputs = [sf.SoundFile(f) for f in input_files]
+    outputs = []
+    try:
+        num_samples = inputs[0].frames
+        for f in inputs:
+            if f.frames != num_samples or f.channels != 1:
+                raise ValueError("Expected single-channel input files of the "
+                                 "same length: {0}".format(
+                                     ' '.join(input_files)))
+        out_dir = os.path.dirname(output_files[0])
+        try:
+            os.makedirs(out_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        outputs = [sf.SoundFile(f, 'w', sampling_rate, 1)
+                   for f in output_files]
+
+        # the frames of the whole-file STFT; frame t starts at sample
+        # t * shift - fading.  The output is trimmed to the length the
+        # whole-file iSTFT would have.
+        num_frames = 1 + max(0, -(-(num_samples + 2 * fading - size)
+                                  // shift))
+        num_output_samples = num_frames * shift - fading
+        if block_length > 0:
+            block = max(1, int(block_length * sampling_rate / shift))
+            # the filter of the first kept frame must only use frames in the
+            # block
+            context = max(int(block_context * sampling_rate / shift),
+                          delay + taps)
+        else:
+            block = num_frames
+            context = 0
+
+        pending = np.zeros((len(inputs), 0))
+        done = -fading  # samples before this have been written
+        for begin in range(0, num_frames, block):
+            end = min(begin + block, num_frames)
+            first = max(begin - context, 0)
+            last = min(end + context, num_frames)
+            y = read_padded(inputs, num_samples, first * shift - fading,
+                            (last - 1) * shift + size - fading)
+            Y = stft(y, size=size, shift=shift, fading=False,
+                     pad=False).transpose(2, 0, 1)
+            Z = wpe(Y, taps=taps, delay=delay, iterations=iterations,
+                    statistics_mode='full').transpose(1, 2, 0)
+            z = istft(Z[:, begin - first:end - first], size=size, shift=shift,
+                      fading=False)
+            z[:, :pending.shape[1]] += pending
+            # the samples before the first frame of the next block are
+            # complete.
+            ready = (end - begin) * shift if end < num_frames else z.shape[1]
+            pending = z[:, ready:]
+            z = z[:, max(0, -done):min(ready, num_output_samples - done)]
+            done += ready
+            for d, f in enumerate(outputs):
+                f.write(z[d])
+    finally:
+        for f in inputs + outputs:
+            f.close()
+    return float(num_samples) / sampling_rate
+
+
+def run_job(args):
+    files, block_length, block_context = args
+    input_files, output_files = split_files(files)
+    start = time.time()
+    duration = dereverberate(input_files, output_files, block_length,
+                             block_context)
+    return (output_files, duration, time.time() - start)
+
+
+def main():
+    args = get_args()
+    if args.files is not None:
+        jobs = [args.files]
+    else:
+        with open(args.file_list) as f:
+            jobs = [line.split() for line in f if line.strip() != '']
+    jobs = [(files, args.block_length, args.block_context) for files in jobs]
+
+    if args.num_jobs > 1:
+        pool = multiprocessing.Pool(args.num_jobs)
+        results = pool.imap(run_job, jobs)
+    else:
+        results = map(run_job, jobs)
+
+    total_duration = 0.0
+    total_time = 0.0
+    for output_files, duration, elapsed in results:
+        total_duration += duration
+        total_time += elapsed
+        print("{0}: dereverberated {1:.1f} seconds of audio in {2:.1f} "
+              "seconds".format(' '.join(output_files), duration, elapsed))
+    if args.num_jobs > 1:
+        pool.close()
+        pool.join()
+    if total_duration > 0:
+        print("{0}: real-time factor {1:.3f}".format(
+            sys.argv[0], total_time / total_duration))
+
+
+if __name__ == "__main__":
+    main()
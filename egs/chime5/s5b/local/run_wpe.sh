@@ -8,6 +8,8 @@
 # Config:
 nj=4
 cmd=run.pl
+block_length=0   # if > 0, run WPE on blocks of this many seconds (bounded memory)
+block_context=2  # seconds of context on each side of the blocks
 
 . utils/parse_options.sh || exit 1;
 
@@ -17,6 +19,7 @@ if [ $# != 3 ]; then
    echo "main options (for others, see top of script file)"
    echo "  --cmd <cmd>                              # Command to run in parallel with"
    echo "  --nj 50                        # number of jobs for parallel processing"
+   echo "  --block-length 30              # run WPE on blocks of 30 seconds instead of whole files"
    exit 1;
 fi
 
@@ -71,10 +74,9 @@ echo -e "Dereverberation - $task - $array\n"
 # making a shell script for each job
 for n in `seq $nj`; do
 cat <<-EOF > $expdir/log/wpe.$n.sh
-while read line; do
-  $miniconda_dir/bin/python local/run_wpe.py \
-    --file \$line
-done < $output_wavfiles.$n
+$miniconda_dir/bin/python local/run_wpe.py \
+  --block-length $block_length --block-context $block_context \
+  --file-list $output_wavfiles.$n
 EOF
 done
 
@@ -8,19 +8,19 @@
 import os
 import sys
 
-def findTranscription(timeDetail):
-  file1 = open('exp/tri5a/decode_callhome_dev/scoring/13.tra')
-  file2 = open('exp/tri5a/decode_callhome_train/scoring/13.tra')
-  for line in file1:
-    lineComp = line.split()
-    if lineComp[0] == timeDetail:
-      return " ".join(lineComp[1:])
-  for line in file2:
+# Read the transcriptions once; if a segment appears more than once, its
+# first transcription is used
+transcriptions = {}
+for scoringFile in ['exp/tri5a/decode_callhome_dev/scoring/13.tra',
+                    'exp/tri5a/decode_callhome_train/scoring/13.tra']:
+  for line in open(scoringFile):
     lineComp = line.split()
-    if lineComp[0] == timeDetail:
-      return " ".join(lineComp[1:])
-  # No result found
-  return -1
+    if lineComp[0] not in transcriptions:
+      transcriptions[lineComp[0]] = " ".join(lineComp[1:])
+
+def findTranscription(timeDetail):
+  # -1 if no result found
+  return transcriptions.get(timeDetail, -1)
 
 
 wordsFile = open('exp/tri5a/graph/words.txt')
@@ -56,7 +56,7 @@ for item in fileList:
     timeInfo = line.split()
     mergedTranslation = ""
     for timeDetail in timeInfo:
-      #Locate this in ASR dev/test, this is going to be very slow
+      #Locate this in ASR dev/test
       tmp = findTranscription(timeDetail)
       if tmp != -1:
         mergedTranslation = mergedTranslation + " " + tmp
@@ -6,41 +6,23 @@
 # words.txt
 
 from __future__ import print_function
+import multiprocessing
 import os
+import shutil
 import sys
 import subprocess
 
+import lattice_fst
+
+# Number of conversations whose lattices are processed in parallel
+numJobs = multiprocessing.cpu_count()
+
 latticeLocation = 'latjosh-2-callhome/lattices-pushed/'
 
 tmpdir = 'data/local/data/tmp/ch-d/lattmp'
 invalidplfdir = 'data/local/data/tmp/ch-d/invalidplf'
 symtable = '/export/a04/gkumar/kaldi-trunk/egs/fishcall_es/j-matt/data/lang/words.clean.txt'
 
-conversationList = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-callhome/dev')
-provFile = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-callhome/ch-d/asr.test.plf', 'w+')
-invalidPLF = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-callhome/ch-d/invalidPLF', 'w+')
-blankPLF = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-callhome/ch-d/blankPLF', 'w+')
-rmLines = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-callhome/ch-d/removeLines', 'w+')
-
-if not os.path.exists(tmpdir):
-    os.makedirs(tmpdir)
-if not os.path.exists(invalidplfdir):
-    os.makedirs(invalidplfdir)
-else:
-    os.system("rm " + invalidplfdir + "/*")
-
-def latticeConcatenate(lat1, lat2):
-    '''
-    Concatenates lattices, writes temporary results to tmpdir
-    '''
-    if lat1 == "":
-        os.system('rm ' + tmpdir + '/tmp.lat')
-        return lat2
-    else:
-        proc = subprocess.Popen(['fstconcat', lat1, lat2, (tmpdir + '/tmp.lat')])
-        proc.wait()
-        return tmpdir + '/tmp.lat'
-
 
 def findLattice(timeDetail):
     '''
@@ -52,64 +34,105 @@ def findLattice(timeDetail):
         return -1
 
 
-# Now read list of files in conversations
-fileList = []
-for line in conversationList:
-    line = line.strip()
-    line = line[:-4]
-    fileList.append(line)
-
-# IN what order were the conversations added to the spanish files?
-# Now get timing information to concatenate the ASR outputs
-
-lineNo = 1
-for item in fileList:
+def processConversation(item):
+    '''
+    Converts the lattices of the lines of the timing file of a conversation to
+    PLF. Returns a list with, for each line, its first segment, its PLF (None
+    if it has no lattices) and the output of checkplf for it
+    '''
+    results = []
+    # Each conversation has its own temporary FST in tmpdir
+    finalFST = tmpdir + "/" + item + ".fst"
     timingFile = open('/export/a04/gkumar/corpora/fishcall/callhome/tim/' + item + '.es')
     for line in timingFile:
         timeInfo = line.split()
 
         # For utterances that are concatenated in the translation file,
         # the corresponding FSTs have to be translated as well
-        mergedTranslation = ""
+        lattices = []
         for timeDetail in timeInfo:
             tmp = findLattice(timeDetail)
             if tmp != -1:
-                # Concatenate lattices
-                mergedTranslation = latticeConcatenate(mergedTranslation, tmp)
-
-        print(mergedTranslation)
-        if mergedTranslation != "":
-
-            # Sanjeev's Recipe : Remove epsilons and topo sort
-            finalFST = tmpdir + "/final.fst"
-            os.system("fstrmepsilon " + mergedTranslation + " | fsttopsort - " + finalFST)
-
-            # Now convert to PLF
-            proc = subprocess.Popen('/export/a04/gkumar/corpora/fishcall/bin/fsm2plf.sh ' + symtable +  ' ' + finalFST, stdout=subprocess.PIPE, shell=True)
-            PLFline = proc.stdout.readline()
-            finalPLFFile = tmpdir + "/final.plf"
-            finalPLF = open(finalPLFFile, "w+")
-            finalPLF.write(PLFline)
-            finalPLF.close()
-
-            # now check if this is a valid PLF, if not write it's ID in a
-            # file so it can be checked later
-            proc = subprocess.Popen("/export/a04/gkumar/moses/mosesdecoder/checkplf < " + finalPLFFile + " 2>&1 | awk 'FNR == 2 {print}'", stdout=subprocess.PIPE, shell=True)
-            line = proc.stdout.readline()
-            print("{} {}".format(line, lineNo))
-            if line.strip() != "PLF format appears to be correct.":
-                os.system("cp " + finalFST + " " + invalidplfdir + "/" + timeInfo[0])
-                invalidPLF.write(invalidplfdir + "/" + timeInfo[0] + "\n")
-                rmLines.write("{}\n".format(lineNo))
-            else:
-                provFile.write(PLFline)
-        else:
-            blankPLF.write(timeInfo[0] + "\n")
-            rmLines.write("{}\n".format(lineNo))
+                lattices.append(tmp)
+
+        if len(lattices) == 0:
+            results.append((timeInfo[0], None, None))
+            continue
+
+        # Concatenate lattices and, Sanjeev's Recipe : Remove epsilons and
+        # topo sort; all in memory, the FST is written only once
+        lattice_fst.write_fst(lattice_fst.concatenate_lattices(lattices),
+                              finalFST)
+
         # Now convert to PLF
-        lineNo += 1
+        proc = subprocess.Popen('/export/a04/gkumar/corpora/fishcall/bin/fsm2plf.sh ' + symtable +  ' ' + finalFST, stdout=subprocess.PIPE, shell=True, universal_newlines=True)
+        PLFline = proc.stdout.readline()
+        proc.communicate()
+
+        # now check if this is a valid PLF, if not keep the FST so it can be
+        # checked later
+        proc = subprocess.Popen("/export/a04/gkumar/moses/mosesdecoder/checkplf 2>&1 | awk 'FNR == 2 {print}'", stdin=subprocess.PIPE, stdout=subprocess.PIPE, shell=True, universal_newlines=True)
+        checkLine = proc.communicate(PLFline)[0]
+        if checkLine.strip() != "PLF format appears to be correct.":
+            shutil.copyfile(finalFST, invalidplfdir + "/" + timeInfo[0])
+        results.append((timeInfo[0], PLFline, checkLine))
+    timingFile.close()
+    if os.path.exists(finalFST):
+        os.remove(finalFST)
+    return results
+
+
+if __name__ == '__main__':
+    conversationList = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-callhome/dev')
+    provFile = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-callhome/ch-d/asr.test.plf', 'w+')
+    invalidPLF = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-callhome/ch-d/invalidPLF', 'w+')
+    blankPLF = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-callhome/ch-d/blankPLF', 'w+')
+    rmLines = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-callhome/ch-d/removeLines', 'w+')
+
+    if not os.path.exists(tmpdir):
+        os.makedirs(tmpdir)
+    if not os.path.exists(invalidplfdir):
+        os.makedirs(invalidplfdir)
+    else:
+        os.system("rm " + invalidplfdir + "/*")
+
+    # Now read list of files in conversations
+    fileList = []
+    for line in conversationList:
+        line = line.strip()
+        line = line[:-4]
+        fileList.append(line)
+
+    # IN what order were the conversations added to the spanish files?
+    # Now get timing information to concatenate the ASR outputs.
+    # The conversations are processed in parallel, but their results are
+    # written in order
+    if numJobs > 1:
+        pool = multiprocessing.Pool(numJobs)
+        conversationResults = pool.imap(processConversation, fileList)
+    else:
+        conversationResults = map(processConversation, fileList)
 
-provFile.close()
-invalidPLF.close()
-blankPLF.close()
-rmLines.close()
+    lineNo = 1
+    for results in conversationResults:
+        for segment, PLFline, checkLine in results:
+            if PLFline is None:
+                blankPLF.write(segment + "\n")
+                rmLines.write("{}\n".format(lineNo))
+            else:
+                print("{} {}".format(checkLine, lineNo))
+                if checkLine.strip() != "PLF format appears to be correct.":
+                    invalidPLF.write(invalidplfdir + "/" + segment + "\n")
+                    rmLines.write("{}\n".format(lineNo))
+                else:
+                    provFile.write(PLFline)
+            lineNo += 1
+
+    if numJobs > 1:
+        pool.close()
+        pool.join()
+
+    provFile.close()
+    invalidPLF.close()
+    blankPLF.close()
+    rmLines.close()
@@ -15,14 +15,17 @@ oneBestTmp = 'exp/sgmm2x_6a_mmi_b0.2/one-best/asr-test'
 provFile = open('/export/a04/gkumar/corpora/fishcall/jack-splits/split-matt/asr.test', 'w+')
 timLocation = '/export/a04/gkumar/corpora/fishcall/fisher/tim'
 
+# Read the transcriptions once; if a segment appears more than once, its
+# first transcription is used
+transcriptions = {}
+for line in open(scoringFile):
+  lineComp = line.split()
+  if lineComp[0] not in transcriptions:
+    transcriptions[lineComp[0]] = " ".join(lineComp[1:])
+
 def findTranscription(timeDetail):
-  file1 = open(scoringFile)
-  for line in file1:
-    lineComp = line.split()
-    if lineComp[0] == timeDetail:
-      return " ".join(lineComp[1:])
-  # No result found
-  return -1
+  # -1 if no result found
+  return transcriptions.get(timeDetail, -1)
 
 words = {}
 
@@ -49,7 +52,7 @@ for item in fileList:
     timeInfo = line.split()
     mergedTranslation = ""
     for timeDetail in timeInfo:
-      #Locate this in ASR dev/test, this is going to be very slow
+      #Locate this in ASR dev/test
       tmp = findTranscription(timeDetail)
       if tmp != -1:
         mergedTranslation = mergedTranslation + " " + tmp
@@ -0,0 +1,523 @@
+# Copyright 2019  Johns Hopkins University
+# Apache 2.0
+
+""" This module is used by local/get_lattices.py (and its callhome and train
+variants) to build the lattice of each line of the translation files in
+memory: the lattices of its segments are read from their OpenFst binary files,
+concatenated, and their epsilons removed and states topologically sorted, as
+fstconcat, fstrmepsilon and fsttopsort would do, and the result is written
+once.  The states, arcs (in the same order) and weights are those the OpenFst
+tools produce; only the properties stored in the header of the written FST
+may differ.  This can be checked on some lattices, with the OpenFst tools on
+the PATH, by running
+    python local/lattice_fst.py <lattice1> [<lattice2> ...]
+which compares the result with theirs using fstequal.
+
+An FST is kept as a few numpy arrays (see class Fst).  Only what the lattices
+need is supported: vector FSTs, with log or tropical ('standard') arcs, and
+epsilon removal requires the epsilon arcs not to form cycles (lattices are
+acyclic).
+"""
+
+from __future__ import division
+import heapq
+import math
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+
+FST_MAGIC_NUMBER = 2125659606
+SYMBOL_TABLE_MAGIC_NUMBER = 2125658996
+FILE_VERSION = 2
+HAS_ISYMBOLS = 0x1
+HAS_OSYMBOLS = 0x2
+NO_STATE_ID = -1
+
+# Some of the FST properties, as in OpenFst's fst/properties.h.
+EXPANDED = 0x1
+MUTABLE = 0x2
+ACCEPTOR = 0x10000
+NOT_ACCEPTOR = 0x20000
+EPSILONS = 0x400000
+NO_EPSILONS = 0x800000
+I_EPSILONS = 0x1000000
+NO_I_EPSILONS = 0x2000000
+O_EPSILONS = 0x4000000
+NO_O_EPSILONS = 0x8000000
+WEIGHTED = 0x100000000
+UNWEIGHTED = 0x200000000
+ACYCLIC = 0x800000000
+INITIAL_ACYCLIC = 0x2000000000
+TOP_SORTED = 0x4000000000
+ACCESSIBLE = 0x10000000000
+COACCESSIBLE = 0x40000000000
+
+# One() and Zero() of the log and tropical semirings.
+WEIGHT_ONE = 0.0
+WEIGHT_ZERO = float('inf')
+# The comparison delta of OpenFst's ShortestDistance() (kShortestDelta).
+DELTA = 1.0 / 1024
+
+# The arcs as they are stored in the binary files.
+ARC_DTYPE = np.dtype([('ilabel', '<i4'), ('olabel', '<i4'),
+                      ('weight', '<f4'), ('nextstate', '<i4')])
+
+
+class Fst(object):
+    """An FST, as the arrays
+        finals: the final weights of the states (float32),
+        offsets: the arcs of state s are arcs[offsets[s]:offsets[s+1]],
+        arcs: the arcs, with fields ilabel, olabel, weight and nextstate,
+    and the start state 'start' (NO_STATE_ID if the FST has no states).
+    'arc_type' is 'log' or 'standard'.
+    """
+
+    def __init__(self, start, finals, offsets, arcs, arc_type='log'):
+        if arc_type not in ['log', 'standard']:
+            raise ValueError("Unsupported arc type '{0}'".format(arc_type))
+        self.start = start
+        self.finals = finals
+        self.offsets = offsets
+        self.arcs = arcs
+        self.arc_type = arc_type
+
+    def num_states(self):
+        return len(self.finals)
+
+    def plus(self, a, b):
+        """The Plus() of two weights of the semiring of the FST, computed like
+        OpenFst's LogWeight and TropicalWeight do (float32 weights, with the
+        log-sum in double precision)."""
+        if self.arc_type == 'standard':
+            return min(a, b)
+        if a == WEIGHT_ZERO:
+            return b
+        if b == WEIGHT_ZERO:
+            return a
+        if a > b:
+            a, b = b, a
+        x = float(np.float32(b - a))
+        return np.float32(float(a) - math.log1p(math.exp(-x)))
+
+    def sources(self):
+        """Returns the source state of each arc."""
+        return np.repeat(np.arange(self.num_states()), np.diff(self.offsets))
+
+
+def empty_fst(arc_type='log'):
+    return Fst(NO_STATE_ID, np.zeros(0, dtype=np.float32),
+               np.zeros(1, dtype=np.int64), np.zeros(0, dtype=ARC_DTYPE),
+               arc_type)
+
+
+def _from_source_states(start, finals, sources, arcs, arc_type):
+    """Creates an Fst from arcs given with their source states; the arcs of
+    each state keep their relative order."""
+    order = np.argsort(sources, kind='mergesort')
+    offsets = np.zeros(len(finals) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(finals)), out=offsets[1:])
+    return Fst(start, np.asarray(finals, dtype=np.float32), offsets,
+               arcs[order], arc_type)
+
+
+def _read_string(buf, pos):
+    n, = struct.unpack_from('<i', buf, pos)
+    return buf[pos + 4:pos + 4 + n].decode('latin-1'), pos + 4 + n
+
+
+def _skip_symbol_table(buf, pos):
+    magic, = struct.unpack_from('<i', buf, pos)
+    if magic != SYMBOL_TABLE_MAGIC_NUMBER:
+        raise ValueError("Bad symbol table in FST")
+    _, pos = _read_string(buf, pos + 4)
+    _, size = struct.unpack_from('<qq', buf, pos)
+    pos += 16
+    for i in range(size):
+        _, pos = _read_string(buf, pos)
+        pos += 8
+    return pos
+
+
+def read_fst(filename):
+    """Reads a vector FST in the OpenFst binary format."""
+    with open(filename, 'rb') as f:
+        buf = f.read()
+    magic, = struct.unpack_from('<i', buf, 0)
+    if magic != FST_MAGIC_NUMBER:
+        raise ValueError("{0} is not an FST in the OpenFst binary "
+                         "format".format(filename))
+    fst_type, pos = _read_string(buf, 4)
+    arc_type, pos = _read_string(buf, pos)
+    if fst_type != 'vector':
+        raise ValueError("{0}: FST type '{1}' is not supported".format(
+            filename, fst_type))
+    (version, flags, properties, start, num_states,
+     num_arcs) = struct.unpack_from('<iiQqqq', buf, pos)
+    pos += 40
+    if flags & HAS_ISYMBOLS:
+        pos = _skip_symbol_table(buf, pos)
+    if flags & HAS_OSYMBOLS:
+        pos = _skip_symbol_table(buf, pos)
+
+    finals = np.zeros(num_states, dtype=np.float32)
+    offsets = np.zeros(num_states + 1, dtype=np.int64)
+    arcs = []
+    state = struct.Struct('<fq')
+    for s in range(num_states):
+        finals[s], n = state.unpack_from(buf, pos)
+        pos += state.size
+        arcs.append(np.frombuffer(buf, dtype=ARC_DTYPE, count=n, offset=pos))
+        pos += n * ARC_DTYPE.itemsize
+        offsets[s + 1] = offsets[s] + n
+    arcs = (np.concatenate(arcs) if len(arcs) > 0
+            else np.zeros(0, dtype=ARC_DTYPE))
+    return Fst(start, finals, offsets, arcs, arc_type)
+
+
+def concatenate(fsts):
+    """Concatenates the FSTs in the list 'fsts', like successive calls of
+    fstconcat: the final states of each FST get an epsilon arc, with their
+    final weight, to the start state of the next one, and are no longer
+    final."""
+    if len(fsts) == 0:
+        raise ValueError("Nothing to concatenate")
+    arc_type = fsts[0].arc_type
+    if any(fst.start == NO_STATE_ID for fst in fsts):
+        return empty_fst(arc_type)
+    bases = np.cumsum([0] + [fst.num_states() for fst in fsts])
+    finals = []
+    sources = []
+    arcs = []
+    for i, fst in enumerate(fsts):
+        if fst.arc_type != arc_type:
+            raise ValueError("Cannot concatenate FSTs with different arc "
+                             "types")
+        fst_arcs = fst.arcs.copy()
+        fst_arcs['nextstate'] += bases[i]
+        sources.append(fst.sources() + bases[i])
+        arcs.append(fst_arcs)
+        fst_finals = fst.finals.copy()
+        if i + 1 < len(fsts):
+            final_states = np.nonzero(fst_finals != WEIGHT_ZERO)[0]
+            eps_arcs = np.zeros(len(final_states), dtype=ARC_DTYPE)
+            eps_arcs['weight'] = fst_finals[final_states]
+            eps_arcs['nextstate'] = bases[i + 1] + fsts[i + 1].start
+            sources.append(final_states + bases[i])
+            arcs.append(eps_arcs)
+            fst_finals[final_states] = WEIGHT_ZERO
+        finals.append(fst_finals)
+    return _from_source_states(fsts[0].start, np.concatenate(finals),
+                               np.concatenate(sources), np.concatenate(arcs),
+                               arc_type)
+
+
+def _dfs_postorder(num_states, offsets, nextstates, roots):
+    """Returns the states reachable from 'roots' in the order in which a
+    depth-first search, following the arcs in order, finishes them, and
+    whether a cycle was found."""
+    color = np.zeros(num_states, dtype=np.int8)  # 0 new, 1 on stack, 2 done.
+    postorder = []
+    cyclic = False
+    for root in roots:
+        if color[root] != 0:
+            continue
+        color[root] = 1
+        stack = [[root, offsets[root]]]
+        while stack:
+            top = stack[-1]
+            s, a = top
+            if a < offsets[s + 1]:
+                top[1] = a + 1
+                t = nextstates[a]
+                if color[t] == 0:
+                    color[t] = 1
+                    stack.append([t, offsets[t]])
+                elif color[t] == 1:
+                    cyclic = True
+                continue
+            stack.pop()
+            color[s] = 2
+            postorder.append(s)
+    return postorder, cyclic
+
+
+class _Adder(object):
+    """Sums weights like OpenFst's Adder: in the log semiring the sum is kept
+    in double precision, with Kahan compensation."""
+
+    def __init__(self, arc_type, weight=WEIGHT_ZERO):
+        self.arc_type = arc_type
+        self.sum = float(weight)
+        self.compensation = 0.0
+
+    def add(self, weight):
+        weight = float(weight)
+        if self.arc_type == 'standard':
+            self.sum = min(self.sum, weight)
+        elif math.isinf(self.sum):
+            self.sum = weight
+            self.compensation = 0.0
+        elif not math.isinf(weight):
+            m = min(self.sum, weight)
+            y = (-math.log1p(math.exp(-abs(self.sum - weight)))
+                 - self.compensation)
+            t = m + y
+            self.compensation = (t - m) - y
+            self.sum = t
+        return np.float32(self.sum)
+
+
+def _epsilon_distances(fst, source, state_arcs, topo_position):
+    """Returns a dict with the shortest distances (in the semiring of 'fst')
+    from 'source' to the states reachable from it by epsilon arcs, where
+    state_arcs[s] is the list of the arcs of state s.  As in OpenFst's
+    ShortestDistance(), the states are visited in topological order and
+    contributions that change a distance by no more than DELTA are
+    ignored."""
+    distance = {source: np.float32(WEIGHT_ONE)}
+    adders = {}
+    residuals = {source: _Adder(fst.arc_type, WEIGHT_ONE)}
+    queue = [(topo_position[source], source)]
+    while queue:
+        _, u = heapq.heappop(queue)
+        r = np.float32(residuals.pop(u).sum)
+        for ilabel, olabel, weight, nextstate in state_arcs[u]:
+            if ilabel != 0 or olabel != 0:
+                continue
+            w = r + weight
+            d = distance.get(nextstate, np.float32(WEIGHT_ZERO))
+            if abs(fst.plus(d, w) - d) <= DELTA:
+                continue
+            if nextstate not in adders:
+                adders[nextstate] = _Adder(fst.arc_type)
+            distance[nextstate] = adders[nextstate].add(w)
+            if nextstate not in residuals:
+                residuals[nextstate] = _Adder(fst.arc_type)
+                heapq.heappush(queue, (topo_position[nextstate], nextstate))
+            residuals[nextstate].add(w)
+    return distance
+
+
+def rm_epsilon(fst):
+    """Removes the epsilon arcs (those with both labels 0) of 'fst', like
+    fstrmepsilon, and in the same way as OpenFst's RmEpsilon() does it in
+    place: the states are expanded in reverse topological order of the
+    epsilon arcs, so that the states reached by epsilon arcs have already
+    been expanded.  Each state gets the non-epsilon arcs and the final
+    weights of the states in its epsilon-closure (found depth-first), with
+    the weights of the epsilon paths to them; arcs with the same labels and
+    next state are combined, and the arcs end up in reverse order.  States
+    that only have epsilon arcs into them are not expanded and are removed,
+    with the other states that are no longer accessible or coaccessible."""
+    if fst.start == NO_STATE_ID:
+        return fst
+    num_states = fst.num_states()
+    arcs = fst.arcs
+    offsets = fst.offsets
+    sources = fst.sources()
+    is_eps = (arcs['ilabel'] == 0) & (arcs['olabel'] == 0)
+
+    # only the start state and the states with non-epsilon arcs into them are
+    # expanded.
+    noneps_in = np.zeros(num_states, dtype=bool)
+    noneps_in[fst.start] = True
+    noneps_in[arcs['nextstate'][~is_eps]] = True
+
+    eps_offsets = np.zeros(num_states + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources[is_eps], minlength=num_states),
+              out=eps_offsets[1:])
+    postorder, cyclic = _dfs_postorder(
+        num_states, eps_offsets, arcs['nextstate'][is_eps],
+        [fst.start] + list(range(num_states)))
+    if cyclic:
+        raise ValueError("Epsilon cycles are not supported")
+    topo_position = np.zeros(num_states, dtype=np.int64)
+    topo_position[postorder[::-1]] = np.arange(num_states)
+
+    finals = [np.float32(f) for f in fst.finals]
+    state_arcs = [[(int(i), int(o), np.float32(w), int(n))
+                   for i, o, w, n in arcs[offsets[s]:offsets[s + 1]]]
+                  for s in range(num_states)]
+    for s in postorder:
+        if not noneps_in[s]:
+            continue
+        distance = _epsilon_distances(fst, s, state_arcs, topo_position)
+        expanded = []
+        index = {}
+        final = np.float32(WEIGHT_ZERO)
+        stack = [s]
+        visited = set()
+        while stack:
+            u = stack.pop()
+            if u in visited:
+                continue
+            visited.add(u)
+            for ilabel, olabel, weight, nextstate in state_arcs[u]:
+                if ilabel == 0 and olabel == 0:
+                    if nextstate not in visited:
+                        stack.append(nextstate)
+                    continue
+                weight = distance[u] + weight
+                key = (ilabel, olabel, nextstate)
+                if key in index:
+                    arc = expanded[index[key]]
+                    expanded[index[key]] = arc[:2] + (
+                        fst.plus(arc[2], weight), arc[3])
+                else:
+                    index[key] = len(expanded)
+                    expanded.append((ilabel, olabel, weight, nextstate))
+            final = fst.plus(final, distance[u] + finals[u])
+        finals[s] = final
+        state_arcs[s] = expanded[::-1]
+    for s in range(num_states):
+        if not noneps_in[s]:
+            state_arcs[s] = []
+
+    new_sources = np.repeat(np.arange(num_states),
+                            [len(a) for a in state_arcs])
+    new_arcs = np.array([arc for a in state_arcs for arc in a],
+                        dtype=ARC_DTYPE)
+    return connect(_from_source_states(fst.start, finals, new_sources,
+                                       new_arcs, fst.arc_type))
+
+
+def _renumber(fst, states):
+    """Returns the FST with only the states in the list 'states', numbered in
+    that order, and the arcs between them."""
+    new_id = np.full(fst.num_states(), NO_STATE_ID, dtype=np.int64)
+    new_id[states] = np.arange(len(states))
+    if len(states) == 0 or new_id[fst.start] == NO_STATE_ID:
+        return empty_fst(fst.arc_type)
+    sources = new_id[fst.sources()]
+    keep = (sources != NO_STATE_ID) & (new_id[fst.arcs['nextstate']] !=
+                                       NO_STATE_ID)
+    arcs = fst.arcs[keep].copy()
+    arcs['nextstate'] = new_id[arcs['nextstate']]
+    return _from_source_states(new_id[fst.start], fst.finals[states],
+                               sources[keep], arcs, fst.arc_type)
+
+
+def connect(fst):
+    """Removes the states that are not on a path from the start state to a
+    final state, like fstconnect (but keeping the order of the states)."""
+    if fst.start == NO_STATE_ID:
+        return fst
+    num_states = fst.num_states()
+    nextstates = fst.arcs['nextstate']
+    accessible, _ = _dfs_postorder(num_states, fst.offsets, nextstates,
+                                   [fst.start])
+    # the coaccessible states are those reachable from the final states in the
+    # reversed FST.
+    order = np.argsort(nextstates, kind='mergesort')
+    reverse_offsets = np.zeros(num_states + 1, dtype=np.int64)
+    np.cumsum(np.bincount(nextstates, minlength=num_states),
+              out=reverse_offsets[1:])
+    coaccessible, _ = _dfs_postorder(
+        num_states, reverse_offsets, fst.sources()[order],
+        np.nonzero(fst.finals != WEIGHT_ZERO)[0])
+    keep = np.zeros(num_states, dtype=bool)
+    keep[accessible] = True
+    keep[np.setdiff1d(np.arange(num_states), coaccessible)] = False
+    if keep.all():
+        return fst
+    return _renumber(fst, np.nonzero(keep)[0])
+
+
+def top_sort(fst):
+    """Renumbers the states of the acyclic FST 'fst' in topological order, like
+    fsttopsort (in the reverse of the order in which a depth-first search from
+    the start state finishes them).  The states that are not accessible are
+    removed."""
+    if fst.start == NO_STATE_ID:
+        return fst
+    postorder, cyclic = _dfs_postorder(fst.num_states(), fst.offsets,
+                                       fst.arcs['nextstate'], [fst.start])
+    if cyclic:
+        raise ValueError("Cannot topologically sort a cyclic FST")
+    return _renumber(fst, postorder[::-1])
+
+
+def _properties(fst):
+    """Returns the properties of 'fst' to store in its binary file; only some
+    properties are worked out, which OpenFst allows."""
+    props = EXPANDED | MUTABLE
+    if fst.start == NO_STATE_ID:
+        return props
+    arcs = fst.arcs
+    ilabels, olabels = arcs['ilabel'], arcs['olabel']
+    props |= (ACCEPTOR if np.array_equal(ilabels, olabels) else NOT_ACCEPTOR)
+    props |= (EPSILONS if np.any((ilabels == 0) & (olabels == 0))
+              else NO_EPSILONS)
+    props |= I_EPSILONS if np.any(ilabels == 0) else NO_I_EPSILONS
+    props |= O_EPSILONS if np.any(olabels == 0) else NO_O_EPSILONS
+    weights = np.concatenate([arcs['weight'], fst.finals])
+    props |= (WEIGHTED if np.any((weights != WEIGHT_ONE) &
+                                 (weights != WEIGHT_ZERO))
+              else UNWEIGHTED)
+    if np.all(arcs['nextstate'] > fst.sources()):
+        props |= ACYCLIC | INITIAL_ACYCLIC | TOP_SORTED
+    return props
+
+
+def write_fst(fst, filename):
+    """Writes 'fst' as a vector FST in the OpenFst binary format."""
+    output = [struct.pack('<i', FST_MAGIC_NUMBER)]
+    for s in ['vector', fst.arc_type]:
+        output.append(struct.pack('<i', len(s)) + s.encode('ascii'))
+    output.append(struct.pack('<iiQqqq', FILE_VERSION, 0, _properties(fst),
+                              fst.start, fst.num_states(), len(fst.arcs)))
+    arcs = fst.arcs.astype(ARC_DTYPE).tobytes()
+    state = struct.Struct('<fq')
+    for s in range(fst.num_states()):
+        begin, end = fst.offsets[s], fst.offsets[s + 1]
+        output.append(state.pack(fst.finals[s], end - begin))
+        output.append(arcs[ARC_DTYPE.itemsize * begin:
+                           ARC_DTYPE.itemsize * end])
+    with open(filename, 'wb') as f:
+        f.write(b''.join(output))
+
+
+def concatenate_lattices(filenames):
+    """Returns the concatenation of the lattices in the files 'filenames',
+    without epsilons and topologically sorted, as
+    'fstconcat ... | fstrmepsilon | fsttopsort' would create it."""
+    return top_sort(rm_epsilon(concatenate([read_fst(f) for f in filenames])))
+
+
+def check_with_fst_tools(filenames):
+    """Returns True if concatenate_lattices(filenames) is equal (according to
+    fstequal) to the FST that fstconcat, fstrmepsilon and fsttopsort create
+    from the lattices in the files 'filenames'."""
+    tmpdir = tempfile.mkdtemp()
+    try:
+        concatenated = filenames[0]
+        for i, filename in enumerate(filenames[1:]):
+            output = os.path.join(tmpdir, "concat.{0}.fst".format(i))
+            subprocess.check_call(["fstconcat", concatenated, filename,
+                                   output])
+            concatenated = output
+        expected = os.path.join(tmpdir, "expected.fst")
+        subprocess.check_call("fstrmepsilon {0} | fsttopsort - {1}".format(
+            concatenated, expected), shell=True)
+        actual = os.path.join(tmpdir, "actual.fst")
+        write_fst(concatenate_lattices(filenames), actual)
+        return subprocess.call(["fstequal", expected, actual]) == 0
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.exit("Usage: {0} <lattice1> [<lattice2> ...]\n"
+                 "Checks that the in-memory concatenation of the lattices "
+                 "is the same as\n'fstconcat ... | fstrmepsilon | "
+                 "fsttopsort'".format(sys.argv[0]))
+    if not check_with_fst_tools(sys.argv[1:]):
+        sys.exit("{0}: the FSTs differ".format(sys.argv[0]))
+    print("{0}: the FSTs are equal".format(sys.argv[0]))
@@ -16,16 +16,19 @@ open('/export/a04/gkumar/kaldi-trunk/egs/fishcall_es/j-8/exp/tri5a/decode_test/s
 open('/export/a04/gkumar/kaldi-trunk/egs/fishcall_es/j-9/exp/tri5a/decode_test/scoring/13.tra'),
 open('/export/a04/gkumar/kaldi-trunk/egs/fishcall_es/j-10/exp/tri5a/decode_test/scoring/13.tra')]
 
+# Read the transcriptions once; if a segment appears more than once, its
+# first transcription is used
+transcriptions = {}
+for file1 in files:
+    for line in file1:
+        lineComp = line.split()
+        if lineComp[0] not in transcriptions:
+            transcriptions[lineComp[0]] = " ".join(lineComp[1:])
+    file1.close()
+
 def findTranscription(timeDetail):
-    
-    for file1 in files:
-        file1.seek(0,0)
-        for line in file1:
-            lineComp = line.split()
-            if lineComp[0] == timeDetail:
-                return " ".join(lineComp[1:])
-    # No result found
-    return -1
+    # -1 if no result found
+    return transcriptions.get(timeDetail, -1)
 
 
 wordsFile = open('exp/tri5a/graph/words.txt')
@@ -61,7 +64,7 @@ for item in fileList:
         timeInfo = line.split()
         mergedTranslation = ""
         for timeDetail in timeInfo:
-            #Locate this in ASR dev/test, this is going to be very slow
+            #Locate this in ASR dev/test
             tmp = findTranscription(timeDetail)
             if tmp != -1:
                 mergedTranslation = mergedTranslation + " " + tmp
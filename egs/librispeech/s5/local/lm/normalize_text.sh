@@ -7,10 +7,14 @@
 
 echo $@
 
+# how many books to normalize in parallel
+nj=1
+
 . ./path.sh || exit 1
+. utils/parse_options.sh || exit 1
 
 if [[ $# -ne 2 ]]; then
-  echo "Usage: $0 <input-book-dirs> <output-root>"
+  echo "Usage: $0 [--nj <n>] <input-book-dirs> <output-root>"
   exit 1
 fi
 
@@ -31,22 +35,10 @@ command -v nsw_expand 1>/dev/null 2>&1 || {
 
 mkdir -p $out_root
 
-processed=0
-for b in $(cat $in_list); do
-  id=$(basename $b)
-  echo "Start processing $id at $(date '+%T %F')"
-  in_file=$b/$id.txt
-  [[ -f "$in_file" ]] || { echo "WARNING: $in_file does not exists"; continue; }
-  out_file=$out_root/$id/$id.txt
-  mkdir -p $out_root/$id
-  $PYTHON local/lm/python/pre_filter.py $in_file /dev/stdout |\
-    $PYTHON local/lm/python/text_pre_process.py /dev/stdin /dev/stdout |\
-    nsw_expand -format opl /dev/stdin |\
-    $PYTHON local/lm/python/text_post_process.py /dev/stdin $out_file /dev/null || exit 1
-  processed=$((processed + 1))
-  echo "Processing of $id has finished at $(date '+%T %F') [$processed texts ready so far]"
-done
-
-echo "$processed texts processed OK and stored under '$out_root'"
+# The books are normalized by local/lm/python/normalize_books.py, which skips
+# the books already listed in the manifest, so rerunning this script after an
+# interruption continues from where it stopped.
+$PYTHON local/lm/python/normalize_books.py --num-jobs $nj \
+  --manifest $out_root/manifest.$(basename $in_list) $in_list $out_root || exit 1
 
 exit 0
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+# Copyright 2019 Johns Hopkins University
+# Apache 2.0
+
+# Normalizes a list of books for language modeling: runs pre_filter.py,
+# text_pre_process.py, Festival's nsw_expand and text_post_process.py on each
+# book, like the pipeline in local/lm/normalize_text.sh did, but in a single
+# process (or a pool of them, with --num-jobs), so that the regexes and nltk's
+# sentence tokenizer are loaded only once per process.
+#
+# Each normalized book is written to <out-root>/<id>/<id>.txt as soon as it is
+# ready, and its id is then appended to the manifest; books that are already in
+# the manifest are skipped, so an interrupted run can simply be restarted.
+
+from __future__ import print_function
+import argparse
+import codecs
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import pre_filter
+import text_pre_process
+import text_post_process
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Normalizes the texts of a list of books for LM training",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--num-jobs', type=int, default=1,
+                        help="Number of books to normalize in parallel")
+    parser.add_argument('--nsw-expand', default="nsw_expand -format opl",
+                        help="The command that expands the non-standard words; "
+                        "it reads from its last argument, /dev/stdin")
+    parser.add_argument('--sent-end-marker', default="DOTDOTDOT")
+    parser.add_argument('--max-sent-len', type=int, default=600,
+                        help="The maximum allowed # of words per sentence")
+    parser.add_argument('--manifest',
+                        help="The file listing the books that have been "
+                        "normalized; <out-root>/manifest by default")
+    parser.add_argument("in_list",
+                        help="File with the directories of the books, one per "
+                        "line; the text of the book <dir> is in "
+                        "<dir>/<basename of dir>.txt")
+    parser.add_argument("out_root",
+                        help="The normalized text of a book is stored in "
+                        "<out-root>/<id>/<id>.txt")
+    opts = parser.parse_args()
+    if opts.manifest is None:
+        opts.manifest = os.path.join(opts.out_root, 'manifest')
+    return opts
+
+
+def init_worker():
+    text_pre_process.get_punkt()
+
+
+def normalize_book(job):
+    """
+    Normalizes the book in directory 'book_dir' and writes it to
+    <out_root>/<id>/<id>.txt.  Returns (id, status, message), where status is
+    'ok', 'missing' (if there is no text for the book) or 'error'.
+    """
+    book_dir, out_root, opts = job
+    book_id = os.path.basename(book_dir.rstrip('/'))
+    in_file = os.path.join(book_dir, book_id + '.txt')
+    if not os.path.isfile(in_file):
+        return book_id, 'missing', "%s does not exist" % in_file
+    try:
+        with codecs.open(in_file, 'r', 'utf-8', errors='ignore') as src:
+            in_lines = [l.strip() for l in src]
+        text = '\n'.join(pre_filter.filter_lines(in_lines)) + '\n'
+        text = text_pre_process.pre_process(text, opts.sent_end_marker)
+
+        nsw = subprocess.Popen(opts.nsw_expand + " /dev/stdin", shell=True,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        opl = nsw.communicate(text.encode('ascii'))[0]
+        if nsw.returncode != 0:
+            return book_id, 'error', "'%s' exited with status %d" % (
+                opts.nsw_expand, nsw.returncode)
+        lines, _, _ = text_post_process.post_process(
+            opl.decode('ascii', 'ignore').splitlines(), opts.sent_end_marker,
+            opts.max_sent_len)
+
+        out_dir = os.path.join(out_root, book_id)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        out_file = os.path.join(out_dir, book_id + '.txt')
+        # the output is renamed into place, so that the file exists only if it
+        # is complete.
+        with open(out_file + '.tmp', 'w') as dst:
+            dst.write('\n'.join(lines) + '\n')
+        os.rename(out_file + '.tmp', out_file)
+    except Exception as e:
+        return book_id, 'error', "%s: %s" % (type(e).__name__, e)
+    return book_id, 'ok', None
+
+
+def read_manifest(manifest, out_root):
+    done = set()
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            for line in f:
+                book_id = line.strip()
+                if os.path.isfile(os.path.join(out_root, book_id,
+                                               book_id + '.txt')):
+                    done.add(book_id)
+    return done
+
+
+if __name__ == '__main__':
+    opts = parse_args()
+    if not os.path.isdir(opts.out_root):
+        os.makedirs(opts.out_root)
+
+    with open(opts.in_list) as f:
+        book_dirs = [l.strip() for l in f if len(l.strip()) > 0]
+    done = read_manifest(opts.manifest, opts.out_root)
+    jobs = [(b, opts.out_root, opts) for b in book_dirs
+            if os.path.basename(b.rstrip('/')) not in done]
+    print("%d of %d texts were already normalized according to %s" %
+          (len(book_dirs) - len(jobs), len(book_dirs), opts.manifest))
+
+    if opts.num_jobs > 1:
+        pool = multiprocessing.Pool(opts.num_jobs, initializer=init_worker)
+        results = pool.imap_unordered(normalize_book, jobs)
+    else:
+        init_worker()
+        results = map(normalize_book, jobs)
+
+    processed = 0
+    failed = 0
+    with open(opts.manifest, 'a') as manifest:
+        for book_id, status, message in results:
+            if status == 'missing':
+                print("WARNING: %s" % message)
+                continue
+            if status == 'error':
+                print("ERROR: %s was not normalized: %s" % (book_id, message))
+                failed += 1
+                continue
+            print(book_id, file=manifest)
+            manifest.flush()
+            processed += 1
+            print("Processing of %s has finished at %s [%d texts ready so far]" %
+                  (book_id, time.strftime('%T %F'), processed))
+            sys.stdout.flush()
+    if opts.num_jobs > 1:
+        pool.close()
+        pool.join()
+
+    print("%d texts processed OK and stored under '%s'" %
+          (processed, opts.out_root))
+    if failed > 0:
+        print("%d texts failed; rerun to retry them" % failed)
+        sys.exit(1)
@@ -67,12 +67,12 @@ def empty_lines(lines, index, extent):
             return False
     return True
 
-if __name__ == '__main__':
-    opts = parse_opts()
-
-    with open(opts.in_text) as in_text:
-        in_lines = [l.strip() for l in in_text.readlines()]
-
+def filter_lines(in_lines):
+    """
+    Given the lines of a text, stripped of surrounding whitespace, returns
+    them without the empty lines and the lines that are not helpful for
+    language modeling
+    """
     out_lines = list()
     for i, l in enumerate(in_lines):
         if len(l) == 0:
@@ -107,7 +107,15 @@ if __name__ == '__main__':
             l = sq_brackets[0].sub(r'\1\3', l)
 
         out_lines.append(l)
+    return out_lines
+
+if __name__ == '__main__':
+    opts = parse_opts()
+
+    with open(opts.in_text) as in_text:
+        in_lines = [l.strip() for l in in_text.readlines()]
+
+    out_lines = filter_lines(in_lines)
 
     with open(opts.out_text, 'w') as out_text:
         out_text.write('\n'.join(out_lines) + '\n')
-        
\ No newline at end of file
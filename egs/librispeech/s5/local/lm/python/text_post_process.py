@@ -30,49 +30,70 @@ def parse_args():
     return parser.parse_args()
 
 
+class LongSentenceError(Exception):
+    pass
+
+_word = re.compile("^[A-Z]+\'?[A-Z\']*$")
+
+def post_process(opl_lines, sent_end_marker, max_sent_len, abort_long_sent=False):
+    """
+    Post-processes the lines of an .opl file, as described at the top.
+    Returns a tuple (lines, sent_bounds, corrections): the sentences, the
+    list of the tokens after which there are sentence breaks, and the
+    number of corrected tokens.  Raises LongSentenceError if a sentence is
+    longer than 'max_sent_len' and 'abort_long_sent' is True.
+    """
+    corrections = 0
+    lines = list()
+    current_line = list()
+    sent_bounds = list()
+    n_tokens = 0
+    for opl_line in opl_lines:
+        start_scan = 3
+        opl_line = opl_line.upper()
+        opl_tokens = opl_line.split()
+        if opl_tokens[0] == sent_end_marker.upper():
+            sent_bounds.append(n_tokens - 1)
+            if len(current_line) > max_sent_len:
+                if abort_long_sent:
+                    raise LongSentenceError()
+                else:
+                    sys.stderr.write('WARNING: Too long sentence - splitting ...\n')
+                    sent_start = 0
+                    while sent_start < len(current_line):
+                        lines.append(' '.join(current_line[sent_start:\
+                                              sent_start + max_sent_len]))
+                        sent_start += max_sent_len
+            else:
+                lines.append(' '.join(current_line))
+            current_line = list()
+            continue
+        if len(opl_tokens) >= 4 and opl_tokens[3] == 'SUNDAY' and opl_tokens[1] == 'EXPN':
+            corrections += 1
+            n_tokens += 1
+            start_scan = 4
+            current_line.append('SUN')
+        for i in range(start_scan, len(opl_tokens)):
+            m = _word.match(opl_tokens[i])
+            if m is not None:
+                n_tokens += 1
+                current_line.append(opl_tokens[i])
+            #else:
+            #    sys.stderr.write('rejected: %s\n' % opl_tokens[i])
+    return lines, sent_bounds, corrections
+
+
 if __name__ == '__main__':
     opts = parse_args()
     with open(opts.in_text) as src, \
          open(opts.out_text, 'w') as dst, \
          open(opts.sent_bounds, 'w') as bounds:
-        corrections = 0
-        lines = list()
-        current_line = list()
-        sent_bounds = list()
-        n_tokens = 0
-        for opl_line in src:
-            start_scan = 3
-            opl_line = opl_line.upper()
-            opl_tokens = opl_line.split()
-            if opl_tokens[0] == opts.sent_end_marker.upper():
-                sent_bounds.append(n_tokens - 1)
-                if len(current_line) > opts.max_sent_len:
-                    if opts.abort_long_sent:
-                        sys.stderr.write('ERROR: Too long sentence - aborting!\n')
-                        sys.exit(1)
-                    else:
-                        sys.stderr.write('WARNING: Too long sentence - splitting ...\n')
-                        sent_start = 0
-                        while sent_start < len(current_line):
-                            lines.append(' '.join(current_line[sent_start:\
-                                                  sent_start + opts.max_sent_len]))
-                            sent_start += opts.max_sent_len
-                else:
-                    lines.append(' '.join(current_line))
-                current_line = list()
-                continue
-            if len(opl_tokens) >= 4 and opl_tokens[3] == 'SUNDAY' and opl_tokens[1] == 'EXPN':
-                corrections += 1
-                n_tokens += 1
-                start_scan = 4
-                current_line.append('SUN')
-            for i in range(start_scan, len(opl_tokens)):
-                m = re.match("^[A-Z]+\'?[A-Z\']*$", opl_tokens[i])
-                if m is not None:
-                    n_tokens += 1
-                    current_line.append(opl_tokens[i])
-                #else:
-                #    sys.stderr.write('rejected: %s\n' % opl_tokens[i])
+        try:
+            lines, sent_bounds, corrections = post_process(
+                src, opts.sent_end_marker, opts.max_sent_len, opts.abort_long_sent)
+        except LongSentenceError:
+            sys.stderr.write('ERROR: Too long sentence - aborting!\n')
+            sys.exit(1)
         sys.stderr.write('Corrected tokens: %d\n' % corrections)
         dst.write('\n'.join(lines) + '\n')
         bounds.write(','.join([str(t) for t in sent_bounds]))
@@ -38,20 +38,24 @@ def decode(roman):
         result += -rd if rd < rd1 else rd
     return result + _rdecode[roman[-1]]
 
+_line_break = re.compile('\r?\n')
+_chapter_roman = re.compile('^(\s*C((hapter)|(HAPTER))\s+)(([IVX]+)|([ivx]+))(.*)')
+_line_roman = re.compile('^(\s*)(([IVX]+)|([ivx]+))([\s\.]+[A-Z].*)')
+
 def convert_roman(text):
     """
     Uses heuristics to decide whether to convert a string that looks like a
     roman numeral to decimal number.
     """
-    lines = re.split('\r?\n', text)
+    lines = _line_break.split(text)
     new_lines = list()
     for i, l in enumerate(lines):
-        m = re.match('^(\s*C((hapter)|(HAPTER))\s+)(([IVX]+)|([ivx]+))(.*)', l)
+        m = _chapter_roman.match(l)
         if m is not None:
             new_line = "%s%s%s" % (m.group(1), decode(m.group(5).upper()), m.group(8))
             new_lines.append(new_line)
             continue
-        m = re.match('^(\s*)(([IVX]+)|([ivx]+))([\s\.]+[A-Z].*)', l)
+        m = _line_roman.match(l)
         if m is not None:
             new_line = "%s%s%s" % (m.group(1), decode(m.group(2).upper()), m.group(5))
             new_lines.append(new_line)
@@ -59,10 +63,20 @@ def convert_roman(text):
         new_lines.append(l)
     return '\n'.join(new_lines)
 
+_punkt = None
+
+def get_punkt():
+    """
+    Returns nltk's sentence tokenizer, which is loaded only once per process
+    """
+    global _punkt
+    if _punkt is None:
+        _punkt = nltk.data.load('tokenizers/punkt/english.pickle')
+    return _punkt
+
 def segment_sentences(text, sent_marker):
-    punkt = nltk.data.load('tokenizers/punkt/english.pickle')
-    sents = punkt.tokenize(text)
-    line_sents = [re.sub('\r?\n', ' ', s) for s in sents]
+    sents = get_punkt().tokenize(text)
+    line_sents = [_line_break.sub(' ', s) for s in sents]
     line_sep = ' %s \n' % sent_marker
     return (line_sep.join(line_sents) + sent_marker)
 
@@ -84,18 +98,24 @@ def pre_segment(text):
             out_text.append(l)
     return '\n'.join(out_text)
 
+def pre_process(text_in, sent_end_marker, out_encoding="ascii"):
+    """
+    Pre-processes the (unicode) text of a book as described at the top
+    """
+    text = unicodedata.normalize(
+                'NFKD', text_in).encode(out_encoding, 'ignore').decode(out_encoding)
+    text = convert_roman(text)
+    text = pre_segment(text)
+    return segment_sentences(text, sent_end_marker)
+
 if __name__ == '__main__':
     opts = parse_args()
     with codecs.open(opts.in_text, 'r', opts.in_encoding, errors='ignore') as src:
         text_in = src.read()
 
-    text = unicodedata.normalize(
-                'NFKD', text_in).encode(opts.out_encoding, 'ignore')
-    text = convert_roman(text)
-    text = pre_segment(text)
-    text = segment_sentences(text, opts.sent_end_marker)
+    text = pre_process(text_in, opts.sent_end_marker, opts.out_encoding)
 
-    with open(opts.out_text, 'w') as dst:
+    with codecs.open(opts.out_text, 'w', opts.out_encoding) as dst:
         dst.write(text)
 
 
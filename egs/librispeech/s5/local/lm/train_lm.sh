@@ -23,6 +23,9 @@ prune_thresh_medium=0.0000001
 # how many text normalization jobs to run in parallel
 normjobs=2
 
+# how many books each text normalization job normalizes in parallel
+normthreads=1
+
 . utils/parse_options.sh || exit 1
 
 if [[ $# -ne 4 ]]; then
@@ -60,8 +63,8 @@ fi
 if [ "$stage" -le 2 ]; then
   echo "Performing text normalization ($normjobs jobs) - check $tmp_dir/txt_norm.JOB.log ..."
   mkdir -p $norm_dir
-  $mkgraph_cmd JOB=1:$normjobs $tmp_dir/txt_norm.JOB.log \
-    local/lm/normalize_text.sh $split_prefix-JOB $norm_dir || exit 1
+  $mkgraph_cmd --num-threads $normthreads JOB=1:$normjobs $tmp_dir/txt_norm.JOB.log \
+    local/lm/normalize_text.sh --nj $normthreads $split_prefix-JOB $norm_dir || exit 1
   echo "Finished OK"
 fi
 
@@ -18,14 +18,14 @@ from __future__ import division
 import sys
 import argparse
 import os
-import xml.dom.minidom as minidom
+import multiprocessing
+import xml.etree.ElementTree as ET
 import numpy as np
 from math import atan2, cos, sin, pi, degrees, sqrt
 from collections import namedtuple
 import random
 from scipy.spatial import ConvexHull
 from PIL import Image
-from scipy.misc import toimage
 parser = argparse.ArgumentParser(description="Creates line images from page image",
                                  epilog="E.g.  " + sys.argv[0] + "  data/LDC2012T15"
                                              " data/LDC2013T09 data/LDC2013T15 data/madcat.train.raw.lineid "
@@ -55,6 +55,8 @@ parser.add_argument("--subset", type=lambda x: (str(x).lower()=='true'), default
                    help="only processes subset of data based on writing condition")
 parser.add_argument("--augment", type=lambda x: (str(x).lower()=='true'), default=False,
                    help="performs image augmentation")
+parser.add_argument('--num-jobs', type=int, default=1,
+                    help='number of page images to process in parallel')
 args = parser.parse_args()
 
 """
@@ -80,18 +82,6 @@ bounding_box_tuple = namedtuple('bounding_box_tuple', 'area '
                          )
 
 
-def unit_vector(pt0, pt1):
-    """ Given two points pt0 and pt1, return a unit vector that
-        points in the direction of pt0 to pt1.
-    Returns
-    -------
-    (float, float): unit vector
-    """
-    dis_0_to_1 = sqrt((pt0[0] - pt1[0])**2 + (pt0[1] - pt1[1])**2)
-    return (pt1[0] - pt0[0])/ dis_0_to_1, \
-           (pt1[1] - pt0[1])/ dis_0_to_1
-
-
 def orthogonal_vector(vector):
     """ Given a vector, returns a orthogonal/perpendicular vector of equal length.
     Returns
@@ -101,15 +91,15 @@ def orthogonal_vector(vector):
     return -1 * vector[1], vector[0]
 
 
-def bounding_area(index, hull):
-    """ Given index location in an array and convex hull, it gets two points
-        hull[index] and hull[index+1]. From these two points, it returns a named
-        tuple that mainly contains area of the box that bounds the hull. This
-        bounding box orintation is same as the orientation of the lines formed
-        by the point hull[index] and hull[index+1].
+def bounding_areas(hull):
+    """ Given the points of a convex hull in order, returns the boxes that
+        bound the hull, one for each edge of the hull, i.e. for the line formed
+        by the points hull[index] and hull[index+1] (and hull[-1] and hull[0]).
+        The orientation of each bounding box is same as that of its edge.
+        This is done for all the edges at once (rotating calipers).
     Returns
     -------
-    a named tuple that contains:
+    a dict of arrays, with one element (or row) per edge, that contains:
     area: area of the rectangle
     length_parallel: length of the side that is parallel to unit_vector
     length_orthogonal: length of the side that is orthogonal to unit_vector
@@ -117,21 +107,25 @@ def bounding_area(index, hull):
     unit_vector: direction of the length_parallel side.
     (it's orthogonal vector can be found with the orthogonal_vector function)
     """
-    unit_vector_p = unit_vector(hull[index], hull[index+1])
-    unit_vector_o = orthogonal_vector(unit_vector_p)
+    hull = np.asarray(hull, dtype=np.float64)
+    edges = np.roll(hull, -1, axis=0) - hull
+    dis_0_to_1 = np.sqrt(edges[:, 0]**2 + edges[:, 1]**2)
+    unit_vector_p = edges / dis_0_to_1[:, np.newaxis]
+    unit_vector_o = np.stack(orthogonal_vector(unit_vector_p.T), axis=1)
 
-    dis_p = tuple(np.dot(unit_vector_p, pt) for pt in hull)
-    dis_o = tuple(np.dot(unit_vector_o, pt) for pt in hull)
+    # dis_p[i, j] is the projection of the point hull[j] on the edge i
+    dis_p = np.dot(unit_vector_p, hull.T)
+    dis_o = np.dot(unit_vector_o, hull.T)
 
-    min_p = min(dis_p)
-    min_o = min(dis_o)
-    len_p = max(dis_p) - min_p
-    len_o = max(dis_o) - min_o
+    min_p = dis_p.min(axis=1)
+    min_o = dis_o.min(axis=1)
+    len_p = dis_p.max(axis=1) - min_p
+    len_o = dis_o.max(axis=1) - min_o
 
     return {'area': len_p * len_o,
             'length_parallel': len_p,
             'length_orthogonal': len_o,
-            'rectangle_center': (min_p + float(len_p)/ 2, min_o + float(len_o)/ 2),
+            'rectangle_center': np.stack((min_p + len_p/2, min_o + len_o/2), axis=1),
             'unit_vector': unit_vector_p,
             }
 
@@ -207,14 +201,16 @@ def minimum_bounding_box(points):
     if len(points) <= 2: raise ValueError('More than two points required.')
 
     hull_ordered = [points[index] for index in ConvexHull(points).vertices]
-    hull_ordered.append(hull_ordered[0])
-    hull_ordered = tuple(hull_ordered)
 
-    min_rectangle = bounding_area(0, hull_ordered)
-    for i in range(1, len(hull_ordered)-1):
-        rectangle = bounding_area(i, hull_ordered)
-        if rectangle['area'] < min_rectangle['area']:
-            min_rectangle = rectangle
+    rectangles = bounding_areas(hull_ordered)
+    # the first of the rectangles with the smallest area
+    index = np.argmin(rectangles['area'])
+    min_rectangle = {'area': float(rectangles['area'][index]),
+                     'length_parallel': float(rectangles['length_parallel'][index]),
+                     'length_orthogonal': float(rectangles['length_orthogonal'][index]),
+                     'rectangle_center': tuple(rectangles['rectangle_center'][index].tolist()),
+                     'unit_vector': tuple(rectangles['unit_vector'][index].tolist()),
+                     }
 
     min_rectangle['unit_vector_angle'] = atan2(min_rectangle['unit_vector'][1], min_rectangle['unit_vector'][0])
     min_rectangle['rectangle_center'] = to_xy_coordinates(min_rectangle['unit_vector_angle'], min_rectangle['rectangle_center'])
@@ -303,18 +299,34 @@ def rotated_points(bounding_box, center):
     return x_dash_1, y_dash_1, x_dash_2, y_dash_2, x_dash_3, y_dash_3, x_dash_4, y_dash_4
 
 
-def pad_image(image):
-    """ Given an image, returns a padded image around the border.
-        This routine save the code from crashing if bounding boxes that are
-        slightly outside the page boundary.
+def crop_padded_image(image, box):
+    """ Given a page image and a box, returns the region of the page image
+        padded around the border (by args.padding // 2 on the top and left
+        side and the rest on the bottom and right side, in white) that is in the
+        box. Padding saves the code from crashing if bounding boxes that are
+        slightly outside the page boundary. Only the region is padded, so that
+        many lines can be cropped from one decoded page image without making
+        a padded copy of the whole page. Like Image.crop(), the parts of the box
+        outside the padded page image are black.
     Returns
     -------
-    image: page image
+    image: region of the padded page image
     """
     offset = int(args.padding // 2)
-    padded_image = Image.new('RGB', (image.size[0] + int(args.padding), image.size[1] + int(args.padding)), "white")
-    padded_image.paste(im = image, box = (offset, offset))
-    return padded_image
+    padded_width = image.size[0] + int(args.padding)
+    padded_height = image.size[1] + int(args.padding)
+    region = Image.new('RGB', (box[2] - box[0], box[3] - box[1]))
+    padded_box = (max(box[0], 0), max(box[1], 0),
+                  min(box[2], padded_width), min(box[3], padded_height))
+    if padded_box[0] < padded_box[2] and padded_box[1] < padded_box[3]:
+        region.paste("white", (padded_box[0] - box[0], padded_box[1] - box[1],
+                               padded_box[2] - box[0], padded_box[3] - box[1]))
+    page_box = (max(box[0] - offset, 0), max(box[1] - offset, 0),
+                min(box[2] - offset, image.size[0]), min(box[3] - offset, image.size[1]))
+    if page_box[0] < page_box[2] and page_box[1] < page_box[3]:
+        region.paste(im = image.crop(page_box),
+                     box = (page_box[0] + offset - box[0], page_box[1] + offset - box[1]))
+    return region
 
 
 def update_minimum_bounding_box_input(bounding_box_input):
@@ -339,35 +351,74 @@ def dilate_polygon(points, amount_increase):
     """ Increases size of polygon given as a list of tuples.
         Assumes points in polygon are given in CCW
     """
-    expanded_points = []
-    for index, point in enumerate(points):
-        prev_point = points[(index - 1) % len(points)]
-        next_point = points[(index + 1) % len(points)]
-        prev_edge = np.subtract(point, prev_point)
-        next_edge = np.subtract(next_point, point)
+    points = np.asarray(points)
+    prev_edge = points - np.roll(points, 1, axis=0)
+    next_edge = np.roll(points, -1, axis=0) - points
 
-        prev_normal = ((1 * prev_edge[1]), (-1 * prev_edge[0]))
-        prev_normal = np.divide(prev_normal, np.linalg.norm(prev_normal))
-        next_normal = ((1 * next_edge[1]), (-1 * next_edge[0]))
-        next_normal = np.divide(next_normal, np.linalg.norm(next_normal))
+    prev_normal = np.stack((prev_edge[:, 1], -1 * prev_edge[:, 0]), axis=1)
+    prev_normal = prev_normal / np.linalg.norm(prev_normal, axis=1)[:, np.newaxis]
+    next_normal = np.stack((next_edge[:, 1], -1 * next_edge[:, 0]), axis=1)
+    next_normal = next_normal / np.linalg.norm(next_normal, axis=1)[:, np.newaxis]
 
-        bisect = np.add(prev_normal, next_normal)
-        bisect = np.divide(bisect, np.linalg.norm(bisect))
+    bisect = prev_normal + next_normal
+    bisect = bisect / np.linalg.norm(bisect, axis=1)[:, np.newaxis]
 
-        cos_theta = np.dot(next_normal, bisect)
-        hyp = float(amount_increase)/ cos_theta
+    cos_theta = np.sum(next_normal * bisect, axis=1)
+    hyp = float(amount_increase)/ cos_theta
 
-        new_point = np.around(point + hyp * bisect)
-        new_point = new_point.astype(int)
-        new_point = new_point.tolist()
-        new_point = tuple(new_point)
-        expanded_points.append(new_point)
-    return expanded_points
+    expanded_points = np.around(points + hyp[:, np.newaxis] * bisect).astype(int)
+    return [tuple(point) for point in expanded_points.tolist()]
 
 
-def set_line_image_data(image, line_id, image_file_name, image_fh):
+def get_line_image(image, bounding_box):
+    """ Given a page image and the bounding box of a line in the padded
+        page image, crops the line image and rotates it by the smallest angle
+        of the bounding box, so that it is horizontal.
+    Returns
+    -------
+    image: line image
+    """
+    (x1, y1), (x2, y2), (x3, y3), (x4, y4) = bounding_box.corner_points
+    min_x, min_y = int(min(x1, x2, x3, x4)), int(min(y1, y2, y3, y4))
+    max_x, max_y = int(max(x1, x2, x3, x4)), int(max(y1, y2, y3, y4))
+    box = (min_x, min_y, max_x, max_y)
+    region_initial = crop_padded_image(image, box)
+    rot_points = []
+    p1, p2 = (x1 - min_x, y1 - min_y), (x2 - min_x, y2 - min_y)
+    p3, p4 = (x3 - min_x, y3 - min_y), (x4 - min_x, y4 - min_y)
+    rot_points.append(p1)
+    rot_points.append(p2)
+    rot_points.append(p3)
+    rot_points.append(p4)
+
+    cropped_bounding_box = bounding_box_tuple(bounding_box.area,
+            bounding_box.length_parallel,
+            bounding_box.length_orthogonal,
+            bounding_box.length_orthogonal,
+            bounding_box.unit_vector,
+            bounding_box.unit_vector_angle,
+            set(rot_points)
+        )
+
+    rotation_angle_in_rad = get_smaller_angle(cropped_bounding_box)
+    img2 = region_initial.rotate(degrees(rotation_angle_in_rad), resample = Image.BICUBIC)
+    x_dash_1, y_dash_1, x_dash_2, y_dash_2, x_dash_3, y_dash_3, x_dash_4, y_dash_4 = rotated_points(
+        cropped_bounding_box, get_center(region_initial))
+
+    min_x = int(min(x_dash_1, x_dash_2, x_dash_3, x_dash_4))
+    min_y = int(min(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
+    max_x = int(max(x_dash_1, x_dash_2, x_dash_3, x_dash_4))
+    max_y = int(max(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
+    box = (min_x, min_y, max_x, max_y)
+    return img2.crop(box)
+
+
+def set_line_image_data(image, line_id, image_file_name):
     """ Given an image, saves a flipped line image. Line image file name
         is formed by appending the line id at the end page image name.
+    Returns
+    -------
+    (string): path of the line image.
     """
 
     base_name = os.path.splitext(os.path.basename(image_file_name))[0]
@@ -375,33 +426,57 @@ def set_line_image_data(image, line_id, image_file_name, image_fh):
     line_image_file_name = base_name + line_id + '.png'
     image_path = os.path.join(args.out_dir, line_image_file_name)
     imgray = image.convert('L')
-    imgray_rev_arr = np.fliplr(imgray)
-    imgray_rev = toimage(imgray_rev_arr)
+    imgray_rev = imgray.transpose(Image.FLIP_LEFT_RIGHT)
     imgray_rev.save(image_path)
-    image_fh.write(image_path + '\n')
+    return image_path
+
+
+def get_local_name(node):
+    """ Given an xml element, returns its tag name without the namespace.
+    """
+    return node.tag.rsplit('}', 1)[-1]
 
 
-def get_line_images_from_page_image(image_file_name, madcat_file_path, image_fh):
+def get_zones(madcat_file_path):
+    """ Given a madcat xml file, yields the id and the corner points of the
+        word bounding boxes (token-image) of each zone (line), in order. The file
+        is parsed incrementally and the elements of each zone are freed after it
+        is processed, so that the whole document is never held in memory.
+    Returns
+    -------
+    (string, [(int, int)]): id of the zone and the points of its words.
+    """
+    for event, node in ET.iterparse(madcat_file_path):
+        if get_local_name(node) != 'zone':
+            continue
+        minimum_bounding_box_input = []
+        for token_node in node.iter():
+            if get_local_name(token_node) != 'token-image':
+                continue
+            for word_node in token_node.iter():
+                if get_local_name(word_node) == 'point':
+                    word_coordinate = (int(word_node.get('x')), int(word_node.get('y')))
+                    minimum_bounding_box_input.append(word_coordinate)
+        yield node.get('id', ''), minimum_bounding_box_input
+        node.clear()
+
+
+def get_line_images_from_page_image(image_file_name, madcat_file_path):
     """ Given a page image, extracts the line images from it.
     Input
     -----
     image_file_name (string): complete path and name of the page image.
     madcat_file_path (string): complete path and name of the madcat xml file
                                   corresponding to the page image.
+    Returns
+    -------
+    [string]: paths of the line images.
     """
-    im_wo_pad = Image.open(image_file_name)
-    im = pad_image(im_wo_pad)
-    doc = minidom.parse(madcat_file_path)
-    zone = doc.getElementsByTagName('zone')
-    for node in zone:
-        id = node.getAttribute('id')
-        token_image = node.getElementsByTagName('token-image')
-        minimum_bounding_box_input = []
-        for token_node in token_image:
-            word_point = token_node.getElementsByTagName('point')
-            for word_node in word_point:
-                word_coordinate = (int(word_node.getAttribute('x')), int(word_node.getAttribute('y')))
-                minimum_bounding_box_input.append(word_coordinate)
+    # The page image is decoded once, and each line is cropped from it.
+    im = Image.open(image_file_name)
+    im.load()
+    image_paths = []
+    for id, minimum_bounding_box_input in get_zones(madcat_file_path):
         updated_mbb_input = update_minimum_bounding_box_input(minimum_bounding_box_input)
         points_ordered = [updated_mbb_input[index] for index in ConvexHull(updated_mbb_input).vertices]
         if args.augment:
@@ -409,77 +484,25 @@ def get_line_images_from_page_image(image_file_name, madcat_file_path, image_fh)
                 additional_pixel = random.randint(1, args.pixel_scaling)
                 mar = dilate_polygon(points_ordered, (i-1)*args.pixel_scaling + additional_pixel + 1)
                 bounding_box = minimum_bounding_box(mar)
-                (x1, y1), (x2, y2), (x3, y3), (x4, y4) = bounding_box.corner_points
-                min_x, min_y = int(min(x1, x2, x3, x4)), int(min(y1, y2, y3, y4))
-                max_x, max_y = int(max(x1, x2, x3, x4)), int(max(y1, y2, y3, y4))
-                box = (min_x, min_y, max_x, max_y)
-                region_initial = im.crop(box)
-                rot_points = []
-                p1, p2 = (x1 - min_x, y1 - min_y), (x2 - min_x, y2 - min_y)
-                p3, p4 = (x3 - min_x, y3 - min_y), (x4 - min_x, y4 - min_y)
-                rot_points.append(p1)
-                rot_points.append(p2)
-                rot_points.append(p3)
-                rot_points.append(p4)
-
-                cropped_bounding_box = bounding_box_tuple(bounding_box.area,
-                        bounding_box.length_parallel,
-                        bounding_box.length_orthogonal,
-                        bounding_box.length_orthogonal,
-                        bounding_box.unit_vector,
-                        bounding_box.unit_vector_angle,
-                        set(rot_points)
-                    )
-
-                rotation_angle_in_rad = get_smaller_angle(cropped_bounding_box)
-                img2 = region_initial.rotate(degrees(rotation_angle_in_rad), resample = Image.BICUBIC)
-                x_dash_1, y_dash_1, x_dash_2, y_dash_2, x_dash_3, y_dash_3, x_dash_4, y_dash_4 = rotated_points(
-                    cropped_bounding_box, get_center(region_initial))
-
-                min_x = int(min(x_dash_1, x_dash_2, x_dash_3, x_dash_4))
-                min_y = int(min(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
-                max_x = int(max(x_dash_1, x_dash_2, x_dash_3, x_dash_4))
-                max_y = int(max(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
-                box = (min_x, min_y, max_x, max_y)
-                region_final = img2.crop(box)
+                region_final = get_line_image(im, bounding_box)
                 line_id = id + '_scale' + str(i)
-                set_line_image_data(region_final, line_id, image_file_name, image_fh)
+                image_paths.append(set_line_image_data(region_final, line_id, image_file_name))
         else:
             bounding_box = minimum_bounding_box(points_ordered)
-            (x1, y1), (x2, y2), (x3, y3), (x4, y4) = bounding_box.corner_points
-            min_x, min_y = int(min(x1, x2, x3, x4)), int(min(y1, y2, y3, y4))
-            max_x, max_y = int(max(x1, x2, x3, x4)), int(max(y1, y2, y3, y4))
-            box = (min_x, min_y, max_x, max_y)
-            region_initial = im.crop(box)
-            rot_points = []
-            p1, p2 = (x1 - min_x, y1 - min_y), (x2 - min_x, y2 - min_y)
-            p3, p4 = (x3 - min_x, y3 - min_y), (x4 - min_x, y4 - min_y)
-            rot_points.append(p1)
-            rot_points.append(p2)
-            rot_points.append(p3)
-            rot_points.append(p4)
-
-            cropped_bounding_box = bounding_box_tuple(bounding_box.area,
-                    bounding_box.length_parallel,
-                    bounding_box.length_orthogonal,
-                    bounding_box.length_orthogonal,
-                    bounding_box.unit_vector,
-                    bounding_box.unit_vector_angle,
-                    set(rot_points)
-                )
-
-            rotation_angle_in_rad = get_smaller_angle(cropped_bounding_box)
-            img2 = region_initial.rotate(degrees(rotation_angle_in_rad), resample = Image.BICUBIC)
-            x_dash_1, y_dash_1, x_dash_2, y_dash_2, x_dash_3, y_dash_3, x_dash_4, y_dash_4 = rotated_points(
-                cropped_bounding_box, get_center(region_initial))
-
-            min_x = int(min(x_dash_1, x_dash_2, x_dash_3, x_dash_4))
-            min_y = int(min(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
-            max_x = int(max(x_dash_1, x_dash_2, x_dash_3, x_dash_4))
-            max_y = int(max(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
-            box = (min_x, min_y, max_x, max_y)
-            region_final = img2.crop(box)
-            set_line_image_data(region_final, id, image_file_name, image_fh)
+            region_final = get_line_image(im, bounding_box)
+            image_paths.append(set_line_image_data(region_final, id, image_file_name))
+    return image_paths
+
+
+def process_page(page):
+    """ Given the pair (image_file_name, madcat_file_path) of a page, extracts
+        the line images from it. This is run by the worker processes.
+    Returns
+    -------
+    [string]: paths of the line images.
+    """
+    image_file_name, madcat_file_path = page
+    return get_line_images_from_page_image(image_file_name, madcat_file_path)
 
 
 def check_file_location(base_name, wc_dict1, wc_dict2, wc_dict3):
@@ -554,6 +577,7 @@ def main():
 
     splits_handle = open(args.data_splits, 'r')
     splits_data = splits_handle.read().strip().split('\n')
+    pages = []
     prev_base_name = ''
     for line in splits_data:
         base_name = os.path.splitext(os.path.splitext(line.split(' ')[0])[0])[0]
@@ -562,9 +586,23 @@ def main():
             madcat_file_path, image_file_path, wc_dict = check_file_location(base_name, wc_dict1, wc_dict2, wc_dict3)
             if wc_dict is None or not check_writing_condition(wc_dict, base_name):
                 continue
-            get_line_images_from_page_image(image_file_path, madcat_file_path, image_fh)
+            pages.append((image_file_path, madcat_file_path))
+
+    # The pages are processed in parallel, and the paths of the line images
+    # are written in the order of the pages. The workers are seeded
+    # differently for the augmentation.
+    def write_image_paths(image_paths_of_pages):
+        for image_paths in image_paths_of_pages:
+            for image_path in image_paths:
+                image_fh.write(image_path + '\n')
+
+    if args.num_jobs > 1:
+        with multiprocessing.Pool(args.num_jobs, initializer=random.seed) as pool:
+            write_image_paths(pool.imap(process_page, pages))
+    else:
+        write_image_paths(map(process_page, pages))
+    image_fh.close()
 
 
 if __name__ == '__main__':
       main()
-
@@ -18,14 +18,14 @@
 import sys
 import argparse
 import os
-import xml.dom.minidom as minidom
+import multiprocessing
+import xml.etree.ElementTree as ET
 import numpy as np
 from math import atan2, cos, sin, pi, degrees, sqrt
 from collections import namedtuple
 
 from scipy.spatial import ConvexHull
 from PIL import Image
-from scipy.misc import toimage
 
 parser = argparse.ArgumentParser(description="Creates line images from page image",
                                  epilog="E.g.  " + sys.argv[0] + "  data/LDC2012T15"
@@ -40,6 +40,8 @@ parser.add_argument('out_dir', type=str,
                     help='directory location to write output files')
 parser.add_argument('--padding', type=int, default=400,
                     help='padding across horizontal/verticle direction')
+parser.add_argument('--num-jobs', type=int, default=1,
+                    help='number of page images to process in parallel')
 args = parser.parse_args()
 
 """
@@ -65,21 +67,6 @@ bounding_box_tuple = namedtuple('bounding_box_tuple', 'area '
                                         'corner_points'
                          )
 
-def unit_vector(pt0, pt1):
-    """ Returns an unit vector that points in the direction of pt0 to pt1.
-    Args:
-        pt0 (float, float): Point 0. Eg. (1.0, 2.0).
-        pt1 (float, float): Point 1. Eg. (3.0, 8.0).
-
-    Returns:
-        (float, float): unit vector that points in the direction of pt0 to pt1.
-        Eg.  0.31622776601683794, 0.9486832980505138
-    """
-    dis_0_to_1 = sqrt((pt0[0] - pt1[0])**2 + (pt0[1] - pt1[1])**2)
-    return (pt1[0] - pt0[0])/ dis_0_to_1, \
-           (pt1[1] - pt0[1])/ dis_0_to_1
-
-
 def orthogonal_vector(vector):
     """ From vector returns a orthogonal/perpendicular vector of equal length.
     Args:
@@ -92,16 +79,17 @@ def orthogonal_vector(vector):
     return -1 * vector[1], vector[0]
 
 
-def bounding_area(index, hull):
-    """ Returns a named tuple that mainly contains area of the box that bounds
-        the hull. This bounding box orintation is same as the orientation of the 
-        lines formed by the point hull[index] and hull[index+1].
+def bounding_areas(hull):
+    """ Returns the boxes that bound the hull, one for each edge of the hull,
+        i.e. for the line formed by the points hull[index] and hull[index+1]
+        (and hull[-1] and hull[0]). The orientation of each bounding box is
+        same as that of its edge. This is done for all the edges at once
+        (rotating calipers).
     Args:
-        index (int): Eg. 1.
-        hull [(float, float)]: list or tuple of point cloud
+        hull [(float, float)]: list or tuple of the points of a convex hull, in order.
         Eg. ((1.0, -1.0), (2.0, -3.0), (3.0, 4.0), (5.0, 6.0)).
 
-    Returns: a named tuple that contains:
+    Returns: a dict of arrays, with one element (or row) per edge, that contains:
              area: area of the rectangle
              length_parallel: length of the side that is parallel to unit_vector
              length_orthogonal: length of the side that is orthogonal to unit_vector
@@ -110,21 +98,25 @@ def bounding_area(index, hull):
              unit_vector: direction of the length_parallel side.
              (it's orthogonal vector can be found with the orthogonal_vector function
     """
-    unit_vector_p = unit_vector(hull[index], hull[index+1])
-    unit_vector_o = orthogonal_vector(unit_vector_p)
+    hull = np.asarray(hull, dtype=np.float64)
+    edges = np.roll(hull, -1, axis=0) - hull
+    dis_0_to_1 = np.sqrt(edges[:, 0]**2 + edges[:, 1]**2)
+    unit_vector_p = edges / dis_0_to_1[:, np.newaxis]
+    unit_vector_o = np.stack(orthogonal_vector(unit_vector_p.T), axis=1)
 
-    dis_p = tuple(np.dot(unit_vector_p, pt) for pt in hull)
-    dis_o = tuple(np.dot(unit_vector_o, pt) for pt in hull)
+    # dis_p[i, j] is the projection of the point hull[j] on the edge i
+    dis_p = np.dot(unit_vector_p, hull.T)
+    dis_o = np.dot(unit_vector_o, hull.T)
 
-    min_p = min(dis_p)
-    min_o = min(dis_o)
-    len_p = max(dis_p) - min_p
-    len_o = max(dis_o) - min_o
+    min_p = dis_p.min(axis=1)
+    min_o = dis_o.min(axis=1)
+    len_p = dis_p.max(axis=1) - min_p
+    len_o = dis_o.max(axis=1) - min_o
 
     return {'area': len_p * len_o,
             'length_parallel': len_p,
             'length_orthogonal': len_o,
-            'rectangle_center': (min_p + float(len_p)/ 2, min_o + float(len_o)/ 2),
+            'rectangle_center': np.stack((min_p + len_p/2, min_o + len_o/2), axis=1),
             'unit_vector': unit_vector_p,
             }
 
@@ -214,14 +206,16 @@ def minimum_bounding_box(points):
     if len(points) <= 2: raise ValueError('More than two points required.')
 
     hull_ordered = [points[index] for index in ConvexHull(points).vertices]
-    hull_ordered.append(hull_ordered[0])
-    hull_ordered = tuple(hull_ordered)
 
-    min_rectangle = bounding_area(0, hull_ordered)
-    for i in range(1, len(hull_ordered)-1):
-        rectangle = bounding_area(i, hull_ordered)
-        if rectangle['area'] < min_rectangle['area']:
-            min_rectangle = rectangle
+    rectangles = bounding_areas(hull_ordered)
+    # the first of the rectangles with the smallest area
+    index = np.argmin(rectangles['area'])
+    min_rectangle = {'area': float(rectangles['area'][index]),
+                     'length_parallel': float(rectangles['length_parallel'][index]),
+                     'length_orthogonal': float(rectangles['length_orthogonal'][index]),
+                     'rectangle_center': tuple(rectangles['rectangle_center'][index].tolist()),
+                     'unit_vector': tuple(rectangles['unit_vector'][index].tolist()),
+                     }
 
     min_rectangle['unit_vector_angle'] = atan2(min_rectangle['unit_vector'][1], min_rectangle['unit_vector'][0])
     min_rectangle['rectangle_center'] = to_xy_coordinates(min_rectangle['unit_vector_angle'], min_rectangle['rectangle_center'])
@@ -326,19 +320,34 @@ def rotated_points(bounding_box, center):
     return x_dash_1, y_dash_1, x_dash_2, y_dash_2, x_dash_3, y_dash_3, x_dash_4, y_dash_4
 
 
-def pad_image(image):
-    """ Pads the image around the border. It help in getting
-        bounding boxes that are slightly outside the page boundary.
+def crop_padded_image(image, box):
+    """ Crops a region from the page image padded around the border (in
+        white). Padding helps in getting bounding boxes that are slightly
+        outside the page boundary. Only the region is padded, so that many lines
+        can be cropped from one decoded page image without making a padded copy
+        of the whole page. Like Image.crop(), the parts of the box outside the
+        padded page image are black.
     Args:
         image: page image.
+        box (int, int, int, int): region in the padded page image.
+        Eg. (120, 300, 1800, 420).
 
     Returns:
-        image: page image
+        image: region of the padded page image
     """
-    
-    padded_image = Image.new('RGB', (image.size[0] + padding, image.size[1] + padding), "white")
-    padded_image.paste(im=image, box=(offset, offset))
-    return padded_image
+
+    region = Image.new('RGB', (box[2] - box[0], box[3] - box[1]))
+    padded_box = (max(box[0], 0), max(box[1], 0),
+                  min(box[2], image.size[0] + padding), min(box[3], image.size[1] + padding))
+    if padded_box[0] < padded_box[2] and padded_box[1] < padded_box[3]:
+        region.paste("white", (padded_box[0] - box[0], padded_box[1] - box[1],
+                               padded_box[2] - box[0], padded_box[3] - box[1]))
+    page_box = (max(box[0] - offset, 0), max(box[1] - offset, 0),
+                min(box[2] - offset, image.size[0]), min(box[3] - offset, image.size[1]))
+    if page_box[0] < page_box[2] and page_box[1] < page_box[3]:
+        region.paste(im=image.crop(page_box),
+                     box=(page_box[0] + offset - box[0], page_box[1] + offset - box[1]))
+    return region
 
 
 def update_minimum_bounding_box_input(bounding_box_input):
@@ -362,7 +371,7 @@ def update_minimum_bounding_box_input(bounding_box_input):
 
 
 def set_line_image_data(image, line_id, image_file_name):
-    """ Flips a given line image and saves it. Line image file name 
+    """ Saves a given line image. Line image file name
         is formed by appending the line id at the end page image name.
     Args:
         image: line image, non flipped
@@ -370,39 +379,61 @@ def set_line_image_data(image, line_id, image_file_name):
         image_file_name(string): name of the page image.
 
     Returns:
+        (string): path of the line image.
     """
 
     base_name = os.path.splitext(os.path.basename(image_file_name))[0]
-    image_file_name_wo_tif, b = image_file_name.split('.tif')
     line_id = '_' + line_id.zfill(4)
     line_image_file_name = base_name + line_id + '.png'
     image_path = os.path.join(output_directory, line_image_file_name)
-    imgray = toimage(image.convert('L'))
+    imgray = image.convert('L')
     imgray.save(image_path)
-    image_fh.write(image_path + '\n')
+    return image_path
+
 
-def get_line_images_from_page_image(image_file_name, madcat_file_path):
-    """ Extracts the line image from page image.
+def get_zones(madcat_file_path):
+    """ Yields the id and the word bounding box corner points of each zone
+        (line) of a madcat xml file, in order. The file is parsed incrementally
+        and each zone is freed after it is processed, so that the whole document
+        is never held in memory.
     Args:
-        image_file_name (string): complete path and name of the page image.
-        madcat_file_path (string): complete path and name of the madcat xml file
-                                  corresponding to the page image.
+        madcat_file_path (string): complete path and name of the madcat xml file.
 
     Returns:
+        (string, [(int, int)]): id of the zone and the corner points of its words.
+        Eg. ('1', [(1043, 203), (1122, 203), (1122, 262), (1043, 262)])
     """
-    im_wo_pad = Image.open(image_file_name)
-    im = pad_image(im_wo_pad)
-    doc = minidom.parse(madcat_file_path)
-    zone = doc.getElementsByTagName('zone')
-    for node in zone:
-        id = node.getAttribute('id')
-        token_image = node.getElementsByTagName('token-image')
+
+    for event, node in ET.iterparse(madcat_file_path):
+        if node.tag.rsplit('}', 1)[-1] != 'zone':
+            continue
         minimum_bounding_box_input = []
-        for token_node in token_image:
-            word_point = token_node.getElementsByTagName('point')
-            for word_node in word_point:
-                word_coordinate = (int(word_node.getAttribute('x')), int(word_node.getAttribute('y')))
-                minimum_bounding_box_input.append(word_coordinate)
+        for token_node in node.iter():
+            if token_node.tag.rsplit('}', 1)[-1] != 'token-image':
+                continue
+            for word_node in token_node.iter():
+                if word_node.tag.rsplit('}', 1)[-1] == 'point':
+                    word_coordinate = (int(word_node.get('x')), int(word_node.get('y')))
+                    minimum_bounding_box_input.append(word_coordinate)
+        yield node.get('id', ''), minimum_bounding_box_input
+        node.clear()
+
+
+def get_line_images_from_page_image(page):
+    """ Extracts the line images from page image. The page image is decoded
+        once and each line is cropped from it. It is run by the worker processes.
+    Args:
+        page (string, string): complete path and name of the page image and of
+                               the madcat xml file corresponding to the page image.
+
+    Returns:
+        [string]: paths of the line images.
+    """
+    image_file_name, madcat_file_path = page
+    im = Image.open(image_file_name)
+    im.load()
+    image_paths = []
+    for id, minimum_bounding_box_input in get_zones(madcat_file_path):
         updated_mbb_input = update_minimum_bounding_box_input(minimum_bounding_box_input)
         bounding_box = minimum_bounding_box(updated_mbb_input)
 
@@ -416,7 +447,7 @@ def get_line_images_from_page_image(image_file_name, madcat_file_path):
         max_x = int(max(x1, x2, x3, x4))
         max_y = int(max(y1, y2, y3, y4))
         box = (min_x, min_y, max_x, max_y)
-        region_initial = im.crop(box)
+        region_initial = crop_padded_image(im, box)
         rot_points = []
         p1_new = (x1 - min_x, y1 - min_y)
         p2_new = (x2 - min_x, y2 - min_y)
@@ -448,13 +479,16 @@ def get_line_images_from_page_image(image_file_name, madcat_file_path):
         max_y = int(max(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
         box = (min_x, min_y, max_x, max_y)
         region_final = img2.crop(box)
-        set_line_image_data(region_final, id, image_file_name)
+        image_paths.append(set_line_image_data(region_final, id, image_file_name))
+    return image_paths
 
 
-def check_file_location():
+def check_file_location(base_name, wc_dict1):
     """ Returns the complete path of the page image and corresponding
         xml file.
     Args:
+        base_name (string): name of the page image, without the extension.
+        wc_dict1 (dict): writing conditions of the page images.
 
     Returns:
         image_file_name (string): complete path and name of the page image.
@@ -488,11 +522,12 @@ def parse_writing_conditions(writing_conditions):
             file_writing_cond[line_list[0]] = line_list[3]
     return file_writing_cond
 
-def check_writing_condition(wc_dict):
+def check_writing_condition(wc_dict, base_name):
     """ Checks if a given page image is writing in a given writing condition.
         It is used to create subset of dataset based on writing condition.
     Args:
          wc_dict (dict): dictionary with key as page image name and value as writing condition.
+         base_name (string): name of the page image, without the extension.
 
     Returns:
         (bool): True if writing condition matches.
@@ -508,29 +543,50 @@ def check_writing_condition(wc_dict):
 
 ### main ###
 
+# These are used by the worker processes too.
 data_path1 = os.path.join(args.database_path1, 'data')
-
-splits_handle = open(args.data_splits, 'r')
-splits_data = splits_handle.read().strip().split('\n')
-
 padding = int(args.padding)
 offset = int(padding // 2)
-
 output_directory = args.out_dir
-image_file = os.path.join(output_directory, 'images.scp')
-image_fh = open(image_file, 'w', encoding='utf-8')
 
-writing_conditions1 = os.path.join(args.database_path1, 'docs', 'writing_conditions.tab')
 
-wc_dict1 = parse_writing_conditions(writing_conditions1)
+def main():
+    splits_handle = open(args.data_splits, 'r')
+    splits_data = splits_handle.read().strip().split('\n')
 
-prev_base_name = ''
-for line in splits_data:
-    base_name = os.path.splitext(os.path.splitext(line.split(' ')[0])[0])[0]
-    if prev_base_name != base_name:
-        prev_base_name = base_name
-        madcat_file_path, image_file_path, wc_dict = check_file_location()
-        if wc_dict == None or not check_writing_condition(wc_dict):
-            continue
-        if madcat_file_path != None:
-            get_line_images_from_page_image(image_file_path, madcat_file_path)
+    image_file = os.path.join(output_directory, 'images.scp')
+    image_fh = open(image_file, 'w', encoding='utf-8')
+
+    writing_conditions1 = os.path.join(args.database_path1, 'docs', 'writing_conditions.tab')
+
+    wc_dict1 = parse_writing_conditions(writing_conditions1)
+
+    pages = []
+    prev_base_name = ''
+    for line in splits_data:
+        base_name = os.path.splitext(os.path.splitext(line.split(' ')[0])[0])[0]
+        if prev_base_name != base_name:
+            prev_base_name = base_name
+            madcat_file_path, image_file_path, wc_dict = check_file_location(base_name, wc_dict1)
+            if wc_dict == None or not check_writing_condition(wc_dict, base_name):
+                continue
+            if madcat_file_path != None:
+                pages.append((image_file_path, madcat_file_path))
+
+    # The pages are processed in parallel and the paths of the line images
+    # are written in the order of the pages.
+    def write_image_paths(image_paths_of_pages):
+        for image_paths in image_paths_of_pages:
+            for image_path in image_paths:
+                image_fh.write(image_path + '\n')
+
+    if args.num_jobs > 1:
+        with multiprocessing.Pool(args.num_jobs) as pool:
+            write_image_paths(pool.imap(get_line_images_from_page_image, pages))
+    else:
+        write_image_paths(map(get_line_images_from_page_image, pages))
+    image_fh.close()
+
+
+if __name__ == '__main__':
+    main()
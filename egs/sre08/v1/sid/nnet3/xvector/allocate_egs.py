@@ -66,7 +66,8 @@
 # We're using python 3.x style print but want it to work in python 2.x.
 from __future__ import print_function
 from __future__ import division
-import re, os, argparse, sys, math, warnings, random
+import os, argparse, sys, math
+import numpy as np
 
 def get_args():
     parser = argparse.ArgumentParser(description="Writes ranges.*, outputs.* and archive_chunk_lengths files "
@@ -132,59 +133,44 @@ def process_args(args):
         raise Exception("--num-jobs is invalid (must not exceed num-archives)")
     return args
 
-# Create utt2len
-def get_utt2len(utt2len_filename):
+# Reads the utt2len and utt2int files into parallel arrays.  Utterances are
+# sorted by name, so that an index into these arrays orders the same way as
+# the utterance-id itself; this lets us sort the ranges files numerically.
+# Returns (utts, utt_lens, utt_spks).
+def get_utt_arrays(utt2len_filename, utt2int_filename):
     utt2len = {}
-    f = open(utt2len_filename, "r")
-    if f is None:
-        sys.exit("Error opening utt2len file " + str(utt2len_filename))
-    utt_ids = []
-    lengths = []
-    for line in f:
-        tokens = line.split()
-        if len(tokens) != 2:
-            sys.exit("bad line in utt2len file " + line)
-        utt2len[tokens[0]] = int(tokens[1])
-    f.close()
-    return utt2len
-    # Done utt2len
-
-# Handle utt2int, create spk2utt, spks
-def get_labels(utt2int_filename):
-    f = open(utt2int_filename, "r")
-    if f is None:
-        sys.exit("Error opening utt2int file " + str(utt2int_filename))
-    spk2utt = {}
+    with open(utt2len_filename, "r") as f:
+        for line in f:
+            tokens = line.split()
+            if len(tokens) != 2:
+                sys.exit("bad line in utt2len file " + line)
+            utt2len[tokens[0]] = int(tokens[1])
     utt2spk = {}
-    for line in f:
-        tokens = line.split()
-        if len(tokens) != 2:
-            sys.exit("bad line in utt2int file " + line)
-        spk = int(tokens[1])
-        utt = tokens[0]
-        utt2spk[utt] = spk
-        if spk not in spk2utt:
-            spk2utt[spk] = [utt]
-        else:
-            spk2utt[spk].append(utt)
-    spks = spk2utt.keys()
-    f.close()
-    return spks, spk2utt, utt2spk
-    # Done utt2int
-
-
-# this function returns a random integer utterance index, limited to utterances
-# above a minimum length in frames, with probability proportional to its length.
-def get_random_utt(spkr, spk2utt, min_length):
-    this_utts = spk2utt[spkr]
-    this_num_utts = len(this_utts)
-    i = random.randint(0, this_num_utts-1)
-    utt = this_utts[i]
-    return utt
+    with open(utt2int_filename, "r") as f:
+        for line in f:
+            tokens = line.split()
+            if len(tokens) != 2:
+                sys.exit("bad line in utt2int file " + line)
+            utt2spk[tokens[0]] = int(tokens[1])
+    utts = sorted(utt2spk.keys())
+    try:
+        utt_lens = np.array([utt2len[utt] for utt in utts], dtype=np.int64)
+    except KeyError as e:
+        sys.exit("utterance {0} in utt2int file is not in utt2len file".format(e))
+    utt_spks = np.array([utt2spk[utt] for utt in utts], dtype=np.int64)
+    return utts, utt_lens, utt_spks
+
+
+# Builds a compressed (CSR-style) version of spk2utt from utt_spks: the
+# utterances of speaker spks[k] are spk_utts[spk_starts[k]:spk_starts[k]+spk_counts[k]].
+# Returns (spks, spk_starts, spk_counts, spk_utts).
+def get_spk2utt_arrays(utt_spks):
+    spk_utts = np.argsort(utt_spks, kind="stable")
+    spks, spk_starts, spk_counts = np.unique(utt_spks[spk_utts],
+                                             return_index=True,
+                                             return_counts=True)
+    return spks, spk_starts, spk_counts, spk_utts
 
-def random_chunk_length(min_frames_per_chunk, max_frames_per_chunk):
-    ans = random.randint(min_frames_per_chunk, max_frames_per_chunk)
-    return ans
 
 # This function returns an integer in the range
 # [min-frames-per-chunk, max-frames-per-chunk] according to a geometric
@@ -202,122 +188,118 @@ def deterministic_chunk_length(archive_id, num_archives, min_frames_per_chunk, m
                      (num_archives-1)) * min_frames_per_chunk + 0.5)
 
 
-
-# given an utterance length utt_length (in frames) and two desired chunk lengths
-# (length1 and length2) whose sum is <= utt_length,
-# this function randomly picks the starting points of the chunks for you.
-# the chunks may appear randomly in either order.
-def get_random_offset(utt_length, length):
-    if length > utt_length:
+# Draws all the egs of one archive in one go.  Each speaker appears
+# num_repeats times (in random order) and we keep the first num_egs of them
+# (fewer if we run out of speakers); for each eg we pick one of the speaker's utterances
+# uniformly and a random start frame such that a chunk of 'length' frames fits.
+# Returns (utt_indexes, offsets) as int64 arrays.
+def allocate_archive_egs(rng, num_egs, length, num_repeats,
+                         spk_starts, spk_counts, spk_utts, utt_lens):
+    spk_order = rng.permutation(np.tile(np.arange(len(spk_starts)), num_repeats))
+    spk_order = spk_order[:num_egs]
+    utt_indexes = spk_utts[spk_starts[spk_order]
+                           + rng.integers(0, spk_counts[spk_order])]
+    free_lengths = utt_lens[utt_indexes] - length
+    if np.any(free_lengths < 0):
         sys.exit("code error: length > utt-length")
-    free_length = utt_length - length
-
-    offset = random.randint(0, free_length)
-    return offset
+    offsets = rng.integers(0, free_lengths + 1)
+    return utt_indexes, offsets
 
 
 def main():
     args = get_args()
     if not os.path.exists(args.egs_dir + "/temp"):
         os.makedirs(args.egs_dir + "/temp")
-    random.seed(args.seed)
-    utt2len = get_utt2len(args.utt2len_filename)
-    spks, spk2utt, utt2spk = get_labels(args.utt2int_filename)
+    rng = np.random.default_rng(args.seed)
+    utts, utt_lens, utt_spks = get_utt_arrays(args.utt2len_filename,
+                                              args.utt2int_filename)
+    spks, spk_starts, spk_counts, spk_utts = get_spk2utt_arrays(utt_spks)
     if args.num_pdfs == -1:
-        args.num_pdfs = max(spks) + 1
-
-    # archive_chunk_lengths is an mapping from archive id to the number of
-    # frames in examples of that archive.
-    archive_chunk_lengths = []
-    # all_egs contains 2-tuples of the form (utt-id, offset)
-    all_egs= []
+        args.num_pdfs = int(spks.max()) + 1
 
     prefix = ""
     if args.prefix != "":
         prefix = args.prefix + "_"
 
-    info_f = open(args.egs_dir + "/temp/" + prefix + "archive_chunk_lengths", "w")
-    if info_f is None:
-        sys.exit(str("Error opening file {0}/temp/" + prefix + "archive_chunk_lengths").format(args.egs_dir));
+    # archive_chunk_lengths is an array mapping from archive id to the number
+    # of frames in examples of that archive.
+    if args.randomize_chunk_length == "true":
+        # don't constrain the lengths to be the same
+        archive_chunk_lengths = rng.integers(args.min_frames_per_chunk,
+                                             args.max_frames_per_chunk + 1,
+                                             size=args.num_archives)
+    else:
+        archive_chunk_lengths = np.array(
+            [deterministic_chunk_length(archive_index, args.num_archives,
+                                        args.min_frames_per_chunk,
+                                        args.max_frames_per_chunk)
+             for archive_index in range(args.num_archives)], dtype=np.int64)
+
+    with open(args.egs_dir + "/temp/" + prefix + "archive_chunk_lengths", "w") as info_f:
+        info_f.write("".join("{0} {1}\n".format(archive_index + 1, length)
+                             for archive_index, length
+                             in enumerate(archive_chunk_lengths)))
+
+    # all_egs[n] is a 2-tuple (utt_indexes, offsets) of arrays for archive n.
+    all_egs = []
     for archive_index in range(args.num_archives):
         print("Processing archive {0}".format(archive_index + 1))
-        if args.randomize_chunk_length == "true":
-            # don't constrain the lengths to be the same
-            length = random_chunk_length(args.min_frames_per_chunk, args.max_frames_per_chunk)
-        else:
-            length = deterministic_chunk_length(archive_index, args.num_archives, args.min_frames_per_chunk, args.max_frames_per_chunk);
-        print("{0} {1}".format(archive_index + 1, length), file=info_f)
-        archive_chunk_lengths.append(length)
+        length = int(archive_chunk_lengths[archive_index])
         this_num_egs = int(float(args.frames_per_iter) / length + 1)
-        this_egs = [ ] # A 2-tuple of the form (utt-id, start-frame)
-        spkrs = args.num_repeats * list(spk2utt.keys())
-        random.shuffle(spkrs)
-        for n in range(this_num_egs):
-            if len(spkrs) == 0:
-                print("Ran out of speakers for archive {0}".format(archive_index + 1))
-                break
-            spkr = spkrs.pop()
-            utt = get_random_utt(spkr, spk2utt, length)
-            utt_len = utt2len[utt]
-            offset = get_random_offset(utt_len, length)
-            this_egs.append( (utt, offset) )
+        this_egs = allocate_archive_egs(rng, this_num_egs, length,
+                                        args.num_repeats, spk_starts,
+                                        spk_counts, spk_utts, utt_lens)
+        if len(this_egs[0]) < this_num_egs:
+            print("Ran out of speakers for archive {0}".format(archive_index + 1))
         all_egs.append(this_egs)
-    info_f.close()
 
     # work out how many archives we assign to each job in an equitable way.
     num_archives_per_job = [ 0 ] * args.num_jobs
     for i in range(0, args.num_archives):
         num_archives_per_job[i % args.num_jobs]  = num_archives_per_job[i % args.num_jobs] + 1
 
-    pdf2num = {}
+    pdf2num = np.zeros(args.num_pdfs, dtype=np.int64)
     cur_archive = 0
     for job in range(args.num_jobs):
-        this_ranges = []
-        this_archives_for_job = []
         this_num_archives = num_archives_per_job[job]
-
-        for i in range(0, this_num_archives):
-            this_archives_for_job.append(cur_archive)
-            for (utterance_index, offset) in all_egs[cur_archive]:
-                this_ranges.append( (utterance_index, i, offset) )
-            cur_archive = cur_archive + 1
-
-        f = open(args.egs_dir + "/temp/" + prefix + "ranges." + str(job + 1), "w")
-        if f is None:
-            sys.exit("Error opening file " + args.egs_dir + "/temp/" + prefix + "ranges." + str(job + 1))
-        for (utterance_index, i, offset) in sorted(this_ranges):
-            archive_index = this_archives_for_job[i]
-            print("{0} {1} {2} {3} {4} {5}".format(utterance_index,
-                                           i,
-                                           archive_index + 1,
-                                           offset,
-                                           archive_chunk_lengths[archive_index],
-                                           utt2spk[utterance_index]),
-              file=f)
-            if utt2spk[utterance_index] in pdf2num:
-                 pdf2num[utt2spk[utterance_index]] += 1
-            else:
-                pdf2num[utt2spk[utterance_index]] = 1
-        f.close()
-
-
-        f = open(args.egs_dir + "/temp/" + prefix + "outputs." + str(job + 1), "w")
-        if f is None:
-            sys.exit("Error opening file " + args.egs_dir + "/temp/" + prefix + "outputs." + str(job + 1))
-        print( " ".join([ str("{0}/" + prefix + "egs_temp.{1}.ark").format(args.egs_dir, n + 1) for n in this_archives_for_job ]),
-           file=f)
-        f.close()
-
-    f = open(args.egs_dir + "/" + prefix + "pdf2num", "w")
-    nums = []
-    for k in range(0, args.num_pdfs):
-        if k in pdf2num:
-          nums.append(pdf2num[k])
-        else:
-          nums.append(0)
-
-    print(" ".join(map(str, nums)), file=f)
-    f.close()
+        this_archives_for_job = list(range(cur_archive, cur_archive + this_num_archives))
+        cur_archive = cur_archive + this_num_archives
+
+        utt_indexes = np.concatenate([all_egs[n][0] for n in this_archives_for_job])
+        offsets = np.concatenate([all_egs[n][1] for n in this_archives_for_job])
+        relative_indexes = np.concatenate(
+            [np.full(len(all_egs[n][0]), i, dtype=np.int64)
+             for i, n in enumerate(this_archives_for_job)])
+        archive_indexes = np.array(this_archives_for_job,
+                                   dtype=np.int64)[relative_indexes]
+        # Sort by (utterance-id, relative-archive-index, offset); since the
+        # utterances are sorted by name this sorts by the utterance-id string.
+        order = np.lexsort((offsets, relative_indexes, utt_indexes))
+        utt_indexes = utt_indexes[order]
+        relative_indexes = relative_indexes[order]
+        archive_indexes = archive_indexes[order]
+        offsets = offsets[order]
+        egs_spks = utt_spks[utt_indexes]
+        lengths = archive_chunk_lengths[archive_indexes]
+
+        with open(args.egs_dir + "/temp/" + prefix + "ranges." + str(job + 1), "w") as f:
+            f.write("".join(
+                "{0} {1} {2} {3} {4} {5}\n".format(utts[u], i, a + 1, o, l, s)
+                for u, i, a, o, l, s in zip(utt_indexes.tolist(),
+                                            relative_indexes.tolist(),
+                                            archive_indexes.tolist(),
+                                            offsets.tolist(),
+                                            lengths.tolist(),
+                                            egs_spks.tolist())))
+        egs_spks = egs_spks[egs_spks < args.num_pdfs]
+        pdf2num += np.bincount(egs_spks, minlength=args.num_pdfs)
+
+        with open(args.egs_dir + "/temp/" + prefix + "outputs." + str(job + 1), "w") as f:
+            print( " ".join([ str("{0}/" + prefix + "egs_temp.{1}.ark").format(args.egs_dir, n + 1) for n in this_archives_for_job ]),
+               file=f)
+
+    with open(args.egs_dir + "/" + prefix + "pdf2num", "w") as f:
+        print(" ".join(map(str, pdf2num.tolist())), file=f)
 
     print("allocate_egs.py: finished generating " + prefix + "ranges.* and " + prefix + "outputs.* files")
 
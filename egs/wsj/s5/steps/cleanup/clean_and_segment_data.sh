@@ -19,6 +19,13 @@ cleanup=true
 nj=4
 graph_opts=
 segmentation_opts=
+single_pass_segmentation=false  # If true, stages 5 to 7 (modify_ctm_edits.py,
+                                # taint_ctm_edits.py and segment_ctm_edits.py) are
+                                # done in a single pass by
+                                # get_segments_from_ctm_edits.py, which does not write
+                                # ctm_edits.modified and ctm_edits.tainted.
+num_workers=1   # Number of processes used by get_segments_from_ctm_edits.py
+                # (only with --single-pass-segmentation true).
 
 . ./path.sh
 . utils/parse_options.sh
@@ -47,6 +54,9 @@ if [ $# -ne 5 ]; then
   echo "  --segmentation-opts 'opts'  # Additional options to segment_ctm_edits.py."
   echo "                              # Please run steps/cleanup/internal/segment_ctm_edits.py"
   echo "                              # without arguments to see allowed options."
+  echo "  --single-pass-segmentation <true|false>  # If true, do the modification, tainting and"
+  echo "                              # segmentation of the ctm-edits in a single pass (default: false)"
+  echo "  --num-workers <n>           # Number of processes used in the single-pass segmentation."
   echo "  --graph-opts 'opts'         # Additional options to make_biased_lm_graphs.sh."
   echo "                              # Please run steps/cleanup/make_biased_lm_graphs.sh"
   echo "                              # without arguments to see allowed options."
@@ -126,7 +136,7 @@ if [ $stage -le 4 ]; then
   steps/cleanup/internal/get_non_scored_words.py $lang > $dir/non_scored_words.txt
 fi
 
-if [ $stage -le 5 ]; then
+if [ $stage -le 5 ] && ! $single_pass_segmentation; then
   echo "$0: modifying ctm-edits file to allow repetitions [for dysfluencies] and "
   echo "   ... to fix reference mismatches involving non-scored words. "
 
@@ -138,7 +148,7 @@ if [ $stage -le 5 ]; then
   echo " a list of commonly-repeated words."
 fi
 
-if [ $stage -le 6 ]; then
+if [ $stage -le 6 ] && ! $single_pass_segmentation; then
   echo "$0: applying 'taint' markers to ctm-edits file to mark silences and"
   echo "  ... non-scored words that are next to errors."
   $cmd $dir/log/taint_ctm_edits.log \
@@ -147,7 +157,25 @@ if [ $stage -le 6 ]; then
 fi
 
 
-if [ $stage -le 7 ]; then
+if [ $stage -le 7 ] && $single_pass_segmentation; then
+  echo "$0: modifying and tainting the ctm-edits file and creating segmentation"
+  echo "  ... from it in a single pass."
+
+  $cmd --num-threads $num_workers $dir/log/segment_ctm_edits.log \
+    steps/cleanup/internal/get_segments_from_ctm_edits.py \
+      --num-workers=$num_workers --modify-opts="--verbose=3" \
+      --segmentation-opts="$segmentation_opts --oov-symbol-file=$lang/oov.txt --ctm-edits-out=$dir/ctm_edits.segmented --word-stats-out=$dir/word_stats.txt" \
+      $dir/non_scored_words.txt \
+      $dir/lattice_oracle/ctm_edits $dir/text $dir/segments
+
+  echo "$0: contents of $dir/log/segment_ctm_edits.log are:"
+  cat $dir/log/segment_ctm_edits.log
+  echo "For word-level statistics on p(not-being-in-a-segment), with 'worst' words at the top,"
+  echo "see $dir/word_stats.txt"
+  echo "For detailed utterance-level debugging information, see $dir/ctm_edits.segmented"
+fi
+
+if [ $stage -le 7 ] && ! $single_pass_segmentation; then
   echo "$0: creating segmentation from ctm-edits file."
 
   $cmd $dir/log/segment_ctm_edits.log \
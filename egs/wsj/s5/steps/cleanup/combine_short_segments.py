@@ -13,6 +13,9 @@ import copy
 import shutil
 import warnings
 
+sys.path.insert(0, 'steps')
+import libs.data_dir as data_dir_lib
+
 def GetArgs():
     # we add compulsary arguments as named arguments for readability
     parser = argparse.ArgumentParser(description="""
@@ -61,19 +64,6 @@ def CheckFiles(input_data_dir):
         if not os.path.exists(file_name):
             raise Exception("There is no such file {0}".format(file_name))
 
-def ParseFileToDict(file, assert2fields = False, value_processor = None):
-    if value_processor is None:
-        value_processor = lambda x: x[0]
-
-    dict = {}
-    for line in open(file, 'r'):
-        parts = line.split()
-        if assert2fields:
-            assert(len(parts) == 2)
-
-        dict[parts[0]] = value_processor(parts[1:])
-    return dict
-
 def WriteDictToFile(dict, file_name):
     file = open(file_name, 'w')
     keys = dict.keys()
@@ -90,18 +80,18 @@ def WriteDictToFile(dict, file_name):
 
 
 def ParseDataDirInfo(data_dir):
-    data_dir_file = lambda file_name: '{0}/{1}'.format(data_dir, file_name)
+    data = data_dir_lib.DataDir(data_dir)
 
-    utt2spk = ParseFileToDict(data_dir_file('utt2spk'))
-    spk2utt = ParseFileToDict(data_dir_file('spk2utt'), value_processor = lambda x: x)
-    text = ParseFileToDict(data_dir_file('text'), value_processor = lambda x: " ".join(x))
+    utt2spk = data['utt2spk'].to_dict('spk')
+    spk2utt = data['spk2utt'].to_dict('utts')
+    text = dict([(utt, " ".join(words.split())) for utt, words in data['text'].to_dict('text').items()])
     # we want to assert feats.scp has just 2 fields, as we don't know how
     # to process it otherwise
-    feat = ParseFileToDict(data_dir_file('feats.scp'), assert2fields = True)
-    utt2dur = ParseFileToDict(data_dir_file('utt2dur'), value_processor = lambda x: float(x[0]))
+    feat = data.get('feats.scp', [('rxfile', 'token')]).to_dict('rxfile')
+    utt2dur = data['utt2dur'].to_dict('dur')
     utt2uniq = None
-    if os.path.exists(data_dir_file('utt2uniq')):
-        utt2uniq = ParseFileToDict(data_dir_file('utt2uniq'))
+    if data.has('utt2uniq'):
+        utt2uniq = data['utt2uniq'].to_dict('uniq')
     return utt2spk, spk2utt, text, feat, utt2dur, utt2uniq
 
 
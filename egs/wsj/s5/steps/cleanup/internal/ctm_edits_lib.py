@@ -0,0 +1,67 @@
+# Copyright 2016    Vimal Manohar
+#           2016    Johns Hopkins University (author: Daniel Povey)
+# Apache 2.0.
+
+"""This module contains functions shared by the scripts that read and write the
+'ctm-edits' format produced by get_ctm_edits.py (modify_ctm_edits.py,
+taint_ctm_edits.py, segment_ctm_edits.py and get_segments_from_ctm_edits.py,
+which runs all of these on each utterance in a single process).
+
+The in-memory representation of the ctm-edits of an utterance is the one the
+processing functions of those scripts work on: a list with one element per
+line, each of which is the list of fields of the line, e.g.
+  [ [ 'AJJacobs_2007P-0001605-0003029', '1', '0', '0.09', '<eps>', '1.0', '<eps>', 'sil' ],
+    [ 'AJJacobs_2007P-0001605-0003029', '1', '0.09', '0.15', 'i', '1.0', 'i', 'cor' ],
+    ... ]
+The fields are kept as the strings that are (or would be) written to the
+ctm-edits file, so passing this from one stage to the next gives exactly the
+same result as writing the file and reading it back.
+"""
+
+from __future__ import print_function
+import sys
+
+
+def ReadUtterances(f, program_name):
+    """Reads ctm-edits lines from the file object f and yields, for each
+    utterance, a pair (utterance_id, split_lines_of_utt).  Consecutive lines
+    with the same utterance-id (the first field) form an utterance.  Exits
+    with an error message prefixed by 'program_name' on empty input or
+    empty lines."""
+    first_line = f.readline()
+    if first_line == '':
+        sys.exit("{0}: empty input".format(program_name))
+    split_pending_line = first_line.split()
+    if len(split_pending_line) == 0:
+        sys.exit("{0}: bad input line {1}".format(program_name, first_line))
+    cur_utterance = split_pending_line[0]
+    split_lines_of_cur_utterance = []
+
+    while True:
+        if len(split_pending_line) == 0 or split_pending_line[0] != cur_utterance:
+            yield (cur_utterance, split_lines_of_cur_utterance)
+            split_lines_of_cur_utterance = []
+            if len(split_pending_line) == 0:
+                break
+            else:
+                cur_utterance = split_pending_line[0]
+
+        split_lines_of_cur_utterance.append(split_pending_line)
+        next_line = f.readline()
+        split_pending_line = next_line.split()
+        if len(split_pending_line) == 0:
+            if next_line != '':
+                sys.exit("{0}: got an empty or whitespace input line".format(
+                    program_name))
+
+
+def UtteranceToString(split_lines_of_utt):
+    """Returns the ctm-edits lines of an utterance as a string (with a newline
+    after each line)."""
+    return ''.join([' '.join(split_line) + '\n'
+                    for split_line in split_lines_of_utt])
+
+
+def WriteUtterance(f, split_lines_of_utt):
+    """Writes the ctm-edits lines of an utterance to the file object f."""
+    f.write(UtteranceToString(split_lines_of_utt))
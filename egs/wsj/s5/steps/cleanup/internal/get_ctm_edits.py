@@ -7,6 +7,8 @@
 from __future__ import print_function
 import sys, operator, argparse
 
+import ctm_edits_lib
+
 # Modify the CTM to include for each token the information from Levenshtein
 # alignment of 'hypothesis' and 'reference'
 # (i.e. the output of 'align-text'.
@@ -89,18 +91,23 @@ import sys, operator, argparse
 
 
 
+# The options are in a separate parser so that get_segments_from_ctm_edits.py
+# can parse them too.
+options_parser = argparse.ArgumentParser(add_help = False)
+options_parser.add_argument("--oov", type = int, default = -1,
+                            help = "The integer representation of the OOV symbol; substitutions "
+                            "by the OOV symbol for out-of-vocabulary reference words are treated "
+                            "as correct, if you also supply the --symbol-table option.")
+options_parser.add_argument("--symbol-table", type = str,
+                            help = "The words.txt your system used; if supplied, it is used to "
+                            "determine OOV words (and such words will count as correct if "
+                            "substituted by the OOV symbol).  See also the --oov option")
+
 parser = argparse.ArgumentParser(
     description = "Append to the CTM the Levenshtein alignment of 'hypothesis' and 'reference'; "
-    "creates augmented CTM with extra fields (see script for details)")
-
-parser.add_argument("--oov", type = int, default = -1,
-                    help = "The integer representation of the OOV symbol; substitutions "
-                    "by the OOV symbol for out-of-vocabulary reference words are treated "
-                    "as correct, if you also supply the --symbol-table option.")
-parser.add_argument("--symbol-table", type = str,
-                    help = "The words.txt your system used; if supplied, it is used to "
-                    "determine OOV words (and such words will count as correct if "
-                    "substituted by the OOV symbol).  See also the --oov option")
+    "creates augmented CTM with extra fields (see script for details)",
+    parents = [options_parser])
+
 # Required arguments
 parser.add_argument("edits_in", metavar = "<edits-in>",
                     help = "Filename of output of 'align-text', which this program reads. "
@@ -109,12 +116,23 @@ parser.add_argument("ctm_in", metavar = "<ctm-in>",
                     help = "Filename of input hypothesis in ctm format")
 parser.add_argument("ctm_edits_out", metavar = "<ctm-edits-out>",
                     help = "Filename of output (CTM appended with word-edit information)")
-args = parser.parse_args()
+
+args = None
+symbol_table = set()
+oov_word = None
 
 
+# This sets the options (as parsed by 'options_parser' or 'parser') used by the
+# functions below, and reads the symbol table if one was supplied.  It must be
+# called before ProcessOneUtterance().
+def Initialize(this_args):
+    global args
+    args = this_args
+    ReadSymbolTable()
+
 
 def OpenFiles():
-    global ctm_edits_out, edits_in, ctm_in, symbol_table, oov_word
+    global ctm_edits_out, edits_in, ctm_in
     try:
         ctm_edits_out = open(args.ctm_edits_out, 'w', encoding='utf-8')
     except:
@@ -131,6 +149,9 @@ def OpenFiles():
         sys.exit("get_ctm_edits.py: error opening ctm file {0} for input".format(
                 args.ctm_in))
 
+
+def ReadSymbolTable():
+    global symbol_table, oov_word
     symbol_table = set()
     oov_word = None
     if args.symbol_table != None:
@@ -252,12 +273,14 @@ def FloatToString(f):
     return format_str % f
 
 
-def OutputCtm(utterance_id, edits_array, ctm_array):
-    global ctm_edits_out
+# This returns the lines of the output ctm-edits for an utterance, as a list
+# of lists of fields (see ctm_edits_lib.py).
+def GetCtmEditsLines(utterance_id, edits_array, ctm_array):
     # note: this function expects the padded entries created by PadARrays.
     assert len(edits_array) == len(ctm_array)
     channel = '1'  # this is hardcoded at both input and output, since this CTM
                    # doesn't really represent recordings, only utterances.
+    split_lines_of_utt = []
     for i in range(len(edits_array)):
         ( hyp_word, ref_word ) = edits_array[i]
         ( start_time, duration, hyp_word2, confidence ) = ctm_array[i]
@@ -267,11 +290,15 @@ def OutputCtm(utterance_id, edits_array, ctm_array):
             sys.exit(1)
         assert hyp_word == hyp_word2
         edit_type = GetEditType(hyp_word, ref_word, duration)
-        print(utterance_id, channel, FloatToString(start_time),
-              FloatToString(duration), hyp_word, confidence, ref_word,
-              edit_type, file = ctm_edits_out)
+        split_lines_of_utt.append([ utterance_id, channel, FloatToString(start_time),
+                                    FloatToString(duration), hyp_word, str(confidence),
+                                    ref_word, edit_type ])
+    return split_lines_of_utt
 
 
+# This returns the ctm-edits of an utterance, as a list of lists of fields,
+# given the line of the edits input and the lines of the ctm input for the
+# utterance.
 def ProcessOneUtterance(utterance_id, edits_line, ctm_lines):
     try:
         # Remove the utterance-id from the beginning of the edits line
@@ -314,9 +341,13 @@ def ProcessOneUtterance(utterance_id, edits_line, ctm_lines):
     except Exception as e:
         sys.exit("get_ctm_edits.py: error processing utterance {0}, error was: {1}".format(
                 utterance_id, str(e)))
-    OutputCtm(utterance_id, edits_array, ctm_array)
+    return GetCtmEditsLines(utterance_id, edits_array, ctm_array)
 
-def ProcessData():
+
+# This reads the edits and the ctm and yields, for each utterance, a tuple
+# (utterance_id, edits_line, ctm_lines) to be given to ProcessOneUtterance().
+# 'edits_in_name' is only used in error messages.
+def ReadUtterances(edits_in, ctm_in, edits_in_name):
     num_utterances_processed = 0
 
     pending_ctm_line = ctm_in.readline()
@@ -327,25 +358,37 @@ def ProcessData():
             if pending_ctm_line != '':
                 sys.exit("get_ctm_edits.py: edits_in input {0} ended before "
                          "ctm input was ended.  We processed {1} "
-                         "utterances.".format(args.edits_in, num_utterances_processed))
+                         "utterances.".format(edits_in_name, num_utterances_processed))
             break
         a = this_edits_line.split()
         if len(a) == 0:
             sys.exit("get_ctm_edits.py: edits_input {0} had an empty line".format(
-                    args.edits_in))
+                    edits_in_name))
         utterance_id = a[0]
-        utterance_id_len = len(utterance_id)
         this_utterance_ctm_lines = []
         while len(pending_ctm_line.strip()) > 0 and pending_ctm_line.split()[0] == utterance_id:
             this_utterance_ctm_lines.append(pending_ctm_line)
             pending_ctm_line = ctm_in.readline()
-        ProcessOneUtterance(utterance_id, this_edits_line,
-                            this_utterance_ctm_lines)
+        yield (utterance_id, this_edits_line, this_utterance_ctm_lines)
+        num_utterances_processed += 1
+
+
+def ProcessData():
+    num_utterances_processed = 0
+    for utterance_id, edits_line, ctm_lines in ReadUtterances(
+            edits_in, ctm_in, args.edits_in):
+        ctm_edits_lib.WriteUtterance(
+            ctm_edits_out, ProcessOneUtterance(utterance_id, edits_line, ctm_lines))
         num_utterances_processed += 1
     print("get_ctm_edits.py: processed {0} utterances".format(
             num_utterances_processed), file=sys.stderr)
 
 
-OpenFiles()
-ProcessData()
+def Main():
+    Initialize(parser.parse_args())
+    OpenFiles()
+    ProcessData()
+
 
+if __name__ == "__main__":
+    Main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+
+# Copyright 2016   Vimal Manohar
+#           2016   Johns Hopkins University (author: Daniel Povey)
+# Apache 2.0
+
+from __future__ import print_function
+import argparse
+import io
+import multiprocessing
+import os
+import shlex
+import sys
+
+import ctm_edits_lib
+import get_ctm_edits
+import modify_ctm_edits
+import taint_ctm_edits
+import segment_ctm_edits
+
+# This script does, in a single process, what is otherwise done by running
+# modify_ctm_edits.py, taint_ctm_edits.py and segment_ctm_edits.py one after
+# the other (and, if the --edits-in option is given, get_ctm_edits.py before
+# them).  Each utterance is passed through all these stages before the next
+# one is read, and the ctm-edits are handed from one stage to the next in
+# memory (see ctm_edits_lib.py), so the intermediate ctm-edits files are not
+# written and read back unless you ask for them with --intermediate-dir.  The
+# outputs (and the statistics printed to the standard error) are the same as
+# those of the separate scripts.
+
+parser = argparse.ArgumentParser(
+    description = "This program produces segmentation and text information "
+    "from the ctm-edits output by steps/cleanup/internal/get_ctm_edits.py, "
+    "doing the work of steps/cleanup/internal/modify_ctm_edits.py, "
+    "steps/cleanup/internal/taint_ctm_edits.py and "
+    "steps/cleanup/internal/segment_ctm_edits.py on each utterance in turn, "
+    "without writing the intermediate files.  See comments at the top of the "
+    "script for more information.")
+
+parser.add_argument("--edits-in", type = str,
+                    help = "If supplied, the input <ctm-edits-in> is instead read as a "
+                    "ctm, and the ctm-edits are first computed from it and from this file "
+                    "(the output of 'align-text'), as done by get_ctm_edits.py.")
+parser.add_argument("--get-ctm-edits-opts", type = str, default = "",
+                    help = "Options for the get_ctm_edits.py stage (only relevant if "
+                    "--edits-in is supplied), e.g. '--oov=2 --symbol-table=data/lang/words.txt'")
+parser.add_argument("--modify-opts", type = str, default = "",
+                    help = "Options for the modify_ctm_edits.py stage, e.g. '--verbose=3'")
+parser.add_argument("--taint-opts", type = str, default = "",
+                    help = "Options for the taint_ctm_edits.py stage, e.g. "
+                    "'--remove-deletions=false'")
+parser.add_argument("--segmentation-opts", type = str, default = "",
+                    help = "Options for the segment_ctm_edits.py stage, e.g. "
+                    "'--oov-symbol-file=data/lang/oov.txt --ctm-edits-out=exp/foo/ctm_edits.segmented'")
+parser.add_argument("--intermediate-dir", type = str,
+                    help = "If supplied, the ctm-edits as output by the stages before "
+                    "the segmentation are written to <intermediate-dir>/ctm_edits "
+                    "(only if --edits-in is supplied), <intermediate-dir>/ctm_edits.modified "
+                    "and <intermediate-dir>/ctm_edits.tainted, for debugging.")
+parser.add_argument("--num-workers", type = int, default = 1,
+                    help = "Number of worker processes that process the utterances.")
+parser.add_argument("non_scored_words_in", metavar = "<non-scored-words-file>",
+                    help="Filename of file containing a list of non-scored words, "
+                    "one per line. See steps/cleanup/internal/get_nonscored_words.py.")
+parser.add_argument("ctm_edits_in", metavar = "<ctm-edits-in>",
+                    help = "Filename of input ctm-edits file (or ctm file, if --edits-in "
+                    "is supplied). Use /dev/stdin for standard input.")
+parser.add_argument("text_out", metavar = "<text-out>",
+                    help = "Filename of output text file (same format as data/train/text, i.e. "
+                    "<new-utterance-id> <word1> <word2> ... <wordN>")
+parser.add_argument("segments_out", metavar = "<segments-out>",
+                    help = "Filename of output segments.  This has the same format as data/train/segments, "
+                    "but instead of <recording-id>, the second field is the old utterance-id, i.e "
+                    "<new-utterance-id> <old-utterance-id> <start-time> <end-time>")
+
+# The number of utterances that are given to a worker process at a time.
+utterances_per_task = 100
+
+# The names of the files in --intermediate-dir.
+intermediate_names = [ 'ctm_edits', 'ctm_edits.modified', 'ctm_edits.tainted' ]
+
+
+# This parses the options for one of the stages, using the 'options_parser' of
+# its module.
+def ParseStageOptions(module, option_name, opts):
+    try:
+        return module.options_parser.parse_args(shlex.split(opts))
+    except SystemExit:
+        sys.exit("get_segments_from_ctm_edits.py: error parsing {0}='{1}'".format(
+                option_name, opts))
+
+
+# This sets the options of all the stages; it is called in the main process
+# and at the start of each worker process.
+def Initialize(stage_args, non_scored_words, edits_in, dump_intermediate):
+    global use_edits_in, write_intermediate
+    (get_args, modify_args, taint_args, segment_args) = stage_args
+    use_edits_in = edits_in
+    write_intermediate = dump_intermediate
+    if use_edits_in:
+        get_ctm_edits.Initialize(get_args)
+    modify_ctm_edits.Initialize(modify_args, non_scored_words)
+    taint_ctm_edits.Initialize(taint_args)
+    segment_ctm_edits.Initialize(segment_args, non_scored_words)
+
+
+# The statistics of all the stages.
+class Stats(object):
+    def __init__(self):
+        self.num_utterances = 0
+        self.modify_stats = modify_ctm_edits.Stats()
+        self.taint_stats = taint_ctm_edits.Stats()
+        self.segment_stats = segment_ctm_edits.Stats()
+
+    def Add(self, other):
+        self.num_utterances += other.num_utterances
+        self.modify_stats.Add(other.modify_stats)
+        self.taint_stats.Add(other.taint_stats)
+        self.segment_stats.Add(other.segment_stats)
+
+
+# This passes a list of utterances through all the stages.  Each element of
+# 'utterances' is either (utterance_id, edits_line, ctm_lines) if --edits-in
+# was supplied, or (utterance_id, split_lines_of_utt).  It returns the
+# outputs as a dict from 'text', 'segments', 'ctm_edits.segmented' (if
+# --ctm-edits-out is in --segmentation-opts), and the names in
+# 'intermediate_names' (if --intermediate-dir was supplied) to strings.
+def ProcessUtterances(utterances, stats):
+    outputs = {}
+    for name in [ 'text', 'segments' ] + intermediate_names:
+        outputs[name] = io.StringIO()
+    ctm_edits_output_handle = None
+    if segment_ctm_edits.args.ctm_edits_out != None:
+        ctm_edits_output_handle = outputs['ctm_edits.segmented'] = io.StringIO()
+
+    for utterance in utterances:
+        stats.num_utterances += 1
+        utterance_id = utterance[0]
+        if use_edits_in:
+            split_lines_of_utt = get_ctm_edits.ProcessOneUtterance(*utterance)
+            if write_intermediate:
+                ctm_edits_lib.WriteUtterance(outputs['ctm_edits'], split_lines_of_utt)
+        else:
+            split_lines_of_utt = utterance[1]
+        split_lines_of_utt = modify_ctm_edits.ProcessUtterance(
+            split_lines_of_utt, stats.modify_stats)
+        # An utterance all of whose lines were removed would not appear in
+        # the output file of modify_ctm_edits.py, so we don't process it
+        # further.
+        if len(split_lines_of_utt) == 0:
+            continue
+        if write_intermediate:
+            ctm_edits_lib.WriteUtterance(outputs['ctm_edits.modified'], split_lines_of_utt)
+        split_lines_of_utt = taint_ctm_edits.ProcessUtterance(
+            split_lines_of_utt, stats.taint_stats,
+            taint_ctm_edits.remove_deletions)
+        if len(split_lines_of_utt) == 0:
+            continue
+        if write_intermediate:
+            ctm_edits_lib.WriteUtterance(outputs['ctm_edits.tainted'], split_lines_of_utt)
+        segment_ctm_edits.ProcessUtterance(utterance_id, split_lines_of_utt,
+                                           stats.segment_stats,
+                                           outputs['text'], outputs['segments'],
+                                           ctm_edits_output_handle)
+    return dict([ (name, f.getvalue()) for name, f in outputs.items() ])
+
+
+# This is what the worker processes run; it returns the outputs together with
+# the statistics for this list of utterances.
+def ProcessUtterancesInWorker(utterances):
+    stats = Stats()
+    try:
+        outputs = ProcessUtterances(utterances, stats)
+    except SystemExit as e:
+        # a SystemExit would not be passed back to the main process.
+        raise RuntimeError(str(e))
+    return (outputs, stats)
+
+
+# This yields lists of up to 'utterances_per_task' utterances in the format
+# expected by ProcessUtterances().  Errors in the input are raised as
+# RuntimeError, because with --num-workers > 1 this is run in a thread of the
+# pool, which would not pass on a SystemExit.
+def GetTasks(edits_in, ctm_edits_in):
+    if edits_in is not None:
+        utterances = get_ctm_edits.ReadUtterances(edits_in, ctm_edits_in,
+                                                  args.edits_in)
+    else:
+        utterances = ctm_edits_lib.ReadUtterances(
+            ctm_edits_in, "get_segments_from_ctm_edits.py")
+    task = []
+    try:
+        for utterance in utterances:
+            task.append(utterance)
+            if len(task) == utterances_per_task:
+                yield task
+                task = []
+    except SystemExit as e:
+        raise RuntimeError(str(e))
+    if len(task) > 0:
+        yield task
+
+
+def OpenFile(filename, mode):
+    try:
+        return open(filename, mode, encoding='utf-8')
+    except:
+        sys.exit("get_segments_from_ctm_edits.py: error opening file {0}".format(
+                filename))
+
+
+def Main():
+    global args
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf8")
+    args = parser.parse_args()
+    if args.num_workers < 1:
+        sys.exit("get_segments_from_ctm_edits.py: --num-workers must be at least 1")
+
+    stage_args = (ParseStageOptions(get_ctm_edits, "--get-ctm-edits-opts",
+                                    args.get_ctm_edits_opts),
+                  ParseStageOptions(modify_ctm_edits, "--modify-opts",
+                                    args.modify_opts),
+                  ParseStageOptions(taint_ctm_edits, "--taint-opts",
+                                    args.taint_opts),
+                  ParseStageOptions(segment_ctm_edits, "--segmentation-opts",
+                                    args.segmentation_opts))
+    segment_args = stage_args[3]
+    non_scored_words = modify_ctm_edits.ReadNonScoredWords(args.non_scored_words_in)
+    initargs = (stage_args, non_scored_words, args.edits_in is not None,
+                args.intermediate_dir is not None)
+    Initialize(*initargs)
+
+    ctm_edits_in = OpenFile(args.ctm_edits_in, 'r')
+    edits_in = None
+    if args.edits_in is not None:
+        edits_in = OpenFile(args.edits_in, 'r')
+    output_files = { 'text': OpenFile(args.text_out, 'w'),
+                     'segments': OpenFile(args.segments_out, 'w') }
+    if segment_args.ctm_edits_out != None:
+        output_files['ctm_edits.segmented'] = OpenFile(segment_args.ctm_edits_out, 'w')
+    if args.intermediate_dir is not None:
+        for name in intermediate_names:
+            if name != 'ctm_edits' or args.edits_in is not None:
+                output_files[name] = OpenFile(
+                    os.path.join(args.intermediate_dir, name), 'w')
+
+    stats = Stats()
+    tasks = GetTasks(edits_in, ctm_edits_in)
+    pool = None
+    try:
+        if args.num_workers > 1:
+            pool = multiprocessing.Pool(args.num_workers, initializer = Initialize,
+                                        initargs = initargs)
+            # imap() returns the results in the order of the input.
+            for outputs, this_stats in pool.imap(ProcessUtterancesInWorker, tasks):
+                for name, f in output_files.items():
+                    f.write(outputs[name])
+                stats.Add(this_stats)
+            pool.close()
+            pool.join()
+        else:
+            for task in tasks:
+                outputs = ProcessUtterances(task, stats)
+                for name, f in output_files.items():
+                    f.write(outputs[name])
+    except RuntimeError as e:
+        if pool is not None:
+            pool.terminate()
+        sys.exit(str(e))
+    try:
+        for f in output_files.values():
+            f.close()
+    except:
+        sys.exit("get_segments_from_ctm_edits.py: error closing one or more outputs "
+                 "(broken pipe or full disk?)")
+
+    if args.edits_in is not None:
+        print("get_ctm_edits.py: processed {0} utterances".format(
+                stats.num_utterances), file = sys.stderr)
+    modify_ctm_edits.PrintNonScoredStats(stats.modify_stats)
+    modify_ctm_edits.PrintRepetitionStats(stats.modify_stats)
+    taint_ctm_edits.PrintStats(stats.taint_stats)
+    segment_ctm_edits.PrintSegmentStats(stats.segment_stats)
+    if segment_args.word_stats_out != None:
+        segment_ctm_edits.PrintWordStats(segment_args.word_stats_out,
+                                         stats.segment_stats)
+    if segment_args.ctm_edits_out != None:
+        print("segment_ctm_edits.py: detailed utterance-level debug information "
+              "is in " + segment_args.ctm_edits_out, file = sys.stderr)
+
+
+if __name__ == "__main__":
+    Main()
@@ -11,15 +11,17 @@ import math
 from collections import defaultdict
 
 import io
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer,encoding="utf8")
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer,encoding="utf8")
-sys.stdin = io.TextIOWrapper(sys.stdin.buffer,encoding="utf8")
+
+sys.path.insert(0, 'utils/lang/internal')
+from vector_fst import TextFst, add_binary_output_options, make_fst, write_fst
 
 parser = argparse.ArgumentParser(description="""
 This script creates a biased language model suitable for alignment and
 data-cleanup purposes.   It reads (possibly multiple) lines of integerized text
 from the input and writes a text-form FST of a backoff language model to
-the standard output, to be piped into fstcompile.""")
+the standard output, to be piped into fstcompile (or, with --binary-output=true,
+the FST compiled as fstcompile would do it).  It can also be imported
+as a module (see MakeBiasedLm()), as done by steps/cleanup/make_biased_lms.py.""")
 
 parser.add_argument("--word-disambig-symbol", type = int, required = True,
                     help = "Integer corresponding to the disambiguation "
@@ -44,12 +46,7 @@ parser.add_argument("--discounting-constant", type = float, default = 0.3,
                     "you a more-strongly-biased LM.")
 parser.add_argument("--verbose", type = int, default = 0,
                     choices=[0,1,2,3,4,5], help = "Verbose level")
-
-args = parser.parse_args()
-
-if args.verbose >= 1:
-    print(' '.join(sys.argv), file = sys.stderr)
-
+add_binary_output_options(parser, symbol_tables = False)
 
 
 
@@ -111,18 +108,19 @@ class NgramCounts(object):
             history = tuple(words[history_start:n])
             self.AddCount(history, predicted_word, 1.0)
 
-    def AddRawCountsFromStandardInput(self):
+    # 'lines' is an iterable of strings, e.g. a list of lines or a file.
+    def AddRawCountsFromLines(self, lines, verbose = 0):
         lines_processed = 0
-        while True:
-            line = sys.stdin.readline()
-            if line == '':
-                break
+        for line in lines:
             self.AddRawCountsFromLine(line)
             lines_processed += 1
-        if lines_processed == 0 or args.verbose > 0:
+        if lines_processed == 0 or verbose > 0:
             print("make_one_biased_lm.py: processed {0} lines of input".format(
                     lines_processed), file = sys.stderr)
 
+    def AddRawCountsFromStandardInput(self, verbose = 0):
+        self.AddRawCountsFromLines(sys.stdin, verbose)
+
 
     # This function returns a dict from history (as a tuple of integers of
     # length > 1, ignoring lower-order histories), to the total count of this
@@ -202,29 +200,14 @@ class NgramCounts(object):
         print('total count = {0}, excluding discount = {1}'.format(
                 total, total_excluding_backoff), file = sys.stderr)
 
-    def AddTopWords(self, top_words_file):
+    # 'top_words' is a list of (integer-id-of-word, prob) pairs, as returned
+    # by ReadTopWords().
+    def AddTopWords(self, top_words):
         empty_history = ()
         word_to_count = self.counts[0][empty_history]
         total = sum(word_to_count.values())
-        try:
-            f = open(top_words_file, mode='r', encoding='utf-8')
-        except:
-            sys.exit("make_one_biased_lm.py: error opening top-words file: "
-                     "--top-words=" + top_words_file)
-        while True:
-            line = f.readline()
-            if line == '':
-                break
-            try:
-                [ word_index, prob ] = line.split()
-                word_index = int(word_index)
-                prob = float(prob)
-                assert word_index > 0 and prob > 0.0
-                word_to_count[word_index] += prob * total
-            except Exception as e:
-                sys.exit("make_one_biased_lm.py: could not make sense of the "
-                         "line '{0}' in op-words file: {1} ".format(line, str(e)))
-        f.close()
+        for word_index, prob in top_words:
+            word_to_count[word_index] += prob * total
 
 
     def GetTotalCountMap(self):
@@ -257,8 +240,12 @@ class NgramCounts(object):
             prob += backoff_prob * prob_in_backoff
         return prob
 
-    # This function prints the estimated language model as an FST.
-    def PrintAsFst(self, word_disambig_symbol):
+    # This function prints the estimated language model as an FST, to 'file'
+    # (by default the standard output); or, if 'fst' is given (as returned by
+    # make_fst()), adds its arcs and final-probs to 'fst'.
+    def PrintAsFst(self, word_disambig_symbol, file = None, fst = None):
+        if fst is None:
+            fst = TextFst(file, separator = ' ')
         # n is the history-length (== order + 1).  We iterate over the
         # history-length in the order 1, 0, 2, 3, and then iterate over the
         # histories of each order in sorted order.  Putting order 1 first
@@ -287,34 +274,86 @@ class NgramCounts(object):
                         while not next_hist in hist_to_state:
                             next_hist = next_hist[1:]
                         next_fst_state = hist_to_state[next_hist]
-                        print(this_fst_state, next_fst_state, word, word,
-                              this_cost)
+                        fst.add_arc(this_fst_state, next_fst_state, word, word,
+                                    this_cost)
                     elif word == self.eos_symbol:
                         # print final-prob for this state.
-                        print(this_fst_state, this_cost)
+                        fst.set_final(this_fst_state, this_cost)
                     else:
                         assert word == self.backoff_symbol
                         backoff_fst_state = hist_to_state[hist[1:len(hist)]]
-                        print(this_fst_state, backoff_fst_state,
-                              word_disambig_symbol, 0, this_cost)
-
-
-ngram_counts = NgramCounts(args.ngram_order)
-ngram_counts.AddRawCountsFromStandardInput()
-
-if args.verbose >= 3:
-    ngram_counts.Print("Raw counts:")
-ngram_counts.CompletelyDiscountLowCountStates(args.min_lm_state_count)
-if args.verbose >= 3:
-    ngram_counts.Print("Counts after discounting low-count states:")
-ngram_counts.ApplyBackoff(args.discounting_constant)
-if args.verbose >= 3:
-    ngram_counts.Print("Counts after applying Kneser-Ney discounting:")
-if args.top_words != None:
-    ngram_counts.AddTopWords(args.top_words)
+                        fst.add_arc(this_fst_state, backoff_fst_state,
+                                    word_disambig_symbol, 0, this_cost)
+
+
+# Reads the --top-words file, with lines in the format
+# '<integer-id-of-word> <prob>', and returns a list of (word, prob) pairs.
+def ReadTopWords(top_words_file):
+    top_words = []
+    try:
+        f = open(top_words_file, mode='r', encoding='utf-8')
+    except:
+        sys.exit("make_one_biased_lm.py: error opening top-words file: "
+                 "--top-words=" + top_words_file)
+    for line in f:
+        try:
+            [ word_index, prob ] = line.split()
+            word_index = int(word_index)
+            prob = float(prob)
+            assert word_index > 0 and prob > 0.0
+            top_words.append((word_index, prob))
+        except Exception as e:
+            sys.exit("make_one_biased_lm.py: could not make sense of the "
+                     "line '{0}' in op-words file: {1} ".format(line, str(e)))
+    f.close()
+    return top_words
+
+
+# Estimates the biased LM from 'lines' (an iterable of strings of integerized
+# text), with the options in 'args' (as parsed by 'parser'), and returns the
+# NgramCounts object.  'top_words' is the list returned by ReadTopWords(), or
+# None to read it from args.top_words if set; pass it in to avoid re-reading
+# the file for each LM.
+def MakeBiasedLm(lines, args, top_words = None):
+    if top_words is None and args.top_words is not None:
+        top_words = ReadTopWords(args.top_words)
+
+    ngram_counts = NgramCounts(args.ngram_order)
+    ngram_counts.AddRawCountsFromLines(lines, args.verbose)
+
     if args.verbose >= 3:
-        ngram_counts.Print("Counts after applying top-n-words")
-ngram_counts.PrintAsFst(args.word_disambig_symbol)
+        ngram_counts.Print("Raw counts:")
+    ngram_counts.CompletelyDiscountLowCountStates(args.min_lm_state_count)
+    if args.verbose >= 3:
+        ngram_counts.Print("Counts after discounting low-count states:")
+    ngram_counts.ApplyBackoff(args.discounting_constant)
+    if args.verbose >= 3:
+        ngram_counts.Print("Counts after applying Kneser-Ney discounting:")
+    if top_words is not None:
+        ngram_counts.AddTopWords(top_words)
+        if args.verbose >= 3:
+            ngram_counts.Print("Counts after applying top-n-words")
+    return ngram_counts
+
+
+def Main():
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer,encoding="utf8")
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer,encoding="utf8")
+    sys.stdin = io.TextIOWrapper(sys.stdin.buffer,encoding="utf8")
+
+    args = parser.parse_args()
+
+    if args.verbose >= 1:
+        print(' '.join(sys.argv), file = sys.stderr)
+
+    ngram_counts = MakeBiasedLm(sys.stdin, args)
+    fst = make_fst(args, separator = ' ')
+    ngram_counts.PrintAsFst(args.word_disambig_symbol, fst = fst)
+    write_fst(fst, args)
+
+
+if __name__ == "__main__":
+    Main()
 
 
 # test comand:
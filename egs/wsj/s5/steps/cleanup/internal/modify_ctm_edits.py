@@ -10,6 +10,8 @@ import logging
 import sys
 from collections import defaultdict
 
+import ctm_edits_lib
+
 """
 This script reads and writes the 'ctm-edits' file that is
 produced by get_ctm_edits.py.
@@ -63,6 +65,24 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 
+# The options are in a separate parser so that get_segments_from_ctm_edits.py
+# can parse them too.
+options_parser = argparse.ArgumentParser(add_help = False)
+options_parser.add_argument("--verbose", type = int, default = 1,
+                            choices=[0,1,2,3],
+                            help = "Verbose level, higher = more verbose output")
+options_parser.add_argument("--allow-repetitions", type = str, default = 'true',
+                            choices=['true','false'],
+                            help = "If true, allow repetitions in the transcript of one or "
+                            "two-word sequences: for instance if the ref says 'i' but "
+                            "the hyp says 'i i', or the ref says 'but then' and the hyp says "
+                            "'but then but then', fix the reference accordingly.  Intervening "
+                            "non-scored words are allowed between the repetitions.  These "
+                            "fixes will be marked as 'cor', not as 'fix', since there is "
+                            "generally no way to tell which repetition was the 'real' one "
+                            "(and since we're generally confident that such things were "
+                            "actually uttered).")
+
 parser = argparse.ArgumentParser(
     description = "This program modifies the reference in the ctm-edits which "
     "is output by steps/cleanup/internal/get_ctm_edits.py, to allow insertions, deletions and "
@@ -72,22 +92,9 @@ parser = argparse.ArgumentParser(
     "after the reference is corrected, will be marked as operation 'fix' rather than "
     "'cor' (correct) so that the downstream processing knows that this was not in "
     "the original reference.  Also by defaults tags non-scored words as such when "
-    "they are correct; see the --tag-non-scored option.")
-
-parser.add_argument("--verbose", type = int, default = 1,
-                    choices=[0,1,2,3],
-                    help = "Verbose level, higher = more verbose output")
-parser.add_argument("--allow-repetitions", type = str, default = 'true',
-                    choices=['true','false'],
-                    help = "If true, allow repetitions in the transcript of one or "
-                    "two-word sequences: for instance if the ref says 'i' but "
-                    "the hyp says 'i i', or the ref says 'but then' and the hyp says "
-                    "'but then but then', fix the reference accordingly.  Intervening "
-                    "non-scored words are allowed between the repetitions.  These "
-                    "fixes will be marked as 'cor', not as 'fix', since there is "
-                    "generally no way to tell which repetition was the 'real' one "
-                    "(and since we're generally confident that such things were "
-                    "actually uttered).")
+    "they are correct; see the --tag-non-scored option.",
+    parents = [options_parser])
+
 parser.add_argument("non_scored_words_in", metavar = "<non-scored-words-file>",
                     help="Filename of file containing a list of non-scored words, "
                     "one per line. See steps/cleanup/get_nonscored_words.py.")
@@ -98,12 +105,21 @@ parser.add_argument("ctm_edits_out", metavar = "<ctm-edits-out>",
                     help = "Filename of output ctm-edits file. "
                     "Use /dev/stdout for standard output.")
 
-args = parser.parse_args()
+args = None
+non_scored_words = set()
+
 
+# This sets the options (as parsed by 'options_parser' or 'parser') and the
+# set of non-scored words used by the functions below.
+def Initialize(this_args, this_non_scored_words):
+    global args, non_scored_words
+    args = this_args
+    non_scored_words = this_non_scored_words
 
 
+# This returns the set of non-scored words read from the file.
 def ReadNonScoredWords(non_scored_words_file):
-    global non_scored_words
+    non_scored_words = set()
     try:
         f = open(non_scored_words_file, encoding='utf-8')
     except:
@@ -116,6 +132,33 @@ def ReadNonScoredWords(non_scored_words_file):
                      "file {0}: {1}".format(non_scored_words_file, line))
         non_scored_words.add(a[0])
     f.close()
+    return non_scored_words
+
+
+# This class holds the statistics printed at the end by PrintNonScoredStats()
+# and PrintRepetitionStats().  Statistics accumulated separately (e.g. in
+# different processes) can be summed with Add().
+class Stats(object):
+    def __init__(self):
+        self.num_lines = 0
+        self.num_correct_lines = 0
+        # ref_change_stats will be a map from a string like
+        # 'foo -> bar' to an integer count; it keeps track of how much we changed
+        # the reference.
+        self.ref_change_stats = defaultdict(int)
+        # repetition_stats will be a map from strings like
+        # 'a', or 'a b' (the repeated strings), to an integer count; like
+        # ref_change_stats, it keeps track of how many changes we made
+        # in allowing repetitions.
+        self.repetition_stats = defaultdict(int)
+
+    def Add(self, other):
+        self.num_lines += other.num_lines
+        self.num_correct_lines += other.num_correct_lines
+        for k, v in other.ref_change_stats.items():
+            self.ref_change_stats[k] += v
+        for k, v in other.repetition_stats.items():
+            self.repetition_stats[k] += v
 
 
 
@@ -131,11 +174,12 @@ def ReadNonScoredWords(non_scored_words_file):
 # It modifies the object 'a'.   This function returns the modified array,
 # and please note that it is destructive of its input 'a'.
 # If it returnso the empty array then the line is to be deleted.
-def ProcessLineForNonScoredWords(a):
-    global num_lines, num_correct_lines, ref_change_stats
+# The statistics are accumulated in 'stats' (of type Stats).
+def ProcessLineForNonScoredWords(a, stats):
+    ref_change_stats = stats.ref_change_stats
     try:
         assert len(a) == 8
-        num_lines += 1
+        stats.num_lines += 1
         # we could do:
         # [ file, channel, start, duration, hyp_word, confidence, ref_word, edit_type ] = a
         duration = a[3]
@@ -163,7 +207,7 @@ def ProcessLineForNonScoredWords(a):
                 edit_type = 'fix'
         else:
             assert edit_type == 'cor' or edit_type == 'sil'
-            num_correct_lines += 1
+            stats.num_correct_lines += 1
 
         a[4] = hyp_word
         a[6] = ref_word
@@ -182,8 +226,8 @@ def ProcessLineForNonScoredWords(a):
 # ref to match.
 # It returns the modified list-of-lists [but note that the input
 # is actually modified].
-def ProcessUtteranceForRepetitions(split_lines_of_utt):
-    global non_scored_words, repetition_stats
+def ProcessUtteranceForRepetitions(split_lines_of_utt, stats):
+    repetition_stats = stats.repetition_stats
     # The array 'selected_lines' will contain the indexes of of selected
     # elements of 'split_lines_of_utt'.  Consider split_line =
     # split_lines_of_utt[i].  If the hyp and ref words in split_line are both
@@ -304,18 +348,19 @@ def ProcessUtteranceForRepetitions(split_lines_of_utt):
 # note: split_lines_of_utt is a list of lists, one per line, each containing the
 # sequence of fields.
 # Returns the same format of data after processing.
-def ProcessUtterance(split_lines_of_utt):
+def ProcessUtterance(split_lines_of_utt, stats):
     new_split_lines_of_utt = []
     for split_line in split_lines_of_utt:
-        new_split_line = ProcessLineForNonScoredWords(split_line)
+        new_split_line = ProcessLineForNonScoredWords(split_line, stats)
         if new_split_line != []:
             new_split_lines_of_utt.append(new_split_line)
     if args.allow_repetitions == 'true':
-        new_split_lines_of_utt = ProcessUtteranceForRepetitions(new_split_lines_of_utt)
+        new_split_lines_of_utt = ProcessUtteranceForRepetitions(new_split_lines_of_utt,
+                                                                stats)
     return new_split_lines_of_utt
 
 
-def ProcessData():
+def ProcessData(stats):
     try:
         f_in = open(args.ctm_edits_in, encoding='utf-8')
     except:
@@ -326,45 +371,23 @@ def ProcessData():
     except:
         sys.exit("modify_ctm_edits.py: error opening ctm-edits output "
                  "file {0}".format(args.ctm_edits_out))
-    num_lines_processed = 0
-
-
-    # Most of what we're doing in the lines below is splitting the input lines
-    # and grouping them per utterance, before giving them to ProcessUtterance()
-    # and then printing the modified lines.
-    first_line = f_in.readline()
-    if first_line == '':
-        sys.exit("modify_ctm_edits.py: empty input")
-    split_pending_line = first_line.split()
-    if len(split_pending_line) == 0:
-        sys.exit("modify_ctm_edits.py: bad input line " + first_line)
-    cur_utterance = split_pending_line[0]
-    split_lines_of_cur_utterance = []
-
-    while True:
-        if len(split_pending_line) == 0 or split_pending_line[0] != cur_utterance:
-            split_lines_of_cur_utterance = ProcessUtterance(split_lines_of_cur_utterance)
-            for split_line in split_lines_of_cur_utterance:
-                print(' '.join(split_line), file = f_out)
-            split_lines_of_cur_utterance = []
-            if len(split_pending_line) == 0:
-                break
-            else:
-                cur_utterance = split_pending_line[0]
-
-        split_lines_of_cur_utterance.append(split_pending_line)
-        next_line = f_in.readline()
-        split_pending_line = next_line.split()
-        if len(split_pending_line) == 0:
-            if next_line != '':
-                sys.exit("modify_ctm_edits.py: got an empty or whitespace input line")
+
+    # ReadUtterances() splits the input lines and groups them per utterance;
+    # we give them to ProcessUtterance() and then print the modified lines.
+    for _, split_lines_of_cur_utterance in ctm_edits_lib.ReadUtterances(
+            f_in, "modify_ctm_edits.py"):
+        ctm_edits_lib.WriteUtterance(
+            f_out, ProcessUtterance(split_lines_of_cur_utterance, stats))
     try:
         f_out.close()
     except:
         sys.exit("modify_ctm_edits.py: error closing ctm-edits output "
                  "(broken pipe or full disk?)")
 
-def PrintNonScoredStats():
+def PrintNonScoredStats(stats):
+    num_lines = stats.num_lines
+    num_correct_lines = stats.num_correct_lines
+    ref_change_stats = stats.ref_change_stats
     if args.verbose < 1:
         return
     if num_lines == 0:
@@ -397,7 +420,10 @@ def PrintNonScoredStats():
           file = sys.stderr)
 
 
-def PrintRepetitionStats():
+def PrintRepetitionStats(stats):
+    num_lines = stats.num_lines
+    num_correct_lines = stats.num_correct_lines
+    repetition_stats = stats.repetition_stats
     if args.verbose < 1 or sum(repetition_stats.values()) == 0:
         return
     num_lines_modified = sum(repetition_stats.values())
@@ -428,21 +454,14 @@ def PrintRepetitionStats():
           file = sys.stderr)
 
 
-non_scored_words = set()
-ReadNonScoredWords(args.non_scored_words_in)
-
-num_lines = 0
-num_correct_lines = 0
-# ref_change_stats will be a map from a string like
-# 'foo -> bar' to an integer count; it keeps track of how much we changed
-# the reference.
-ref_change_stats = defaultdict(int)
-# repetition_stats will be a map from strings like
-# 'a', or 'a b' (the repeated strings), to an integer count; like
-# ref_change_stats, it keeps track of how many changes we made
-# in allowing repetitions.
-repetition_stats = defaultdict(int)
-
-ProcessData()
-PrintNonScoredStats()
-PrintRepetitionStats()
+def Main():
+    args = parser.parse_args()
+    Initialize(args, ReadNonScoredWords(args.non_scored_words_in))
+    stats = Stats()
+    ProcessData(stats)
+    PrintNonScoredStats(stats)
+    PrintRepetitionStats(stats)
+
+
+if __name__ == "__main__":
+    Main()
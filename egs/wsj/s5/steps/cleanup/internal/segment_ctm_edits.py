@@ -10,6 +10,8 @@ from __future__ import division
 import sys, operator, argparse, os
 from collections import defaultdict
 
+import ctm_edits_lib
+
 # This script reads 'ctm-edits' file format that is produced by get_ctm_edits.py
 # and modified by modify_ctm_edits.py and taint_ctm_edits.py Its function is to
 # produce a segmentation and text from the ctm-edits input.
@@ -18,84 +20,87 @@ from collections import defaultdict
 # <file-id> <channel> <start-time> <duration> <conf> <hyp-word> <ref-word> <edit> ['tainted']
 # [note: file-id is really utterance-id at this point].
 
+# The options are in a separate parser so that get_segments_from_ctm_edits.py
+# can parse them too.
+options_parser = argparse.ArgumentParser(add_help = False)
+options_parser.add_argument("--min-segment-length", type = float, default = 0.5,
+                            help = "Minimum allowed segment length (in seconds) for any "
+                            "segment; shorter segments than this will be discarded.")
+options_parser.add_argument("--min-new-segment-length", type = float, default = 1.0,
+                            help = "Minimum allowed segment length (in seconds) for newly "
+                            "created segments (i.e. not identical to the input utterances). "
+                            "Expected to be >= --min-segment-length.")
+options_parser.add_argument("--frame-length", type = float, default = 0.01,
+                            help = "This only affects rounding of the output times; they will "
+                            "be constrained to multiples of this value.")
+options_parser.add_argument("--max-tainted-length", type = float, default = 0.05,
+                            help = "Maximum allowed length of any 'tainted' line.  Note: "
+                            "'tainted' lines may only appear at the boundary of a "
+                            "segment")
+options_parser.add_argument("--max-edge-silence-length", type = float, default = 0.5,
+                            help = "Maximum allowed length of silence if it appears at the "
+                            "edge of a segment (will be truncated).  This rule is "
+                            "relaxed if such truncation would take a segment below "
+                            "the --min-segment-length or --min-new-segment-length.")
+options_parser.add_argument("--max-edge-non-scored-length", type = float, default = 0.5,
+                            help = "Maximum allowed length of a non-scored word (noise, cough, etc.) "
+                            "if it appears at the edge of a segment (will be truncated). "
+                            "This rule is relaxed if such truncation would take a "
+                            "segment below the --min-segment-length.")
+options_parser.add_argument("--max-internal-silence-length", type = float, default = 2.0,
+                            help = "Maximum allowed length of silence if it appears inside a segment "
+                            "(will cause the segment to be split).")
+options_parser.add_argument("--max-internal-non-scored-length", type = float, default = 2.0,
+                            help = "Maximum allowed length of a non-scored word (noise, etc.) if "
+                            "it appears inside a segment (will cause the segment to be "
+                            "split).  Note: reference words which are real words but OOV "
+                            "are not included in this category.")
+options_parser.add_argument("--unk-padding", type = float, default = 0.05,
+                            help = "Amount of padding with <unk> that we do if a segment boundary is "
+                            "next to errors (ins, del, sub).  That is, we add this amount of "
+                            "time to the segment and add the <unk> word to cover the acoustics. "
+                            "If nonzero, the --oov-symbol-file option must be supplied.")
+options_parser.add_argument("--max-junk-proportion", type = float, default = 0.1,
+                            help = "Maximum proportion of the time of the segment that may "
+                            "consist of potentially bad data, in which we include 'tainted' lines of "
+                            "the ctm-edits input and unk-padding.")
+options_parser.add_argument("--min-split-point-duration", type=float, default=0.1,
+                            help="""Minimum duration of silence or non-scored word
+                            to be considered a viable split point when
+                            truncating based on junk proportion.""")
+options_parser.add_argument("--max-deleted-words-kept-when-merging", type = int, default = 1,
+                            help = "When merging segments that are found to be overlapping or "
+                            "adjacent after all other processing, keep in the transcript the "
+                            "reference words that were deleted between the segments [if any] "
+                            "as long as there were no more than this many reference words. "
+                            "Setting this to zero will mean that any reference words that "
+                            "were deleted between the segments we're about to reattach will "
+                            "not appear in the generated transcript (so we'll match the hyp).")
+options_parser.add_argument("--oov-symbol-file", type = str, default = None,
+                            help = "Filename of file such as data/lang/oov.txt which contains "
+                            "the text form of the OOV word, normally '<unk>'.  Supplied as "
+                            "a file to avoid complications with escaping.  Necessary if "
+                            "the --unk-padding option has a nonzero value (which it does "
+                            "by default.")
+options_parser.add_argument("--ctm-edits-out", type = str,
+                            help = "Filename to output an extended version of the ctm-edits format "
+                            "with segment start and end points noted.  This file is intended to be "
+                            "read by humans; there are currently no scripts that will read it.")
+options_parser.add_argument("--word-stats-out", type = str,
+                            help = "Filename for output of word-level stats, of the form "
+                            "'<word> <bad-proportion> <total-count-in-ref>', e.g. 'hello 0.12 12408', "
+                            "where the <bad-proportion> is the proportion of the time that this "
+                            "reference word does not make it into a segment.  It can help reveal words "
+                            "that have problematic pronunciations or are associated with "
+                            "transcription errors.")
+
 parser = argparse.ArgumentParser(
     description = "This program produces segmentation and text information "
     "based on reading ctm-edits input format which is produced by "
     "steps/cleanup/internal/get_ctm_edits.py, steps/cleanup/internal/modify_ctm_edits.py and "
     "steps/cleanup/internal/taint_ctm_edits.py.",
- formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-
-parser.add_argument("--min-segment-length", type = float, default = 0.5,
-                    help = "Minimum allowed segment length (in seconds) for any "
-                    "segment; shorter segments than this will be discarded.")
-parser.add_argument("--min-new-segment-length", type = float, default = 1.0,
-                    help = "Minimum allowed segment length (in seconds) for newly "
-                    "created segments (i.e. not identical to the input utterances). "
-                    "Expected to be >= --min-segment-length.")
-parser.add_argument("--frame-length", type = float, default = 0.01,
-                    help = "This only affects rounding of the output times; they will "
-                    "be constrained to multiples of this value.")
-parser.add_argument("--max-tainted-length", type = float, default = 0.05,
-                    help = "Maximum allowed length of any 'tainted' line.  Note: "
-                    "'tainted' lines may only appear at the boundary of a "
-                    "segment")
-parser.add_argument("--max-edge-silence-length", type = float, default = 0.5,
-                    help = "Maximum allowed length of silence if it appears at the "
-                    "edge of a segment (will be truncated).  This rule is "
-                    "relaxed if such truncation would take a segment below "
-                    "the --min-segment-length or --min-new-segment-length.")
-parser.add_argument("--max-edge-non-scored-length", type = float, default = 0.5,
-                    help = "Maximum allowed length of a non-scored word (noise, cough, etc.) "
-                    "if it appears at the edge of a segment (will be truncated). "
-                    "This rule is relaxed if such truncation would take a "
-                    "segment below the --min-segment-length.")
-parser.add_argument("--max-internal-silence-length", type = float, default = 2.0,
-                    help = "Maximum allowed length of silence if it appears inside a segment "
-                    "(will cause the segment to be split).")
-parser.add_argument("--max-internal-non-scored-length", type = float, default = 2.0,
-                    help = "Maximum allowed length of a non-scored word (noise, etc.) if "
-                    "it appears inside a segment (will cause the segment to be "
-                    "split).  Note: reference words which are real words but OOV "
-                    "are not included in this category.")
-parser.add_argument("--unk-padding", type = float, default = 0.05,
-                    help = "Amount of padding with <unk> that we do if a segment boundary is "
-                    "next to errors (ins, del, sub).  That is, we add this amount of "
-                    "time to the segment and add the <unk> word to cover the acoustics. "
-                    "If nonzero, the --oov-symbol-file option must be supplied.")
-parser.add_argument("--max-junk-proportion", type = float, default = 0.1,
-                    help = "Maximum proportion of the time of the segment that may "
-                    "consist of potentially bad data, in which we include 'tainted' lines of "
-                    "the ctm-edits input and unk-padding.")
-parser.add_argument("--min-split-point-duration", type=float, default=0.1,
-                    help="""Minimum duration of silence or non-scored word
-                    to be considered a viable split point when
-                    truncating based on junk proportion.""")
-parser.add_argument("--max-deleted-words-kept-when-merging", type = int, default = 1,
-                    help = "When merging segments that are found to be overlapping or "
-                    "adjacent after all other processing, keep in the transcript the "
-                    "reference words that were deleted between the segments [if any] "
-                    "as long as there were no more than this many reference words. "
-                    "Setting this to zero will mean that any reference words that "
-                    "were deleted between the segments we're about to reattach will "
-                    "not appear in the generated transcript (so we'll match the hyp).")
-parser.add_argument("--oov-symbol-file", type = str, default = None,
-                    help = "Filename of file such as data/lang/oov.txt which contains "
-                    "the text form of the OOV word, normally '<unk>'.  Supplied as "
-                    "a file to avoid complications with escaping.  Necessary if "
-                    "the --unk-padding option has a nonzero value (which it does "
-                    "by default.")
-parser.add_argument("--ctm-edits-out", type = str,
-                    help = "Filename to output an extended version of the ctm-edits format "
-                    "with segment start and end points noted.  This file is intended to be "
-                    "read by humans; there are currently no scripts that will read it.")
-parser.add_argument("--word-stats-out", type = str,
-                    help = "Filename for output of word-level stats, of the form "
-                    "'<word> <bad-proportion> <total-count-in-ref>', e.g. 'hello 0.12 12408', "
-                    "where the <bad-proportion> is the proportion of the time that this "
-                    "reference word does not make it into a segment.  It can help reveal words "
-                    "that have problematic pronunciations or are associated with "
-                    "transcription errors.")
-
+ formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+ parents = [options_parser])
 
 parser.add_argument("non_scored_words_in", metavar = "<non-scored-words-file>",
                     help="Filename of file containing a list of non-scored words, "
@@ -111,8 +116,68 @@ parser.add_argument("segments_out", metavar = "<segments-out>",
                     "but instead of <recording-id>, the second field is the old utterance-id, i.e "
                     "<new-utterance-id> <old-utterance-id> <start-time> <end-time>")
 
-args = parser.parse_args()
+args = None
+non_scored_words = set()
+oov_symbol = None
+
 
+# This sets the options (as parsed by 'options_parser' or 'parser') and the
+# set of non-scored words used by the functions below, and reads the
+# --oov-symbol-file.
+def Initialize(this_args, this_non_scored_words):
+    global args, non_scored_words, oov_symbol
+    args = this_args
+    non_scored_words = this_non_scored_words
+    oov_symbol = None
+    if args.oov_symbol_file != None:
+        try:
+            with open(args.oov_symbol_file, encoding='utf-8') as f:
+                line = f.readline()
+                assert len(line.split()) == 1
+                oov_symbol = line.split()[0]
+                assert f.readline() == ''
+        except Exception as e:
+            sys.exit("segment_ctm_edits.py: error reading file --oov-symbol-file=" +
+                     args.oov_symbol_file + ", error is: " + str(e))
+    elif args.unk_padding != 0.0:
+        sys.exit("segment_ctm_edits.py: if the --unk-padding option is nonzero (which "
+                 "it is by default, the --oov-symbol-file option must be supplied.")
+
+
+# This returns the list [0, 0] that is the initial value of the entries of
+# Stats.word_count_pair.
+def NewWordCountPair():
+    return [0, 0]
+
+
+# This class holds the statistics printed at the end by PrintSegmentStats()
+# and PrintWordStats().  Statistics accumulated separately (e.g. in different
+# processes) can be summed with Add().
+class Stats(object):
+    def __init__(self):
+        # segment_total_length and num_segments are maps from
+        # 'stage' strings; see AccumulateSegmentStats for details.
+        self.segment_total_length = defaultdict(int)
+        self.num_segments = defaultdict(int)
+        # word_count_pair is a map from a string (the word) to a list
+        # [total-count, count-not-within-segments]; see AccWordStatsForUtterance.
+        self.word_count_pair = defaultdict(NewWordCountPair)
+        self.num_utterances = 0
+        self.num_utterances_without_segments = 0
+        self.total_length_of_utterances = 0
+
+    def Add(self, other):
+        for k, v in other.segment_total_length.items():
+            self.segment_total_length[k] += v
+        for k, v in other.num_segments.items():
+            self.num_segments[k] += v
+        for k, v in other.word_count_pair.items():
+            pair = self.word_count_pair[k]
+            pair[0] += v[0]
+            pair[1] += v[1]
+        self.num_utterances += other.num_utterances
+        self.num_utterances_without_segments += other.num_utterances_without_segments
+        self.total_length_of_utterances += other.total_length_of_utterances
 
 
 
@@ -640,16 +705,17 @@ class Segment(object):
 # Here, 'text' will be something that indicates the stage of processing,
 # e.g. 'Stage 0: segment cores', 'Stage 1: add tainted lines',
 #, etc.
-def AccumulateSegmentStats(segment_list, text):
-    global segment_total_length, num_segments
+def AccumulateSegmentStats(segment_list, text, stats):
     for segment in segment_list:
-        num_segments[text] += 1
-        segment_total_length[text] += segment.Length()
+        stats.num_segments[text] += 1
+        stats.segment_total_length[text] += segment.Length()
 
-def PrintSegmentStats():
-    global segment_total_length, num_segments, \
-       num_utterances, num_utterances_without_segments, \
-       total_length_of_utterances
+def PrintSegmentStats(stats):
+    segment_total_length = stats.segment_total_length
+    num_segments = stats.num_segments
+    num_utterances = stats.num_utterances
+    num_utterances_without_segments = stats.num_utterances_without_segments
+    total_length_of_utterances = stats.total_length_of_utterances
 
     print('Number of utterances is %d, of which %.2f%% had no segments after '
           'all processing; total length of data in original utterances (in seconds) '
@@ -676,38 +742,37 @@ def PrintSegmentStats():
 # It returns a 2-tuple (list-of-segments, list-of-deleted-segments)
 # where the deleted segments are only useful for diagnostic printing.
 # Note: split_lines_of_utt is a list of lists, one per line, each containing the
-# sequence of fields.
-def GetSegmentsForUtterance(split_lines_of_utt):
-    global num_utterances, num_utterances_without_segments, total_length_of_utterances
-
-    num_utterances += 1
+# sequence of fields.  The statistics are accumulated in 'stats' (of type
+# Stats).
+def GetSegmentsForUtterance(split_lines_of_utt, stats):
+    stats.num_utterances += 1
 
     segment_ranges = ComputeSegmentCores(split_lines_of_utt)
 
     utterance_end_time = float(split_lines_of_utt[-1][2]) + float(split_lines_of_utt[-1][3])
-    total_length_of_utterances += utterance_end_time
+    stats.total_length_of_utterances += utterance_end_time
 
     segments = [ Segment(split_lines_of_utt, x[0], x[1])
                  for x in segment_ranges ]
 
-    AccumulateSegmentStats(segments, 'stage  0 [segment cores]')
+    AccumulateSegmentStats(segments, 'stage  0 [segment cores]', stats)
     for segment in segments:
         segment.PossiblyAddTaintedLines()
-    AccumulateSegmentStats(segments, 'stage  1 [add tainted lines]')
+    AccumulateSegmentStats(segments, 'stage  1 [add tainted lines]', stats)
     new_segments = []
     for s in segments:
         new_segments += s.PossiblySplitSegment()
     segments = new_segments
-    AccumulateSegmentStats(segments, 'stage  2 [split segments]')
+    AccumulateSegmentStats(segments, 'stage  2 [split segments]', stats)
     for s in segments:
         s.PossiblyTruncateBoundaries()
-    AccumulateSegmentStats(segments, 'stage  3 [truncate boundaries]')
+    AccumulateSegmentStats(segments, 'stage  3 [truncate boundaries]', stats)
     for s in segments:
         s.RelaxBoundaryTruncation()
-    AccumulateSegmentStats(segments, 'stage  4 [relax boundary truncation]')
+    AccumulateSegmentStats(segments, 'stage  4 [relax boundary truncation]', stats)
     for s in segments:
         s.PossiblyAddUnkPadding()
-    AccumulateSegmentStats(segments, 'stage  5 [unk-padding]')
+    AccumulateSegmentStats(segments, 'stage  5 [unk-padding]', stats)
 
     deleted_segments = []
     new_segments = []
@@ -719,7 +784,7 @@ def GetSegmentsForUtterance(split_lines_of_utt):
         else:
             new_segments.append(s)
     segments = new_segments
-    AccumulateSegmentStats(segments, 'stage  6 [remove new segments under --min-new-segment-length')
+    AccumulateSegmentStats(segments, 'stage  6 [remove new segments under --min-new-segment-length', stats)
 
     new_segments = []
     for s in segments:
@@ -730,15 +795,15 @@ def GetSegmentsForUtterance(split_lines_of_utt):
         else:
             new_segments.append(s)
     segments = new_segments
-    AccumulateSegmentStats(segments, 'stage  7 [remove segments under --min-segment-length')
+    AccumulateSegmentStats(segments, 'stage  7 [remove segments under --min-segment-length', stats)
 
     for s in segments:
         s.PossiblyTruncateStartForJunkProportion()
-    AccumulateSegmentStats(segments, 'stage  8 [truncate segment-starts for --max-junk-proportion')
+    AccumulateSegmentStats(segments, 'stage  8 [truncate segment-starts for --max-junk-proportion', stats)
 
     for s in segments:
         s.PossiblyTruncateEndForJunkProportion()
-    AccumulateSegmentStats(segments, 'stage  9 [truncate segment-ends for --max-junk-proportion')
+    AccumulateSegmentStats(segments, 'stage  9 [truncate segment-ends for --max-junk-proportion', stats)
 
     new_segments = []
     for s in segments:
@@ -749,7 +814,7 @@ def GetSegmentsForUtterance(split_lines_of_utt):
             deleted_segments.append(s)
 
     segments = new_segments
-    AccumulateSegmentStats(segments, 'stage 10 [remove segments without scored,non-OOV words]')
+    AccumulateSegmentStats(segments, 'stage 10 [remove segments without scored,non-OOV words]', stats)
 
     new_segments = []
     for s in segments:
@@ -761,7 +826,7 @@ def GetSegmentsForUtterance(split_lines_of_utt):
             deleted_segments.append(s)
 
     segments = new_segments
-    AccumulateSegmentStats(segments, 'stage 11 [remove segments with junk exceeding --max-junk-proportion]')
+    AccumulateSegmentStats(segments, 'stage 11 [remove segments with junk exceeding --max-junk-proportion]', stats)
 
     new_segments = []
     if len(segments) > 0:
@@ -772,7 +837,7 @@ def GetSegmentsForUtterance(split_lines_of_utt):
             else:
                 new_segments.append(segments[i])
     segments = new_segments
-    AccumulateSegmentStats(segments, 'stage 12 [merge overlapping or touching segments]')
+    AccumulateSegmentStats(segments, 'stage 12 [merge overlapping or touching segments]', stats)
 
     for i in range(len(segments) - 1):
         if segments[i].EndTime() > segments[i+1].StartTime():
@@ -780,7 +845,7 @@ def GetSegmentsForUtterance(split_lines_of_utt):
             segments[i+1].debug_str += ",overlaps-previous-segment"
 
     if len(segments) == 0:
-        num_utterances_without_segments += 1
+        stats.num_utterances_without_segments += 1
 
     return (segments, deleted_segments)
 
@@ -878,10 +943,10 @@ def PrintDebugInfoForUtterance(ctm_edits_out_handle,
 # probabilities of being in segments will generally be associated with some kind
 # of error (there is a higher probability of having a wrong lexicon entry).
 def AccWordStatsForUtterance(split_lines_of_utt,
-                             segments_for_utterance):
+                             segments_for_utterance, stats):
     # word_count_pair is a map from a string (the word) to
     # a list [total-count, count-not-within-segments]
-    global word_count_pair
+    word_count_pair = stats.word_count_pair
     line_is_in_segment = [ False ] * len(split_lines_of_utt)
     for segment in segments_for_utterance:
         for i in range(segment.start_index, segment.end_index):
@@ -893,13 +958,13 @@ def AccWordStatsForUtterance(split_lines_of_utt,
             if not line_is_in_segment[i]:
                 word_count_pair[this_ref_word][1] += 1
 
-def PrintWordStats(word_stats_out):
+def PrintWordStats(word_stats_out, stats):
     try:
         f = open(word_stats_out, 'w', encoding='utf-8')
     except:
         sys.exit("segment_ctm_edits.py: error opening word-stats file --word-stats-out={0} "
                  "for writing".format(word_stats_out))
-    global word_count_pair
+    word_count_pair = stats.word_count_pair
     # Sort from most to least problematic.  We want to give more prominence to
     # words that are most frequently not in segments, but also to high-count
     # words.  Define badness = pair[1] / pair[0], and total_count = pair[0],
@@ -923,7 +988,26 @@ def PrintWordStats(word_stats_out):
           file = sys.stderr)
 
 
-def ProcessData():
+# This does all the processing of one utterance: it works out the segments,
+# accumulates the word stats and writes the text and segments (and, if
+# ctm_edits_output_handle is not None, the debugging information) for the
+# utterance.  Note: this is destructive of 'split_lines_of_utt'.
+def ProcessUtterance(utterance_id, split_lines_of_utt, stats,
+                     text_output_handle, segments_output_handle,
+                     ctm_edits_output_handle = None):
+    (segments_for_utterance,
+     deleted_segments_for_utterance) = GetSegmentsForUtterance(split_lines_of_utt, stats)
+    AccWordStatsForUtterance(split_lines_of_utt, segments_for_utterance, stats)
+    WriteSegmentsForUtterance(text_output_handle, segments_output_handle,
+                              utterance_id, segments_for_utterance)
+    if ctm_edits_output_handle != None:
+        PrintDebugInfoForUtterance(ctm_edits_output_handle,
+                                   split_lines_of_utt,
+                                   segments_for_utterance,
+                                   deleted_segments_for_utterance)
+
+
+def ProcessData(stats):
     try:
         f_in = open(args.ctm_edits_in, encoding='utf-8')
     except:
@@ -939,6 +1023,7 @@ def ProcessData():
     except:
         sys.exit("segment_ctm_edits.py: error opening segments output "
                  "file {0}".format(args.text_out))
+    ctm_edits_output_handle = None
     if args.ctm_edits_out != None:
         try:
             ctm_edits_output_handle = open(args.ctm_edits_out, 'w', encoding='utf-8')
@@ -946,42 +1031,13 @@ def ProcessData():
             sys.exit("segment_ctm_edits.py: error opening ctm-edits output "
                      "file {0}".format(args.ctm_edits_out))
 
-    # Most of what we're doing in the lines below is splitting the input lines
-    # and grouping them per utterance, before giving them to ProcessUtterance()
-    # and then printing the modified lines.
-    first_line = f_in.readline()
-    if first_line == '':
-        sys.exit("segment_ctm_edits.py: empty input")
-    split_pending_line = first_line.split()
-    if len(split_pending_line) == 0:
-        sys.exit("segment_ctm_edits.py: bad input line " + first_line)
-    cur_utterance = split_pending_line[0]
-    split_lines_of_cur_utterance = []
-
-    while True:
-        if len(split_pending_line) == 0 or split_pending_line[0] != cur_utterance:
-            (segments_for_utterance,
-             deleted_segments_for_utterance) = GetSegmentsForUtterance(split_lines_of_cur_utterance)
-            AccWordStatsForUtterance(split_lines_of_cur_utterance, segments_for_utterance)
-            WriteSegmentsForUtterance(text_output_handle, segments_output_handle,
-                                      cur_utterance, segments_for_utterance)
-            if args.ctm_edits_out != None:
-                PrintDebugInfoForUtterance(ctm_edits_output_handle,
-                                           split_lines_of_cur_utterance,
-                                           segments_for_utterance,
-                                           deleted_segments_for_utterance)
-            split_lines_of_cur_utterance = []
-            if len(split_pending_line) == 0:
-                break
-            else:
-                cur_utterance = split_pending_line[0]
-
-        split_lines_of_cur_utterance.append(split_pending_line)
-        next_line = f_in.readline()
-        split_pending_line = next_line.split()
-        if len(split_pending_line) == 0:
-            if next_line != '':
-                sys.exit("segment_ctm_edits.py: got an empty or whitespace input line")
+    # ReadUtterances() splits the input lines and groups them per utterance,
+    # before we give them to ProcessUtterance().
+    for cur_utterance, split_lines_of_cur_utterance in ctm_edits_lib.ReadUtterances(
+            f_in, "segment_ctm_edits.py"):
+        ProcessUtterance(cur_utterance, split_lines_of_cur_utterance, stats,
+                         text_output_handle, segments_output_handle,
+                         ctm_edits_output_handle)
     try:
         text_output_handle.close()
         segments_output_handle.close()
@@ -992,8 +1048,9 @@ def ProcessData():
                  "(broken pipe or full disk?)")
 
 
+# This returns the set of non-scored words read from the file.
 def ReadNonScoredWords(non_scored_words_file):
-    global non_scored_words
+    non_scored_words = set()
     try:
         f = open(non_scored_words_file, encoding='utf-8')
     except:
@@ -1006,45 +1063,23 @@ def ReadNonScoredWords(non_scored_words_file):
                      "file {0}: {1}".format(non_scored_words_file, line))
         non_scored_words.add(a[0])
     f.close()
+    return non_scored_words
 
 
 
 
-non_scored_words = set()
-ReadNonScoredWords(args.non_scored_words_in)
+def Main():
+    args = parser.parse_args()
+    Initialize(args, ReadNonScoredWords(args.non_scored_words_in))
+    stats = Stats()
+    ProcessData(stats)
+    PrintSegmentStats(stats)
+    if args.word_stats_out != None:
+        PrintWordStats(args.word_stats_out, stats)
+    if args.ctm_edits_out != None:
+        print("segment_ctm_edits.py: detailed utterance-level debug information "
+              "is in " + args.ctm_edits_out, file = sys.stderr)
 
-oov_symbol = None
-if args.oov_symbol_file != None:
-    try:
-        with open(args.oov_symbol_file, encoding='utf-8') as f:
-            line = f.readline()
-            assert len(line.split()) == 1
-            oov_symbol = line.split()[0]
-            assert f.readline() == ''
-    except Exception as e:
-        sys.exit("segment_ctm_edits.py: error reading file --oov-symbol-file=" +
-                 args.oov_symbol_file + ", error is: " + str(e))
-elif args.unk_padding != 0.0:
-    sys.exit("segment_ctm_edits.py: if the --unk-padding option is nonzero (which "
-             "it is by default, the --oov-symbol-file option must be supplied.")
-
-# segment_total_length and num_segments are maps from
-# 'stage' strings; see AccumulateSegmentStats for details.
-segment_total_length = defaultdict(int)
-num_segments = defaultdict(int)
-# the lambda expression below is an anonymous function that takes no arguments
-# and returns the new list [0, 0].
-word_count_pair = defaultdict(lambda: [0, 0])
-num_utterances = 0
-num_utterances_without_segments = 0
-total_length_of_utterances = 0
-
-
-ProcessData()
-PrintSegmentStats()
-if args.word_stats_out != None:
-    PrintWordStats(args.word_stats_out)
-if args.ctm_edits_out != None:
-    print("segment_ctm_edits.py: detailed utterance-level debug information "
-          "is in " + args.ctm_edits_out, file = sys.stderr)
 
+if __name__ == "__main__":
+    Main()
@@ -9,7 +9,8 @@ import sys, operator, argparse, os
 from collections import defaultdict
 
 import io
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf8")
+
+import ctm_edits_lib
 
 
 # This script reads and writes the 'ctm-edits' file that is
@@ -43,6 +44,16 @@ sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf8")
 
 
 
+# The options are in a separate parser so that get_segments_from_ctm_edits.py
+# can parse them too.
+options_parser = argparse.ArgumentParser(add_help = False)
+options_parser.add_argument("--verbose", type = int, default = 1,
+                            choices=[0,1,2,3],
+                            help = "Verbose level, higher = more verbose output")
+options_parser.add_argument("--remove-deletions", type=str, default="true",
+                            choices=["true", "false"],
+                            help = "Remove deletions next to taintable lines")
+
 parser = argparse.ArgumentParser(
     description = "This program modifies the ctm-edits format to identify "
     "silence and 'fixed' non-scored-word lines, and lines where the hyp is "
@@ -52,14 +63,9 @@ parser = argparse.ArgumentParser(
     "lines.  Lines in the ctm representing deletions from the reference will "
     "be removed if they have 'tainted' adjacent lines (since it won't be clear "
     "where such reference words were really realized, if at all). "
-    "See comments at the top of the script for more information.")
-
-parser.add_argument("--verbose", type = int, default = 1,
-                    choices=[0,1,2,3],
-                    help = "Verbose level, higher = more verbose output")
-parser.add_argument("--remove-deletions", type=str, default="true",
-                    choices=["true", "false"],
-                    help = "Remove deletions next to taintable lines")
+    "See comments at the top of the script for more information.",
+    parents = [options_parser])
+
 parser.add_argument("ctm_edits_in", metavar = "<ctm-edits-in>",
                     help = "Filename of input ctm-edits file. "
                     "Use /dev/stdin for standard input.")
@@ -67,8 +73,37 @@ parser.add_argument("ctm_edits_out", metavar = "<ctm-edits-out>",
                     help = "Filename of output ctm-edits file. "
                     "Use /dev/stdout for standard output.")
 
-args = parser.parse_args()
-args.remove_deletions = bool(args.remove_deletions == "true")
+args = None
+remove_deletions = True
+
+
+# This sets the options (as parsed by 'options_parser' or 'parser') used by the
+# functions below.
+def Initialize(this_args):
+    global args, remove_deletions
+    args = this_args
+    remove_deletions = bool(args.remove_deletions == "true")
+
+
+# This class holds the statistics printed at the end by PrintStats().
+# Statistics accumulated separately (e.g. in different processes) can be
+# summed with Add().
+class Stats(object):
+    def __init__(self):
+        # num_lines_of_type will map from line-type ('cor', 'sub', etc.) to count.
+        self.num_lines_of_type = defaultdict(int)
+        self.num_tainted_lines = 0
+        self.num_del_lines_giving_taint = 0
+        self.num_sub_lines_giving_taint = 0
+        self.num_ins_lines_giving_taint = 0
+
+    def Add(self, other):
+        for k, v in other.num_lines_of_type.items():
+            self.num_lines_of_type[k] += v
+        self.num_tainted_lines += other.num_tainted_lines
+        self.num_del_lines_giving_taint += other.num_del_lines_giving_taint
+        self.num_sub_lines_giving_taint += other.num_sub_lines_giving_taint
+        self.num_ins_lines_giving_taint += other.num_ins_lines_giving_taint
 
 
 
@@ -77,11 +112,10 @@ args.remove_deletions = bool(args.remove_deletions == "true")
 # split_lines_of_utt is a list of lists, one per line, each containing the
 # sequence of fields.  Returns the same format of data after processing to add
 # the 'tainted' field.  Note: this function is destructive of its input; the
-# input will not have the same value afterwards.
-def ProcessUtterance(split_lines_of_utt, remove_deletions=True):
-    global num_lines_of_type, num_tainted_lines, \
-           num_del_lines_giving_taint, num_sub_lines_giving_taint, \
-           num_ins_lines_giving_taint
+# input will not have the same value afterwards.  The statistics are
+# accumulated in 'stats' (of type Stats).
+def ProcessUtterance(split_lines_of_utt, stats, remove_deletions=True):
+    num_lines_of_type = stats.num_lines_of_type
 
     # work out whether each line is taintable [i.e. silence or fix or unk replacing
     # real-word].
@@ -109,7 +143,7 @@ def ProcessUtterance(split_lines_of_utt, remove_deletions=True):
             while j >= 0 and taintable[j]:
                 tainted_an_adjacent_line = True
                 if len(split_lines_of_utt[j]) == 8:
-                    num_tainted_lines += 1
+                    stats.num_tainted_lines += 1
                     split_lines_of_utt[j].append('tainted')
                 j -= 1
             # Next go forwards tainting lines
@@ -117,18 +151,18 @@ def ProcessUtterance(split_lines_of_utt, remove_deletions=True):
             while j < len(split_lines_of_utt) and taintable[j]:
                 tainted_an_adjacent_line = True
                 if len(split_lines_of_utt[j]) == 8:
-                    num_tainted_lines += 1
+                    stats.num_tainted_lines += 1
                     split_lines_of_utt[j].append('tainted')
                 j += 1
             if tainted_an_adjacent_line:
                 if edit_type == 'del':
                     if remove_deletions:
                         split_lines_of_utt[i][7] = 'remove-this-line'
-                    num_del_lines_giving_taint += 1
+                    stats.num_del_lines_giving_taint += 1
                 elif edit_type == 'sub':
-                    num_sub_lines_giving_taint += 1
+                    stats.num_sub_lines_giving_taint += 1
                 else:
-                    num_ins_lines_giving_taint += 1
+                    stats.num_ins_lines_giving_taint += 1
 
     new_split_lines_of_utt = []
     for i in range(len(split_lines_of_utt)):
@@ -138,7 +172,7 @@ def ProcessUtterance(split_lines_of_utt, remove_deletions=True):
     return new_split_lines_of_utt
 
 
-def ProcessData():
+def ProcessData(stats):
     try:
         f_in = open(args.ctm_edits_in, encoding="utf8")
     except:
@@ -149,39 +183,14 @@ def ProcessData():
     except:
         sys.exit("taint_ctm_edits.py: error opening ctm-edits output "
                  "file {0}".format(args.ctm_edits_out))
-    num_lines_processed = 0
-
-
-    # Most of what we're doing in the lines below is splitting the input lines
-    # and grouping them per utterance, before giving them to ProcessUtterance()
-    # and then printing the modified lines.
-    first_line = f_in.readline()
-    if first_line == '':
-        sys.exit("taint_ctm_edits.py: empty input")
-    split_pending_line = first_line.split()
-    if len(split_pending_line) == 0:
-        sys.exit("taint_ctm_edits.py: bad input line " + first_line)
-    cur_utterance = split_pending_line[0]
-    split_lines_of_cur_utterance = []
-
-    while True:
-        if len(split_pending_line) == 0 or split_pending_line[0] != cur_utterance:
-            split_lines_of_cur_utterance = ProcessUtterance(
-                split_lines_of_cur_utterance, args.remove_deletions)
-            for split_line in split_lines_of_cur_utterance:
-                print(' '.join(split_line), file = f_out)
-            split_lines_of_cur_utterance = []
-            if len(split_pending_line) == 0:
-                break
-            else:
-                cur_utterance = split_pending_line[0]
-
-        split_lines_of_cur_utterance.append(split_pending_line)
-        next_line = f_in.readline()
-        split_pending_line = next_line.split()
-        if len(split_pending_line) == 0:
-            if next_line != '':
-                sys.exit("taint_ctm_edits.py: got an empty or whitespace input line")
+
+    # ReadUtterances() splits the input lines and groups them per utterance;
+    # we give them to ProcessUtterance() and then print the modified lines.
+    for _, split_lines_of_cur_utterance in ctm_edits_lib.ReadUtterances(
+            f_in, "taint_ctm_edits.py"):
+        ctm_edits_lib.WriteUtterance(
+            f_out, ProcessUtterance(split_lines_of_cur_utterance, stats,
+                                    remove_deletions))
     try:
         f_out.close()
     except:
@@ -217,7 +226,8 @@ def PrintNonScoredStats():
           file = sys.stderr)
 
 
-def PrintStats():
+def PrintStats(stats):
+    num_lines_of_type = stats.num_lines_of_type
     tot_lines = sum(num_lines_of_type.values())
     if args.verbose < 1 or tot_lines == 0:
         return
@@ -228,10 +238,10 @@ def PrintStats():
           file = sys.stderr)
 
 
-    del_giving_taint_percent = num_del_lines_giving_taint * 100.0 / tot_lines
-    sub_giving_taint_percent = num_sub_lines_giving_taint * 100.0 / tot_lines
-    ins_giving_taint_percent = num_ins_lines_giving_taint * 100.0 / tot_lines
-    tainted_lines_percent = num_tainted_lines * 100.0 / tot_lines
+    del_giving_taint_percent = stats.num_del_lines_giving_taint * 100.0 / tot_lines
+    sub_giving_taint_percent = stats.num_sub_lines_giving_taint * 100.0 / tot_lines
+    ins_giving_taint_percent = stats.num_ins_lines_giving_taint * 100.0 / tot_lines
+    tainted_lines_percent = stats.num_tainted_lines * 100.0 / tot_lines
 
     print("taint_ctm_edits.py: as a percentage of all lines, (%.2f%%, %.2f%%, %.2f%%) were "
           "(deletions, substitutions, insertions) that tainted adjacent lines.  %.2f%% of all "
@@ -241,12 +251,13 @@ def PrintStats():
 
 
 
-# num_lines_of_type will map from line-type ('cor', 'sub', etc.) to count.
-num_lines_of_type = defaultdict(int)
-num_tainted_lines = 0
-num_del_lines_giving_taint = 0
-num_sub_lines_giving_taint = 0
-num_ins_lines_giving_taint = 0
+def Main():
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf8")
+    Initialize(parser.parse_args())
+    stats = Stats()
+    ProcessData(stats)
+    PrintStats(stats)
+
 
-ProcessData()
-PrintStats()
+if __name__ == "__main__":
+    Main()
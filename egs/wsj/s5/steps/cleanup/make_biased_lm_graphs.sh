@@ -25,6 +25,8 @@ top_n_words_weight=1.0  # this weight is before renormalization; it can be more
 min_words_per_graph=100  # Utterances will be grouped so that they have at least
                          # this many words, before making the graph.
 stage=0
+num_workers=1  # Number of processes per job that estimate the biased LMs; each
+               # job reserves this many slots through --num-threads.
 
 ### options for make_one_biased_lm.py.
 ngram_order=4  # maximum n-gram order to use (but see also --min-lm-state-cout).
@@ -68,6 +70,7 @@ if [ $# != 4 ]; then
    echo "                                            # and 1.  Default 0.3.  Smaller -> more strongly biased LM."
    echo "  --config <config-file>                    # config containing options"
    echo "  --nj <nj>                                 # number of parallel jobs"
+   echo "  --num-workers <n>                         # number of processes per job making the LMs"
    echo "  --cmd (utils/run.pl|utils/queue.pl <queue opts>) # how to run jobs."
    exit 1;
 fi
@@ -135,11 +138,14 @@ if [ $stage -le 1 ]; then
   echo "$0: creating utterance-group-specific decoding graphs with biased LMs"
 
   # These options are passed through directly to make_one_biased_lm.py.
-  lm_opts="--word-disambig-symbol=$word_disambig_symbol --ngram-order=$ngram_order --min-lm-state-count=$min_lm_state_count --discounting-constant=$discounting_constant --top-words=$graph_dir/top_words.int"
+  # --binary-output=true makes it write the FSTs in binary form, which is
+  # faster to read for compile-train-graphs-fsts than the text form.
+  lm_opts="--word-disambig-symbol=$word_disambig_symbol --ngram-order=$ngram_order --min-lm-state-count=$min_lm_state_count --discounting-constant=$discounting_constant --top-words=$graph_dir/top_words.int --binary-output=true"
 
-  $cmd JOB=1:$nj $graph_dir/log/compile_decoding_graphs.JOB.log \
+  $cmd --num-threads $num_workers JOB=1:$nj $graph_dir/log/compile_decoding_graphs.JOB.log \
     utils/sym2int.pl --map-oov $oov -f 2- $lang/words.txt $graph_dir/texts/text.JOB \| \
     steps/cleanup/make_biased_lms.py --min-words-per-graph=$min_words_per_graph \
+      --num-workers=$num_workers \
       --lm-opts="$lm_opts" $graph_dir/fsts/utt2group.JOB \| \
     compile-train-graphs-fsts $scale_opts --read-disambig-syms=$lang/phones/disambig.int \
       $dir/tree $dir/final.mdl $lang/L_disambig.fst ark:- \
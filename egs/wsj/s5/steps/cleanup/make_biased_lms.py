@@ -3,22 +3,32 @@
 from __future__ import print_function
 import sys
 import argparse
-import math
-import subprocess
-from collections import defaultdict
+import multiprocessing
+import os
+import shlex
 
 import io
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer,encoding="utf8")
 sys.stderr = io.TextIOWrapper(sys.stderr.buffer,encoding="utf8")
 sys.stdin = io.TextIOWrapper(sys.stdin.buffer,encoding="utf8")
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'internal'))
+import make_one_biased_lm
+from vector_fst import make_fst, write_fst
+
 parser = argparse.ArgumentParser(description="""
 This script is a wrapper for make_one_biased_lm.py that reads a Kaldi archive
 of (integerized) text data from the standard input and writes a Kaldi archive of
 backoff-language-model FSTs to the standard-output.  It takes care of
 grouping utterances to respect the --min-words-per-graph option.  It writes
 the graphs to the standard output and also outputs a map from input utterance-ids
-to the per-group utterance-ids that index the output graphs.""")
+to the per-group utterance-ids that index the output graphs.  The LMs are
+estimated in-process (optionally by a pool of worker processes, see
+--num-workers), and the graphs are written in the order of the input.
+If --lm-opts contains --binary-output=true, the archive is written in binary
+form (the FSTs as fstcompile would write them), which saves the reading program
+from having to parse the text-form FSTs.""")
 
 parser.add_argument("--lm-opts", type = str, default = "",
                     help = "Options to pass in to make_one_biased_lm.py (which "
@@ -27,78 +37,150 @@ parser.add_argument("--min-words-per-graph", type = int, default = 100,
                     help = "Minimum number of words per utterance group; this program "
                     "will try to arrange the input utterances into groups such that each "
                     "one has at least this many words in total.")
+parser.add_argument("--num-workers", type = int, default = 1,
+                    help = "Number of worker processes used to estimate the LMs.")
 parser.add_argument("utterance_map", type = str,
                     help = "Filename to which a map from input utterances to grouped "
                     "utterances, is written")
 
-args = parser.parse_args()
-
-
-
-try:
-    utterance_map_file = open(args.utterance_map, "w")
-except:
-    sys.exit("make_biased_lms.py: error opening {0} to write utterance map".format(
-            args.utterance_map))
-
-# This processes one group of input lines; 'group_of_lines' is
-# an array of lines of input integerized text, e.g.
-# [ 'utt1 67 89 432', 'utt2 89 48 62' ]
-def ProcessGroupOfLines(group_of_lines):
+# The options from --lm-opts and the top-words.  They are set by main(), and
+# in the worker processes by InitWorker(); the top-words are read once, in the
+# main process, and shared by the workers.
+lm_args = None
+top_words = None
+
+
+def InitWorker(worker_lm_args, worker_top_words):
+    global lm_args, top_words
+    lm_args = worker_lm_args
+    top_words = worker_top_words
+
+
+# This yields groups of input lines of integerized text, each with at least
+# --min-words-per-graph words (except possibly the last), as
+# (group_utterance_id, group_of_lines) where 'group_of_lines' is a list of
+# lines with the utterance-ids removed, e.g. [ '67 89 432', '89 48 62' ].
+# It writes the utterance map as it goes.  Raises ValueError on empty lines;
+# with --num-workers > 1 this generator is consumed by a thread of the pool,
+# which passes the exception on to the caller of imap() (whereas SystemExit
+# would kill the thread and leave the caller waiting forever).
+def GroupsOfLines(input_file, min_words_per_graph, utterance_map_file):
+    num_words_this_group = 0
+    this_group_of_lines = []  # An array of strings, one per line
+    while True:
+        line = input_file.readline();
+        num_words_this_group += len(line.split())
+        if line != '':
+            this_group_of_lines.append(line)
+        if num_words_this_group >= min_words_per_graph or \
+            (line == '' and len(this_group_of_lines) != 0):
+            yield SplitGroupOfLines(this_group_of_lines, utterance_map_file)
+            num_words_this_group = 0
+            this_group_of_lines = []
+        if line == '':
+            break
+
+
+def SplitGroupOfLines(group_of_lines, utterance_map_file):
     num_lines = len(group_of_lines)
     try:
         first_utterance_id = group_of_lines[0].split()[0]
-    except:
-        sys.exit("make_biased_lms.py: empty input line")
+    except IndexError:
+        raise ValueError("empty input line")
 
     group_utterance_id = '{0}-group-of-{1}'.format(first_utterance_id, num_lines)
+    texts = []
+    for line in group_of_lines:
+        a = line.split()
+        if len(a) == 0:
+            raise ValueError("empty input line")
+        utterance_id = a[0]
+        # print <utt> <utt-group> to utterance-map file
+        print(utterance_id, group_utterance_id, file = utterance_map_file)
+        texts.append(' '.join(a[1:]))  # get rid of utterance id.
+    return (group_utterance_id, texts)
+
+
+# This estimates the LM for one group of lines and returns it as a text-form
+# FST (a string), or if --binary-output=true was in --lm-opts, as a binary FST
+# (bytes).  It runs in the worker processes.
+def MakeFstForGroup(group):
+    (group_utterance_id, texts) = group
+    ngram_counts = make_one_biased_lm.MakeBiasedLm(texts, lm_args, top_words)
+    if lm_args.binary_output == 'true':
+        output = io.BytesIO()
+    else:
+        output = io.StringIO()
+    fst = make_fst(lm_args, stream = output, separator = ' ')
+    ngram_counts.PrintAsFst(lm_args.word_disambig_symbol, fst = fst)
+    write_fst(fst, lm_args, stream = output)
+    return (group_utterance_id, output.getvalue())
+
+
+def WriteFst(group_utterance_id, fst):
+    if lm_args.binary_output == 'true':
+        # In binary Kaldi archives, the name is followed by a space and
+        # then directly by the binary FST.
+        sys.stdout.flush()
+        sys.stdout.buffer.write(group_utterance_id.encode('utf-8') + b' ')
+        sys.stdout.buffer.write(fst)
+        sys.stdout.buffer.flush()
+        return
     # print the group utterance-id to the stdout; it forms the name in
     # the text-form archive.
     print(group_utterance_id)
-    sys.stdout.flush()
-
-    try:
-        command = "steps/cleanup/internal/make_one_biased_lm.py " + args.lm_opts
-        p = subprocess.Popen(command, shell = True, stdin = subprocess.PIPE,
-                             stdout = sys.stdout, stderr = sys.stderr)
-        for line in group_of_lines:
-            a = line.split()
-            if len(a) == 0:
-                sys.exit("make_biased_lms.py: empty input line")
-            utterance_id = a[0]
-            # print <utt> <utt-group> to utterance-map file
-            print(utterance_id, group_utterance_id, file = utterance_map_file)
-            rest_of_line = ' '.join(a[1:]) + '\n' # get rid of utterance id.
-            p.stdin.write(rest_of_line.encode('utf-8'))
-        p.stdin.close()
-        assert p.wait() == 0
-    except Exception:
-        sys.stderr.write(
-            "make_biased_lms.py: error calling subprocess, command was: " +
-            command)
-        raise
+    sys.stdout.write(fst)
     # Print a blank line; this terminates the FST in the Kaldi fst-archive
     # format.
     print("")
     sys.stdout.flush()
 
 
+def main():
+    global lm_args, top_words
+    args = parser.parse_args()
 
-num_words_this_group = 0
-this_group_of_lines = []  # An array of strings, one per line
+    try:
+        lm_args = make_one_biased_lm.parser.parse_args(shlex.split(args.lm_opts))
+    except SystemExit:
+        sys.exit("make_biased_lms.py: error parsing --lm-opts='{0}'".format(
+                args.lm_opts))
+    if lm_args.binary_output == 'true' and lm_args.fst_type != 'vector':
+        sys.exit("make_biased_lms.py: only --fst-type=vector is supported in "
+                 "Kaldi archives of FSTs")
 
-while True:
-    line = sys.stdin.readline();
-    num_words_this_group += len(line.split())
-    if line != '':
-        this_group_of_lines.append(line)
-    if num_words_this_group >= args.min_words_per_graph or \
-        (line == '' and len(this_group_of_lines) != 0):
-        ProcessGroupOfLines(this_group_of_lines)
-        num_words_this_group = 0
-        this_group_of_lines = []
-    if line == '':
-        break
+    try:
+        utterance_map_file = open(args.utterance_map, "w")
+    except:
+        sys.exit("make_biased_lms.py: error opening {0} to write utterance map".format(
+                args.utterance_map))
+
+    if lm_args.top_words is not None:
+        top_words = make_one_biased_lm.ReadTopWords(lm_args.top_words)
+
+    groups = GroupsOfLines(sys.stdin, args.min_words_per_graph,
+                           utterance_map_file)
+    try:
+        if args.num_workers > 1:
+            with multiprocessing.Pool(args.num_workers, initializer = InitWorker,
+                                      initargs = (lm_args, top_words)) as pool:
+                # imap() returns the results in the order of the input.
+                for group_utterance_id, fst in pool.imap(MakeFstForGroup, groups,
+                                                         chunksize = 4):
+                    WriteFst(group_utterance_id, fst)
+                pool.close()
+                pool.join()
+        else:
+            for group in groups:
+                WriteFst(*MakeFstForGroup(group))
+    except ValueError as e:
+        sys.exit("make_biased_lms.py: {0}".format(str(e)))
+
+    utterance_map_file.close()
+
+
+if __name__ == "__main__":
+    main()
 
 
 # test comand [to be run from ../..]
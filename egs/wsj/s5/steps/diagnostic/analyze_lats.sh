@@ -10,6 +10,7 @@
 iter=final
 cmd=run.pl
 acwt=0.1
+num_threads=1   # number of processes used to read the stats of the jobs.
 #end configuration section.
 
 echo "$0 $@"  # Print the command line for logging
@@ -22,6 +23,7 @@ if [ $# -ne 2 ]; then
   echo " Options:"
   echo "    --cmd (run.pl|queue.pl...)      # specify how to run the sub-processes."
   echo "    --acwt <acoustic-scale>         # Acoustic scale for getting best-path (default: 0.1)"
+  echo "    --num-threads <n>               # number of processes used to read the stats (default: 1)"
   echo "e.g.:"
   echo "$0 data/lang exp/tri4b/decode_dev"
   echo "This script writes some diagnostics to <decode-dir>/log/alignments.log"
@@ -55,9 +57,9 @@ $cmd JOB=1:$num_jobs $dir/log/get_lattice_stats.JOB.log \
   END{for $k (sort keys %count){print "$count{$k} $k"}}' \| \
   gzip -c '>' $dir/phone_stats.JOB.gz || exit 1
 
-$cmd $dir/log/analyze_alignments.log \
-  gunzip -c "$dir/phone_stats.*.gz" \| \
-  steps/diagnostic/analyze_phone_length_stats.py $lang || exit 1
+$cmd --num-threads $num_threads $dir/log/analyze_alignments.log \
+  steps/diagnostic/analyze_phone_length_stats.py --num-jobs $num_threads $lang \
+    $dir/phone_stats.*.gz || exit 1
 
 grep WARNING $dir/log/analyze_alignments.log
 echo "$0: see stats in $dir/log/analyze_alignments.log"
@@ -77,9 +79,9 @@ $cmd JOB=1:$num_jobs $dir/log/lattice_best_path.JOB.log \
   END{for $k (sort keys %count){print "$k $count{$k}\n"}}' \| \
   gzip -c '>' $dir/depth_stats_tmp.JOB.gz
 
-$cmd $dir/log/analyze_lattice_depth_stats.log \
-  gunzip -c "$dir/depth_stats_tmp.*.gz" \| \
-  steps/diagnostic/analyze_lattice_depth_stats.py $lang || exit 1
+$cmd --num-threads $num_threads $dir/log/analyze_lattice_depth_stats.log \
+  steps/diagnostic/analyze_lattice_depth_stats.py --num-jobs $num_threads $lang \
+    $dir/depth_stats_tmp.*.gz || exit 1
 
 grep Overall $dir/log/analyze_lattice_depth_stats.log
 echo "$0: see stats in $dir/log/analyze_lattice_depth_stats.log"
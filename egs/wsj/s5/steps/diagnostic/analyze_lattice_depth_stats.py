@@ -7,8 +7,11 @@
 from __future__ import print_function
 from __future__ import division
 import argparse
+import gzip
+import multiprocessing
 import sys, os
-from collections import defaultdict
+
+import numpy as np
 
 
 parser = argparse.ArgumentParser(description="This script reads stats created in analyze_lats.sh "
@@ -20,152 +23,274 @@ parser.add_argument("--frequency-cutoff-percentage", type = float,
                     default = 0.5, help="Cutoff, expressed as a percentage "
                     "(between 0 and 100), of frequency at which we print stats "
                     "for a phone.")
+parser.add_argument("--num-jobs", type = int, default = 1,
+                    help="Number of processes used to read the stats files "
+                    "(only relevant if more than one is given).")
 
 parser.add_argument("lang",
                     help="Language directory, e.g. data/lang.")
+parser.add_argument("stats_files", nargs = '*',
+                    help="Files (optionally gzipped) with the stats, i.e. lines "
+                    "'<phone> <depth> <count>'; if none are given, the stats "
+                    "are read from the standard input.")
+
+# the approximate number of bytes of input we read and process at a time.
+block_size = 16 * 1024 * 1024
+
+
+# is_space[c] and is_valid[c] say whether the byte c is whitespace, and
+# whether it may appear in lines of integers.
+is_space = np.zeros(256, dtype=bool)
+is_space[np.frombuffer(b' \t\r\n', dtype=np.uint8)] = True
+is_valid = is_space.copy()
+is_valid[np.frombuffer(b'-0123456789', dtype=np.uint8)] = True
 
-args = parser.parse_args()
-
-# set up phone_int2text to map from phone to printed form.
-phone_int2text = {}
-try:
-    f = open(args.lang + "/phones.txt", "r");
-    for line in f.readlines():
-        [ word, number] = line.split()
-        phone_int2text[int(number)] = word
-    f.close()
-except:
-    sys.exit("analyze_lattice_depth_stats.py: error opening or reading {0}/phones.txt".format(
-            args.lang))
-# this is a special case... for begin- and end-of-sentence stats,
-# we group all nonsilence phones together.
-phone_int2text[0] = 'nonsilence'
-
-# populate the set and 'nonsilence', which will contain the integer phone-ids of
-# nonsilence phones (and disambig phones, which won't matter).
-nonsilence = set(phone_int2text.keys())
-nonsilence.remove(0)
-try:
-    # open lang/phones/silence.csl-- while there are many ways of obtaining the
-    # silence/nonsilence phones, we read this because it's present in graph
-    # directories as well as lang directories.
-    filename = "{0}/phones/silence.csl".format(args.lang)
-    f = open(filename, "r")
-    line = f.readline()
-    for silence_phone in line.split(":"):
-        nonsilence.remove(int(silence_phone))
-    f.close()
-except Exception as e:
-    sys.exit("analyze_lattice_depth_stats.py: error processing {0}/phones/silence.csl: {1}".format(
-            args.lang, str(e)))
-
-# phone_depth_counts is a dict of dicts.
-# for each integer phone-id 'phone',
-# phone_depth_counts[phone] is a map from depth to count (of frames on which
-# that was the 1-best phone in the alignment, and the lattice depth
-# had that value).  So we'd access it as
-# count = phone_depth_counts[phone][depth].
-
-phone_depth_counts = dict()
-
-# note: -1 is for all phones put in one bucket.
-for p in [ -1 ] + list(phone_int2text.keys()):
-    phone_depth_counts[p] = defaultdict(int)
-
-total_frames = 0
-
-while True:
-    line = sys.stdin.readline()
-    if line == '':
-        break
-    a = line.split()
-    if len(a) != 3:
-        sys.exit("analyze_lattice_depth_stats.py: reading stdin, could not interpret line: " + line)
+
+# Parses 'data' (bytes), which should consist of 'num_lines' lines each
+# containing 'num_fields' integers, and returns them as an array of dimension
+# (num_lines, num_fields); returns None if the data cannot be interpreted that
+# way.
+def ParseIntegerLines(data, num_lines, num_fields):
+    chars = np.frombuffer(data, dtype=np.uint8)
+    if not np.all(is_valid[chars]):
+        return None
+    # count the fields on each line: a field starts at each non-space byte
+    # that follows a space or the start of the data.
+    space = is_space[chars]
+    field_starts = np.nonzero(~space & np.concatenate(([True], space[:-1])))[0]
+    line_index = np.cumsum(chars == ord('\n')) - (chars == ord('\n'))
+    fields_per_line = np.bincount(line_index[field_starts], minlength = num_lines)
+    if len(fields_per_line) != num_lines or np.any(fields_per_line != num_fields):
+        return None
     try:
-        phone, depth, count = [ int(x) for x in a ]
-
-        phone_depth_counts[phone][depth] += count
-        total_frames += count
-        if phone in nonsilence:
-            nonsilence_phone = 0
-            phone_depth_counts[nonsilence_phone][depth] += count
-        universal_phone = -1
-        phone_depth_counts[universal_phone][depth] += count
-    except Exception as e:
-        sys.exit("analyze_lattice_depth_stats.py: unexpected phone {0} "
-                 "seen (lang directory mismatch?): line is {1}, error is {2}".format(phone, line, str(e)))
+        # fails on fields like '-' or '1-2'.
+        values = np.array(data.split(), dtype=np.int64)
+    except (ValueError, OverflowError):
+        return None
+    return values.reshape(num_lines, num_fields)
+
+
+# Adds the histogram 'b' to the histogram 'a' (arrays with the same number of
+# dimensions), extending 'a' if 'b' is longer in the last dimension; returns
+# the sum.
+def AddHistograms(a, b):
+    if a is None:
+        return b
+    if b.shape[-1] > a.shape[-1]:
+        a, b = b, a
+    a[..., :b.shape[-1]] += b
+    return a
 
-if total_frames == 0:
-    sys.exit("analyze_lattice_depth_stats.py: read no input")
 
+# Reads lines '<phone> <depth> <count>' from the file object f (opened in binary
+# mode) and returns a tuple (phone_depth_counts, total_frames), where
+# phone_depth_counts is an array of dimension (num_phones, max_depth + 1) such
+# that phone_depth_counts[phone, depth] is the count of frames on which that was
+# the 1-best phone in the alignment and the lattice depth had that value.
+# Raises ValueError for malformed input or out-of-range phones.
+def ReadStats(f, num_phones):
+    phone_depth_counts = None
+    total_frames = 0
+    while True:
+        lines = f.readlines(block_size)
+        if len(lines) == 0:
+            break
+        values = ParseIntegerLines(b''.join(lines), len(lines), 3)
+        if values is None:
+            for line in lines:
+                a = line.split()
+                try:
+                    assert len(a) == 3
+                    [ int(x) for x in a ]
+                except (AssertionError, ValueError):
+                    raise ValueError("could not interpret line: " +
+                                     line.decode('utf-8', 'replace'))
+            raise ValueError("could not interpret input")
+        phones, depths, counts = values[:, 0], values[:, 1], values[:, 2]
+        if depths.min() < 0:
+            bad = np.nonzero(depths < 0)[0][0]
+            raise ValueError("could not interpret line: " +
+                             lines[bad].decode('utf-8', 'replace'))
+        if phones.min() < 0 or phones.max() >= num_phones:
+            bad = np.nonzero((phones < 0) | (phones >= num_phones))[0][0]
+            raise ValueError("unexpected phone {0} seen (lang directory mismatch?): "
+                             "line is {1}".format(phones[bad], lines[bad].decode('utf-8', 'replace')))
+        num_depths = int(depths.max()) + 1
+        # np.bincount with weights accumulates in double precision, which is
+        # exact for counts below 2^53.
+        block_counts = np.bincount(phones * num_depths + depths, weights = counts,
+                                   minlength = num_phones * num_depths)
+        block_counts = np.rint(block_counts).astype(np.int64).reshape(num_phones, num_depths)
+        phone_depth_counts = AddHistograms(phone_depth_counts, block_counts)
+        total_frames += int(counts.sum())
+    if phone_depth_counts is None:
+        phone_depth_counts = np.zeros((num_phones, 1), dtype=np.int64)
+    return (phone_depth_counts, total_frames)
 
-# If depth_to_count is a map from depth-in-frames to count,
+
+def ReadStatsFile(filename_and_num_phones):
+    filename, num_phones = filename_and_num_phones
+    if filename.endswith(".gz"):
+        f = gzip.open(filename, "rb")
+    else:
+        f = open(filename, "rb")
+    try:
+        return ReadStats(f, num_phones)
+    except ValueError as e:
+        raise ValueError("reading {0}, {1}".format(filename, str(e)))
+    finally:
+        f.close()
+
+
+# If depth_counts is an array indexed by depth-in-frames containing counts,
 # return the depth-in-frames that equals the (fraction * 100)'th
 # percentile of the distribution.
-def GetPercentile(depth_to_count, fraction):
-    this_total_frames = sum(depth_to_count.values())
+def GetPercentile(depth_counts, fraction):
+    this_total_frames = depth_counts.sum()
     if this_total_frames == 0:
         return 0
     else:
-        items = sorted(depth_to_count.items())
+        depths = np.nonzero(depth_counts)[0]
+        cumulative_counts = np.cumsum(depth_counts[depths])
         count_cutoff = int(fraction * this_total_frames)
-        cur_count_total = 0
-        for depth,count in items:
-            assert count >= 0
-            cur_count_total += count
-            if cur_count_total >= count_cutoff:
-                return depth
-        assert false # we shouldn't reach here.
-
-def GetMean(depth_to_count):
-    this_total_frames = sum(depth_to_count.values())
+        # the first depth at which the cumulative count reaches the cutoff.
+        i = np.nonzero(cumulative_counts >= count_cutoff)[0][0]
+        assert depth_counts[depths[:i + 1]].min() >= 0
+        return int(depths[i])
+
+def GetMean(depth_counts):
+    this_total_frames = depth_counts.sum()
     if this_total_frames == 0:
         return 0.0
-    this_total_depth = sum([ float(l * c) for l,c in depth_to_count.items() ])
+    this_total_depth = float(np.dot(np.arange(len(depth_counts), dtype=np.float64),
+                                    depth_counts))
     return this_total_depth / this_total_frames
 
 
-print("The total amount of data analyzed assuming 100 frames per second "
-      "is {0} hours".format("%.1f" % (total_frames / 360000.0)))
+def Main():
+    args = parser.parse_args()
 
-# the next block prints lines like (to give some examples):
-# Nonsilence phones as a group account for 74.4% of phone occurrences, with lattice depth (10,50,90-percentile)=(1,2,7) and mean=3.1
-# Phone SIL accounts for 25.5% of phone occurrences, with lattice depth (10,50,90-percentile)=(1,1,4) and mean=2.5
-# Phone Z_E accounts for 2.5% of phone occurrences, with lattice depth (10,50,90-percentile)=(1,2,6) and mean=2.9
-# ...
+    # set up phone_int2text to map from phone to printed form.
+    phone_int2text = {}
+    try:
+        f = open(args.lang + "/phones.txt", "r");
+        for line in f.readlines():
+            [ word, number] = line.split()
+            phone_int2text[int(number)] = word
+        f.close()
+    except:
+        sys.exit("analyze_lattice_depth_stats.py: error opening or reading {0}/phones.txt".format(
+                args.lang))
+    # this is a special case... for begin- and end-of-sentence stats,
+    # we group all nonsilence phones together.
+    phone_int2text[0] = 'nonsilence'
+
+    # populate the set and 'nonsilence', which will contain the integer phone-ids of
+    # nonsilence phones (and disambig phones, which won't matter).
+    nonsilence = set(phone_int2text.keys())
+    nonsilence.remove(0)
+    try:
+        # open lang/phones/silence.csl-- while there are many ways of obtaining the
+        # silence/nonsilence phones, we read this because it's present in graph
+        # directories as well as lang directories.
+        filename = "{0}/phones/silence.csl".format(args.lang)
+        f = open(filename, "r")
+        line = f.readline()
+        for silence_phone in line.split(":"):
+            nonsilence.remove(int(silence_phone))
+        f.close()
+    except Exception as e:
+        sys.exit("analyze_lattice_depth_stats.py: error processing {0}/phones/silence.csl: {1}".format(
+                args.lang, str(e)))
+
+    # phone_depth_counts is a 2-dimensional array; for each integer phone-id
+    # 'phone', phone_depth_counts[phone] is an array indexed by depth containing
+    # the count of frames on which that was the 1-best phone in the alignment,
+    # and the lattice depth had that value.  So we'd access it as
+    # count = phone_depth_counts[phone, depth].
+    # The stats of the different files are read in parallel and summed.
+    num_phones = max(phone_int2text.keys()) + 1
+    try:
+        if len(args.stats_files) == 0:
+            try:
+                results = [ ReadStats(getattr(sys.stdin, 'buffer', sys.stdin), num_phones) ]
+            except ValueError as e:
+                raise ValueError("reading stdin, " + str(e))
+        elif args.num_jobs > 1 and len(args.stats_files) > 1:
+            pool = multiprocessing.Pool(min(args.num_jobs, len(args.stats_files)))
+            results = pool.map(ReadStatsFile, [ (x, num_phones) for x in args.stats_files ])
+            pool.close()
+            pool.join()
+        else:
+            results = [ ReadStatsFile((x, num_phones)) for x in args.stats_files ]
+    except (IOError, ValueError) as e:
+        sys.exit("analyze_lattice_depth_stats.py: " + str(e))
+
+    phone_depth_counts = None
+    total_frames = 0
+    for this_phone_depth_counts, this_total_frames in results:
+        phone_depth_counts = AddHistograms(phone_depth_counts, this_phone_depth_counts)
+        total_frames += this_total_frames
+
+    if total_frames == 0:
+        sys.exit("analyze_lattice_depth_stats.py: read no input")
+
+    for phone in np.nonzero(phone_depth_counts.sum(axis = 1))[0]:
+        if not int(phone) in phone_int2text:
+            sys.exit("analyze_lattice_depth_stats.py: unexpected phone {0} "
+                     "seen (lang directory mismatch?)".format(phone))
+
+    # note: -1 is for all phones put in one bucket, and 0 for all the nonsilence
+    # phones.
+    phone_to_depths = dict()
+    phone_to_depths[-1] = phone_depth_counts.sum(axis = 0)
+    nonsilence_counts = phone_depth_counts[sorted(nonsilence)].sum(axis = 0)
+    for p in phone_int2text.keys():
+        phone_to_depths[p] = phone_depth_counts[p]
+    phone_to_depths[0] = phone_to_depths[0] + nonsilence_counts
 
 
-# sort the phones in decreasing order of count.
-for phone,depths in sorted(phone_depth_counts.items(), key = lambda x : -sum(x[1].values())):
+    print("The total amount of data analyzed assuming 100 frames per second "
+          "is {0} hours".format("%.1f" % (total_frames / 360000.0)))
 
-    frequency_percentage = sum(depths.values()) * 100.0 / total_frames
-    if frequency_percentage < args.frequency_cutoff_percentage:
-        continue
+    # the next block prints lines like (to give some examples):
+    # Nonsilence phones as a group account for 74.4% of phone occurrences, with lattice depth (10,50,90-percentile)=(1,2,7) and mean=3.1
+    # Phone SIL accounts for 25.5% of phone occurrences, with lattice depth (10,50,90-percentile)=(1,1,4) and mean=2.5
+    # Phone Z_E accounts for 2.5% of phone occurrences, with lattice depth (10,50,90-percentile)=(1,2,6) and mean=2.9
+    # ...
 
 
-    depth_percentile_10 = GetPercentile(depths, 0.1)
-    depth_percentile_50 = GetPercentile(depths, 0.5)
-    depth_percentile_90 = GetPercentile(depths, 0.9)
-    depth_mean = GetMean(depths)
+    # sort the phones in decreasing order of count.
+    for phone,depths in sorted(phone_to_depths.items(), key = lambda x : -int(x[1].sum())):
 
-    if phone > 0:
-        try:
+        frequency_percentage = int(depths.sum()) * 100.0 / total_frames
+        if frequency_percentage < args.frequency_cutoff_percentage:
+            continue
+
+
+        depth_percentile_10 = GetPercentile(depths, 0.1)
+        depth_percentile_50 = GetPercentile(depths, 0.5)
+        depth_percentile_90 = GetPercentile(depths, 0.9)
+        depth_mean = GetMean(depths)
+
+        if phone > 0:
             phone_text = phone_int2text[phone]
-        except:
-            sys.exit("analyze_lattice_depth_stats.py: phone {0} is not covered on phones.txt "
-                     "(lang/alignment mismatch?)".format(phone))
-        preamble = "Phone {phone_text} accounts for {percent}% of frames, with".format(
-            phone_text = phone_text, percent = "%.1f" % frequency_percentage)
-    elif phone == 0:
-        preamble = "Nonsilence phones as a group account for {percent}% of frames, with".format(
-            percent = "%.1f" % frequency_percentage)
-    else:
-        assert phone == -1
-        preamble = "Overall,";
-
-    print("{preamble} lattice depth (10,50,90-percentile)=({p10},{p50},{p90}) and mean={mean}".format(
-            preamble = preamble,
-            p10 = depth_percentile_10,
-            p50 = depth_percentile_50,
-            p90 = depth_percentile_90,
-            mean = "%.1f" % depth_mean))
+            preamble = "Phone {phone_text} accounts for {percent}% of frames, with".format(
+                phone_text = phone_text, percent = "%.1f" % frequency_percentage)
+        elif phone == 0:
+            preamble = "Nonsilence phones as a group account for {percent}% of frames, with".format(
+                percent = "%.1f" % frequency_percentage)
+        else:
+            assert phone == -1
+            preamble = "Overall,";
+
+        print("{preamble} lattice depth (10,50,90-percentile)=({p10},{p50},{p90}) and mean={mean}".format(
+                preamble = preamble,
+                p10 = depth_percentile_10,
+                p50 = depth_percentile_50,
+                p90 = depth_percentile_90,
+                mean = "%.1f" % depth_mean))
+
+
+if __name__ == "__main__":
+    Main()
@@ -6,8 +6,11 @@
 
 from __future__ import print_function
 import argparse
+import gzip
+import multiprocessing
 import sys, os
-from collections import defaultdict
+
+import numpy as np
 
 
 parser = argparse.ArgumentParser(description="This script reads stats created in analyze_alignments.sh "
@@ -21,248 +24,383 @@ parser.add_argument("--frequency-cutoff-percentage", type = float,
                     default = 0.5, help="Cutoff, expressed as a percentage "
                     "(between 0 and 100), of frequency at which we print stats "
                     "for a phone.")
+parser.add_argument("--num-jobs", type = int, default = 1,
+                    help="Number of processes used to read the stats files "
+                    "(only relevant if more than one is given).")
 
 parser.add_argument("lang",
                     help="Language directory, e.g. data/lang.")
-
-args = parser.parse_args()
-
-
-# set up phone_int2text to map from phone to printed form.
-phone_int2text = {}
-try:
-    f = open(args.lang + "/phones.txt", "r");
-    for line in f.readlines():
-        [ word, number] = line.split()
-        phone_int2text[int(number)] = word
-    f.close()
-except:
-    sys.exit("analyze_phone_length_stats.py: error opening or reading {0}/phones.txt".format(
-            args.lang))
-# this is a special case... for begin- and end-of-sentence stats,
-# we group all nonsilence phones together.
-phone_int2text[0] = 'nonsilence'
-
-
-# populate the set 'nonsilence', which will contain the integer phone-ids of
-# nonsilence phones (and disambig phones, which won't matter).
-nonsilence = set(phone_int2text.keys())
-nonsilence.remove(0)
-try:
-    # open lang/phones/silence.csl-- while there are many ways of obtaining the
-    # silence/nonsilence phones, we read this because it's present in graph
-    # directories as well as lang directories.
-    filename = "{0}/phones/silence.csl".format(args.lang)
-    f = open(filename, "r")
-    line = f.readline()
-    f.close()
-    for silence_phone in line.split(":"):
-        nonsilence.remove(int(silence_phone))
-except Exception as e:
-    sys.exit("analyze_phone_length_stats.py: error processing {0}/phones/silence.csl: {1}".format(
-            args.lang, str(e)))
-
-
-# phone_length is a dict of dicts of dicts;
-# phone_lengths[boundary_type] for boundary_type in [ 'begin', 'end', 'all' ] is
-# a dict indexed by phone, containing dicts from length to a count of occurrences.
-# Phones are ints and lengths are integers representing numbers of frames.
-# So: count == phone_lengths[boundary_type][phone][length].
-# note: for the 'begin' and 'end' boundary-types, we group all nonsilence phones
-# into phone-id zero.
-phone_lengths = dict()
-for boundary_type in [ 'begin', 'end', 'all' ]:
-    phone_lengths[boundary_type] = dict()
-    for p in phone_int2text.keys():
-        phone_lengths[boundary_type][p] = defaultdict(int)
-
-# total_phones is a dict from boundary_type to total count [of phone occurrences]
-total_phones = defaultdict(int)
-# total_frames is a dict from boundary_type to total number of frames.
-total_frames = defaultdict(int)
-# total_frames is a dict from num-frames to count of num-utterances with that
-# num-frames.
-
-while True:
-    line = sys.stdin.readline()
-    if line == '':
-        break
-    a = line.split()
-    if len(a) != 4:
-        sys.exit("analyze_phone_length_stats.py: reading stdin, could not interpret line: " + line)
+parser.add_argument("stats_files", nargs = '*',
+                    help="Files (optionally gzipped) with the stats, i.e. lines "
+                    "'<count> <boundary-type> <phone> <length>'; if none are given, "
+                    "the stats are read from the standard input.")
+
+# the approximate number of bytes of input we read and process at a time.
+block_size = 16 * 1024 * 1024
+
+boundary_types = [ 'begin', 'end', 'all' ]
+
+
+# is_space[c] and is_valid[c] say whether the byte c is whitespace, and
+# whether it may appear in lines of integers.
+is_space = np.zeros(256, dtype=bool)
+is_space[np.frombuffer(b' \t\r\n', dtype=np.uint8)] = True
+is_valid = is_space.copy()
+is_valid[np.frombuffer(b'-0123456789', dtype=np.uint8)] = True
+
+
+# Parses 'data' (bytes), which should consist of 'num_lines' lines each
+# containing 'num_fields' integers, and returns them as an array of dimension
+# (num_lines, num_fields); returns None if the data cannot be interpreted that
+# way.
+def ParseIntegerLines(data, num_lines, num_fields):
+    chars = np.frombuffer(data, dtype=np.uint8)
+    if not np.all(is_valid[chars]):
+        return None
+    # count the fields on each line: a field starts at each non-space byte
+    # that follows a space or the start of the data.
+    space = is_space[chars]
+    field_starts = np.nonzero(~space & np.concatenate(([True], space[:-1])))[0]
+    line_index = np.cumsum(chars == ord('\n')) - (chars == ord('\n'))
+    fields_per_line = np.bincount(line_index[field_starts], minlength = num_lines)
+    if len(fields_per_line) != num_lines or np.any(fields_per_line != num_fields):
+        return None
     try:
-        count, boundary_type, phone, length = a
-        total_phones[boundary_type] += int(count)
-        total_frames[boundary_type] += int(count) * int(length)
-        phone_lengths[boundary_type][int(phone)][int(length)] += int(count)
-        if int(phone) in nonsilence:
-            nonsilence_phone = 0
-            phone_lengths[boundary_type][nonsilence_phone][int(length)] += int(count)
-    except Exception as e:
-        sys.exit("analyze_phone_length_stats.py: unexpected phone {0} "
-                 "seen (lang directory mismatch?): {1}".format(phone, str(e)))
-
-if len(phone_lengths) == 0:
-    sys.exit("analyze_phone_length_stats.py: read no input")
-
-# work out the optional-silence phone
-try:
-    f = open(args.lang + "/phones/optional_silence.int", "r")
-    optional_silence_phone = int(f.readline())
-    optional_silence_phone_text = phone_int2text[optional_silence_phone]
-    f.close()
-    if optional_silence_phone in nonsilence:
-        print("analyze_phone_length_stats.py: was expecting the optional-silence phone to "
-              "be a member of the silence phones, it is not.  This script won't work correctly.")
-except:
-    largest_count = 0
-    optional_silence_phone = 1
-    for p in phone_int2text.keys():
-        if p > 0 and not p in nonsilence:
-            this_count = sum([ l * c for l,c in phone_lengths['all'][p].items() ])
-            if this_count > largest_count:
-                largest_count = this_count
-                optional_silence_phone = p
-    optional_silence_phone_text = phone_int2text[optional_silence_phone]
-    print("analyze_phone_length_stats.py: could not get optional-silence phone from "
-          "{0}/phones/optional_silence.int, guessing that it's {1} from the stats. ".format(
-            args.lang, optional_silence_phone_text))
-
-
-
-# If length_to_count is a map from length-in-frames to count,
+        # fails on fields like '-' or '1-2'.
+        values = np.array(data.split(), dtype=np.int64)
+    except (ValueError, OverflowError):
+        return None
+    return values.reshape(num_lines, num_fields)
+
+
+# Adds the histogram 'b' to the histogram 'a' (arrays with the same number of
+# dimensions), extending 'a' if 'b' is longer in the last dimension; returns
+# the sum.
+def AddHistograms(a, b):
+    if a is None:
+        return b
+    if b.shape[-1] > a.shape[-1]:
+        a, b = b, a
+    a[..., :b.shape[-1]] += b
+    return a
+
+
+# Reads lines '<count> <boundary-type> <phone> <length>' from the file object f
+# (opened in binary mode) and returns an array phone_lengths of dimension
+# (3, num_phones, max_length + 1) such that
+# phone_lengths[boundary_types.index(boundary_type), phone, length] is the count
+# of occurrences of the phone with that length.
+# Raises ValueError for malformed input or out-of-range phones.
+def ReadStats(f, num_phones):
+    phone_lengths = None
+    while True:
+        lines = f.readlines(block_size)
+        if len(lines) == 0:
+            break
+        # replace the boundary types by their indexes, so all fields are integers.
+        data = b''.join(lines)
+        for i, boundary_type in enumerate(boundary_types):
+            data = data.replace(' {0} '.format(boundary_type).encode(),
+                                ' {0} '.format(i).encode())
+        values = ParseIntegerLines(data, len(lines), 4)
+        if values is None:
+            for line in lines:
+                a = line.split()
+                if len(a) != 4:
+                    raise ValueError("could not interpret line: " +
+                                     line.decode('utf-8', 'replace'))
+                try:
+                    assert a[1].decode() in boundary_types
+                    [ int(x) for x in a[0:1] + a[2:4] ]
+                except (AssertionError, ValueError):
+                    raise ValueError("unexpected phone {0} seen (lang directory mismatch?): "
+                                     "line is {1}".format(a[2].decode('utf-8', 'replace'),
+                                                          line.decode('utf-8', 'replace')))
+            raise ValueError("could not interpret input")
+        counts, types, phones, lengths = [ values[:, i] for i in range(4) ]
+        if types.min() < 0 or types.max() >= len(boundary_types) or lengths.min() < 0:
+            bad = np.nonzero((types < 0) | (types >= len(boundary_types)) | (lengths < 0))[0][0]
+            raise ValueError("could not interpret line: " +
+                             lines[bad].decode('utf-8', 'replace'))
+        if phones.min() < 0 or phones.max() >= num_phones:
+            bad = np.nonzero((phones < 0) | (phones >= num_phones))[0][0]
+            raise ValueError("unexpected phone {0} seen (lang directory mismatch?): "
+                             "line is {1}".format(phones[bad], lines[bad].decode('utf-8', 'replace')))
+        num_lengths = int(lengths.max()) + 1
+        # np.bincount with weights accumulates in double precision, which is
+        # exact for counts below 2^53.
+        block_counts = np.bincount((types * num_phones + phones) * num_lengths + lengths,
+                                   weights = counts,
+                                   minlength = len(boundary_types) * num_phones * num_lengths)
+        block_counts = np.rint(block_counts).astype(np.int64).reshape(
+            len(boundary_types), num_phones, num_lengths)
+        phone_lengths = AddHistograms(phone_lengths, block_counts)
+    if phone_lengths is None:
+        phone_lengths = np.zeros((len(boundary_types), num_phones, 1), dtype=np.int64)
+    return phone_lengths
+
+
+def ReadStatsFile(filename_and_num_phones):
+    filename, num_phones = filename_and_num_phones
+    if filename.endswith(".gz"):
+        f = gzip.open(filename, "rb")
+    else:
+        f = open(filename, "rb")
+    try:
+        return ReadStats(f, num_phones)
+    except ValueError as e:
+        raise ValueError("reading {0}, {1}".format(filename, str(e)))
+    finally:
+        f.close()
+
+
+# If length_counts is an array indexed by length-in-frames containing counts,
 # return the length-in-frames that equals the (fraction * 100)'th
 # percentile of the distribution.
-def GetPercentile(length_to_count, fraction):
-    total_phones = sum(length_to_count.values())
+def GetPercentile(length_counts, fraction):
+    total_phones = length_counts.sum()
     if total_phones == 0:
         return 0
     else:
-        items = sorted(length_to_count.items())
+        lengths = np.nonzero(length_counts)[0]
+        cumulative_counts = np.cumsum(length_counts[lengths])
         count_cutoff = int(fraction * total_phones)
-        cur_count_total = 0
-        for length,count in items:
-            assert count >= 0
-            cur_count_total += count
-            if cur_count_total >= count_cutoff:
-                return length
-        assert false # we shouldn't reach here.
-
-def GetMean(length_to_count):
-    total_phones = sum(length_to_count.values())
+        # the first length at which the cumulative count reaches the cutoff.
+        i = np.nonzero(cumulative_counts >= count_cutoff)[0][0]
+        assert length_counts[lengths[:i + 1]].min() >= 0
+        return int(lengths[i])
+
+def GetTotalFrames(length_counts):
+    return float(np.dot(np.arange(len(length_counts), dtype=np.float64), length_counts))
+
+def GetMean(length_counts):
+    total_phones = length_counts.sum()
     if total_phones == 0:
         return 0.0
-    total_frames = sum([ float(l * c) for l,c in length_to_count.items() ])
-    return total_frames / total_phones
-
-
-# Analyze frequency, median and mean of optional-silence at beginning and end of utterances.
-# The next block will print something like
-#  "At utterance begin, SIL is seen 15.0% of the time; when seen, duration (median, mean) is (5, 7.6) frames."
-#  "At utterance end, SIL is seen 14.6% of the time; when seen, duration (median, mean) is (4, 6.1) frames."
-
-
-# This block will print warnings if silence is seen less than 80% of the time at utterance
-# beginning and end.
-for boundary_type in 'begin', 'end':
-    phone_to_lengths = phone_lengths[boundary_type]
-    num_utterances = total_phones[boundary_type]
-    assert num_utterances > 0
-    opt_sil_lengths = phone_to_lengths[optional_silence_phone]
-    frequency_percentage = sum(opt_sil_lengths.values()) * 100.0 / num_utterances
-    # The reason for this warning is that the tradition in speech recognition is
-    # to supply a little silence at the beginning and end of utterances... up to
-    # maybe half a second.  If your database is not like this, you should know;
-    # you may want to mess with the segmentation to add more silence.
-    if frequency_percentage < 80.0:
-        print("analyze_phone_length_stats.py: WARNING: optional-silence {0} is seen only {1}% "
-              "of the time at utterance {2}.  This may not be optimal.".format(
-                optional_silence_phone_text, frequency_percentage, boundary_type))
-
-
-
-# this will control a sentence that we print..
-boundary_to_text = { }
-boundary_to_text['begin'] = 'At utterance begin'
-boundary_to_text['end'] = 'At utterance end'
-boundary_to_text['all'] = 'Overall'
-
-# the next block prints lines like (to give some examples):
-# At utterance begin, SIL accounts for 98.4% of phone occurrences, with duration (median, mean, 95-percentile) is (57,59.9,113) frames.
-# ...
-# At utterance end, nonsilence accounts for 4.2% of phone occurrences, with duration (median, mean, 95-percentile) is (13,13.3,22) frames.
-# ...
-# Overall, R_I accounts for 3.2% of phone occurrences, with duration (median, mean, 95-percentile) is (6,6.9,12) frames.
-
-for boundary_type in 'begin', 'end', 'all':
-    phone_to_lengths = phone_lengths[boundary_type]
-    tot_num_phones = total_phones[boundary_type]
-    # sort the phones in decreasing order of count.
-    for phone,lengths in sorted(phone_to_lengths.items(), key = lambda x : -sum(x[1].values())):
-        frequency_percentage = sum(lengths.values()) * 100.0 / tot_num_phones
-        if frequency_percentage < args.frequency_cutoff_percentage:
-            continue
-
-        duration_median = GetPercentile(lengths, 0.5)
-        duration_percentile_95 = GetPercentile(lengths, 0.95)
-        duration_mean = GetMean(lengths)
-
-        text = boundary_to_text[boundary_type]  # e.g. 'At utterance begin'.
-        try:
+    return GetTotalFrames(length_counts) / total_phones
+
+
+def Main():
+    args = parser.parse_args()
+
+    # set up phone_int2text to map from phone to printed form.
+    phone_int2text = {}
+    try:
+        f = open(args.lang + "/phones.txt", "r");
+        for line in f.readlines():
+            [ word, number] = line.split()
+            phone_int2text[int(number)] = word
+        f.close()
+    except:
+        sys.exit("analyze_phone_length_stats.py: error opening or reading {0}/phones.txt".format(
+                args.lang))
+    # this is a special case... for begin- and end-of-sentence stats,
+    # we group all nonsilence phones together.
+    phone_int2text[0] = 'nonsilence'
+
+
+    # populate the set 'nonsilence', which will contain the integer phone-ids of
+    # nonsilence phones (and disambig phones, which won't matter).
+    nonsilence = set(phone_int2text.keys())
+    nonsilence.remove(0)
+    try:
+        # open lang/phones/silence.csl-- while there are many ways of obtaining the
+        # silence/nonsilence phones, we read this because it's present in graph
+        # directories as well as lang directories.
+        filename = "{0}/phones/silence.csl".format(args.lang)
+        f = open(filename, "r")
+        line = f.readline()
+        f.close()
+        for silence_phone in line.split(":"):
+            nonsilence.remove(int(silence_phone))
+    except Exception as e:
+        sys.exit("analyze_phone_length_stats.py: error processing {0}/phones/silence.csl: {1}".format(
+                args.lang, str(e)))
+
+
+    # The stats of the different files are read in parallel and summed into
+    # the array all_phone_lengths (see ReadStats()).
+    num_phones = max(phone_int2text.keys()) + 1
+    try:
+        if len(args.stats_files) == 0:
+            try:
+                results = [ ReadStats(getattr(sys.stdin, 'buffer', sys.stdin), num_phones) ]
+            except ValueError as e:
+                raise ValueError("reading stdin, " + str(e))
+        elif args.num_jobs > 1 and len(args.stats_files) > 1:
+            pool = multiprocessing.Pool(min(args.num_jobs, len(args.stats_files)))
+            results = pool.map(ReadStatsFile, [ (x, num_phones) for x in args.stats_files ])
+            pool.close()
+            pool.join()
+        else:
+            results = [ ReadStatsFile((x, num_phones)) for x in args.stats_files ]
+    except (IOError, ValueError) as e:
+        sys.exit("analyze_phone_length_stats.py: " + str(e))
+
+    all_phone_lengths = None
+    for this_phone_lengths in results:
+        all_phone_lengths = AddHistograms(all_phone_lengths, this_phone_lengths)
+
+    for phone in np.nonzero(all_phone_lengths.sum(axis = (0, 2)))[0]:
+        if not int(phone) in phone_int2text:
+            sys.exit("analyze_phone_length_stats.py: unexpected phone {0} "
+                     "seen (lang directory mismatch?)".format(phone))
+
+    # phone_length is a dict of dicts;
+    # phone_lengths[boundary_type] for boundary_type in [ 'begin', 'end', 'all' ] is
+    # a dict indexed by phone, containing arrays indexed by length containing a
+    # count of occurrences.
+    # Phones are ints and lengths are integers representing numbers of frames.
+    # So: count == phone_lengths[boundary_type][phone][length].
+    # note: for the 'begin' and 'end' boundary-types, we group all nonsilence phones
+    # into phone-id zero.
+    phone_lengths = dict()
+    # total_phones is a dict from boundary_type to total count [of phone occurrences]
+    total_phones = dict()
+    # total_frames is a dict from boundary_type to total number of frames.
+    total_frames = dict()
+    for b, boundary_type in enumerate(boundary_types):
+        phone_lengths[boundary_type] = dict()
+        for p in phone_int2text.keys():
+            phone_lengths[boundary_type][p] = all_phone_lengths[b, p]
+        phone_lengths[boundary_type][0] = (phone_lengths[boundary_type][0] +
+                                           all_phone_lengths[b, sorted(nonsilence)].sum(axis = 0))
+        total_phones[boundary_type] = int(all_phone_lengths[b].sum())
+        total_frames[boundary_type] = int(np.dot(all_phone_lengths[b].sum(axis = 0),
+                                                 np.arange(all_phone_lengths.shape[2])))
+
+    if total_phones['all'] == 0:
+        sys.exit("analyze_phone_length_stats.py: read no input")
+
+    # work out the optional-silence phone
+    try:
+        f = open(args.lang + "/phones/optional_silence.int", "r")
+        optional_silence_phone = int(f.readline())
+        optional_silence_phone_text = phone_int2text[optional_silence_phone]
+        f.close()
+        if optional_silence_phone in nonsilence:
+            print("analyze_phone_length_stats.py: was expecting the optional-silence phone to "
+                  "be a member of the silence phones, it is not.  This script won't work correctly.")
+    except:
+        largest_count = 0
+        optional_silence_phone = 1
+        for p in phone_int2text.keys():
+            if p > 0 and not p in nonsilence:
+                this_count = GetTotalFrames(phone_lengths['all'][p])
+                if this_count > largest_count:
+                    largest_count = this_count
+                    optional_silence_phone = p
+        optional_silence_phone_text = phone_int2text[optional_silence_phone]
+        print("analyze_phone_length_stats.py: could not get optional-silence phone from "
+              "{0}/phones/optional_silence.int, guessing that it's {1} from the stats. ".format(
+                args.lang, optional_silence_phone_text))
+
+
+    # Analyze frequency, median and mean of optional-silence at beginning and end of utterances.
+    # The next block will print something like
+    #  "At utterance begin, SIL is seen 15.0% of the time; when seen, duration (median, mean) is (5, 7.6) frames."
+    #  "At utterance end, SIL is seen 14.6% of the time; when seen, duration (median, mean) is (4, 6.1) frames."
+
+
+    # This block will print warnings if silence is seen less than 80% of the time at utterance
+    # beginning and end.
+    for boundary_type in 'begin', 'end':
+        phone_to_lengths = phone_lengths[boundary_type]
+        num_utterances = total_phones[boundary_type]
+        assert num_utterances > 0
+        opt_sil_lengths = phone_to_lengths[optional_silence_phone]
+        frequency_percentage = int(opt_sil_lengths.sum()) * 100.0 / num_utterances
+        # The reason for this warning is that the tradition in speech recognition is
+        # to supply a little silence at the beginning and end of utterances... up to
+        # maybe half a second.  If your database is not like this, you should know;
+        # you may want to mess with the segmentation to add more silence.
+        if frequency_percentage < 80.0:
+            print("analyze_phone_length_stats.py: WARNING: optional-silence {0} is seen only {1}% "
+                  "of the time at utterance {2}.  This may not be optimal.".format(
+                    optional_silence_phone_text, frequency_percentage, boundary_type))
+
+
+
+    # this will control a sentence that we print..
+    boundary_to_text = { }
+    boundary_to_text['begin'] = 'At utterance begin'
+    boundary_to_text['end'] = 'At utterance end'
+    boundary_to_text['all'] = 'Overall'
+
+    # the next block prints lines like (to give some examples):
+    # At utterance begin, SIL accounts for 98.4% of phone occurrences, with duration (median, mean, 95-percentile) is (57,59.9,113) frames.
+    # ...
+    # At utterance end, nonsilence accounts for 4.2% of phone occurrences, with duration (median, mean, 95-percentile) is (13,13.3,22) frames.
+    # ...
+    # Overall, R_I accounts for 3.2% of phone occurrences, with duration (median, mean, 95-percentile) is (6,6.9,12) frames.
+
+    for boundary_type in 'begin', 'end', 'all':
+        phone_to_lengths = phone_lengths[boundary_type]
+        tot_num_phones = total_phones[boundary_type]
+        # sort the phones in decreasing order of count.
+        for phone,lengths in sorted(phone_to_lengths.items(), key = lambda x : -int(x[1].sum())):
+            frequency_percentage = int(lengths.sum()) * 100.0 / tot_num_phones
+            if frequency_percentage < args.frequency_cutoff_percentage:
+                continue
+
+            duration_median = GetPercentile(lengths, 0.5)
+            duration_percentile_95 = GetPercentile(lengths, 0.95)
+            duration_mean = GetMean(lengths)
+
+            text = boundary_to_text[boundary_type]  # e.g. 'At utterance begin'.
             phone_text = phone_int2text[phone]
-        except:
-            sys.exit("analyze_phone_length_stats.py: phone {0} is not covered on phones.txt "
-                     "(lang/alignment mismatch?)".format(phone))
-        print("{text}, {phone_text} accounts for {percent}% of phone occurrences, with "
-              "duration (median, mean, 95-percentile) is ({median},{mean},{percentile95}) frames.".format(
-                text = text, phone_text = phone_text,
-                percent = "%.1f" % frequency_percentage,
-                median = duration_median, mean = "%.1f" % duration_mean,
-                percentile95 = duration_percentile_95))
-
-
-## Print stats on frequency and average length of word-internal optional-silences.
-## For optional-silence only, subtract the begin and end-utterance stats from the 'all'
-## stats, to get the stats excluding initial and final phones.
-total_frames['internal'] = total_frames['all'] - total_frames['begin'] - total_frames['end']
-total_phones['internal'] = total_phones['all'] - total_phones['begin'] - total_phones['end']
-
-internal_opt_sil_phone_lengths = dict(phone_lengths['all'][optional_silence_phone])
-# internal_opt_sil_phone_lenghts is a dict from length to count.
-for length in list(internal_opt_sil_phone_lengths.keys()):
-    # subtract the counts for begin and end from the overall counts to get the
-    # word-internal count.
-    internal_opt_sil_phone_lengths[length] -= (phone_lengths['begin'][optional_silence_phone][length] +
-                                               phone_lengths['end'][optional_silence_phone][length])
-    if internal_opt_sil_phone_lengths[length] == 0:
-        del internal_opt_sil_phone_lengths[length]
-
-if total_phones['internal'] != 0.0:
-    total_internal_optsil_frames = sum([ float(l * c) for l,c in internal_opt_sil_phone_lengths.items() ])
-    total_optsil_frames = sum([ float(l * c)
-                                for l,c in phone_lengths['all'][optional_silence_phone].items() ])
-    opt_sil_internal_frame_percent = total_internal_optsil_frames * 100.0 / total_frames['internal']
-    opt_sil_total_frame_percent = total_optsil_frames * 100.0 / total_frames['all']
-    internal_frame_percent = total_frames['internal'] * 100.0 / total_frames['all']
-
-    print("The optional-silence phone {0} occupies {1}% of frames overall ".format(
-            optional_silence_phone_text, "%.1f" % opt_sil_total_frame_percent))
-    hours_total = total_frames['all'] / 360000.0;
-    hours_nonsil = (total_frames['all'] - total_optsil_frames) / 360000.0
-    print("Limiting the stats to the {0}% of frames not covered by an utterance-[begin/end] phone, "
-          "optional-silence {1} occupies {2}% of frames.".format("%.1f" % internal_frame_percent,
-                                                                 optional_silence_phone_text,
-                                                                 "%.1f" % opt_sil_internal_frame_percent))
-    print("Assuming 100 frames per second, the alignments represent {0} hours of data, "
-          "or {1} hours if {2} frames are excluded.".format(
-            "%.1f" % hours_total, "%.1f" % hours_nonsil, optional_silence_phone_text))
-
-    opt_sil_internal_phone_percent = (sum(internal_opt_sil_phone_lengths.values()) *
-                                      100.0 / total_phones['internal'])
-    duration_median = GetPercentile(internal_opt_sil_phone_lengths, 0.5)
-    duration_mean = GetMean(internal_opt_sil_phone_lengths)
-    duration_percentile_95 = GetPercentile(internal_opt_sil_phone_lengths, 0.95)
-    print("Utterance-internal optional-silences {0} comprise {1}% of utterance-internal phones, with duration "
-          "(median, mean, 95-percentile) = ({2},{3},{4})".format(
-                optional_silence_phone_text, "%.1f" % opt_sil_internal_phone_percent,
-                duration_median, "%0.1f" % duration_mean, duration_percentile_95))
+            print("{text}, {phone_text} accounts for {percent}% of phone occurrences, with "
+                  "duration (median, mean, 95-percentile) is ({median},{mean},{percentile95}) frames.".format(
+                    text = text, phone_text = phone_text,
+                    percent = "%.1f" % frequency_percentage,
+                    median = duration_median, mean = "%.1f" % duration_mean,
+                    percentile95 = duration_percentile_95))
+
+
+    ## Print stats on frequency and average length of word-internal optional-silences.
+    ## For optional-silence only, subtract the begin and end-utterance stats from the 'all'
+    ## stats, to get the stats excluding initial and final phones.
+    total_frames['internal'] = total_frames['all'] - total_frames['begin'] - total_frames['end']
+    total_phones['internal'] = total_phones['all'] - total_phones['begin'] - total_phones['end']
+
+    # internal_opt_sil_phone_lengths is an array indexed by length containing
+    # counts: for the lengths seen overall, we subtract the counts for begin and
+    # end from the overall counts to get the word-internal count.
+    internal_opt_sil_phone_lengths = np.where(
+        phone_lengths['all'][optional_silence_phone] != 0,
+        phone_lengths['all'][optional_silence_phone] -
+        phone_lengths['begin'][optional_silence_phone] -
+        phone_lengths['end'][optional_silence_phone], 0)
+
+    if total_phones['internal'] != 0.0:
+        total_internal_optsil_frames = GetTotalFrames(internal_opt_sil_phone_lengths)
+        total_optsil_frames = GetTotalFrames(phone_lengths['all'][optional_silence_phone])
+        opt_sil_internal_frame_percent = total_internal_optsil_frames * 100.0 / total_frames['internal']
+        opt_sil_total_frame_percent = total_optsil_frames * 100.0 / total_frames['all']
+        internal_frame_percent = total_frames['internal'] * 100.0 / total_frames['all']
+
+        print("The optional-silence phone {0} occupies {1}% of frames overall ".format(
+                optional_silence_phone_text, "%.1f" % opt_sil_total_frame_percent))
+        hours_total = total_frames['all'] / 360000.0;
+        hours_nonsil = (total_frames['all'] - total_optsil_frames) / 360000.0
+        print("Limiting the stats to the {0}% of frames not covered by an utterance-[begin/end] phone, "
+              "optional-silence {1} occupies {2}% of frames.".format("%.1f" % internal_frame_percent,
+                                                                     optional_silence_phone_text,
+                                                                     "%.1f" % opt_sil_internal_frame_percent))
+        print("Assuming 100 frames per second, the alignments represent {0} hours of data, "
+              "or {1} hours if {2} frames are excluded.".format(
+                "%.1f" % hours_total, "%.1f" % hours_nonsil, optional_silence_phone_text))
+
+        opt_sil_internal_phone_percent = (int(internal_opt_sil_phone_lengths.sum()) *
+                                          100.0 / total_phones['internal'])
+        duration_median = GetPercentile(internal_opt_sil_phone_lengths, 0.5)
+        duration_mean = GetMean(internal_opt_sil_phone_lengths)
+        duration_percentile_95 = GetPercentile(internal_opt_sil_phone_lengths, 0.95)
+        print("Utterance-internal optional-silences {0} comprise {1}% of utterance-internal phones, with duration "
+              "(median, mean, 95-percentile) = ({2},{3},{4})".format(
+                    optional_silence_phone_text, "%.1f" % opt_sil_internal_phone_percent,
+                    duration_median, "%0.1f" % duration_mean, duration_percentile_95))
+
+
+if __name__ == "__main__":
+    Main()
@@ -0,0 +1,662 @@
+
+# Copyright 2018 Johns Hopkins University
+# Apache 2.0
+
+""" This module reads the files of Kaldi data directories (utt2spk, spk2utt,
+segments, text, utt2dur, wav.scp, reco2num_frames etc.) into column-wise
+numpy arrays sorted on the key, instead of dicts of python strings.  For large
+data directories this takes a fraction of the time and memory, and allows
+joins, filters and subsets to be done with vectorized numpy operations.
+
+The parsed form of each file is cached on disk, in the subdirectory '.cache'
+of the directory containing it, and is used instead of re-parsing the file as
+long as the file is not modified (the size, modification time and inode of
+the file are checked).
+
+e.g.:
+    data = data_dir_lib.DataDir('data/train')
+    segments = data['segments']
+    utt2dur = data['utt2dur']
+    utts, (i, j) = data_dir_lib.join(segments, utt2dur)
+    lengths = (segments.column('end')[i] - segments.column('start')[i])
+"""
+
+from __future__ import print_function
+from __future__ import division
+import logging
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+# The formats of the files (mostly of data directories) that this module knows
+# how to read: for each file name, a list of (column-name, column-type) for the
+# fields that follow the key on each line.  The column types are:
+#   'token'       a string without whitespace, stored once per distinct value
+#   'float'       a floating-point number
+#   'int'         an integer
+#   'text'        the rest of the line (e.g. a transcript or an rxfilename
+#                 that is a command); must be the only column.
+#   'token-list'  the rest of the line as a list of tokens; must be the only
+#                 column.
+# A column given as (column-name, column-type, default) is optional: it may be
+# missing from the end of a line, in which case it has the value 'default'
+# (given as it would appear in the file).  Optional columns must come after
+# the other columns, and cannot be of type 'text' or 'token-list'.
+file_formats = {
+    'utt2spk': [('spk', 'token')],
+    'spk2utt': [('utts', 'token-list')],
+    'reco2utt': [('utts', 'token-list')],
+    'utt2uniq': [('uniq', 'token')],
+    'utt2lang': [('lang', 'token')],
+    'spk2gender': [('gender', 'token')],
+    'segments': [('reco', 'token'), ('start', 'float'), ('end', 'float'),
+                 ('channel', 'token', '')],
+    'reco2file_and_channel': [('file', 'token'), ('channel', 'token')],
+    'utt2dur': [('dur', 'float')],
+    'reco2dur': [('dur', 'float')],
+    'utt2num_frames': [('num_frames', 'int')],
+    'reco2num_frames': [('num_frames', 'int')],
+    'text': [('text', 'text')],
+    'wav.scp': [('rxfile', 'text')],
+    'feats.scp': [('rxfile', 'text')],
+    'cmvn.scp': [('rxfile', 'text')],
+    'vad.scp': [('rxfile', 'text')],
+}
+
+# The approximate number of bytes of input we parse at a time.
+block_size = 16 * 1024 * 1024
+
+# Increase this if the format of the cached files changes.
+cache_version = 1
+
+# _is_whitespace[c] is true if the byte c is whitespace.
+_is_whitespace = np.zeros(256, dtype=bool)
+_is_whitespace[np.frombuffer(b' \t\r\n', dtype=np.uint8)] = True
+
+
+def _range_indices(starts, lengths):
+    """Returns the concatenation of the ranges [starts[i], starts[i] +
+    lengths[i]) as an array."""
+    offsets = np.cumsum(lengths) - lengths
+    return (np.arange(int(lengths.sum()), dtype=np.int64)
+            + np.repeat(starts - offsets, lengths))
+
+
+def _to_strings(chars, starts, ends):
+    """Returns the substrings chars[starts[i]:ends[i]] of the uint8 array
+    'chars' as a numpy array of fixed-width byte strings."""
+    lengths = ends - starts
+    width = max(1, int(lengths.max())) if len(lengths) > 0 else 1
+    out = np.zeros((len(starts), width), dtype=np.uint8)
+    positions = np.arange(width)
+    # work on chunks of rows to limit the size of the index arrays.
+    chunk = 1 << 16
+    for begin in range(0, len(starts), chunk):
+        indices = starts[begin:begin + chunk, None] + positions
+        np.minimum(indices, len(chars) - 1, out=indices)
+        this_out = chars[indices]
+        this_out[positions >= lengths[begin:begin + chunk, None]] = 0
+        out[begin:begin + chunk] = this_out
+    return out.view('S{0}'.format(width)).reshape(len(starts))
+
+
+def _intern(strings):
+    """Returns a tuple (vocab, ids) such that vocab is the sorted array of the
+    distinct values of the array 'strings' and strings == vocab[ids]."""
+    if len(strings) == 0:
+        return strings, np.zeros(0, dtype=np.int32)
+    # runs of the same value are common (e.g. the recordings in a segments
+    # file), so we only sort the first value of each run.
+    is_run_start = np.concatenate(([True], strings[1:] != strings[:-1]))
+    vocab, run_ids = np.unique(strings[is_run_start], return_inverse=True)
+    return vocab, run_ids.astype(np.int32)[np.cumsum(is_run_start) - 1]
+
+
+def _encode(keys):
+    """Converts a sequence of keys (str or bytes) to an array of byte
+    strings."""
+    if isinstance(keys, np.ndarray) and keys.dtype.kind == 'S':
+        return keys
+    return np.array([k.encode('utf-8') if not isinstance(k, bytes) else k
+                     for k in keys], dtype=bytes)
+
+
+class TokenColumn(object):
+    """ A column of tokens, each distinct value of which is stored only once:
+        'vocab' is the sorted array of distinct values, and 'ids' contains,
+        for each row, the index of its value in 'vocab'.
+    """
+    def __init__(self, vocab, ids):
+        self.vocab = vocab
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        return self.vocab[self.ids[i]]
+
+    def subset(self, indices):
+        return TokenColumn(self.vocab, self.ids[indices])
+
+    def isin(self, values):
+        """Returns a boolean array saying, for each row, whether its value is
+        in 'values'."""
+        return np.isin(self.vocab, _encode(values))[self.ids]
+
+    def decode(self, encoding):
+        vocab = [v.decode(encoding) for v in self.vocab]
+        return [vocab[i] for i in self.ids]
+
+    def to_arrays(self):
+        return {'vocab': self.vocab, 'ids': self.ids}
+
+    @staticmethod
+    def from_arrays(arrays):
+        return TokenColumn(arrays['vocab'], arrays['ids'])
+
+
+class TextColumn(object):
+    """ A column of arbitrary strings, stored concatenated in the uint8 array
+        'data'; the value of row i is data[offsets[i]:offsets[i+1]].
+    """
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def subset(self, indices):
+        starts = self.offsets[:-1][indices]
+        lengths = self.offsets[1:][indices] - starts
+        return TextColumn(self.data[_range_indices(starts, lengths)],
+                          np.concatenate(([0], np.cumsum(lengths))))
+
+    def decode(self, encoding):
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        return [data[offsets[i]:offsets[i + 1]].decode(encoding)
+                for i in range(len(offsets) - 1)]
+
+    def to_arrays(self):
+        return {'data': self.data, 'offsets': self.offsets}
+
+    @staticmethod
+    def from_arrays(arrays):
+        return TextColumn(arrays['data'], arrays['offsets'])
+
+
+class TokenListColumn(object):
+    """ A column of lists of tokens (e.g. the utterances of a speaker).  The
+        tokens are stored as in TokenColumn, with the tokens of row i being
+        vocab[ids[offsets[i]:offsets[i+1]]].
+    """
+    def __init__(self, vocab, ids, offsets):
+        self.vocab = vocab
+        self.ids = ids
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.vocab[self.ids[self.offsets[i]:self.offsets[i + 1]]]
+
+    def subset(self, indices):
+        starts = self.offsets[:-1][indices]
+        lengths = self.offsets[1:][indices] - starts
+        return TokenListColumn(self.vocab,
+                               self.ids[_range_indices(starts, lengths)],
+                               np.concatenate(([0], np.cumsum(lengths))))
+
+    def decode(self, encoding):
+        vocab = [v.decode(encoding) for v in self.vocab]
+        ids = self.ids.tolist()
+        offsets = self.offsets.tolist()
+        return [[vocab[j] for j in ids[offsets[i]:offsets[i + 1]]]
+                for i in range(len(offsets) - 1)]
+
+    def to_arrays(self):
+        return {'vocab': self.vocab, 'ids': self.ids, 'offsets': self.offsets}
+
+    @staticmethod
+    def from_arrays(arrays):
+        return TokenListColumn(arrays['vocab'], arrays['ids'],
+                               arrays['offsets'])
+
+
+_column_classes = {'token': TokenColumn, 'text': TextColumn,
+                   'token-list': TokenListColumn}
+
+
+class Table(object):
+    """ The contents of a Kaldi file like utt2spk or segments: 'keys' is the
+        sorted array (of byte strings) of the keys, i.e. the first field of
+        each line, and the columns contain the other fields of the lines, in
+        the same order.  Columns of type 'float' and 'int' are numpy arrays;
+        the others are of the classes TokenColumn, TextColumn and
+        TokenListColumn, whose method decode() returns their values as a list
+        of python strings.
+    """
+    def __init__(self, keys, columns, column_format, encoding='utf-8'):
+        self.keys = keys
+        self.columns = columns
+        self.column_format = column_format
+        self.encoding = encoding
+
+    def __len__(self):
+        return len(self.keys)
+
+    def column(self, name):
+        for i, spec in enumerate(self.column_format):
+            if spec[0] == name:
+                return self.columns[i]
+        raise KeyError("No column named '{0}'; the columns are {1}".format(
+            name, [x[0] for x in self.column_format]))
+
+    def find(self, keys):
+        """Returns the indexes of 'keys' (a sequence of str or bytes, or an
+        array of byte strings) in this table, with -1 for the ones that are
+        not present."""
+        keys = _encode(keys)
+        if len(self.keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        indices = np.minimum(np.searchsorted(self.keys, keys),
+                             len(self.keys) - 1)
+        return np.where(self.keys[indices] == keys, indices, -1)
+
+    def subset(self, indices):
+        """Returns the table with only the rows given by 'indices', which is
+        a boolean mask or an increasing array of indexes."""
+        return Table(self.keys[indices],
+                     [c.subset(indices) if hasattr(c, 'subset') else c[indices]
+                      for c in self.columns],
+                     self.column_format, self.encoding)
+
+    def select(self, keys):
+        """Returns the table with only the rows whose keys are in 'keys'."""
+        return self.subset(np.isin(self.keys, _encode(keys)))
+
+    def decode_keys(self):
+        return [k.decode(self.encoding) for k in self.keys]
+
+    def decode_column(self, name):
+        """Returns the values of a column as a list of python objects."""
+        column = self.column(name)
+        if isinstance(column, np.ndarray):
+            return column.tolist()
+        return column.decode(self.encoding)
+
+    def to_dict(self, name):
+        """Returns a dict from key to the value of column 'name', as python
+        objects."""
+        return dict(zip(self.decode_keys(), self.decode_column(name)))
+
+
+def join(*tables):
+    """Returns a tuple (keys, indices), where 'keys' is the sorted array of
+    the keys that are present in all the tables, and indices[n] is the
+    array of the indexes of those keys in tables[n]."""
+    keys = tables[0].keys
+    indices = [np.arange(len(keys))]
+    for table in tables[1:]:
+        keys, i, j = np.intersect1d(keys, table.keys, assume_unique=True,
+                                    return_indices=True)
+        indices = [x[i] for x in indices] + [j]
+    return keys, indices
+
+
+def _get_line(data, newlines, line):
+    start = newlines[line - 1] + 1 if line > 0 else 0
+    end = newlines[line] if line < len(newlines) else len(data)
+    return data[start:end].decode('utf-8', 'replace')
+
+
+def _parse_block(data, column_format):
+    """Parses 'data' (bytes), which should consist of whole lines, and
+    returns a tuple (keys, values) where 'keys' is an array of byte strings and
+    'values' a list with the values of each column in the unsorted form that
+    _finalize() expects.  Raises ValueError on malformed lines, with the
+    line number relative to the start of 'data'."""
+    chars = np.frombuffer(data, dtype=np.uint8)
+    is_sep = _is_whitespace[chars]
+    is_field = ~is_sep
+    starts = np.nonzero(is_field & np.concatenate(([True], is_sep[:-1])))[0]
+    ends = np.nonzero(is_field & np.concatenate((is_sep[1:], [True])))[0] + 1
+    newlines = np.nonzero(chars == ord('\n'))[0]
+    num_lines = len(newlines) + (1 if chars[-1] != ord('\n') else 0)
+    fields_per_line = np.bincount(np.searchsorted(newlines, starts),
+                                  minlength=num_lines)
+    first_field = np.cumsum(fields_per_line) - fields_per_line
+
+    rest_of_line = column_format[-1][1] in ['text', 'token-list']
+    num_required = len([spec for spec in column_format if len(spec) == 2])
+    if rest_of_line:
+        bad = fields_per_line == 0
+    else:
+        bad = ((fields_per_line < num_required + 1)
+               | (fields_per_line > len(column_format) + 1))
+    if bad.any():
+        line = int(np.nonzero(bad)[0][0])
+        raise ValueError(line, "bad line '{0}'".format(
+            _get_line(data, newlines, line)))
+
+    keys = _to_strings(chars, starts[first_field], ends[first_field])
+    values = []
+    if column_format[-1][1] == 'text':
+        # the value starts at the second field (if any) and ends at the end of
+        # the last field.
+        value_starts = np.where(fields_per_line > 1,
+                                starts[np.minimum(first_field + 1,
+                                                  len(starts) - 1)],
+                                ends[first_field])
+        value_ends = ends[first_field + fields_per_line - 1]
+        lengths = value_ends - value_starts
+        values.append((chars[_range_indices(value_starts, lengths)], lengths))
+    elif column_format[-1][1] == 'token-list':
+        is_token = np.ones(len(starts), dtype=bool)
+        is_token[first_field] = False
+        values.append((_to_strings(chars, starts[is_token], ends[is_token]),
+                       fields_per_line - 1))
+    else:
+        for c, spec in enumerate(column_format):
+            name, column_type = spec[:2]
+            fields = first_field + c + 1
+            if len(spec) > 2:
+                # an optional column: the lines without it get the default.
+                present = fields_per_line > c + 1
+                fields = np.where(present, fields, first_field)
+                strings = np.where(present,
+                                   _to_strings(chars, starts[fields],
+                                               ends[fields]),
+                                   _encode([spec[2]]))
+            else:
+                strings = _to_strings(chars, starts[fields], ends[fields])
+            if column_type == 'token':
+                values.append(strings)
+                continue
+            dtype = np.float64 if column_type == 'float' else np.int64
+            try:
+                values.append(strings.astype(dtype))
+            except ValueError:
+                for line, value in enumerate(strings):
+                    try:
+                        dtype(value)
+                    except ValueError:
+                        raise ValueError(line, "bad {0} '{1}' in line "
+                                         "'{2}'".format(
+                                             name, value.decode('utf-8', 'replace'),
+                                             _get_line(data, newlines, line)))
+                raise
+    return keys, values
+
+
+def _finalize(keys, values, column_format):
+    """Concatenates the outputs of _parse_block() for the blocks of a file,
+    sorts them on the key and returns the list of columns."""
+    keys = np.concatenate(keys)
+    # the files are normally sorted already, in which case order is None.
+    order = None
+    if not np.all(keys[1:] >= keys[:-1]):
+        order = np.argsort(keys, kind='mergesort')
+        keys = keys[order]
+    columns = []
+    for c, spec in enumerate(column_format):
+        column_type = spec[1]
+        if column_type in ['text', 'token-list']:
+            lengths = np.concatenate([v[c][1] for v in values])
+            offsets = np.concatenate(([0], np.cumsum(lengths)))
+            data = np.concatenate([v[c][0] for v in values])
+            if column_type == 'text':
+                column = TextColumn(data, offsets)
+            else:
+                column = TokenListColumn(*_intern(data), offsets=offsets)
+            if order is not None:
+                column = column.subset(order)
+        else:
+            column = np.concatenate([v[c] for v in values])
+            if order is not None:
+                column = column[order]
+            if column_type == 'token':
+                column = TokenColumn(*_intern(column))
+        columns.append(column)
+    return keys, columns
+
+
+def _parse_file(f, filename, column_format):
+    """Parses the lines read from the file object f (opened in binary mode)
+    and returns a tuple (keys, columns)."""
+    keys = []
+    values = []
+    num_lines = 0
+    pending = b''
+    while True:
+        data = f.read(block_size)
+        if len(data) > 0:
+            data = pending + data
+            end = data.rfind(b'\n') + 1
+            pending = data[end:]
+            data = data[:end]
+            if len(data) == 0:
+                continue
+        else:
+            # the last line, if it has no newline.
+            data = pending
+            pending = b''
+            if len(data) == 0:
+                break
+        try:
+            this_keys, this_values = _parse_block(data, column_format)
+        except ValueError as e:
+            raise ValueError("{0}: line {1}: {2}".format(
+                filename, num_lines + e.args[0] + 1, e.args[1]))
+        keys.append(this_keys)
+        values.append(this_values)
+        num_lines += len(this_keys)
+    if len(keys) == 0:
+        # an empty file: get arrays of the right types from a dummy line.
+        this_keys, this_values = _parse_block(
+            b'x' + b' 0' * len(column_format) + b'\n', column_format)
+        keys = [this_keys[:0]]
+        values = [[_empty(v) for v in this_values]]
+
+    keys, columns = _finalize(keys, values, column_format)
+    duplicates = np.nonzero(keys[1:] == keys[:-1])[0]
+    if len(duplicates) > 0:
+        raise ValueError("{0}: duplicate key '{1}'".format(
+            filename, keys[duplicates[0]].decode('utf-8', 'replace')))
+    return keys, columns
+
+
+def _empty(value):
+    if isinstance(value, tuple):
+        return tuple(v[:0] for v in value)
+    return value[:0]
+
+
+def _cache_filename(filename):
+    dirname, basename = os.path.split(filename)
+    return os.path.join(dirname, '.cache', basename + '.npz')
+
+
+def _file_signature(filename):
+    st = os.stat(filename)
+    mtime_ns = getattr(st, 'st_mtime_ns', int(st.st_mtime * 1e9))
+    return np.array([st.st_size, mtime_ns, st.st_ino], dtype=np.int64)
+
+
+def _read_cache(filename, column_format, signature):
+    """Returns (keys, columns) from the cached form of 'filename', or None if
+    there is no valid cache for it."""
+    cache = _cache_filename(filename)
+    if not os.path.exists(cache):
+        return None
+    try:
+        with np.load(cache, allow_pickle=False) as arrays:
+            if (int(arrays['version']) != cache_version
+                    or not np.array_equal(arrays['signature'], signature)
+                    or str(arrays['format']) != repr(column_format)):
+                return None
+            columns = []
+            for c, spec in enumerate(column_format):
+                column_type = spec[1]
+                prefix = 'column{0}_'.format(c)
+                if column_type in _column_classes:
+                    this_arrays = dict([(k[len(prefix):], arrays[k])
+                                        for k in arrays.files
+                                        if k.startswith(prefix)])
+                    columns.append(
+                        _column_classes[column_type].from_arrays(this_arrays))
+                else:
+                    columns.append(arrays[prefix + 'values'])
+            return arrays['keys'], columns
+    except Exception as e:
+        logger.warning("Ignoring cached form {0} of {1}, which could not be "
+                       "read: {2}".format(cache, filename, e))
+        return None
+
+
+def _write_cache(filename, column_format, signature, keys, columns):
+    cache = _cache_filename(filename)
+    arrays = {'version': np.array(cache_version), 'signature': signature,
+              'format': np.array(repr(column_format)), 'keys': keys}
+    for c, column in enumerate(columns):
+        prefix = 'column{0}_'.format(c)
+        if isinstance(column, np.ndarray):
+            arrays[prefix + 'values'] = column
+        else:
+            for name, value in column.to_arrays().items():
+                arrays[prefix + name] = value
+    # write to a temporary file and rename it, so that processes reading the
+    # same file at the same time never see a partial cache.
+    tmp = "{0}.tmp.{1}".format(cache, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(cache)):
+            os.makedirs(os.path.dirname(cache))
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.rename(tmp, cache)
+    except (IOError, OSError) as e:
+        # e.g. the directory is not writable; the cache is just an
+        # optimization.
+        logger.debug("Could not write cache {0}: {1}".format(cache, e))
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def read_table(filename, column_format, encoding='utf-8', use_cache=True):
+    """Reads a Kaldi file like utt2spk or segments and returns it as a Table.
+
+    Args:
+        filename: the file to read, or "-" for the standard input.
+        column_format: the name of a file format in 'file_formats' (e.g.
+            'segments'), or a list of (column-name, column-type) or
+            (column-name, column-type, default) in the same form as its
+            values.
+        encoding: the encoding used when decoding strings from the table.
+        use_cache: if true, use and create the cached form of the file.
+
+    Raises ValueError if the file has malformed lines or duplicate keys.
+    """
+    if not isinstance(column_format, list):
+        column_format = file_formats[column_format]
+    for spec in column_format[:-1]:
+        if spec[1] in ['text', 'token-list']:
+            raise ValueError("Columns of type {0} must be the only "
+                             "column".format(spec[1]))
+    for spec, next_spec in zip(column_format[:-1], column_format[1:]):
+        if len(spec) > 2 and len(next_spec) == 2:
+            raise ValueError("Optional columns must come after the other "
+                             "columns")
+    if len(column_format[-1]) > 2 and column_format[-1][1] in ['text',
+                                                               'token-list']:
+        raise ValueError("Columns of type {0} cannot be "
+                         "optional".format(column_format[-1][1]))
+
+    if filename == "-":
+        keys, columns = _parse_file(getattr(sys.stdin, 'buffer', sys.stdin),
+                                    "standard input", column_format)
+        return Table(keys, columns, column_format, encoding)
+
+    signature = _file_signature(filename)
+    cached = _read_cache(filename, column_format, signature) if use_cache else None
+    if cached is not None:
+        keys, columns = cached
+    else:
+        with open(filename, 'rb') as f:
+            keys, columns = _parse_file(f, filename, column_format)
+        if use_cache:
+            _write_cache(filename, column_format, signature, keys, columns)
+    return Table(keys, columns, column_format, encoding)
+
+
+class DataDir(object):
+    """ A Kaldi data directory, e.g. data/train, whose files are read (with
+        read_table()) the first time they are accessed.
+
+        e.g.:  data = DataDir('data/train')
+               utt2spk = data['utt2spk']
+    """
+    def __init__(self, path, encoding='utf-8', use_cache=True):
+        self.path = path
+        self.encoding = encoding
+        self.use_cache = use_cache
+        self.tables = {}
+
+    def filename(self, name):
+        return os.path.join(self.path, name)
+
+    def has(self, name):
+        return os.path.exists(self.filename(name))
+
+    def get(self, name, column_format=None):
+        """Returns the file 'name' of the data directory as a Table;
+        'column_format' is only needed for files that are not in
+        'file_formats'."""
+        if column_format is None:
+            column_format = name
+        key = (name, repr(column_format))
+        if key not in self.tables:
+            self.tables[key] = read_table(
+                self.filename(name), column_format,
+                encoding=self.encoding, use_cache=self.use_cache)
+        return self.tables[key]
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+
+import unittest
+
+class SelfTest(unittest.TestCase):
+
+    def test_isin(self):
+        column = TokenColumn(*_intern(np.array([b'a', b'b', b'a', b'c'])))
+        self.assertEqual([True, False, True, True],
+                         column.isin(['a', 'c', 'd']).tolist())
+        self.assertEqual([False] * 4, column.isin([]).tolist())
+
+    def test_select(self):
+        with tempfile.NamedTemporaryFile(suffix='utt2spk') as f:
+            f.write(b'utt3 spk2\nutt1 spk1\nutt2 spk1\n')
+            f.flush()
+            table = read_table(f.name, 'utt2spk', use_cache=False)
+        subset = table.select([b'utt3', 'utt1', 'utt4'])
+        self.assertEqual(['utt1', 'utt3'], subset.decode_keys())
+        self.assertEqual(['spk1', 'spk2'], subset.decode_column('spk'))
+        self.assertEqual({'utt1': 'spk1'},
+                         table.select(['utt1']).to_dict('spk'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,7 @@ from __future__ import print_function
 import traceback
 import datetime
 import logging
+import os
 import re
 
 import libs.common as common_lib
@@ -387,6 +388,142 @@ def get_train_times(exp_dir):
         train_times[iter] = max(values)
     return train_times
 
+def get_train_job_times(exp_dir, iter, num_jobs):
+    """ Returns a dict mapping each job of iteration 'iter' to a tuple
+    (host, time) parsed from the '# Running on' and '# Accounting: time='
+    lines of its log file exp_dir/log/train.<iter>.<job>.log.  The host is
+    None if the log does not say where the job ran (e.g. with run.pl); jobs
+    whose time cannot be found are left out.
+    """
+    host_regex = re.compile("^# Running on (\S+)")
+    time_regex = re.compile("^# Accounting: time=([0-9]+) ")
+    job_times = {}
+    for job in range(1, num_jobs + 1):
+        host = None
+        time = None
+        try:
+            with open("{0}/log/train.{1}.{2}.log".format(exp_dir, iter, job),
+                      'r') as f:
+                for line in f:
+                    if not line.startswith('#'):
+                        continue
+                    mat_obj = host_regex.search(line)
+                    if mat_obj is not None:
+                        host = mat_obj.group(1)
+                    mat_obj = time_regex.search(line)
+                    if mat_obj is not None:
+                        time = float(mat_obj.group(1))
+        except IOError:
+            continue
+        if time is not None:
+            job_times[job] = (host, time)
+    return job_times
+
+
+def get_train_log_files(exp_dir):
+    """ Returns a list of tuples (iter, job, filename) for all the training
+    logs exp_dir/log/train.<iter>.<job>.log, sorted by iteration and job.
+    """
+    log_regex = re.compile("^train\.([0-9]+)\.([0-9]+)\.log$")
+    ans = []
+    for name in os.listdir("{0}/log".format(exp_dir)):
+        mat_obj = log_regex.search(name)
+        if mat_obj is not None:
+            ans.append((int(mat_obj.group(1)), int(mat_obj.group(2)),
+                        "{0}/log/{1}".format(exp_dir, name)))
+    ans.sort()
+    return ans
+
+
+g_compute_debug_regex = re.compile(
+    "\(([^:() ]+):DebugAfterExecute\(\)[^)]*\) c[0-9]+: (.*)$")
+g_component_command_regex = re.compile(
+    "^([^ (]+)\.(Propagate|Backprop)\(")
+g_matrix_method_regex = re.compile("^m[0-9]+(\([^)]*\))?\.([A-Za-z]+)\(")
+
+
+def get_compute_debug_command_type(command):
+    """ Works out what kind of command this is, from the string printed
+    for it by NnetComputation::GetCommandStrings() (see PrintCommand() in
+    nnet-computation.cc).  Returns a tuple (component_name, command_type),
+    where component_name is None for commands that don't involve a component.
+    E.g. for
+    'BLstm1_backward_W_i-xr.Propagate(NULL, m6212(3136:3199, 0:555), &m31(0:63, 0:1023))'
+    it returns ('BLstm1_backward_W_i-xr', 'Propagate'), and for
+    'm19 = []' it returns (None, 'DeallocMatrix').
+    """
+    mat_obj = g_component_command_regex.search(command)
+    if mat_obj is not None:
+        return (mat_obj.group(1), mat_obj.group(2))
+    mat_obj = g_matrix_method_regex.search(command)
+    if mat_obj is not None:
+        method = mat_obj.group(2)
+        return (None, {'swap': 'SwapMatrix',
+                       'set': 'SetConst'}.get(method, method))
+    if command.startswith('CompressMatrix('):
+        return (None, 'CompressMatrix')
+    if command.startswith('DecompressMatrix('):
+        return (None, 'DecompressMatrix')
+    if command.startswith('output '):
+        return (None, 'ProvideOutput')
+    if command.startswith('goto '):
+        return (None, 'GotoLabel')
+    if command.startswith('[') or command.startswith('#'):
+        return (None, 'NoOperation')
+    if ' = undefined(' in command:
+        return (None, 'AllocMatrix')
+    if command.endswith(' = []'):
+        return (None, 'DeallocMatrix')
+    if ' = user input ' in command:
+        return (None, 'AcceptInput')
+    if ' += ' in command:
+        return (None, 'MatrixAdd')
+    if ' = ' in command:
+        return (None, 'MatrixCopy')
+    return (None, 'Other')
+
+
+def parse_compute_debug_timing(log_file):
+    """ Parses the timing information printed by
+    NnetComputer::DebugAfterExecute() in the log of a training job run with
+    --computation.debug=true (e.g. nnet3-train or nnet3-chain-train), i.e.
+    lines like
+    LOG (nnet3-chain-train:DebugAfterExecute():nnet-compute.cc:158) c68: tdnn1.affine.Propagate(NULL, m6(0:63, 0:119), &m7) | m7: 0->0.9 | time: 0.0007689 secs
+
+    Returns a tuple (program, times) where 'program' is the name of the
+    program (None if there were no such lines) and 'times' is a dict mapping
+    (component_name, command_type) tuples, as returned by
+    get_compute_debug_command_type(), to a list [count, total_time].
+    """
+    program = None
+    times = {}
+    with open(log_file, 'r') as f:
+        for line in f:
+            if 'DebugAfterExecute' not in line:
+                continue
+            parts = line.split("|")
+            if len(parts) != 3:
+                # we don't know how to deal with these lines
+                continue
+            time_parts = parts[2].split()
+            if (len(time_parts) != 3 or time_parts[0] != "time:"
+                    or time_parts[2] != "secs"):
+                continue
+            mat_obj = g_compute_debug_regex.search(parts[0].strip())
+            if mat_obj is None:
+                continue
+            # remove the version, as in 'nnet3-train[5.5.1]'.
+            program = mat_obj.group(1).split('[')[0]
+            key = get_compute_debug_command_type(mat_obj.group(2))
+            try:
+                stats = times[key]
+            except KeyError:
+                stats = times[key] = [0, 0.0]
+            stats[0] += 1
+            stats[1] += float(time_parts[1])
+    return (program, times)
+
+
 def parse_prob_logs(exp_dir, key='accuracy', output="output"):
     train_prob_files = "%s/log/compute_prob_train.*.log" % (exp_dir)
     valid_prob_files = "%s/log/compute_prob_valid.*.log" % (exp_dir)
@@ -128,7 +128,8 @@ def train_new_models(dir, iter, srand, num_jobs,
                      shuffle_buffer_size, num_chunk_per_minibatch_str,
                      frame_subsampling_factor, run_opts, train_opts,
                      backstitch_training_scale=0.0, backstitch_training_interval=1,
-                     use_multitask_egs=False):
+                     use_multitask_egs=False, egs_stager=None,
+                     keep_proportions=None):
     """
     Called from train_one_iteration(), this method trains new models
     with 'num_jobs' jobs, and
@@ -145,6 +146,14 @@ def train_new_models(dir, iter, srand, num_jobs,
                         multilingual egs can be generated using get_egs.sh and
                         steps/nnet3/multilingual/allocate_multilingual_examples.py,
                         those are the top-level scripts.
+    egs_stager : If not None, an EgsStagingCache object (see
+                 libs/nnet3/train/egs_staging.py) giving the local copies
+                 of the egs archives, if they have been staged.
+    keep_proportions : If not None, a list with, for each job, the proportion
+                       of its archive to train on (see
+                       libs/nnet3/train/load_balancing.py); the
+                       l2-regularize-factor of each job is made proportional
+                       to it.
     """
 
     deriv_time_opts = []
@@ -178,6 +187,21 @@ def train_new_models(dir, iter, srand, num_jobs,
             archive_index=archive_index,
             use_multitask_egs=use_multitask_egs)
         scp_or_ark = "scp" if use_multitask_egs else "ark"
+        if egs_stager is not None and not use_multitask_egs:
+            egs_path = egs_stager.get_path("cegs.{0}.ark".format(archive_index))
+        else:
+            egs_path = "{0}/cegs.{1}.{2}".format(egs_dir, archive_index,
+                                                 scp_or_ark)
+        if keep_proportions is not None:
+            # the seed changes every iteration, so that different egs are
+            # left out each time the archive is used.
+            keep_proportion_opt = "--keep-proportion={0} --srand={1}".format(
+                keep_proportions[job - 1], iter + srand)
+            l2_regularize_factor = (keep_proportions[job - 1]
+                                    / sum(keep_proportions))
+        else:
+            keep_proportion_opt = ""
+            l2_regularize_factor = 1.0 / num_jobs
         cache_io_opts = (("--read-cache={dir}/cache.{iter}".format(dir=dir,
                                                                   iter=iter)
                           if iter > 0 else "") +
@@ -198,9 +222,9 @@ def train_new_models(dir, iter, srand, num_jobs,
                     --l2-regularize-factor={l2_regularize_factor} {train_opts} \
                     --srand={srand} \
                     "{raw_model}" {dir}/den.fst \
-                    "ark,bg:nnet3-chain-copy-egs {multitask_egs_opts} \
+                    "ark,bg:nnet3-chain-copy-egs {multitask_egs_opts} {keep_proportion_opt} \
                         --frame-shift={fr_shft} \
-                        {scp_or_ark}:{egs_dir}/cegs.{archive_index}.{scp_or_ark} ark:- | \
+                        {scp_or_ark}:{egs_path} ark:- | \
                         nnet3-chain-shuffle-egs --buffer-size={buf_size} \
                         --srand={srand} ark:- ark:- | nnet3-chain-merge-egs \
                         --minibatch-size={num_chunk_per_mb} ark:- ark:- |" \
@@ -220,9 +244,10 @@ def train_new_models(dir, iter, srand, num_jobs,
                         momentum=momentum, max_param_change=max_param_change,
                         backstitch_training_scale=backstitch_training_scale,
                         backstitch_training_interval=backstitch_training_interval,
-                        l2_regularize_factor=1.0/num_jobs,
+                        l2_regularize_factor=l2_regularize_factor,
+                        keep_proportion_opt=keep_proportion_opt,
                         raw_model=raw_model_string,
-                        egs_dir=egs_dir, archive_index=archive_index,
+                        egs_path=egs_path,
                         buf_size=shuffle_buffer_size,
                         num_chunk_per_mb=num_chunk_per_minibatch_str,
                         multitask_egs_opts=multitask_egs_opts,
@@ -247,10 +272,15 @@ def train_one_iteration(dir, iter, srand, egs_dir,
                         frame_subsampling_factor,
                         run_opts, dropout_edit_string="", train_opts="",
                         backstitch_training_scale=0.0, backstitch_training_interval=1,
-                        use_multitask_egs=False):
+                        use_multitask_egs=False, egs_stager=None,
+                        keep_proportions=None):
     """ Called from steps/nnet3/chain/train.py for one iteration for
     neural network training with LF-MMI objective
 
+    egs_stager: If not None, an EgsStagingCache object from which the
+        (possibly staged) paths of the egs archives are obtained.
+    keep_proportions: If not None, the proportion of its archive each job
+        trains on; the models are then averaged with these weights.
     """
 
     # Set off jobs doing some diagnostics, in the background.
@@ -326,7 +356,9 @@ def train_one_iteration(dir, iter, srand, egs_dir,
                      backstitch_training_scale=(backstitch_training_scale *
                          iter / 15 if iter < 15 else backstitch_training_scale),
                      backstitch_training_interval=backstitch_training_interval,
-                     use_multitask_egs=use_multitask_egs)
+                     use_multitask_egs=use_multitask_egs,
+                     egs_stager=egs_stager,
+                     keep_proportions=keep_proportions)
 
     [models_to_average, best_model] = common_train_lib.get_successful_models(
          num_jobs, '{0}/log/train.{1}.%.log'.format(dir, iter))
@@ -339,7 +371,9 @@ def train_one_iteration(dir, iter, srand, egs_dir,
         common_train_lib.get_average_nnet_model(
             dir=dir, iter=iter,
             nnets_list=" ".join(nnets_list),
-            run_opts=run_opts)
+            run_opts=run_opts,
+            weights=([keep_proportions[n - 1] for n in models_to_average]
+                     if keep_proportions is not None else None))
 
     else:
         # choose the best model from different jobs
@@ -141,7 +141,10 @@ def get_successful_models(num_models, log_file_pattern,
 
 
 def get_average_nnet_model(dir, iter, nnets_list, run_opts,
-                           get_raw_nnet_from_am=True):
+                           get_raw_nnet_from_am=True, weights=None):
+    """ Averages the models in nnets_list; if weights is not None, it is a
+    list with the (unnormalized) weight of each model.
+    """
 
     next_iter = iter + 1
     if get_raw_nnet_from_am:
@@ -155,10 +158,14 @@ def get_average_nnet_model(dir, iter, nnets_list, run_opts,
 
     common_lib.execute_command(
         """{command} {dir}/log/average.{iter}.log \
-                nnet3-average {nnets_list} \
+                nnet3-average {weights_opt} {nnets_list} \
                 {out_model}""".format(command=run_opts.command,
                                       dir=dir,
                                       iter=iter,
+                                      weights_opt=(
+                                          "--weights=" + ":".join(
+                                              [str(w) for w in weights])
+                                          if weights is not None else ""),
                                       nnets_list=nnets_list,
                                       out_model=out_model))
 
@@ -772,6 +779,27 @@ class CommonParser(object):
                                  action=common_lib.NullstrToNoneAction,
                                  help="""String to provide options directly
                                  to steps/nnet3/get_egs.sh script""")
+        self.parser.add_argument("--egs.staging-dir", type=str,
+                                 dest='egs_staging_dir', default=None,
+                                 action=common_lib.NullstrToNoneAction,
+                                 help="""Directory on node-local disk (e.g.
+                                 /tmp/egs_staging) to which the egs archives
+                                 of the next iteration are copied in the
+                                 background while the current iteration is
+                                 training.  It must be visible to the training
+                                 jobs, so it is only used if --cmd is run.pl
+                                 (jobs on the same machine as this script).
+                                 Archives that
+                                 are not staged in time are read from the egs
+                                 directory.  Each run stages its archives in
+                                 a subdirectory of its own, which is removed
+                                 at the end of training.""")
+        self.parser.add_argument("--egs.staging-max-size", type=float,
+                                 dest='egs_staging_max_size', default=100.0,
+                                 help="""Maximum total size, in GB, of the
+                                 archives kept in --egs.staging-dir; the
+                                 least recently used archives are removed
+                                 first.""")
 
         # trainer options
         self.parser.add_argument("--trainer.srand", type=int, dest='srand',
@@ -856,6 +884,32 @@ class CommonParser(object):
             type=positive_int,  metavar='N', dest='num_jobs_step', default=1,
             help="""Number of jobs increment, when exceeds this number. For
             example, if N=3, the number of jobs may progress as 1, 2, 3, 6, 9...""")
+        self.parser.add_argument("--trainer.optimization.balance-jobs",
+                                 type=str, dest='balance_jobs',
+                                 default=False, choices=["true", "false"],
+                                 action=common_lib.StrToBoolAction,
+                                 help="""If true, measure the throughput of
+                                 each training job from its log and, on later
+                                 iterations, let the slower jobs process only
+                                 a proportion of their archive so that all
+                                 jobs finish at about the same time.  The
+                                 l2-regularize-factor and the model-averaging
+                                 weights are scaled to match.  The fixed
+                                 overhead of the jobs (startup, model I/O) is
+                                 estimated and left out of the throughputs.
+                                 Off by default because the egs the slower
+                                 jobs leave out are not given to other jobs:
+                                 less data is seen per epoch, and the model
+                                 depends on the speed of the workers.
+                                 Only useful if a given job index always runs
+                                 on the same kind of worker (e.g. run.pl, or
+                                 ssh.pl with fixed hosts; not queue.pl).""")
+        self.parser.add_argument("--trainer.optimization.balance-min-proportion",
+                                 type=float, dest='balance_min_proportion',
+                                 default=0.5,
+                                 help="""With --trainer.optimization.balance-jobs,
+                                 the smallest proportion of its archive any
+                                 job will be given.""")
         self.parser.add_argument("--trainer.optimization.max-models-combine",
                                  "--trainer.max-models-combine",
                                  type=int, dest='max_models_combine',
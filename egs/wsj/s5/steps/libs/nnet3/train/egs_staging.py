@@ -0,0 +1,208 @@
+
+
+# Copyright 2019  Johns Hopkins University
+# Apache 2.0
+
+"""This module contains a staging cache that copies training egs archives from
+the (possibly remote, e.g. NFS) egs directory to node-local scratch space.
+
+While iteration N is training, the archives that iteration N+1 will read are
+copied in a background thread, so that by the time the jobs of iteration N+1
+are launched they can read the archives from local disk. The total size of
+the staged archives is bounded; the least recently used archives are evicted
+first, and an archive that is not (yet) fully staged is simply read from the
+egs directory.  Each training run stages its archives in its own
+subdirectory of the staging directory, which is removed when the run
+finishes, so several runs can share a staging directory.
+
+Note: the staging directory has to be visible to the training jobs, so this
+can only be used when the jobs run on the same machine as the training script,
+i.e. with run.pl (e.g. on a multi-GPU machine).  With queue.pl, slurm.pl etc.
+the jobs may run on other nodes, so get_egs_stager() does not enable staging.
+"""
+
+import atexit
+import collections
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def get_archive_indexes(num_archives_processed, num_jobs, num_archives):
+    """Returns the list of 1-based archive indexes read by the 'num_jobs' jobs
+    of an iteration that starts after 'num_archives_processed' archives,
+    in the same way as train_new_models() computes 'archive_index'.
+    """
+    return [((num_archives_processed + job - 1) % num_archives) + 1
+            for job in range(1, num_jobs + 1)]
+
+
+def get_egs_stager(egs_dir, staging_dir, max_size_gb, command):
+    """Returns an EgsStagingCache for 'egs_dir' if 'staging_dir' is not None
+    and the training jobs, run with 'command' (e.g. "run.pl" or
+    "queue.pl --gpu 1"), run on this machine; otherwise returns None.
+    """
+    if staging_dir is None:
+        return None
+    if os.path.basename(command.split()[0]) != "run.pl":
+        logger.warning("Not staging the egs in {0}: the training jobs are "
+                       "run with '{1}' and may not run on this machine "
+                       "(staging needs run.pl)".format(staging_dir, command))
+        return None
+    return EgsStagingCache(egs_dir, staging_dir, max_size_gb)
+
+
+class EgsStagingCache(object):
+    """A size-bounded LRU cache of egs archives on local disk.
+
+    Usage:
+        stager = EgsStagingCache(egs_dir, staging_dir, max_size_gb)
+        # before launching the jobs of an iteration that reads egs.{1,2}.ark,
+        # when the next iteration will read egs.{3,4}.ark:
+        stager.prefetch(["egs.3.ark", "egs.4.ark"],
+                        in_use=["egs.1.ark", "egs.2.ark"])
+        path = stager.get_path("egs.1.ark")   # local path or egs_dir path
+        ...
+        stager.close()   # removes the staged archives
+    """
+
+    def __init__(self, egs_dir, staging_dir, max_size_gb=100.0):
+        self.egs_dir = egs_dir
+        self.staging_dir = staging_dir
+        self.max_size = int(max_size_gb * (1 << 30))
+
+        # maps archive name -> size in bytes, in least-recently-used order.
+        self._staged = collections.OrderedDict()
+        self._pinned = set()
+        self._wanted = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+
+        if not os.path.exists(staging_dir):
+            os.makedirs(staging_dir)
+        # the archives of this run, which are named as in egs_dir, are staged
+        # in a directory of their own so that runs sharing 'staging_dir' do
+        # not see each other's archives.
+        self.run_dir = tempfile.mkdtemp(prefix="egs.", dir=staging_dir)
+        # in case the training script fails before calling close().
+        atexit.register(self.close)
+        self._thread = threading.Thread(target=self._prefetch_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _local_path(self, name):
+        return os.path.join(self.run_dir, name)
+
+    def _remote_path(self, name):
+        return os.path.join(self.egs_dir, name)
+
+    def get_path(self, name):
+        """Returns the path to read the archive 'name' from: the staged copy
+        if there is one, otherwise the path in the egs directory.
+        """
+        with self._lock:
+            if name in self._staged:
+                # move to the most-recently-used end.
+                size = self._staged.pop(name)
+                self._staged[name] = size
+                return self._local_path(name)
+        return self._remote_path(name)
+
+    def prefetch(self, names, in_use=()):
+        """Requests the archives in 'names' to be staged in the background.
+        This replaces any earlier request that has not been completed yet.
+        The archives in 'in_use' (normally those of the iteration about to
+        be run) are not evicted while staging these.
+        """
+        with self._lock:
+            self._wanted = list(names)
+            self._pinned = set(in_use)
+            self._wakeup.notify()
+
+    def prefetch_next_iteration(self, egs_prefix, num_archives_processed,
+                                num_jobs, next_num_jobs, num_archives):
+        """Called by the training scripts before running an iteration with
+        'num_jobs' jobs after 'num_archives_processed' archives: stages the
+        archives (named e.g. egs.N.ark or cegs.N.ark, depending on
+        'egs_prefix') of the next iteration, which has 'next_num_jobs' jobs.
+        """
+        in_use = ["{0}{1}.ark".format(egs_prefix, i)
+                  for i in get_archive_indexes(num_archives_processed,
+                                               num_jobs, num_archives)]
+        names = ["{0}{1}.ark".format(egs_prefix, i)
+                 for i in get_archive_indexes(
+                     num_archives_processed + num_jobs, next_num_jobs,
+                     num_archives)]
+        self.prefetch(names, in_use=in_use)
+
+    def close(self):
+        """Stops the staging and removes the staged archives; the paths
+        returned by get_path() must not be read after this.  Calling it more
+        than once has no effect."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    def _evict_for(self, size, keep):
+        """Evicts least-recently-used archives not in 'keep' until 'size' more
+        bytes fit. Returns False if that is not possible. Must be called with
+        the lock held."""
+        used = sum(self._staged.values())
+        for name in list(self._staged.keys()):
+            if used + size <= self.max_size:
+                break
+            if name in keep or name in self._pinned:
+                continue
+            used -= self._staged.pop(name)
+            try:
+                os.remove(self._local_path(name))
+            except OSError:
+                logger.warning("Could not remove staged archive "
+                               "{0}".format(self._local_path(name)))
+        return used + size <= self.max_size
+
+    def _prefetch_loop(self):
+        while True:
+            with self._lock:
+                while not self._closed and not self._wanted:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+                name = self._wanted.pop(0)
+                if name in self._staged:
+                    continue
+                try:
+                    size = os.path.getsize(self._remote_path(name))
+                except OSError:
+                    logger.warning("Could not stage {0}: it does not "
+                                   "exist".format(self._remote_path(name)))
+                    continue
+                keep = set(self._wanted)
+                keep.add(name)
+                if not self._evict_for(size, keep):
+                    logger.warning("Not staging {0}: the staging cache is "
+                                   "full".format(name))
+                    continue
+
+            tmp_path = self._local_path(name) + ".tmp"
+            try:
+                shutil.copyfile(self._remote_path(name), tmp_path)
+                os.rename(tmp_path, self._local_path(name))
+            except (IOError, OSError) as e:
+                logger.warning("Error staging {0}: {1}".format(name, str(e)))
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                continue
+
+            with self._lock:
+                self._staged[name] = size
@@ -34,7 +34,8 @@ def train_new_models(dir, iter, srand, num_jobs,
                      run_opts, frames_per_eg=-1,
                      min_deriv_time=None, max_deriv_time_relative=None,
                      use_multitask_egs=False, train_opts="",
-                     backstitch_training_scale=0.0, backstitch_training_interval=1):
+                     backstitch_training_scale=0.0, backstitch_training_interval=1,
+                     egs_stager=None, keep_proportions=None):
     """ Called from train_one_iteration(), this model does one iteration of
     training with 'num_jobs' jobs, and writes files like
     exp/tdnn_a/24.{1,2,3,..<num_jobs>}.raw
@@ -64,6 +65,13 @@ def train_new_models(dir, iter, srand, num_jobs,
             be generated using get_egs.sh and
             steps/nnet3/multilingual/allocate_multilingual_examples.py, those
             are the top-level scripts.
+        egs_stager: If not None, an EgsStagingCache object (see
+            libs/nnet3/train/egs_staging.py) giving the local copies of the
+            egs archives, if they have been staged.
+        keep_proportions: If not None, a list with, for each job, the
+            proportion of its archive to train on (see
+            libs/nnet3/train/load_balancing.py); the l2-regularize-factor of
+            each job is made proportional to it.
     """
 
     chunk_level_training = False if frames_per_eg > 0 else True
@@ -117,16 +125,33 @@ def train_new_models(dir, iter, srand, num_jobs,
             use_multitask_egs=use_multitask_egs)
 
         scp_or_ark = "scp" if use_multitask_egs else "ark"
+        if egs_stager is not None and not use_multitask_egs:
+            egs_path = egs_stager.get_path("egs.{0}.ark".format(archive_index))
+        else:
+            egs_path = "{0}/egs.{1}.{2}".format(egs_dir, archive_index,
+                                                scp_or_ark)
+
+        if keep_proportions is not None:
+            # the seed changes every iteration, so that different egs are
+            # left out each time the archive is used.
+            keep_proportion_opt = "--keep-proportion={0} --srand={1}".format(
+                keep_proportions[job - 1], iter + srand)
+            l2_regularize_factor = (keep_proportions[job - 1]
+                                    / sum(keep_proportions))
+        else:
+            keep_proportion_opt = ""
+            l2_regularize_factor = 1.0 / num_jobs
 
         egs_rspecifier = (
-            """ark,bg:nnet3-copy-egs {frame_opts} {multitask_egs_opts} \
-            {scp_or_ark}:{egs_dir}/egs.{archive_index}.{scp_or_ark} ark:- | \
+            """ark,bg:nnet3-copy-egs {frame_opts} {keep_proportion_opt} {multitask_egs_opts} \
+            {scp_or_ark}:{egs_path} ark:- | \
             nnet3-shuffle-egs --buffer-size={shuffle_buffer_size} \
             --srand={srand} ark:- ark:- | {aug_cmd} \
             nnet3-merge-egs --minibatch-size={minibatch_size} ark:- ark:- |""".format(
                 frame_opts=("" if chunk_level_training
                             else "--frame={0}".format(frame)),
-                egs_dir=egs_dir, archive_index=archive_index,
+                egs_path=egs_path,
+                keep_proportion_opt=keep_proportion_opt,
                 shuffle_buffer_size=shuffle_buffer_size,
                 minibatch_size=minibatch_size_str,
                 aug_cmd=image_augmentation_cmd,
@@ -156,7 +181,7 @@ def train_new_models(dir, iter, srand, num_jobs,
                 cache_io_opts=cache_io_opts,
                 verbose_opt=verbose_opt,
                 momentum=momentum, max_param_change=max_param_change,
-                l2_regularize_factor=1.0/num_jobs,
+                l2_regularize_factor=l2_regularize_factor,
                 backstitch_training_scale=backstitch_training_scale,
                 backstitch_training_interval=backstitch_training_interval,
                 train_opts=train_opts,
@@ -181,7 +206,8 @@ def train_one_iteration(dir, iter, srand, egs_dir,
                         shrinkage_value=1.0, dropout_edit_string="",  train_opts="",
                         get_raw_nnet_from_am=True, use_multitask_egs=False,
                         backstitch_training_scale=0.0, backstitch_training_interval=1,
-                        compute_per_dim_accuracy=False):
+                        compute_per_dim_accuracy=False, egs_stager=None,
+                        keep_proportions=None):
     """ Called from steps/nnet3/train_*.py scripts for one iteration of neural
     network training
 
@@ -196,6 +222,10 @@ def train_one_iteration(dir, iter, srand, egs_dir,
         get_raw_nnet_from_am: If True, then the network is read and stored as
             acoustic model i.e. along with transition model e.g. 10.mdl
             as against a raw network e.g. 10.raw when the value is False.
+        egs_stager: If not None, an EgsStagingCache object from which the
+            (possibly staged) paths of the egs archives are obtained.
+        keep_proportions: If not None, the proportion of its archive each job
+            trains on; the models are then averaged with these weights.
     """
 
     # Set off jobs doing some diagnostics, in the background.
@@ -271,7 +301,9 @@ def train_one_iteration(dir, iter, srand, egs_dir,
                      use_multitask_egs=use_multitask_egs,
                      train_opts=train_opts,
                      backstitch_training_scale=backstitch_training_scale,
-                     backstitch_training_interval=backstitch_training_interval)
+                     backstitch_training_interval=backstitch_training_interval,
+                     egs_stager=egs_stager,
+                     keep_proportions=keep_proportions)
 
     [models_to_average, best_model] = common_train_lib.get_successful_models(
          num_jobs, '{0}/log/train.{1}.%.log'.format(dir, iter))
@@ -285,7 +317,9 @@ def train_one_iteration(dir, iter, srand, egs_dir,
             dir=dir, iter=iter,
             nnets_list=" ".join(nnets_list),
             run_opts=run_opts,
-            get_raw_nnet_from_am=get_raw_nnet_from_am)
+            get_raw_nnet_from_am=get_raw_nnet_from_am,
+            weights=([keep_proportions[n - 1] for n in models_to_average]
+                     if keep_proportions is not None else None))
 
     else:
         # choose the best model from different jobs
@@ -0,0 +1,163 @@
+
+
+# Copyright 2019  Johns Hopkins University
+# Apache 2.0
+
+"""This module contains methods for balancing the work of the parallel
+training jobs of an iteration across workers of different speed.
+
+Each job of an iteration normally processes one whole archive and the
+iteration has to wait for the slowest job.  JobThroughputTracker records the
+time each job took (from the '# Accounting:' lines of the training logs) and,
+from then on, gives each job a proportion of its archive to process (via the
+--keep-proportion option of nnet3-copy-egs / nnet3-chain-copy-egs) such that
+the jobs finish at roughly the same time.  The l2-regularize-factor of each
+job and the weights used for model averaging are made proportional to the
+amount of data the job processes.
+
+The time of a job is modelled as a fixed overhead (starting up, reading and
+writing the model), which is the same for all jobs, plus the time to process
+its proportion of the archive.  The overhead is estimated by least squares
+from the measurements of all jobs and subtracted before the proportions are
+worked out; until the proportions have varied (i.e. before the first
+balanced iteration) it cannot be estimated and is taken to be zero, which
+only makes the first proportions too close to 1.
+
+Note that no work is moved from the slow jobs to the fast ones: the egs that
+a slow job leaves out are simply not seen on that iteration (a different
+random subset each time), so balancing trades some of the data seen per
+epoch for shorter iterations, and the model depends on the speed of the
+workers.  This is why it is off by default (see the option
+--trainer.optimization.balance-jobs).
+
+The throughput is tracked per job index, which is only meaningful if a given
+job index keeps running on the same kind of hardware (e.g. run.pl, or ssh.pl
+with a fixed assignment of jobs to machines); with queue.pl a job index is
+not tied to a host.  The host of each job is recorded in
+<dir>/job_throughputs, for reference only.
+"""
+
+from __future__ import division
+from __future__ import print_function
+import logging
+import os
+
+import libs.nnet3.report.log_parse as log_parse
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class JobThroughputTracker(object):
+    """Keeps smoothed per-job timing statistics of the training jobs and
+    works out the proportion of its archive each job should process.
+
+    Arguments:
+        dir: The experiment directory; the per-iteration measurements are
+            appended to dir/job_throughputs, from which they are reloaded if
+            training is restarted.
+        min_proportion: The smallest proportion of an archive any job is
+            given.
+        smoothing: The weight of the new measurement when updating the
+            running averages of the statistics.
+    """
+
+    def __init__(self, dir, min_proportion=0.5, smoothing=0.5):
+        assert 0.0 < min_proportion <= 1.0
+        assert 0.0 < smoothing <= 1.0
+        self.dir = dir
+        self.min_proportion = min_proportion
+        self.smoothing = smoothing
+        # maps job -> exponentially weighted sums [1, p, p*p, t, p*t] over
+        # its measurements, where p is the proportion of the archive
+        # processed and t the time taken.
+        self.job_stats = {}
+        self._stats_file = "{0}/job_throughputs".format(dir)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self._stats_file):
+            return
+        with open(self._stats_file, 'r') as f:
+            for line in f:
+                parts = line.split()
+                # <iter> <job> <host> <time> <keep-proportion>
+                if len(parts) != 5:
+                    continue
+                time = float(parts[3])
+                if time > 0:
+                    self._add(int(parts[1]), float(parts[4]), time)
+
+    def _add(self, job, proportion, time):
+        values = [1.0, proportion, proportion * proportion, time,
+                  proportion * time]
+        if job in self.job_stats:
+            self.job_stats[job] = [
+                (1.0 - self.smoothing) * old + self.smoothing * new
+                for old, new in zip(self.job_stats[job], values)]
+        else:
+            self.job_stats[job] = values
+
+    def update(self, iter, num_jobs, keep_proportions=None):
+        """Reads the times of the training jobs of iteration 'iter', which
+        processed the proportions 'keep_proportions' of their archives
+        (all 1.0 if None), and updates the statistics."""
+        job_times = log_parse.get_train_job_times(self.dir, iter, num_jobs)
+        with open(self._stats_file, 'a') as f:
+            for job in sorted(job_times.keys()):
+                host, time = job_times[job]
+                host = host if host is not None else "-"
+                proportion = (keep_proportions[job - 1]
+                              if keep_proportions is not None else 1.0)
+                print("{0} {1} {2} {3} {4}".format(iter, job, host, time,
+                                                   proportion), file=f)
+                if time > 0:
+                    self._add(job, proportion, time)
+
+    def get_overhead(self):
+        """Returns the least-squares estimate of the fixed overhead c (in
+        seconds) in the model time = c + proportion * seconds_per_archive[job],
+        or 0 if the proportions processed by each job have not varied yet."""
+        # for a given c, the best seconds_per_archive[job] is
+        # (sum(p*t) - c * sum(p)) / sum(p*p); setting the derivative of the
+        # squared error with respect to c to zero then gives
+        # c = sum_jobs(sum(t) - sum(p) * sum(p*t) / sum(p*p)) /
+        #     sum_jobs(sum(1) - sum(p)^2 / sum(p*p)),
+        # whose denominator is zero iff p has not varied within any job.
+        numerator = 0.0
+        denominator = 0.0
+        for n, sp, spp, st, spt in self.job_stats.values():
+            numerator += st - sp * spt / spp
+            denominator += n - sp * sp / spp
+        if denominator < 1.0e-04:
+            return 0.0
+        # the overhead cannot be negative or more than the time of any job.
+        min_time = min([stats[3] / stats[0]
+                        for stats in self.job_stats.values()])
+        return min(max(numerator / denominator, 0.0), 0.9 * min_time)
+
+    def get_keep_proportions(self, num_jobs):
+        """Returns a list with, for each of the 'num_jobs' jobs, the
+        proportion of its archive to process, so that the slower jobs process
+        less data (the rest of their archive is not used on this iteration);
+        returns None if nothing has been measured yet.  Jobs that
+        have not been measured (e.g. because the number of jobs grew) are
+        assumed to have the average throughput."""
+        if len(self.job_stats) == 0:
+            return None
+        overhead = self.get_overhead()
+        # the time each job takes per archive, excluding the overhead.
+        seconds_per_archive = {}
+        for job, (n, sp, spp, st, spt) in self.job_stats.items():
+            seconds_per_archive[job] = max((spt - overhead * sp) / spp,
+                                           1.0e-03)
+        throughputs = dict([(job, 1.0 / s)
+                            for job, s in seconds_per_archive.items()])
+        average = sum(throughputs.values()) / len(throughputs)
+        throughputs = [throughputs.get(job, average)
+                       for job in range(1, num_jobs + 1)]
+        fastest = max(throughputs)
+        logger.info("Estimated fixed overhead of the training jobs: "
+                    "{0:.1f} seconds".format(overhead))
+        return [round(max(self.min_proportion, t / fastest), 3)
+                for t in throughputs]
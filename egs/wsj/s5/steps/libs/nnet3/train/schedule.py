@@ -0,0 +1,189 @@
+
+
+# Copyright 2019  Johns Hopkins University
+# Apache 2.0
+
+"""This module contains methods for working out the training schedule of the
+nnet3 training scripts (steps/nnet3/train*.py and steps/nnet3/chain/train.py)
+before running them, and for predicting how long the training will take from
+the logs of a reference run.
+
+The schedule is worked out in the same way as in the training scripts: the
+number of iterations is set so that the data is processed num_epochs times
+with the number of jobs growing linearly from num_jobs_initial to
+num_jobs_final, and each job of an iteration processes one archive.
+
+The time of an iteration is predicted from the '# Accounting:' lines of the
+training logs of the reference run.  An iteration takes as long as its
+slowest job, plus some time between iterations (for model averaging,
+diagnostics etc.) that is estimated from the modification times of the logs.
+The time of a job is scaled by the ratio of the number of frames per archive
+of the two egs directories, if they are both known; differences in the
+models, minibatch sizes or hardware are not taken into account.
+"""
+
+from __future__ import division
+from __future__ import print_function
+import logging
+import os
+
+import libs.nnet3.train.common as common_train_lib
+import libs.nnet3.report.log_parse as log_parse
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class TrainingSchedule(object):
+    """The schedule of a training run, as worked out by the training scripts.
+
+    Arguments:
+        num_archives: The number of archives in the egs directory.
+        num_epochs: The number of epochs to train for.
+        num_jobs_initial, num_jobs_final, num_jobs_step: As the options
+            --trainer.optimization.num-jobs-{initial,final,step}.
+        archive_expansion: The number of times each archive can be processed
+            per epoch with different frame shifts: frames_per_eg for
+            train_dnn.py and train_raw_dnn.py, frame_subsampling_factor for
+            chain/train.py and 1 for the RNN training scripts.
+        max_models_combine: As --trainer.optimization.max-models-combine, or
+            None if there is no final combination.
+    """
+
+    def __init__(self, num_archives, num_epochs, num_jobs_initial,
+                 num_jobs_final, num_jobs_step=1, archive_expansion=1,
+                 max_models_combine=None):
+        self.num_archives = num_archives
+        self.num_epochs = num_epochs
+        self.num_jobs_initial = num_jobs_initial
+        self.num_jobs_final = num_jobs_final
+        self.num_jobs_step = num_jobs_step
+        self.archive_expansion = archive_expansion
+        self.max_models_combine = max_models_combine
+        self.num_archives_expanded = num_archives * archive_expansion
+        self.num_archives_to_process = int(num_epochs
+                                           * self.num_archives_expanded)
+        self.num_iters = ((self.num_archives_to_process * 2)
+                          // (num_jobs_initial + num_jobs_final))
+        self.num_jobs = [common_train_lib.get_current_num_jobs(
+            iter, self.num_iters, num_jobs_initial, num_jobs_step,
+            num_jobs_final) for iter in range(self.num_iters)]
+        self.num_archives_processed = sum(self.num_jobs)
+        if max_models_combine is not None and self.num_iters > 0:
+            self.models_to_combine = common_train_lib.get_model_combine_iters(
+                self.num_iters, num_epochs, self.num_archives_expanded,
+                max_models_combine, num_jobs_final)
+        else:
+            self.models_to_combine = None
+
+    def get_num_jobs_ranges(self):
+        """Returns a list of tuples (first_iter, last_iter, num_jobs) for
+        the runs of iterations with the same number of jobs."""
+        ranges = []
+        for iter, num_jobs in enumerate(self.num_jobs):
+            if len(ranges) > 0 and ranges[-1][2] == num_jobs:
+                ranges[-1] = (ranges[-1][0], iter, num_jobs)
+            else:
+                ranges.append((iter, iter, num_jobs))
+        return ranges
+
+
+def get_frames_per_archive(egs_dir):
+    """Returns the average number of frames per archive of the egs in
+    'egs_dir', or None if egs_dir/info/num_frames or num_archives does not
+    exist."""
+    try:
+        with open("{0}/info/num_frames".format(egs_dir)) as f:
+            num_frames = int(f.readline())
+        with open("{0}/info/num_archives".format(egs_dir)) as f:
+            num_archives = int(f.readline())
+    except (IOError, ValueError):
+        return None
+    return float(num_frames) / num_archives
+
+
+def median(values):
+    values = sorted(values)
+    n = len(values)
+    if n == 0:
+        return None
+    return (values[(n - 1) // 2] + values[n // 2]) / 2.0
+
+
+class TrainingTimeModel(object):
+    """Predicts the time of the iterations of a training run from the
+    training logs of the reference run in 'exp_dir' (see the module
+    documentation).
+
+    Attributes:
+        job_time: The median time in seconds of a training job.
+        iter_time: The median time in seconds of the slowest job of an
+            iteration.
+        iter_overhead: The median time in seconds between the end of the
+            slowest job of an iteration and the end of the slowest job of
+            the next one, minus the time of the latter.
+        num_iters: The number of iterations of the reference run that these
+            are estimated from.
+    """
+
+    def __init__(self, exp_dir, scale=1.0):
+        iter_num_jobs = {}
+        iter_end_times = {}
+        for iter, job, log_file in log_parse.get_train_log_files(exp_dir):
+            iter_num_jobs[iter] = max(iter_num_jobs.get(iter, 0), job)
+            iter_end_times[iter] = max(iter_end_times.get(iter, 0),
+                                       os.path.getmtime(log_file))
+        iter_job_times = {}
+        for iter, num_jobs in iter_num_jobs.items():
+            job_times = log_parse.get_train_job_times(exp_dir, iter, num_jobs)
+            if len(job_times) > 0:
+                iter_job_times[iter] = [t for _, t in job_times.values()]
+        if len(iter_job_times) == 0:
+            raise Exception("Could not find the times of any training jobs "
+                            "in {0}/log/train.*.*.log".format(exp_dir))
+
+        self.num_iters = len(iter_job_times)
+        self.job_time = scale * median(
+            [t for times in iter_job_times.values() for t in times])
+        self.iter_time = scale * median(
+            [max(times) for times in iter_job_times.values()])
+        overheads = []
+        for iter in iter_job_times:
+            if iter + 1 in iter_job_times:
+                overheads.append(iter_end_times[iter + 1]
+                                 - iter_end_times[iter]
+                                 - max(iter_job_times[iter + 1]))
+        # the overhead can only be estimated if the logs still have their
+        # original modification times.
+        overheads = [t for t in overheads if t >= 0]
+        self.iter_overhead = median(overheads) if len(overheads) > 0 else 0.0
+
+    def get_gpu_hours(self, schedule):
+        """Returns the predicted total time in hours of the training jobs of
+        'schedule' (a TrainingSchedule)."""
+        return schedule.num_archives_processed * self.job_time / 3600.0
+
+    def get_wall_clock_hours(self, schedule):
+        """Returns the predicted time in hours that the iterations of
+        'schedule' take, assuming all the jobs of an iteration run in
+        parallel."""
+        return (schedule.num_iters * (self.iter_time + self.iter_overhead)
+                / 3600.0)
+
+
+def recommend_num_jobs(schedule, time_model, deadline, max_num_jobs):
+    """Returns the pair (num_jobs_initial, num_jobs_final) with the smallest
+    num_jobs_final, not less than that of 'schedule', for which the predicted
+    wall-clock time in hours is at most 'deadline', keeping the ratio of the
+    initial and final number of jobs of 'schedule'; or None if no number of
+    jobs up to max_num_jobs is enough."""
+    ratio = float(schedule.num_jobs_initial) / schedule.num_jobs_final
+    for num_jobs_final in range(schedule.num_jobs_final, max_num_jobs + 1):
+        num_jobs_initial = max(1, int(0.5 + ratio * num_jobs_final))
+        candidate = TrainingSchedule(
+            schedule.num_archives, schedule.num_epochs, num_jobs_initial,
+            num_jobs_final, schedule.num_jobs_step,
+            schedule.archive_expansion, schedule.max_models_combine)
+        if time_model.get_wall_clock_hours(candidate) <= deadline:
+            return (num_jobs_initial, num_jobs_final)
+    return None
@@ -109,6 +109,36 @@ class XconfigAttentionLayer(XconfigLayerBase):
     def output_dim(self, auxiliary_output = None):
       return self.attention_output_dim()
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type != 'RestrictedAttentionComponent':
+            return XconfigLayerBase.get_component_cost(self, component_type,
+                                                       opts, input_dim)
+        num_left_inputs = self.config['num-left-inputs']
+        num_right_inputs = self.config['num-right-inputs']
+        num_left_required = self.config['num-left-inputs-required']
+        num_right_required = self.config['num-right-inputs-required']
+        if num_left_required < 0:
+            num_left_required = num_left_inputs
+        if num_right_required < 0:
+            num_right_required = num_right_inputs
+        time_stride = self.config['time-stride']
+        context_dim = num_left_inputs + num_right_inputs + 1
+        # for each head: the dot products of the query with the keys, the
+        # positional encoding, and the weighted sum of the values.
+        macs = (self.config['num-heads'] * context_dim *
+                (self.config['key-dim'] + self.config['value-dim'] + 1))
+        return {'num-params': 0,
+                'macs': macs,
+                'output-dim': self.attention_output_dim(),
+                'time-offsets': [i * time_stride for i in
+                                 range(-num_left_required,
+                                       num_right_required + 1)],
+                'optional-time-offsets': [
+                    i * time_stride for i in
+                    list(range(-num_left_inputs, -num_left_required)) +
+                    list(range(num_right_required + 1,
+                               num_right_inputs + 1))]}
+
     def get_full_config(self):
         ans = []
         config_lines = self._generate_config()
@@ -310,6 +310,118 @@ class XconfigLayerBase(object):
 
         raise Exception("Child classes must override get_full_config()")
 
+    def get_cost_info(self):
+        """Returns the lines this layer writes to 'ref.config', parsed into
+        pairs (first_token, key_to_value), e.g.
+          ('component', {'name': 'tdnn1.affine',
+                         'type': 'NaturalGradientAffineComponent',
+                         'input-dim': '120', 'output-dim': '1024', ... })
+        This is used by xutils.get_network_cost() (see the
+        --print-cost-report option of xconfig_to_configs.py).  Child classes
+        only need to override this if get_full_config() has side effects
+        or if they don't write their nodes to 'ref.config'.
+        """
+
+        ans = []
+        for config_name, line in self.get_full_config():
+            if config_name != 'ref':
+                continue
+            parsed = xutils.parse_nnet3_config_line(line)
+            if parsed is not None:
+                ans.append(parsed)
+        return ans
+
+    def get_component_cost(self, component_type, opts, input_dim):
+        """Returns the cost of one component of this layer, as a dict
+          { 'num-params': number of trainable parameters,
+            'macs': multiply-adds per frame computed,
+            'output-dim': output dimension,
+            'time-offsets': list of time offsets at which the component reads
+                            its input, e.g. [-1, 0, 1] for a TdnnComponent,
+            'optional-time-offsets': time offsets that are read only if the
+                            input is available there }
+        'opts' is the dict of options on the 'component' line and 'input_dim'
+        the dimension of the input of the component-node.  Element-wise
+        operations count as one multiply-add per dimension.  Child classes that
+        use components not handled here should override this, handling their
+        own component types and calling this function for the rest.
+        """
+
+        output_dim = int(opts.get('output-dim', opts.get('dim', input_dim)))
+        num_params = 0
+        macs = 0
+        time_offsets = [0]
+        if component_type in ['NaturalGradientAffineComponent',
+                              'AffineComponent', 'LinearComponent',
+                              'FixedAffineComponent', 'BlockAffineComponent',
+                              'TdnnComponent']:
+            if component_type == 'TdnnComponent':
+                time_offsets = [int(x) for x in
+                                opts['time-offsets'].split(',')]
+            # for TdnnComponent, 'input-dim' is the dim before splicing.
+            weights = input_dim * len(time_offsets) * output_dim
+            if component_type == 'BlockAffineComponent':
+                weights //= int(opts['num-blocks'])
+            macs = weights
+            if component_type != 'FixedAffineComponent':
+                num_params = weights
+                if (component_type != 'LinearComponent' and
+                        opts.get('use-bias', 'true') != 'false'):
+                    num_params += output_dim
+        elif component_type in ['NaturalGradientPerElementScaleComponent',
+                                'PerElementScaleComponent',
+                                'PerElementOffsetComponent']:
+            num_params = output_dim
+            macs = output_dim
+        elif component_type == 'ScaleAndOffsetComponent':
+            num_params = 2 * int(opts.get('block-dim', output_dim))
+            macs = output_dim
+        elif component_type in ['SumBlockComponent',
+                                'ElementwiseProductComponent']:
+            macs = input_dim
+        elif component_type == 'NormalizeComponent':
+            if opts.get('add-log-stddev', 'false') == 'true':
+                output_dim += 1
+            macs = 2 * input_dim
+        elif component_type == 'StatisticsExtractionComponent':
+            input_period = int(opts.get('input-period', 1))
+            output_period = int(opts.get('output-period', 1))
+            output_dim = 1 + input_dim * (
+                2 if opts.get('include-variance', 'true') == 'true' else 1)
+            # the stats are only computed every 'output-period' frames, but
+            # over all frames in between.
+            return {'num-params': 0, 'macs': output_dim * output_period //
+                    input_period, 'output-dim': output_dim,
+                    'time-offsets': [0],
+                    'optional-time-offsets':
+                    list(range(input_period, output_period, input_period))}
+        elif component_type == 'StatisticsPoolingComponent':
+            input_period = int(opts.get('input-period', 1))
+            left_context = int(opts.get('left-context', 0))
+            right_context = int(opts.get('right-context', 0))
+            output_dim = (input_dim - 1 +
+                          int(opts.get('num-log-count-features', 0)))
+            offsets = list(range(-left_context, right_context + 1,
+                                 input_period))
+            # the pooling is done on cumulative sums of the stats.
+            return {'num-params': 0, 'macs': 2 * input_dim,
+                    'output-dim': output_dim, 'time-offsets': [0],
+                    'optional-time-offsets': [x for x in offsets if x != 0]}
+        elif component_type in ['NoOpComponent', 'DropoutComponent',
+                                'GeneralDropoutComponent',
+                                'DropoutMaskComponent',
+                                'SpecAugmentTimeMaskComponent',
+                                'BackpropTruncationComponent',
+                                'PermuteComponent']:
+            # these do nothing (or just copy data) in test mode.
+            macs = 0
+        else:
+            # nonlinearities and anything else we don't know about.
+            macs = output_dim
+        return {'num-params': num_params, 'macs': macs,
+                'output-dim': output_dim, 'time-offsets': time_offsets,
+                'optional-time-offsets': []}
+
 
 class XconfigInputLayer(XconfigLayerBase):
     """This class is for lines like
@@ -1189,6 +1301,17 @@ class XconfigIdctLayer(XconfigLayerBase):
                 ans.append(('init', line))
         return ans
 
+    def get_cost_info(self):
+        # get_full_config() would write the IDCT matrix to disk, so we don't
+        # call it here.
+        return [('component', {'name': self.name,
+                               'type': 'FixedAffineComponent',
+                               'input-dim': str(self.descriptors['input']['dim']),
+                               'output-dim': str(self.output_dim())}),
+                ('component-node', {'name': self.name,
+                                    'component': self.name,
+                                    'input': self.descriptors['input']['final-string']})]
+
 
     def _generate_config(self):
 
@@ -1273,6 +1396,12 @@ class XconfigExistingLayer(XconfigLayerBase):
         ans = []
         return ans
 
+    def get_cost_info(self):
+        # for the cost computation, the node from the existing model is
+        # treated like an input.
+        return [('input-node', {'name': self.name,
+                                'dim': str(self.config['dim'])})]
+
 
 class XconfigSpecAugmentLayer(XconfigLayerBase):
     """This class is for parsing lines like
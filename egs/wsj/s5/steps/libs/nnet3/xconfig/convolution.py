@@ -112,6 +112,29 @@ from libs.nnet3.xconfig.basic_layers import XconfigLayerBase
 # the following is also passed into the convolution components, if specified:
 #  l2-regularize (float)
 
+# Returns the cost of a TimeHeightConvolutionComponent with the options 'opts'
+# in the format of XconfigLayerBase.get_component_cost().  The multiply-adds
+# ignore the padding at the edges of the height axis.
+def get_time_height_convolution_cost(opts):
+    num_filters_in = int(opts['num-filters-in'])
+    num_filters_out = int(opts['num-filters-out'])
+    height_out = int(opts['height-out'])
+    height_offsets = [int(x) for x in opts['height-offsets'].split(',')]
+    time_offsets = [int(x) for x in opts['time-offsets'].split(',')]
+    if opts.get('required-time-offsets', '') != '':
+        required_time_offsets = [int(x) for x in
+                                 opts['required-time-offsets'].split(',')]
+    else:
+        required_time_offsets = time_offsets
+    filter_dim = num_filters_in * len(height_offsets) * len(time_offsets)
+    return {'num-params': num_filters_out * (filter_dim + 1),
+            'macs': height_out * num_filters_out * filter_dim,
+            'output-dim': height_out * num_filters_out,
+            'time-offsets': required_time_offsets,
+            'optional-time-offsets': [x for x in time_offsets
+                                      if x not in required_time_offsets]}
+
+
 class XconfigConvLayer(XconfigLayerBase):
     def __init__(self, first_token, key_to_value, prev_names = None):
         for operation in first_token.split('-')[:-1]:
@@ -230,6 +253,12 @@ class XconfigConvLayer(XconfigLayerBase):
         assert auxiliary_output is None
         return self.config['num-filters-out'] * self.config['height-out']
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type == 'TimeHeightConvolutionComponent':
+            return get_time_height_convolution_cost(opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         config_lines = self._generate_cnn_config()
@@ -494,6 +523,12 @@ class XconfigResBlock(XconfigLayerBase):
         input_dim = self.descriptors['input']['dim']
         return input_dim
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type == 'TimeHeightConvolutionComponent':
+            return get_time_height_convolution_cost(opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         b = self.config['num-bottleneck-filters']
@@ -838,6 +873,12 @@ class XconfigRes2Block(XconfigLayerBase):
         assert auxiliary_output is None
         return self.config['height-out'] * self.config['num-filters']
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type == 'TimeHeightConvolutionComponent':
+            return get_time_height_convolution_cost(opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         b = self.config['num-bottleneck-filters']
@@ -13,6 +13,25 @@ import re
 import sys
 from libs.nnet3.xconfig.basic_layers import XconfigLayerBase
 
+# Returns the cost of a GruNonlinearityComponent or
+# OutputGruNonlinearityComponent with the options 'opts' in the format of
+# XconfigLayerBase.get_component_cost().  The parameters are the recurrent
+# matrix w_h (a diagonal one for the OutputGruNonlinearityComponent); the
+# multiply-adds count w_h and the element-wise operations.
+def get_gru_nonlinearity_cost(component_type, opts):
+    cell_dim = int(opts['cell-dim'])
+    if component_type == 'GruNonlinearityComponent':
+        num_params = cell_dim * int(opts.get('recurrent-dim', cell_dim))
+    else:
+        assert component_type == 'OutputGruNonlinearityComponent'
+        num_params = cell_dim
+    return {'num-params': num_params,
+            'macs': num_params + 6 * cell_dim,
+            'output-dim': 2 * cell_dim,
+            'time-offsets': [0],
+            'optional-time-offsets': []}
+
+
 # This class is for lines like
 #   'gru-layer name=gru1 input=[-1] delay=-3'
 # It generates an GRU sub-graph without output projections.
@@ -1108,6 +1127,13 @@ class XconfigFastGruLayer(XconfigLayerBase):
     def output_dim(self, auxiliary_output = None):
         return self.config['cell-dim']
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type in ['GruNonlinearityComponent',
+                              'OutputGruNonlinearityComponent']:
+            return get_gru_nonlinearity_cost(component_type, opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         config_lines = self.generate_gru_config()
@@ -1301,6 +1327,13 @@ class XconfigFastPgruLayer(XconfigLayerBase):
 
         return self.config['recurrent-projection-dim'] + self.config['non-recurrent-projection-dim']
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type in ['GruNonlinearityComponent',
+                              'OutputGruNonlinearityComponent']:
+            return get_gru_nonlinearity_cost(component_type, opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         config_lines = self.generate_pgru_config()
@@ -1519,6 +1552,13 @@ class XconfigFastNormPgruLayer(XconfigLayerBase):
 
         return self.config['recurrent-projection-dim'] + self.config['non-recurrent-projection-dim']
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type in ['GruNonlinearityComponent',
+                              'OutputGruNonlinearityComponent']:
+            return get_gru_nonlinearity_cost(component_type, opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         config_lines = self.generate_pgru_config()
@@ -1757,6 +1797,13 @@ class XconfigFastOpgruLayer(XconfigLayerBase):
 
         return self.config['recurrent-projection-dim'] + self.config['non-recurrent-projection-dim']
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type in ['GruNonlinearityComponent',
+                              'OutputGruNonlinearityComponent']:
+            return get_gru_nonlinearity_cost(component_type, opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         config_lines = self.generate_pgru_config()
@@ -1978,6 +2025,13 @@ class XconfigFastNormOpgruLayer(XconfigLayerBase):
 
         return self.config['recurrent-projection-dim'] + self.config['non-recurrent-projection-dim']
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type in ['GruNonlinearityComponent',
+                              'OutputGruNonlinearityComponent']:
+            return get_gru_nonlinearity_cost(component_type, opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         config_lines = self.generate_pgru_config()
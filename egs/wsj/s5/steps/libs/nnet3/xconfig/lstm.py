@@ -13,6 +13,19 @@ import sys
 from libs.nnet3.xconfig.basic_layers import XconfigLayerBase
 
 
+# Returns the cost of an LstmNonlinearityComponent with the options 'opts' in
+# the format of XconfigLayerBase.get_component_cost().  The parameters are the
+# three diagonal peephole matrices; the multiply-adds count the peepholes,
+# the element-wise products and the five nonlinearities.
+def get_lstm_nonlinearity_cost(opts):
+    cell_dim = int(opts['cell-dim'])
+    return {'num-params': 3 * cell_dim,
+            'macs': 11 * cell_dim,
+            'output-dim': 2 * cell_dim,
+            'time-offsets': [0],
+            'optional-time-offsets': []}
+
+
 # This class is for lines like
 #   'lstm-layer name=lstm1 input=[-1] delay=-3'
 # It generates an LSTM sub-graph without output projections.
@@ -660,6 +673,12 @@ class XconfigFastLstmLayer(XconfigLayerBase):
                 raise RuntimeError("Unknown auxiliary output name {0}".format(auxiliary_output))
         return self.config['cell-dim']
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type == 'LstmNonlinearityComponent':
+            return get_lstm_nonlinearity_cost(opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         config_lines = self._generate_lstm_config()
@@ -845,6 +864,12 @@ class XconfigLstmbLayer(XconfigLayerBase):
         assert auxiliary_output is None
         return self.config['cell-dim']
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type == 'LstmNonlinearityComponent':
+            return get_lstm_nonlinearity_cost(opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         config_lines = self._generate_lstm_config()
@@ -1072,6 +1097,12 @@ class XconfigFastLstmpLayer(XconfigLayerBase):
         return self.config['recurrent-projection-dim'] + \
                self.config['non-recurrent-projection-dim']
 
+    def get_component_cost(self, component_type, opts, input_dim):
+        if component_type == 'LstmNonlinearityComponent':
+            return get_lstm_nonlinearity_cost(opts)
+        return XconfigLayerBase.get_component_cost(self, component_type,
+                                                   opts, input_dim)
+
     def get_full_config(self):
         ans = []
         config_lines = self._generate_lstm_config()
@@ -647,6 +647,260 @@ def parse_config_line(orig_config_line):
     return (first_token, ans_dict)
 
 
+# This function parses a line of a (non-xconfig) nnet3 config file, as
+# produced by the get_full_config() functions of the layers, e.g.
+# 'component-node name=tdnn1.affine component=tdnn1.affine input=Append(-1,0)'
+# and returns a pair (first_token, fields) like parse_config_line() does.
+# It returns None for lines that are empty or only contain a comment.
+# Unlike parse_config_line() it does not check for disallowed characters
+# (e.g. the ';' that may appear in some component options).
+def parse_nnet3_config_line(config_line):
+    config_line = config_line.split('#')[0]
+    fields = config_line.split(None, 1)
+    if len(fields) == 0:
+        return None
+    first_token = fields[0]
+    ans_dict = dict()
+    if len(fields) == 2:
+        other_fields = re.split(r'\s*([-a-zA-Z0-9_]*)=', fields[1].strip())
+        if not (other_fields[0] == '' and len(other_fields) % 2 == 1):
+            raise RuntimeError("Could not parse config line: " + config_line)
+        for i in range(len(other_fields) // 2):
+            ans_dict[other_fields[i * 2 + 1]] = other_fields[i * 2 + 2].strip()
+    return (first_token, ans_dict)
+
+
+# Returns a list of pairs (node-name, t) giving the inputs that Descriptor
+# 'desc' needs in order to be evaluated at time t.  'is_computable' is a
+# function (node-name, t) -> bool; the parts of IfDefined() and Failover()
+# expressions are only included if they are computable.  If 'is_computable'
+# is None, IfDefined() expressions are ignored and Failover() expressions
+# use their second argument.  This mirrors what the nnet3 compiler does (see
+# nnet-descriptor.h), except that the 'x' index is ignored.
+def get_descriptor_inputs(desc, t, is_computable=None):
+    op = desc.operator
+    items = desc.items
+    if op is None:
+        return [(items[0], t)]
+    elif op == 'Offset':
+        return get_descriptor_inputs(items[0], t + items[1], is_computable)
+    elif op == 'Round':
+        return get_descriptor_inputs(items[0], (t // items[1]) * items[1],
+                                     is_computable)
+    elif op == 'ReplaceIndex':
+        return get_descriptor_inputs(items[0],
+                                     items[2] if items[1] == 't' else t,
+                                     is_computable)
+    elif op in ['Append', 'Sum']:
+        ans = []
+        for item in items:
+            ans.extend(get_descriptor_inputs(item, t, is_computable))
+        return ans
+    elif op == 'Switch':
+        return get_descriptor_inputs(items[t % len(items)], t, is_computable)
+    elif op == 'Scale':
+        return get_descriptor_inputs(items[1], t, is_computable)
+    elif op == 'Const':
+        return []
+    elif op in ['IfDefined', 'Failover']:
+        if is_computable is not None:
+            ans = get_descriptor_inputs(items[0], t, is_computable)
+            if all([is_computable(name, s) for name, s in ans]):
+                return ans
+        if op == 'Failover':
+            return get_descriptor_inputs(items[1], t, is_computable)
+        return []
+    else:
+        raise RuntimeError("Unknown operator {0}".format(op))
+
+
+# This function works out the cost of the network given by 'all_layers' (a
+# list of objects of type XconfigLayerBase): the number of parameters, and the
+# multiply-adds and the memory for the activations needed to compute one chunk
+# of 'frames_per_chunk' frames at the output, where the output is only
+# evaluated every 'frame_subsampling_factor' frames.  As the nnet3 compiler
+# does, each node is computed only at the frames needed for the output, so
+# this takes into account the time offsets of the Descriptors and components
+# and the frame subsampling; recurrent layers are computed over the whole
+# input that is available (including the 'extra_left_context' and
+# 'extra_right_context' frames).  'output_names' are the output-nodes that
+# are computed; by default 'output' (or all output-nodes if there is no
+# node called 'output').
+#
+# It returns a dict with the totals (keys 'num-params', 'macs',
+# 'activations', 'num-output-frames', 'left-context', 'right-context') and,
+# in 'layers', a list with one dict per layer with keys 'name', 'layer-type',
+# 'num-params', 'macs' and 'activations'.  'macs' are per chunk;
+# 'activations' is the total number of floats output by all the nodes for the
+# chunk (i.e. the memory needed if nothing is freed, as in training).
+def get_network_cost(all_layers, frames_per_chunk, frame_subsampling_factor=1,
+                     extra_left_context=0, extra_right_context=0,
+                     output_names=None):
+    # node-name -> dict with keys 'layer', 'node-type', 'input' (a Descriptor,
+    # or a node-name for dim-range nodes), 'dim', and for component-nodes,
+    # 'cost' (as returned by get_component_cost()).
+    nodes = dict()
+    node_order = []
+    for layer in all_layers:
+        components = dict()
+        for first_token, fields in layer.get_cost_info():
+            if first_token == 'component':
+                components[fields['name']] = fields
+                continue
+            name = fields['name']
+            node = {'layer': layer, 'node-type': first_token}
+            if first_token == 'input-node':
+                node['dim'] = int(fields['dim'])
+            elif first_token == 'dim-range-node':
+                node['input'] = fields['input-node']
+                node['dim'] = int(fields['dim'])
+            elif first_token in ['component-node', 'output-node']:
+                node['input'] = Descriptor(fields['input'])
+                if first_token == 'component-node':
+                    node['component'] = components[fields['component']]
+            else:
+                raise RuntimeError("Unexpected line '{0}' in config of "
+                                   "layer {1}".format(first_token,
+                                                      layer.get_name()))
+            if name not in nodes:
+                node_order.append(name)
+            nodes[name] = node
+
+    # Work out the dims of the nodes and the costs of the components.  The
+    # inputs of recurrent layers refer to nodes that appear later, so this may
+    # take a few passes.
+    layer_params = dict([(layer.get_name(), 0) for layer in all_layers])
+    layer_to_dim = lambda x: nodes[x]['dim']
+    pending_nodes = [name for name in node_order if 'dim' not in nodes[name]]
+    while len(pending_nodes) > 0:
+        remaining_nodes = []
+        for name in pending_nodes:
+            node = nodes[name]
+            component = node.get('component', {})
+            try:
+                if 'input-dim' in component:
+                    input_dim = int(component['input-dim'])
+                elif 'dim' in component:
+                    input_dim = int(component['dim'])
+                else:
+                    input_dim = node['input'].dim(layer_to_dim)
+            except KeyError:
+                remaining_nodes.append(name)
+                continue
+            if node['node-type'] == 'output-node':
+                node['dim'] = input_dim
+            else:
+                cost = node['layer'].get_component_cost(component['type'],
+                                                        component, input_dim)
+                node['cost'] = cost
+                node['dim'] = cost['output-dim']
+                layer_params[node['layer'].get_name()] += cost['num-params']
+        if len(remaining_nodes) == len(pending_nodes):
+            raise RuntimeError("Could not work out the dims of the nodes "
+                               "{0}".format(' '.join(remaining_nodes)))
+        pending_nodes = remaining_nodes
+
+    if output_names is None:
+        output_names = [name for name in node_order
+                        if nodes[name]['node-type'] == 'output-node']
+        if 'output' in output_names:
+            output_names = ['output']
+    if len(output_names) == 0:
+        raise RuntimeError("The network has no output-nodes.")
+
+    output_frames = range(0, frames_per_chunk, frame_subsampling_factor)
+    last_output_frame = output_frames[-1]
+
+    def node_inputs(name, t, is_computable):
+        node = nodes[name]
+        node_type = node['node-type']
+        if node_type == 'input-node':
+            return []
+        elif node_type == 'dim-range-node':
+            return [(node['input'], t)]
+        elif node_type == 'output-node':
+            return get_descriptor_inputs(node['input'], t, is_computable)
+        ans = []
+        for offset in node['cost']['time-offsets']:
+            ans.extend(get_descriptor_inputs(node['input'], t + offset,
+                                             is_computable))
+        if is_computable is not None:
+            for offset in node['cost']['optional-time-offsets']:
+                inputs = get_descriptor_inputs(node['input'], t + offset,
+                                               is_computable)
+                if all([is_computable(n, s) for n, s in inputs]):
+                    ans.extend(inputs)
+        return ans
+
+    def get_requested_frames(is_computable):
+        requested = dict([(name, set()) for name in node_order])
+        pending = [(name, t) for name in output_names for t in output_frames]
+        for name, t in pending:
+            requested[name].add(t)
+        while len(pending) > 0:
+            name, t = pending.pop()
+            for input_name, s in node_inputs(name, t, is_computable):
+                if s not in requested[input_name]:
+                    requested[input_name].add(s)
+                    pending.append((input_name, s))
+        return requested
+
+    # First work out which input frames are needed, ignoring the optional
+    # (IfDefined) dependencies, as the nnet3 compiler does to work out the
+    # model context.
+    requested = get_requested_frames(None)
+    input_frames = set()
+    for name in node_order:
+        if nodes[name]['node-type'] == 'input-node':
+            input_frames.update(requested[name])
+    first_frame = min(input_frames) - extra_left_context
+    last_frame = max(input_frames) + extra_right_context
+
+    # Then work out at which frames each node is computable given the
+    # input frames, in the order of the nodes in the config, since the
+    # non-optional inputs of a node always precede it.
+    span = last_frame - first_frame + 1
+    candidate_frames = range(first_frame - span, last_frame + span + 1)
+    computable = dict()
+    for name in node_order:
+        if nodes[name]['node-type'] == 'input-node':
+            computable[name] = set(range(first_frame, last_frame + 1))
+        else:
+            computable[name] = set(
+                [t for t in candidate_frames
+                 if all([s in computable.get(n, ())
+                         for n, s in node_inputs(name, t, None)])])
+    requested = get_requested_frames(lambda n, t: t in computable[n])
+
+    layers = []
+    layer_index = dict()
+    for layer in all_layers:
+        if layer.get_name() in layer_index:
+            continue
+        layer_index[layer.get_name()] = len(layers)
+        layers.append({'name': layer.get_name(),
+                       'layer-type': layer.layer_type,
+                       'num-params': layer_params[layer.get_name()],
+                       'macs': 0, 'activations': 0})
+    for name in node_order:
+        node = nodes[name]
+        num_frames = len(requested[name])
+        info = layers[layer_index[node['layer'].get_name()]]
+        if node['node-type'] == 'component-node':
+            info['macs'] += num_frames * node['cost']['macs']
+            info['activations'] += num_frames * node['dim']
+        elif node['node-type'] == 'input-node':
+            info['activations'] += num_frames * node['dim']
+
+    return {'num-params': sum([x['num-params'] for x in layers]),
+            'macs': sum([x['macs'] for x in layers]),
+            'activations': sum([x['activations'] for x in layers]),
+            'num-output-frames': len(output_frames),
+            'left-context': -min(input_frames),
+            'right-context': max(input_frames) - last_output_frame,
+            'layers': layers}
+
+
 def test_library():
     tokenize_test = lambda x: tokenize_descriptor(x)[:-1]  # remove 'end of string'
     assert tokenize_test("hi") == ['hi']
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+# Copyright 2019  Johns Hopkins University
+# Apache 2.0.
+
+""" This script prints the training schedule that steps/nnet3/chain/train.py or
+steps/nnet3/train*.py would follow with the given options, without training
+anything: the number of iterations, the number of jobs of the iterations and
+the number of archives processed.  With --reference-dir, it also predicts the
+GPU-hours and the wall-clock time of the training from the logs of a previous
+run, and with --deadline it recommends num-jobs-initial/final for the training
+to finish within that many hours.  See steps/libs/nnet3/train/schedule.py for
+how the time is predicted.
+"""
+
+from __future__ import print_function
+from __future__ import division
+import argparse
+import logging
+import sys
+
+sys.path.insert(0, 'steps')
+import libs.nnet3.train.common as common_train_lib
+import libs.nnet3.train.schedule as schedule_lib
+
+
+logger = logging.getLogger('libs')
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler()
+handler.setLevel(logging.INFO)
+formatter = logging.Formatter("%(asctime)s [%(pathname)s:%(lineno)s - "
+                              "%(funcName)s - %(levelname)s ] %(message)s")
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+def get_args():
+    """ Get args from stdin.
+
+    The options of the training scripts are accepted as they are (those not
+    defined in libs.nnet3.train.common.CommonParser.parser, or below, are
+    ignored), so the options of a training command can be given to this
+    script unchanged.
+    """
+    parser = argparse.ArgumentParser(
+        description="""Prints the training schedule, and optionally the
+        predicted training time, of the nnet3 training scripts with the given
+        options.  E.g.:
+        steps/nnet3/plan_training.py --trainer chain
+        --reference-dir exp/chain/tdnn1a_sp --deadline 48
+        --egs.dir exp/chain/tdnn1b_sp/egs --trainer.num-epochs 6
+        --trainer.optimization.num-jobs-initial 3
+        --trainer.optimization.num-jobs-final 16""",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        conflict_handler='resolve',
+        parents=[common_train_lib.CommonParser().parser])
+
+    parser.add_argument("--trainer", type=str, default='chain',
+                        choices=['chain', 'dnn', 'raw-dnn', 'rnn', 'raw-rnn'],
+                        help="""The training script: chain/train.py,
+                        train_dnn.py, train_raw_dnn.py, train_rnn.py or
+                        train_raw_rnn.py""")
+    parser.add_argument("--chain.frame-subsampling-factor", type=int,
+                        dest='frame_subsampling_factor', default=3,
+                        help="As for steps/nnet3/chain/train.py")
+    parser.add_argument("--reference-dir", type=str, default=None,
+                        help="""Directory of a previous training run whose
+                        logs are used to predict the training time""")
+    parser.add_argument("--reference-egs-dir", type=str, default=None,
+                        help="""The egs directory of --reference-dir, if not
+                        <reference-dir>/egs.  If the number of frames per
+                        archive of the egs directories is known, the time of
+                        the jobs is scaled by their ratio.""")
+    parser.add_argument("--deadline", type=float, default=None,
+                        help="""If set, the number of jobs for the training to
+                        finish within this many hours is recommended
+                        (requires --reference-dir)""")
+    parser.add_argument("--max-num-jobs", type=int, default=None,
+                        help="""The largest num-jobs-final to recommend, e.g.
+                        the number of GPUs available; by default, the number
+                        of archives""")
+
+    args, unknown_args = parser.parse_known_args()
+    if len(unknown_args) > 0:
+        logger.info("Ignoring options: {0}".format(" ".join(unknown_args)))
+
+    if args.egs_dir is None:
+        raise Exception("--egs.dir must be specified.")
+    if args.deadline is not None and args.reference_dir is None:
+        raise Exception("--deadline requires --reference-dir.")
+    return args
+
+
+def get_archive_expansion(args):
+    """Returns the number of times each archive is processed per epoch, as in
+    the training script args.trainer."""
+    if args.trainer == 'chain':
+        return args.frame_subsampling_factor
+    if args.trainer in ['dnn', 'raw-dnn']:
+        with open("{0}/info/frames_per_eg".format(args.egs_dir)) as f:
+            return int(f.readline())
+    return 1
+
+
+def print_schedule(schedule):
+    print("{0} archives ({1} with the frame shifts), {2} epochs: {3} "
+          "archives to process in {4} iterations.".format(
+              schedule.num_archives, schedule.num_archives_expanded,
+              schedule.num_epochs, schedule.num_archives_to_process,
+              schedule.num_iters))
+    print("Jobs per iteration:")
+    for first_iter, last_iter, num_jobs in schedule.get_num_jobs_ranges():
+        print("  iterations {0}-{1}: {2} jobs".format(first_iter, last_iter,
+                                                      num_jobs))
+    print("{0} archives processed in total.".format(
+        schedule.num_archives_processed))
+    if schedule.models_to_combine is not None:
+        print("{0} models are combined at the end.".format(
+            len(schedule.models_to_combine)))
+
+
+def main():
+    args = get_args()
+
+    with open("{0}/info/num_archives".format(args.egs_dir)) as f:
+        num_archives = int(f.readline())
+    schedule = schedule_lib.TrainingSchedule(
+        num_archives, args.num_epochs, args.num_jobs_initial,
+        args.num_jobs_final, args.num_jobs_step,
+        archive_expansion=get_archive_expansion(args),
+        max_models_combine=(args.max_models_combine
+                            if args.do_final_combination else None))
+    max_num_jobs = (schedule.num_archives_expanded if args.trainer == 'chain'
+                    else num_archives)
+    if args.num_jobs_final > max_num_jobs:
+        logger.warning("num-jobs-final={0} is more than the {1} archives; the "
+                       "training script would refuse to run.".format(
+                           args.num_jobs_final, max_num_jobs))
+    print_schedule(schedule)
+
+    if args.reference_dir is None:
+        return
+
+    reference_egs_dir = (args.reference_egs_dir
+                         if args.reference_egs_dir is not None
+                         else "{0}/egs".format(args.reference_dir))
+    frames_per_archive = schedule_lib.get_frames_per_archive(args.egs_dir)
+    reference_frames_per_archive = schedule_lib.get_frames_per_archive(
+        reference_egs_dir)
+    scale = 1.0
+    if frames_per_archive is not None and reference_frames_per_archive:
+        scale = frames_per_archive / reference_frames_per_archive
+    else:
+        logger.warning("Could not compare the archive sizes of {0} and {1}, "
+                       "assuming they are the same.".format(
+                           args.egs_dir, reference_egs_dir))
+    time_model = schedule_lib.TrainingTimeModel(args.reference_dir, scale)
+    print("From {0} iterations of {1}{2}: {3:.0f} s per job, {4:.0f} s per "
+          "iteration (slowest job) plus {5:.0f} s between iterations.".format(
+              time_model.num_iters, args.reference_dir,
+              "" if scale == 1.0 else
+              " scaled by {0:.3f} for the archive size".format(scale),
+              time_model.job_time, time_model.iter_time,
+              time_model.iter_overhead))
+    print("Predicted training time: {0:.1f} GPU-hours, {1:.1f} hours "
+          "wall-clock (excluding the final combination).".format(
+              time_model.get_gpu_hours(schedule),
+              time_model.get_wall_clock_hours(schedule)))
+
+    if args.deadline is None:
+        return
+    if args.max_num_jobs is not None:
+        max_num_jobs = min(max_num_jobs, args.max_num_jobs)
+    recommendation = schedule_lib.recommend_num_jobs(
+        schedule, time_model, args.deadline, max_num_jobs)
+    if recommendation is None:
+        print("The training cannot finish within {0} hours with at most {1} "
+              "jobs.".format(args.deadline, max_num_jobs))
+    elif recommendation[1] == args.num_jobs_final:
+        print("The training should finish within {0} hours.".format(
+            args.deadline))
+    else:
+        num_jobs_initial, num_jobs_final = recommendation
+        candidate = schedule_lib.TrainingSchedule(
+            num_archives, args.num_epochs, num_jobs_initial, num_jobs_final,
+            args.num_jobs_step, schedule.archive_expansion,
+            schedule.max_models_combine)
+        print("To finish within {0} hours, use "
+              "--trainer.optimization.num-jobs-initial {1} "
+              "--trainer.optimization.num-jobs-final {2}: {3} iterations, "
+              "{4:.1f} hours wall-clock.".format(
+                  args.deadline, num_jobs_initial, num_jobs_final,
+                  candidate.num_iters,
+                  time_model.get_wall_clock_hours(candidate)))
+
+
+if __name__ == "__main__":
+    main()
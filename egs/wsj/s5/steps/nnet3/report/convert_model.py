@@ -7,6 +7,15 @@
 # It also contains some utility function that you can get access by importing this
 # file.
 #
+# With --evolution, it instead reads all the models kept in a training directory
+# (<exp-dir>/<iter>.mdl or <iter>.raw) and writes the norms of the parameters of
+# each component, and their changes since the previous kept model, as a numpy
+# .npz file with one entry per model and component; e.g.
+#   steps/nnet3/report/convert_model.py --evolution --num-jobs 4 \
+#      exp/chain/tdnn1a_sp exp/chain/tdnn1a_sp/model_evolution.npz
+# steps/nnet3/report/generate_plots.py plots these if the file is at
+# <exp-dir>/model_evolution.npz.
+#
 # In egs/mini_librispeech/s5/local/chain/diagnostic/report_example.py, you can
 # find an example of the use of this script.
 #
@@ -16,6 +25,11 @@
 
 # This requires python 3.
 
+import argparse
+import multiprocessing
+import os
+import re
+import struct
 import sys
 import subprocess
 import numpy as np
@@ -189,6 +203,97 @@ def read_matrix(s, pos):
    return (ans_mat, pos)
 
 
+# The functions below, read_token_binary() to read_matrix_binary(), are the
+# counterparts of the functions above for Kaldi's binary format.  's' is
+# expected to be of type 'bytes' (the contents of a binary file), and the
+# vectors and matrices are returned as read-only numpy arrays that point into
+# 's', so no data is copied for float (as opposed to double) parameters.
+
+def read_token_binary(s, pos):
+   """Reads a token (in binary mode, tokens are always followed by a space)
+      from the bytes s starting at 'pos', and returns the pair
+      (token, new_pos), or (None, len(s)) at EOF.
+   """
+   end = s.find(b' ', pos)
+   if end < 0:
+      return (None, len(s))
+   return (s[pos:end].decode(), end + 1)
+
+def read_int_binary(s, pos):
+   """Reads a binary-format integer (a size byte followed by the integer)
+      starting at 'pos', and returns the pair (int, new_pos).
+      If something goes wrong it will print a warning to stderr and return (None, pos)
+   """
+   size = s[pos:pos+1]
+   if size not in (b'\x04', b'\x08'):
+      print("{0}: at file position {1}, expected int but got size byte {2!r}".format(
+         sys.argv[0], pos, size), file=sys.stderr)
+      return (None, pos)
+   fmt = '<i' if size == b'\x04' else '<q'
+   return (struct.unpack_from(fmt, s, pos + 1)[0], pos + 1 + ord(size))
+
+def read_float_binary(s, pos):
+   """Reads a binary-format float or double (a size byte followed by the
+      number) starting at 'pos', and returns the pair (float, new_pos).
+      If something goes wrong it will print a warning to stderr and return (None, pos)
+   """
+   size = s[pos:pos+1]
+   if size not in (b'\x04', b'\x08'):
+      print("{0}: at file position {1}, expected float but got size byte {2!r}".format(
+         sys.argv[0], pos, size), file=sys.stderr)
+      return (None, pos)
+   fmt = '<f' if size == b'\x04' else '<d'
+   return (struct.unpack_from(fmt, s, pos + 1)[0], pos + 1 + ord(size))
+
+def read_vector_binary(s, pos):
+   """Reads a binary-format vector ("FV" or "DV", then the dimension and the
+      data) starting at 'pos', and returns the pair (vector, new_pos), where
+      vector is a 1-dimensional float32 numpy array.
+      If something goes wrong it will print a warning to stderr and return (None, pos)
+   """
+   (tok, new_pos) = read_token_binary(s, pos)
+   if tok not in ('FV', 'DV'):
+      print("{0}: at file position {1}, expected vector but got {2}".format(
+         sys.argv[0], pos, tok), file=sys.stderr)
+      return (None, pos)
+   (dim, new_pos) = read_int_binary(s, new_pos)
+   if dim is None:
+      return (None, pos)
+   dtype = np.float32 if tok == 'FV' else np.float64
+   v = np.frombuffer(s, dtype=dtype, count=dim, offset=new_pos)
+   new_pos += v.nbytes
+   return (v.astype(np.float32, copy=False), new_pos)
+
+def read_matrix_binary(s, pos):
+   """Reads a binary-format matrix ("FM" or "DM", then the number of rows and
+      columns and the data) starting at 'pos', and returns the pair
+      (matrix, new_pos), where matrix is a 2-dimensional float32 numpy array.
+      If something goes wrong it will print a warning to stderr and return (None, pos)
+   """
+   (tok, new_pos) = read_token_binary(s, pos)
+   if tok not in ('FM', 'DM'):
+      print("{0}: at file position {1}, expected matrix but got {2}".format(
+         sys.argv[0], pos, tok), file=sys.stderr)
+      return (None, pos)
+   (rows, new_pos) = read_int_binary(s, new_pos)
+   if rows is None:
+      return (None, pos)
+   (cols, new_pos) = read_int_binary(s, new_pos)
+   if cols is None:
+      return (None, pos)
+   dtype = np.float32 if tok == 'FM' else np.float64
+   m = np.frombuffer(s, dtype=dtype, count=rows * cols,
+                     offset=new_pos).reshape(rows, cols)
+   new_pos += m.nbytes
+   return (m.astype(np.float32, copy=False), new_pos)
+
+# maps the text-format readers used in the action dicts (see
+# get_action_dict()) to their binary-format counterparts.
+binary_readers = { read_int: read_int_binary,
+                   read_float: read_float_binary,
+                   read_vector: read_vector_binary,
+                   read_matrix: read_matrix_binary }
+
 
 def is_component_type(component_type):
    """Returns True if 'component_type' is a plausible component type, e.g.
@@ -245,6 +350,11 @@ def read_generic(s, pos, terminating_token, action_dict):
    return (d, pos)
 
 
+# The raw component-types (see get_action_dict()) whose parameter matrix we
+# read in as 'params'.
+parameter_component_types = {'Linear', 'Affine', 'NaturalGradientAffine', 'Tdnn'}
+
+
 def get_action_dict(component_type):
    """Given a component-type (i.e. a string, like <SigmoidComponent>, returns an
       'action_dict' suitable for reading that component type (specifically, one
@@ -272,7 +382,7 @@ def get_action_dict(component_type):
                '<Count>': (read_float, 'count'),
                '<OderivCount>': (read_float, 'oderiv-count') }
    if raw_component_type in {'Affine',
-                             'NaturalGradientAffine'}:
+                             'NaturalGradientAffine', 'Tdnn'}:
       # We call  '<LinearParams>' to just 'params' for compatibility with
       # LinearComponent.
       return { '<LinearParams>': (read_matrix, 'params'),
@@ -336,10 +446,97 @@ def read_component(s, pos):
    return (d, pos)
 
 
+def read_component_binary(s, pos):
+   """This is the counterpart of read_component() for the binary format: it
+      reads a component starting at position 'pos' in the bytes 's', and
+      returns the pair (d, new_pos), or (None, new_pos) if something went wrong.
+
+      Binary data can't be skipped over token by token, so instead we find the
+      end-marker of the component (or failing that, the next <ComponentName>)
+      and look for the tokens of the action dict between here and there.
+   """
+   orig_pos = pos
+   (component_type, pos) = read_token_binary(s, pos)
+   if not is_component_type(component_type):
+      print("{0}: error reading Component: at position {1}, expected <xxxxComponent>,"
+            " got: {2}".format(sys.argv[0], orig_pos, component_type), file=sys.stderr)
+      next_pos = s.find(b'<ComponentName> ', pos)
+      return (None, len(s) if next_pos < 0 else next_pos)
+   terminating_token = ("</" + component_type[1:] + " ").encode()
+   end = s.find(terminating_token, pos)
+   if end >= 0:
+      new_pos = end + len(terminating_token)
+   else:
+      print("{0}: error reading object starting at position {1}, could not "
+            "find {2}".format(sys.argv[0], orig_pos, terminating_token.decode()),
+            file=sys.stderr)
+      end = s.find(b'<ComponentName> ', pos)
+      if end < 0:
+         end = len(s)
+      new_pos = end
+
+   d = dict()
+   for (tok, (func, name)) in get_action_dict(component_type).items():
+      tok_pos = s.find((tok + " ").encode(), pos, end)
+      if tok_pos >= 0:
+         (obj, _) = binary_readers[func](s, tok_pos + len(tok) + 1)
+         d[name] = obj
+   d['type'] = component_type             # e.g. '<LinearComponent>'
+   d['raw-type'] = component_type[1:-10]  # e.g. 'Linear'
+   return (d, new_pos)
+
+
+def read_model_binary(s, filename=''):
+   """Reads an nnet3 model from the bytes 's', the contents of a binary-format
+      .raw or .mdl file (for .mdl files the transition model before the
+      neural net is skipped), and returns a dict like read_model().
+      The parameters of the components are numpy arrays pointing into 's'.
+   """
+   pos = s.find(b'<Nnet3> ')
+   if pos >= 0:
+      # The <Nnet3> token is followed by the config lines, as text, which we
+      # don't attempt to parse.
+      pos = s.find(b'<NumComponents> ', pos)
+   if pos < 0:
+      print("{0}: could not find <NumComponents> in {1}".format(
+         sys.argv[0], filename), file=sys.stderr)
+      return None
+   (num_components, pos) = read_int_binary(s, pos + len(b'<NumComponents> '))
+   if num_components is None:
+      return None
+   d = dict()
+   for c in range(num_components):
+      # As in read_model(), we don't insist on <ComponentName> being the next
+      # thing in the file, in case we failed to read the previous component.
+      pos = s.find(b'<ComponentName> ', pos)
+      if pos < 0:
+         print("{0}: unexpected EOF reading {1}".format(
+            sys.argv[0], filename), file=sys.stderr)
+         return None
+      component_pos = pos
+      (component_name, pos) = read_token_binary(s, pos + len(b'<ComponentName> '))
+      (component, pos) = read_component_binary(s, pos)
+      if component != None:
+         d[component_name] = component
+      else:
+         print("{0}: error reading component with name {1} at position {2}".format(
+            sys.argv[0], component_name, component_pos), file=sys.stderr)
+   return d
+
+
 def read_model(filename):
    """Reads an nnet3 model from the provided filename, and returns a dict
       from the component-name to a dict containing things we have read
-      in for that component."""
+      in for that component.
+      If 'filename' is a binary-format model on disk (which is what the
+      training scripts write), it's read directly by read_model_binary();
+      otherwise it is converted to text with nnet3-copy.
+   """
+   if os.path.isfile(filename):
+      with open(filename, 'rb') as f:
+         s = f.read()
+      if s[:2] == b'\0B':
+         return read_model_binary(s, filename)
    command = "nnet3-copy --binary=false {0} -".format(filename)
    s = get_stdout_from_command(command)
    # The model starts with some structural stuff (component-nodes, etc.) that we
@@ -387,6 +584,7 @@ def read_model(filename):
 
    return d
 
+
 def compute_derived_quantities(model):
    """This function, given a model as returned by 'read_model', computes certain
        potentially-useful derived quantities inside components: things like row
@@ -397,7 +595,7 @@ def compute_derived_quantities(model):
    for c in model.values():
       # 'c' represents the component; it's a dict.
       raw_component_type = c['raw-type']
-      if raw_component_type in {'Linear', 'Affine', 'NaturalGradientAffine'}:
+      if raw_component_type in parameter_component_types:
          params = c['params'] # this is the parameter matrix.
          # compute the row and column norms of the parameter matrix.
          c['row-norms'] = np.sqrt(np.sum(params * params, axis=1))
@@ -407,8 +605,8 @@ def compute_derived_quantities(model):
             # if the input-dim of this layer is divisible by 3, then compute the
             # column-norms after reshaping... this is a kind of pooled column-norm
             # that makes sense for TDNNs or wherever we have used Append().
-            c['col-norms-3'] = np.sqrt(np.sum(np.power(c['col-norms'], 2).reshape(3, size/3), axis=0))
-            assert c['col-norms-3'].shape == (size/3,)
+            c['col-norms-3'] = np.sqrt(np.sum(np.power(c['col-norms'], 2).reshape(3, size//3), axis=0))
+            assert c['col-norms-3'].shape == (size//3,)
 
       if raw_component_type == 'BatchNorm':
          stats_var = c['stats-var']
@@ -426,7 +624,7 @@ def compute_progress(model1, model2):
       c1 = model1[component_name]
       c2 = model2[component_name]
       raw_component_type = c1['raw-type']
-      if raw_component_type in {'Linear', 'Affine', 'NaturalGradientAffine'}:
+      if raw_component_type in parameter_component_types:
          params1 = c1['params']
          params2 = c2['params']
          if params1.size != params2.size:
@@ -447,10 +645,125 @@ def compute_progress(model1, model2):
             # if the input-dim of this layer is divisible by 3, then average the
             # column changes over 3 blocks... this makes sense for TDNNs or
             # wherever we have used Append().
-            c1['col-change-3'] = np.sum(c1['col-change'].reshape(3, size/3), axis=0)
+            c1['col-change-3'] = np.sum(c1['col-change'].reshape(3, size//3), axis=0)
             c1['rel-col-change-3'] = c1['col-change-3'] / (c1['col-norms-3'] + epsilon)
 
 
+# The per-component quantities written by write_model_evolution(), in addition
+# to 'iter', 'prev-iter' and 'component'.
+evolution_columns = ['param-norm', 'bias-norm', 'param-change',
+                     'rel-param-change', 'max-rel-row-change']
+
+
+def get_kept_models(exp_dir):
+   """Returns a list of pairs (iter, filename), sorted by iteration, of the
+      models <exp_dir>/<iter>.mdl (or <iter>.raw if there are no .mdl
+      files) kept from training."""
+   models = dict()
+   for extension in ['raw', 'mdl']:
+      for name in os.listdir(exp_dir):
+         m = re.match(r'^(\d+)\.' + extension + '$', name)
+         if m is not None:
+            models[int(m.group(1))] = os.path.join(exp_dir, name)
+   return sorted(models.items())
+
+
+def compute_evolution(job):
+   """Given a pair (prev_model, models), where 'models' is a list of (iter,
+      filename) of successive kept models and 'prev_model' is the (iter,
+      filename) of the model kept before the first of them (or None), returns
+      a list of (iter, prev_iter, component_name, values) with one element per
+      model and component with parameters, where 'values' correspond to
+      evolution_columns.  The changes are relative to the previous kept model,
+      and are NaN (as is 'bias-norm' for components without bias) if they
+      can't be computed.
+   """
+   (prev_model, models) = job
+   if prev_model is not None:
+      (prev_iter, filename) = prev_model
+      prev = read_model(filename)
+   else:
+      (prev_iter, prev) = (-1, None)
+   ans = []
+   for (iter, filename) in models:
+      model = read_model(filename)
+      if model is None:
+         raise Exception("Error reading model {0}".format(filename))
+      for component_name in sorted(model):
+         c = model[component_name]
+         if c['raw-type'] not in parameter_component_types or 'params' not in c:
+            continue
+         params = c['params']
+         param_norm = np.linalg.norm(params)
+         bias_norm = np.linalg.norm(c['bias']) if c.get('bias') is not None else np.nan
+         (change, rel_change, max_rel_row_change) = (np.nan, np.nan, np.nan)
+         if prev is not None and component_name in prev:
+            prev_params = prev[component_name].get('params')
+            if prev_params is not None and prev_params.shape == params.shape:
+               diff = params - prev_params
+               change = np.linalg.norm(diff)
+               epsilon = 1.0e-20
+               rel_change = change / (np.linalg.norm(prev_params) + epsilon)
+               row_change = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+               prev_row_norms = np.sqrt(np.einsum('ij,ij->i', prev_params, prev_params))
+               if row_change.size > 0:
+                  max_rel_row_change = np.max(row_change / (prev_row_norms + epsilon))
+         ans.append((iter, prev_iter, component_name,
+                     (param_norm, bias_norm, change, rel_change, max_rel_row_change)))
+      (prev_iter, prev) = (iter, model)
+   return ans
+
+
+def write_model_evolution(exp_dir, filename, num_jobs=1):
+   """Computes the norms of the parameters of the models kept in 'exp_dir'
+      and their changes between successive kept models (see
+      compute_evolution()), and writes them to 'filename' as a numpy .npz
+      file of columns: 'iter', 'prev-iter' (-1 for the first model),
+      'component' (an index into 'component-names') and evolution_columns,
+      with one row per model and component.
+      The models are split into 'num_jobs' runs of successive models that are
+      processed in parallel, so only the first model of each run is read twice.
+   """
+   models = get_kept_models(exp_dir)
+   if len(models) == 0:
+      raise Exception("No models <iter>.mdl or <iter>.raw in {0}".format(exp_dir))
+   num_jobs = max(1, min(num_jobs, len(models)))
+   jobs = []
+   for j in range(num_jobs):
+      begin = len(models) * j // num_jobs
+      end = len(models) * (j + 1) // num_jobs
+      jobs.append((models[begin - 1] if begin > 0 else None, models[begin:end]))
+
+   if num_jobs > 1:
+      pool = multiprocessing.Pool(num_jobs)
+      results = pool.imap(compute_evolution, jobs)
+   else:
+      results = map(compute_evolution, jobs)
+   rows = []
+   for r in results:
+      rows.extend(r)
+   if num_jobs > 1:
+      pool.close()
+      pool.join()
+
+   component_names = sorted(set([ row[2] for row in rows ]))
+   component_index = dict([ (name, i) for (i, name) in enumerate(component_names) ])
+   columns = { 'iter': np.array([ row[0] for row in rows ], dtype=np.int32),
+               'prev-iter': np.array([ row[1] for row in rows ], dtype=np.int32),
+               'component': np.array([ component_index[row[2]] for row in rows ],
+                                     dtype=np.int32),
+               'component-names': np.array(component_names, dtype=np.str_) }
+   values = np.array([ row[3] for row in rows ], dtype=np.float32).reshape(
+      len(rows), len(evolution_columns))
+   for (i, name) in enumerate(evolution_columns):
+      columns[name] = values[:, i]
+   with open(filename, 'wb') as f:
+      np.savez(f, **columns)
+   print("{0}: wrote the evolution of {1} components over {2} models to {3}".format(
+      sys.argv[0], len(component_names), len(models), filename), file=sys.stderr)
+
+
+
 def test():
    assert sys.version_info.major >= 3
    assert read_next_token("", 0) == (None, 0)
@@ -472,27 +785,53 @@ def test():
    assert pos == len(s)
    assert np.array_equal(obj['some_vec'], np.array([1, 2, 3], dtype=np.float32))
 
+   s = b"FM \x04\x02\x00\x00\x00\x04\x01\x00\x00\x00" + \
+       np.array([1, 2], dtype=np.float32).tobytes() + b"<end> "
+   (m, pos) = read_matrix_binary(s, 0)
+   assert pos == len(s) - 6 and np.array_equal(np.array([[1], [2]], dtype=np.float32), m)
+   s = b"DV \x04\x02\x00\x00\x00" + np.array([1, 2], dtype=np.float64).tobytes()
+   (v, pos) = read_vector_binary(s, 0)
+   assert pos == len(s) and v.dtype == np.float32 and np.array_equal(v, [1, 2])
+
    m = read_model('exp/chain_cleaned/tdnn1c_sp_bi/final.mdl')
    compute_derived_quantities(m)
    print("model is: {0}".format(m))
    print("tested")
 
 
-
-if __name__ == '__main__':
-   if len(sys.argv) == 1:
-      test()
-
-   if len(sys.argv) != 3:
-      print("Usage: {0} <nnet3-model-in> <pickled-model-out>".format(
-         sys.argv[0]), file=sys.stderr)
-      sys.exit(1)
-
-   m = read_model(sys.argv[1])
+def main():
+   parser = argparse.ArgumentParser(
+      description="Dumps the parameters of an nnet3 model as a pickled python dict; "
+      "or, with --evolution, writes the norms of the parameters of the models kept "
+      "in a training directory, and their changes between successive models, to "
+      "a numpy .npz file.")
+   parser.add_argument("--evolution", action='store_true',
+                       help="If set, the arguments are <exp-dir> <npz-out>.")
+   parser.add_argument("--num-jobs", type=int, default=1,
+                       help="Number of processes used with --evolution.")
+   parser.add_argument("model_in",
+                       help="<nnet3-model-in> (or <exp-dir> with --evolution)")
+   parser.add_argument("output",
+                       help="<pickled-model-out> (or <npz-out> with --evolution)")
+   args = parser.parse_args()
+
+   if args.evolution:
+      write_model_evolution(args.model_in, args.output, args.num_jobs)
+      return
+
+   m = read_model(args.model_in)
    if m != None:
       try:
-         f = open(sys.argv[2], "wb")
+         f = open(args.output, "wb")
          pickle.dump(m, f)
       except:
          print("{0}: error writing to {1}".format(
-            sys.argv[2]), file=sys.stderr)
+            sys.argv[0], args.output), file=sys.stderr)
+         sys.exit(1)
+
+
+if __name__ == '__main__':
+   if len(sys.argv) == 1:
+      test()
+   else:
+      main()
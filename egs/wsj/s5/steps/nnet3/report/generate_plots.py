@@ -7,11 +7,18 @@
 from __future__ import division
 import argparse
 import errno
+import hashlib
 import logging
+import multiprocessing
 import os
+import pickle
 import re
 import sys
 import warnings
+try:
+    from html import escape as html_escape
+except ImportError:
+    from cgi import escape as html_escape
 
 sys.path.insert(0, 'steps')
 import libs.nnet3.report.log_parse as log_parse
@@ -46,7 +53,9 @@ def get_args():
         description="Parses the training logs and generates a variety of plots.\n"
         "e.g.: %(prog)s \\\n"
         "  exp/nnet3/tdnn exp/nnet3/tdnn1 exp/nnet3/tdnn2 exp/nnet3/tdnn/report.\n"
-        "The report file 'report.pdf' will be generated in the <output_dir> directory.")
+        "The report file 'report.pdf' (or 'report.html', see --output-format) will be\n"
+        "generated in the <output_dir> directory. Figures whose data have not changed\n"
+        "since the last run in the same <output_dir> are not regenerated.")
 
     parser.add_argument("--start-iter", type=int, metavar='N', default=1,
                         help="Iteration from which plotting will start.")
@@ -58,6 +67,13 @@ def get_args():
                         action=common_lib.NullstrToNoneAction,
                         help="List of space separated <output-node>:<objective-type> entries, "
                         "one for each output node")
+    parser.add_argument("--num-jobs", type=int, metavar='N', default=1,
+                        help="Number of processes used to generate the figures.")
+    parser.add_argument("--output-format", type=str, default='pdf',
+                        choices=['pdf', 'html'],
+                        help="Format of the report: 'pdf' generates PDF figures and a "
+                        "LaTeX report compiled with pdflatex; 'html' generates PNG "
+                        "figures and an HTML report, which does not need LaTeX.")
     parser.add_argument("--comparison-dir", type=str, metavar='DIR', action='append',
                         help="[DEPRECATED] Experiment directories for comparison. "
                         "These will only be used for plots, not tables.")
@@ -76,6 +92,8 @@ def get_args():
             "If you want to compare with more experiments, you would have to carefully tune "
             "the plot_colors variable which specified colors used for plotting.")
     assert args.start_iter >= 1
+    if args.num_jobs < 1:
+        raise Exception("--num-jobs must be positive.")
     if args.is_chain and args.is_rnnlm:
         raise Exception("Options --is-chain and --is-rnnlm cannot be both true.")
     return args
@@ -138,6 +156,114 @@ class LatexReport(object):
         return True
 
 
+class HtmlReport(object):
+    """Class for writing an HTML report, for when LaTeX is not available or
+    a quick look at the plots is all that is needed"""
+
+    def __init__(self, html_file):
+        self.html_file = html_file
+        self.document = []
+        self.document.append("<!DOCTYPE html>\n<html>\n<head>\n"
+                             "<meta charset=\"utf-8\">\n"
+                             "<title>Training report</title>\n</head>\n<body>")
+
+    def add_figure(self, figure_file, title):
+        # the figures are in the same directory as the report, so refer to
+        # them by their basename; this keeps the report relocatable.
+        self.document.append(
+            "<h3>{0}</h3>\n<img src=\"{1}\" alt=\"{0}\">".format(
+                html_escape(title),
+                html_escape(os.path.basename(figure_file), quote=True)))
+
+    def close(self):
+        self.document.append("</body>\n</html>\n")
+        with open(self.html_file, "w") as f:
+            f.write("\n".join(self.document))
+        return True
+
+
+class FigureGenerator(object):
+    """Collects the figures to be plotted and generates them, using a pool of
+    'num_jobs' processes, when run() is called; the figures are then added to
+    the report (if not None) in the order in which they were added.
+
+    Each figure is generated by calling plot_func(figure_file, *args), where
+    plot_func must be a module-level function and the args must be picklable.
+    A hash of the plotting function and its arguments is stored for each
+    figure in <output_dir>/figure_hashes, and a figure is not regenerated if
+    the file exists and its hash has not changed since the last run, e.g.
+    if the training logs of the experiment did not change.
+    """
+
+    def __init__(self, output_dir, report=None, num_jobs=1,
+                 file_format='pdf'):
+        self.output_dir = output_dir
+        self.report = report
+        self.num_jobs = num_jobs
+        self.file_format = file_format
+        self.figures = []
+        self._hash_file = "{0}/figure_hashes".format(output_dir)
+
+    def add_figure(self, file_basename, title, plot_func, *args):
+        figure_file = "{0}/{1}.{2}".format(self.output_dir, file_basename,
+                                           self.file_format)
+        figure_hash = hashlib.sha1(pickle.dumps(
+            (plot_func.__name__, self.file_format, args), protocol=2)).hexdigest()
+        self.figures.append((figure_file, title, plot_func, args, figure_hash))
+
+    def _read_hashes(self):
+        hashes = {}
+        if os.path.exists(self._hash_file):
+            with open(self._hash_file) as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2:
+                        hashes[parts[0]] = parts[1]
+        return hashes
+
+    def run(self):
+        old_hashes = self._read_hashes()
+        jobs = []
+        for figure_file, title, plot_func, args, figure_hash in self.figures:
+            name = os.path.basename(figure_file)
+            if (old_hashes.get(name) == figure_hash
+                    and os.path.exists(figure_file)):
+                continue
+            jobs.append((plot_func, figure_file, args))
+        logger.info("Generating %d figures (%d are up to date)", len(jobs),
+                    len(self.figures) - len(jobs))
+
+        if self.num_jobs > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(min(self.num_jobs, len(jobs)))
+            try:
+                pool.map(generate_figure, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for job in jobs:
+                generate_figure(job)
+
+        # the figures have all been generated at this point, so the hashes of
+        # the figures that were not plotted in this run are kept as well.
+        new_hashes = old_hashes
+        for figure_file, title, plot_func, args, figure_hash in self.figures:
+            new_hashes[os.path.basename(figure_file)] = figure_hash
+        with open(self._hash_file, "w") as f:
+            for name in sorted(new_hashes):
+                f.write("{0} {1}\n".format(name, new_hashes[name]))
+
+        if self.report is not None:
+            for figure_file, title, _, _, _ in self.figures:
+                self.report.add_figure(figure_file, title)
+        self.figures = []
+
+
+def generate_figure(job):
+    plot_func, figure_file, args = job
+    plot_func(figure_file, *args)
+
+
 def latex_compliant_name(name_string):
     """this function is required as latex does not allow all the component names
     allowed by nnet3.
@@ -149,19 +275,45 @@ def latex_compliant_name(name_string):
     return node_name_string
 
 
+def plot_acc_logprob(figfile_name, data_per_dir, key, output_name,
+                     start_iter):
+    fig = plt.figure()
+    plots = []
+    index = 0
+    for dir, data in data_per_dir:
+        color_val = g_plot_colors[index]
+        data = np.array(data)
+        data = data[data[:, 0] >= start_iter, :]
+        plot_handle, = plt.plot(data[:, 0], data[:, 1], color=color_val,
+                                linestyle="--",
+                                label="train {0}".format(dir))
+        plots.append(plot_handle)
+        plot_handle, = plt.plot(data[:, 0], data[:, 2], color=color_val,
+                                label="valid {0}".format(dir))
+        plots.append(plot_handle)
+        index += 1
+    plt.xlabel('Iteration')
+    plt.ylabel(key)
+    lgd = plt.legend(handles=plots, loc='lower center',
+                     bbox_to_anchor=(0.5, -0.2 + len(data_per_dir) * -0.1),
+                     ncol=1, borderaxespad=0.)
+    plt.grid(True)
+    fig.suptitle("{0} plot for {1}".format(key, output_name))
+    plt.savefig(figfile_name, bbox_extra_artists=(lgd,),
+                bbox_inches='tight')
+    plt.close(fig)
+
+
 def generate_acc_logprob_plots(exp_dir, output_dir, plot, key='accuracy',
         file_basename='accuracy', comparison_dir=None,
-        start_iter=1, latex_report=None, output_name='output'):
+        start_iter=1, figure_generator=None, output_name='output'):
 
     assert start_iter >= 1
 
-    if plot:
-        fig = plt.figure()
-        plots = []
-
     comparison_dir = [] if comparison_dir is None else comparison_dir
     dirs = [exp_dir] + comparison_dir
     index = 0
+    data_per_dir = []
     for dir in dirs:
         [report, times, data] = log_parse.generate_acc_logprob_report(dir, key,
                 output_name)
@@ -172,38 +324,17 @@ def generate_acc_logprob_plots(exp_dir, output_dir, plot, key='accuracy',
                 f.write(report)
 
         if plot:
-            color_val = g_plot_colors[index]
-            data = np.array(data)
-            if data.shape[0] == 0:
+            if len(data) == 0:
                 logger.warning("Couldn't find any rows for the"
                                "accuracy/log-probability plot, not generating it")
                 return
-            data = data[data[:, 0] >= start_iter, :]
-            plot_handle, = plt.plot(data[:, 0], data[:, 1], color=color_val,
-                                    linestyle="--",
-                                    label="train {0}".format(dir))
-            plots.append(plot_handle)
-            plot_handle, = plt.plot(data[:, 0], data[:, 2], color=color_val,
-                                    label="valid {0}".format(dir))
-            plots.append(plot_handle)
+            data_per_dir.append((dir, data))
         index += 1
-    if plot:
-        plt.xlabel('Iteration')
-        plt.ylabel(key)
-        lgd = plt.legend(handles=plots, loc='lower center',
-                         bbox_to_anchor=(0.5, -0.2 + len(dirs) * -0.1),
-                         ncol=1, borderaxespad=0.)
-        plt.grid(True)
-        fig.suptitle("{0} plot for {1}".format(key, output_name))
-        figfile_name = '{0}/{1}_{2}.pdf'.format(
-            output_dir, file_basename,
-            latex_compliant_name(output_name))
-        plt.savefig(figfile_name, bbox_extra_artists=(lgd,),
-                    bbox_inches='tight')
-        if latex_report is not None:
-            latex_report.add_figure(
-                figfile_name,
-                "Plot of {0} vs iterations for {1}".format(key, output_name))
+    if plot and figure_generator is not None:
+        figure_generator.add_figure(
+            "{0}_{1}".format(file_basename, latex_compliant_name(output_name)),
+            "Plot of {0} vs iterations for {1}".format(key, output_name),
+            plot_acc_logprob, data_per_dir, key, output_name, start_iter)
 
 
 # The name of five gates of lstmp
@@ -339,6 +470,21 @@ def plot_a_nonlin_component(fig, dirs, stat_tables_per_component_per_dir,
     return lgd
 
 
+def plot_nonlin_stats(figfile_name, dirs, stat_tables_per_component_per_dir,
+                      component_name, common_prefix, prefix_length,
+                      component_type, start_iter, gate_index, with_oderiv,
+                      title):
+    fig = plt.figure()
+    lgd = plot_a_nonlin_component(fig, dirs,
+            stat_tables_per_component_per_dir, component_name,
+            common_prefix, prefix_length, component_type, start_iter,
+            gate_index, with_oderiv)
+    fig.suptitle(title)
+    fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
+                bbox_inches='tight')
+    plt.close(fig)
+
+
 # This function is used to generate the statistic plots of nonlinearity component
 # Mainly divided into the following steps:
 # 1) With log_parse function, we get the statistics from each directory.
@@ -349,7 +495,7 @@ def plot_a_nonlin_component(fig, dirs, stat_tables_per_component_per_dir,
 # 4) Plot the "Per-dimension average-(value, derivative) percentiles" figure
 #    for each nonlinearity component.
 def generate_nonlin_stats_plots(exp_dir, output_dir, plot, comparison_dir=None,
-                                start_iter=1, latex_report=None):
+                                start_iter=1, figure_generator=None):
     assert start_iter >= 1
 
     comparison_dir = [] if comparison_dir is None else comparison_dir
@@ -424,69 +570,92 @@ def generate_nonlin_stats_plots(exp_dir, output_dir, plot, comparison_dir=None,
                            "provided only for common component names. Make sure that these are "
                            "comparable experiments before analyzing these plots.")
 
-        fig = plt.figure()
+        if figure_generator is None:
+            return
 
         common_prefix = os.path.commonprefix(dirs)
         prefix_length = common_prefix.rfind('/')
         common_prefix = common_prefix[0:prefix_length]
 
         for component_name in main_component_names:
+            # only pass the tables of this component to the plotting function,
+            # so that its hash only depends on the stats of this component.
+            component_tables_per_dir = {}
+            for dir in dirs:
+                if component_name in stat_tables_per_component_per_dir[dir]:
+                    component_tables_per_dir[dir] = {
+                        component_name:
+                        stat_tables_per_component_per_dir[dir][component_name]}
+                else:
+                    component_tables_per_dir[dir] = {}
+            comp_name = latex_compliant_name(component_name)
             if stats_per_dir[exp_dir][component_name]['type'] == 'LstmNonlinearity':
                 for i in range(0,5):
                     component_type = 'Lstm-' + g_lstm_gate[i]
-                    lgd = plot_a_nonlin_component(fig, dirs,
-                            stat_tables_per_component_per_dir, component_name,
-                            common_prefix, prefix_length, component_type, start_iter, i, with_oderiv)
-                    fig.suptitle("Per-dimension average-(value, derivative) percentiles for "
-                         "{component_name}-{gate}".format(component_name=component_name, gate=g_lstm_gate[i]))
-                    comp_name = latex_compliant_name(component_name)
-                    figfile_name = '{dir}/nonlinstats_{comp_name}_{gate}.pdf'.format(
-                        dir=output_dir, comp_name=comp_name, gate=g_lstm_gate[i])
-                    fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
-                        bbox_inches='tight')
-                    if latex_report is not None:
-                        latex_report.add_figure(
-                        figfile_name,
-                        "Per-dimension average-(value, derivative) percentiles for "
-                        "{0}-{1}".format(component_name, g_lstm_gate[i]))
+                    title = ("Per-dimension average-(value, derivative) percentiles for "
+                             "{component_name}-{gate}".format(component_name=component_name,
+                                                             gate=g_lstm_gate[i]))
+                    figure_generator.add_figure(
+                        "nonlinstats_{comp_name}_{gate}".format(
+                            comp_name=comp_name, gate=g_lstm_gate[i]),
+                        title, plot_nonlin_stats, dirs,
+                        component_tables_per_dir, component_name,
+                        common_prefix, prefix_length, component_type,
+                        start_iter, i, with_oderiv, title)
             else:
                 component_type = stats_per_dir[exp_dir][component_name]['type']
-                lgd = plot_a_nonlin_component(fig, dirs,
-                        stat_tables_per_component_per_dir,component_name,
-                        common_prefix, prefix_length, component_type, start_iter, 0, with_oderiv)
                 if with_oderiv:
-                    fig.suptitle("Per-dimension average-(value, derivative) and rms-oderivative percentiles for "
-                         "{component_name}".format(component_name=component_name))
+                    title = ("Per-dimension average-(value, derivative) and rms-oderivative percentiles for "
+                             "{component_name}".format(component_name=component_name))
                 else:
-                    fig.suptitle("Per-dimension average-(value, derivative) percentiles for "
-                         "{component_name}".format(component_name=component_name))
-                comp_name = latex_compliant_name(component_name)
-                figfile_name = '{dir}/nonlinstats_{comp_name}.pdf'.format(
-                    dir=output_dir, comp_name=comp_name)
-                fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
-                        bbox_inches='tight')
-                if latex_report is not None:
-                    if with_oderiv:
-                        latex_report.add_figure(
-                        figfile_name,
-                        "Per-dimension average-(value, derivative) and rms-oderivative percentiles for "
-                        "{0}".format(component_name))
-                    else:
-                        latex_report.add_figure(
-                        figfile_name,
-                        "Per-dimension average-(value, derivative) percentiles for "
-                        "{0}".format(component_name))
+                    title = ("Per-dimension average-(value, derivative) percentiles for "
+                             "{component_name}".format(component_name=component_name))
+                figure_generator.add_figure(
+                    "nonlinstats_{comp_name}".format(comp_name=comp_name),
+                    title, plot_nonlin_stats, dirs, component_tables_per_dir,
+                    component_name, common_prefix, prefix_length,
+                    component_type, start_iter, 0, with_oderiv, title)
+
 
 
+def plot_clipped_proportion(figfile_name, iter_stats_per_dir, component_name,
+                            start_iter):
+    fig = plt.figure()
+    index = 0
+    plots = []
+    for dir, iter_stats in iter_stats_per_dir:
+        color_val = g_plot_colors[index]
+        index += 1
+        if iter_stats is None:
+            continue
+
+        data = np.array(iter_stats)
+        data = data[data[:, 0] >= start_iter, :]
+        ax = plt.subplot(111)
+        mp, = ax.plot(data[:, 0], data[:, 1], color=color_val,
+                      label="Clipped Proportion {0}".format(dir))
+        plots.append(mp)
+        ax.set_ylabel('Clipped Proportion')
+        ax.set_ylim([0, 1.2])
+        ax.grid(True)
+    lgd = plt.legend(handles=plots, loc='lower center',
+                     bbox_to_anchor=(0.5, -0.5 + len(iter_stats_per_dir) * -0.2),
+                     ncol=1, borderaxespad=0.)
+    plt.grid(True)
+    fig.suptitle("Clipped-proportion value at {comp_name}".format(
+                    comp_name=component_name))
+    fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
+                bbox_inches='tight')
+    plt.close(fig)
+
 
 def generate_clipped_proportion_plots(exp_dir, output_dir, plot,
                                       comparison_dir=None, start_iter=1,
-                                      latex_report=None):
+                                      figure_generator=None):
     assert(start_iter >= 1)
 
     comparison_dir = [] if comparison_dir is None else comparison_dir
     dirs = [exp_dir] + comparison_dir
-    index = 0
     stats_per_dir = {}
     for dir in dirs:
         try:
@@ -534,57 +703,74 @@ def generate_clipped_proportion_plots(exp_dir, output_dir, plot,
                 "provided only for common component names. Make sure that these "
                 "are comparable experiments before analyzing these plots.")
 
-        fig = plt.figure()
+        if figure_generator is None:
+            return
+
         for component_name in main_component_names:
-            fig.clf()
-            index = 0
-            plots = []
+            iter_stats_per_dir = []
             for dir in dirs:
-                color_val = g_plot_colors[index]
-                index += 1
                 try:
                     iter_stats = stats_per_dir[dir][
                         'cp_per_iter_per_component'][component_name]
                 except KeyError:
                     # this component is not available in this network so lets
                     # not just plot it
-                    continue
-
-                data = np.array(iter_stats)
-                data = data[data[:, 0] >= start_iter, :]
-                ax = plt.subplot(111)
-                mp, = ax.plot(data[:, 0], data[:, 1], color=color_val,
-                              label="Clipped Proportion {0}".format(dir))
-                plots.append(mp)
-                ax.set_ylabel('Clipped Proportion')
-                ax.set_ylim([0, 1.2])
-                ax.grid(True)
-            lgd = plt.legend(handles=plots, loc='lower center',
-                             bbox_to_anchor=(0.5, -0.5 + len(dirs) * -0.2),
-                             ncol=1, borderaxespad=0.)
-            plt.grid(True)
-            fig.suptitle("Clipped-proportion value at {comp_name}".format(
-                            comp_name=component_name))
+                    iter_stats = None
+                iter_stats_per_dir.append((dir, iter_stats))
             comp_name = latex_compliant_name(component_name)
-            figfile_name = '{dir}/clipped_proportion_{comp_name}.pdf'.format(
-                dir=output_dir, comp_name=comp_name)
-            fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
-                        bbox_inches='tight')
-            if latex_report is not None:
-                latex_report.add_figure(
-                    figfile_name,
-                    "Clipped proportion at {0}".format(component_name))
+            figure_generator.add_figure(
+                "clipped_proportion_{comp_name}".format(comp_name=comp_name),
+                "Clipped proportion at {0}".format(component_name),
+                plot_clipped_proportion, iter_stats_per_dir, component_name,
+                start_iter)
+
+
+def plot_parameter_diff(figfile_name, iter_stats_per_dir, component_name):
+    fig = plt.figure()
+    index = 0
+    plots = []
+    for dir, iter_stats in iter_stats_per_dir:
+        color_val = g_plot_colors[index]
+        index += 1
+        if iter_stats is None:
+            continue
+        iter_stats = [np.array(x) for x in iter_stats]
+        ax = plt.subplot(211)
+        mp, = ax.plot(iter_stats[0][:, 0], iter_stats[0][:, 1],
+                      color=color_val,
+                      label="Parameter Differences {0}".format(dir))
+        plots.append(mp)
+        ax.set_ylabel('Parameter Differences')
+        ax.grid(True)
+
+        ax = plt.subplot(212)
+        mp, = ax.plot(iter_stats[1][:, 0], iter_stats[1][:, 1],
+                      color=color_val,
+                      label="Relative Parameter "
+                            "Differences {0}".format(dir))
+        ax.set_xlabel('Iteration')
+        ax.set_ylabel('Relative Parameter Differences')
+        ax.grid(True)
+
+    lgd = plt.legend(handles=plots, loc='lower center',
+                     bbox_to_anchor=(0.5, -0.5 + len(iter_stats_per_dir) * -0.2),
+                     ncol=1, borderaxespad=0.)
+    plt.grid(True)
+    fig.suptitle("Parameter differences at {comp_name}".format(
+        comp_name=component_name))
+    fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
+                bbox_inches='tight')
+    plt.close(fig)
 
 
 def generate_parameter_diff_plots(exp_dir, output_dir, plot,
                                   comparison_dir=None, start_iter=1,
-                                  latex_report=None):
+                                  figure_generator=None):
     # Parameter changes
     assert start_iter >= 1
 
     comparison_dir = [] if comparison_dir is None else comparison_dir
     dirs = [exp_dir] + comparison_dir
-    index = 0
     stats_per_dir = {}
     key_file = {"Parameter differences": "parameter.diff",
                 "Relative parameter differences": "relative_parameter.diff"}
@@ -646,25 +832,22 @@ def generate_parameter_diff_plots(exp_dir, output_dir, plot,
 
         assert main_component_names
 
-        fig = plt.figure()
+        if figure_generator is None:
+            return
         logger.info("Plotting parameter differences for components: " +
                     ", ".join(main_component_names))
 
         for component_name in main_component_names:
-            fig.clf()
-            index = 0
-            plots = []
+            iter_stats_per_dir = []
             for dir in dirs:
-                color_val = g_plot_colors[index]
-                index += 1
                 iter_stats = []
                 try:
                     for diff_type in ['Parameter differences',
                                       'Relative parameter differences']:
-                        iter_stats.append(np.array(
+                        iter_stats.append(
                             sorted(stats_per_dir[dir][diff_type][
                                 'progress_per_component'][
-                                    component_name].items())))
+                                    component_name].items()))
                 except KeyError as e:
                     # this component is not available in this network so lets
                     # not just plot it
@@ -672,43 +855,98 @@ def generate_parameter_diff_plots(exp_dir, output_dir, plot,
                         raise Exception("No parameter differences were available even in the main "
                                         "experiment dir for the component {0}. Something went "
                                         "wrong: {1}.".format(component_name, e))
-                    continue
-                ax = plt.subplot(211)
-                mp, = ax.plot(iter_stats[0][:, 0], iter_stats[0][:, 1],
-                              color=color_val,
-                              label="Parameter Differences {0}".format(dir))
-                plots.append(mp)
-                ax.set_ylabel('Parameter Differences')
-                ax.grid(True)
-
-                ax = plt.subplot(212)
-                mp, = ax.plot(iter_stats[1][:, 0], iter_stats[1][:, 1],
-                              color=color_val,
-                              label="Relative Parameter "
-                                    "Differences {0}".format(dir))
-                ax.set_xlabel('Iteration')
-                ax.set_ylabel('Relative Parameter Differences')
-                ax.grid(True)
-
-            lgd = plt.legend(handles=plots, loc='lower center',
-                             bbox_to_anchor=(0.5, -0.5 + len(dirs) * -0.2),
-                             ncol=1, borderaxespad=0.)
-            plt.grid(True)
-            fig.suptitle("Parameter differences at {comp_name}".format(
-                comp_name=component_name))
+                    iter_stats = None
+                iter_stats_per_dir.append((dir, iter_stats))
             comp_name = latex_compliant_name(component_name)
-            figfile_name = '{dir}/param_diff_{comp_name}.pdf'.format(
-                dir=output_dir, comp_name=comp_name)
-            fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
-                        bbox_inches='tight')
-            if latex_report is not None:
-                latex_report.add_figure(
-                    figfile_name,
-                    "Parameter differences at {0}".format(component_name))
+            figure_generator.add_figure(
+                "param_diff_{comp_name}".format(comp_name=comp_name),
+                "Parameter differences at {0}".format(component_name),
+                plot_parameter_diff, iter_stats_per_dir, component_name)
+
+
+def plot_model_evolution(figfile_name, iter_stats_per_dir, component_name,
+                         start_iter):
+    fig = plt.figure()
+    index = 0
+    plots = []
+    for dir, iter_stats in iter_stats_per_dir:
+        color_val = g_plot_colors[index]
+        index += 1
+        if iter_stats is None:
+            continue
+        data = iter_stats[iter_stats[:, 0] >= start_iter, :]
+        ax = plt.subplot(211)
+        mp, = ax.plot(data[:, 0], data[:, 1], color=color_val,
+                      label="Parameter Norm {0}".format(dir))
+        plots.append(mp)
+        ax.set_ylabel('Parameter Norm')
+        ax.grid(True)
+
+        ax = plt.subplot(212)
+        ax.plot(data[:, 0], data[:, 2], color=color_val,
+                label="Relative Parameter Change {0}".format(dir))
+        ax.plot(data[:, 0], data[:, 3], color=color_val, linestyle='--',
+                label="Max Relative Row Change {0}".format(dir))
+        ax.set_xlabel('Iteration')
+        ax.set_ylabel('Relative Change\n(dashed: max over rows)')
+        ax.grid(True)
+
+    lgd = plt.legend(handles=plots, loc='lower center',
+                     bbox_to_anchor=(0.5, -0.5 + len(iter_stats_per_dir) * -0.2),
+                     ncol=1, borderaxespad=0.)
+    plt.grid(True)
+    fig.suptitle("Parameter evolution at {comp_name}".format(
+        comp_name=component_name))
+    fig.savefig(figfile_name, bbox_extra_artists=(lgd,),
+                bbox_inches='tight')
+    plt.close(fig)
+
+
+def generate_model_evolution_plots(exp_dir, output_dir, plot,
+                                   comparison_dir=None, start_iter=1,
+                                   figure_generator=None):
+    """Plots the parameter norms and changes in <dir>/model_evolution.npz,
+    as written by steps/nnet3/report/convert_model.py --evolution, for the
+    experiment directories that have this file."""
+    assert start_iter >= 1
+    if not plot or figure_generator is None:
+        return
+
+    comparison_dir = [] if comparison_dir is None else comparison_dir
+    dirs = [exp_dir] + comparison_dir
+    stats_per_dir = {}
+    for dir in dirs:
+        evolution_file = "{0}/model_evolution.npz".format(dir)
+        if not os.path.exists(evolution_file):
+            continue
+        evolution = np.load(evolution_file)
+        stats_per_dir[dir] = {}
+        for i, component_name in enumerate(evolution['component-names']):
+            rows = evolution['component'] == i
+            stats_per_dir[dir][str(component_name)] = np.stack(
+                [evolution['iter'][rows], evolution['param-norm'][rows],
+                 evolution['rel-param-change'][rows],
+                 evolution['max-rel-row-change'][rows]], axis=1)
+    if exp_dir not in stats_per_dir:
+        logger.info("There is no %s/model_evolution.npz, not generating "
+                    "model-evolution plots.", exp_dir)
+        return
+
+    for component_name in sorted(stats_per_dir[exp_dir]):
+        iter_stats_per_dir = []
+        for dir in dirs:
+            iter_stats_per_dir.append(
+                (dir, stats_per_dir.get(dir, {}).get(component_name)))
+        comp_name = latex_compliant_name(component_name)
+        figure_generator.add_figure(
+            "model_evolution_{comp_name}".format(comp_name=comp_name),
+            "Parameter norm and change at {0}".format(component_name),
+            plot_model_evolution, iter_stats_per_dir, component_name,
+            start_iter)
 
 
 def generate_plots(exp_dir, output_dir, output_names, comparison_dir=None,
-                   start_iter=1):
+                   start_iter=1, num_jobs=1, output_format='pdf'):
     try:
         os.makedirs(output_dir)
     except OSError as e:
@@ -717,9 +955,17 @@ def generate_plots(exp_dir, output_dir, output_names, comparison_dir=None,
         else:
             raise e
     if g_plot:
-        latex_report = LatexReport("{0}/report.pdf".format(output_dir))
+        if output_format == 'html':
+            report = HtmlReport("{0}/report.html".format(output_dir))
+            figure_generator = FigureGenerator(output_dir, report, num_jobs,
+                                               file_format='png')
+        else:
+            report = LatexReport("{0}/report.pdf".format(output_dir))
+            figure_generator = FigureGenerator(output_dir, report, num_jobs,
+                                               file_format='pdf')
     else:
-        latex_report = None
+        report = None
+        figure_generator = None
 
     for (output_name, objective_type) in output_names:
         if objective_type == "linear":
@@ -728,55 +974,62 @@ def generate_plots(exp_dir, output_dir, output_names, comparison_dir=None,
                 exp_dir, output_dir, g_plot, key='accuracy',
                 file_basename='accuracy', comparison_dir=comparison_dir,
                 start_iter=start_iter,
-                latex_report=latex_report, output_name=output_name)
+                figure_generator=figure_generator, output_name=output_name)
 
             logger.info("Generating log-likelihood plots for '%s'", output_name)
             generate_acc_logprob_plots(
                 exp_dir, output_dir, g_plot, key='log-likelihood',
                 file_basename='loglikelihood', comparison_dir=comparison_dir,
                 start_iter=start_iter,
-                latex_report=latex_report, output_name=output_name)
+                figure_generator=figure_generator, output_name=output_name)
         elif objective_type == "chain":
             logger.info("Generating log-probability plots for '%s'", output_name)
             generate_acc_logprob_plots(
                 exp_dir, output_dir, g_plot,
                 key='log-probability', file_basename='log_probability',
                 comparison_dir=comparison_dir, start_iter=start_iter,
-                latex_report=latex_report, output_name=output_name)
+                figure_generator=figure_generator, output_name=output_name)
         elif objective_type == "rnnlm_objective":
             logger.info("Generating RNNLM objective plots for '%s'", output_name)
             generate_acc_logprob_plots(
                 exp_dir, output_dir, g_plot, key='rnnlm_objective',
                 file_basename='objective', comparison_dir=comparison_dir,
                 start_iter=start_iter,
-                latex_report=latex_report, output_name=output_name)
+                figure_generator=figure_generator, output_name=output_name)
         else:
             logger.info("Generating %s objective plots for '%s'", objective_type, output_name)
             generate_acc_logprob_plots(
                 exp_dir, output_dir, g_plot, key='objective',
                 file_basename='objective', comparison_dir=comparison_dir,
                 start_iter=start_iter,
-                latex_report=latex_report, output_name=output_name)
+                figure_generator=figure_generator, output_name=output_name)
 
     logger.info("Generating non-linearity stats plots")
     generate_nonlin_stats_plots(
         exp_dir, output_dir, g_plot, comparison_dir=comparison_dir,
-        start_iter=start_iter, latex_report=latex_report)
+        start_iter=start_iter, figure_generator=figure_generator)
 
     logger.info("Generating clipped-proportion plots")
     generate_clipped_proportion_plots(
         exp_dir, output_dir, g_plot, comparison_dir=comparison_dir,
-        start_iter=start_iter, latex_report=latex_report)
+        start_iter=start_iter, figure_generator=figure_generator)
 
     logger.info("Generating parameter difference plots")
     generate_parameter_diff_plots(
         exp_dir, output_dir, g_plot, comparison_dir=comparison_dir,
-        start_iter=start_iter, latex_report=latex_report)
+        start_iter=start_iter, figure_generator=figure_generator)
+
+    logger.info("Generating model-evolution plots")
+    generate_model_evolution_plots(
+        exp_dir, output_dir, g_plot, comparison_dir=comparison_dir,
+        start_iter=start_iter, figure_generator=figure_generator)
 
-    if g_plot and latex_report is not None:
-        has_compiled = latex_report.close()
+    if g_plot and report is not None:
+        figure_generator.run()
+        has_compiled = report.close()
         if has_compiled:
-            logger.info("Report file %s/report.pdf has been generated successfully.", output_dir)
+            logger.info("Report file %s/report.%s has been generated successfully.",
+                        output_dir, output_format)
 
 
 def main():
@@ -808,15 +1061,18 @@ def main():
     if args.comparison_dir is not None:
       generate_plots(args.exp_dir[0], args.output_dir, output_nodes,
                      comparison_dir=args.comparison_dir,
-                     start_iter=args.start_iter)
+                     start_iter=args.start_iter, num_jobs=args.num_jobs,
+                     output_format=args.output_format)
     else:
       if len(args.exp_dir) == 1:
         generate_plots(args.exp_dir[0], args.output_dir, output_nodes,
-                       start_iter=args.start_iter)
+                       start_iter=args.start_iter, num_jobs=args.num_jobs,
+                       output_format=args.output_format)
       if len(args.exp_dir) > 1:
         generate_plots(args.exp_dir[0], args.output_dir, output_nodes,
                        comparison_dir=args.exp_dir[1:],
-                       start_iter=args.start_iter)
+                       start_iter=args.start_iter, num_jobs=args.num_jobs,
+                       output_format=args.output_format)
 
 
 if __name__ == "__main__":
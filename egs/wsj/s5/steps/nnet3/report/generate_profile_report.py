@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+# Copyright 2019  Johns Hopkins University
+# Apache 2.0.
+
+""" This script aggregates the timing information printed by nnet3 training
+programs run with --computation.debug=true (see
+summarize_compute_debug_timing.py, which does this for a single log) over all
+the training logs <exp-dir>/log/train.<iter>.<job>.log of an experiment.
+
+It writes to <output-dir>:
+  profile.txt     A report of the time spent per command type, per component
+                  and per layer (the part of the component name before the
+                  first '.'), and of how the distribution of the time over the
+                  layers changes over training.
+  profile.csv     The time and number of executions per iteration, job,
+                  component and command type.
+  profile.folded  The time in microseconds in the 'folded stacks' format
+                  (program;layer;component;command-type time), which can be
+                  given to flamegraph.pl (https://github.com/brendangregg/FlameGraph)
+                  to produce a flame graph.
+"""
+
+from __future__ import division
+from __future__ import print_function
+import argparse
+import csv
+import logging
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, 'steps')
+import libs.nnet3.report.log_parse as log_parse
+
+
+logging.basicConfig(format="%(filename)s:%(lineno)s:%(levelname)s:%(message)s",
+                    level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_args():
+    parser = argparse.ArgumentParser(
+        description="Aggregates the timing information from the training logs "
+        "of an experiment run with --computation.debug=true, and writes a report, "
+        "a CSV file and a folded-stacks file (for flame graphs) to <output-dir>.",
+        epilog="e.g.: steps/nnet3/report/generate_profile_report.py "
+        "--num-jobs 8 exp/chain/tdnn1a exp/chain/tdnn1a/profile")
+
+    parser.add_argument("--num-jobs", type=int, default=1,
+                        help="Number of processes used to parse the logs.")
+    parser.add_argument("--num-stages", type=int, default=5,
+                        help="The iterations are divided into this many "
+                        "stages to show how the time per layer changes over "
+                        "training.")
+    parser.add_argument("--max-components", type=int, default=50,
+                        help="Maximum number of components listed in the "
+                        "report (the ones that take the most time).")
+    parser.add_argument("exp_dir",
+                        help="Experiment directory, e.g. exp/nnet3/tdnn")
+    parser.add_argument("output_dir",
+                        help="Output directory, e.g. exp/nnet3/tdnn/profile")
+
+    print(' '.join(sys.argv), file=sys.stderr)
+
+    args = parser.parse_args()
+    if args.num_jobs < 1 or args.num_stages < 1:
+        raise Exception("--num-jobs and --num-stages must be positive.")
+    return args
+
+
+def parse_log(log):
+    iter, job, log_file = log
+    program, times = log_parse.parse_compute_debug_timing(log_file)
+    return (iter, job, program, times)
+
+
+def get_layer_name(component):
+    return '[non-component]' if component is None else component.split('.')[0]
+
+
+def add_to_table(table, key, count, time):
+    try:
+        stats = table[key]
+    except KeyError:
+        stats = table[key] = [0, 0.0]
+    stats[0] += count
+    stats[1] += time
+
+
+def write_table(f, title, table, total_time, max_rows=None):
+    print("# {0}".format(title), file=f)
+    print("{0:<48s} {1:>12s} {2:>8s} {3:>12s}".format(
+        "name", "time(s)", "%", "count"), file=f)
+    rows = sorted(table.items(), key=lambda x: x[1][1], reverse=True)
+    if max_rows is not None:
+        rows = rows[:max_rows]
+    for name, (count, time) in rows:
+        print("{0:<48s} {1:>12.2f} {2:>8.2f} {3:>12d}".format(
+            name, time, 100.0 * time / total_time, count), file=f)
+    print("", file=f)
+
+
+def write_reports(output_dir, results, num_stages, max_components):
+    program = 'nnet3-train'
+    for _, _, this_program, _ in results:
+        if this_program is not None:
+            program = this_program
+            break
+
+    # iteration -> layer -> time, for the evolution over training.
+    iter_layer_times = {}
+    command_types = {}
+    components = {}
+    layers = {}
+    folded = {}
+    with open("{0}/profile.csv".format(output_dir), 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['iter', 'job', 'component', 'command_type', 'count',
+                         'time'])
+        for iter, job, _, times in results:
+            layer_times = iter_layer_times.setdefault(iter, {})
+            for (component, command_type), (count, time) in sorted(
+                    times.items(), key=lambda x: (x[0][0] or '', x[0][1])):
+                writer.writerow([iter, job, component or '', command_type,
+                                 count, time])
+                layer = get_layer_name(component)
+                add_to_table(command_types, command_type, count, time)
+                add_to_table(layers, layer, count, time)
+                if component is not None:
+                    add_to_table(components,
+                                 "{0}.{1}".format(component, command_type),
+                                 count, time)
+                    stack = "{0};{1};{2};{3}".format(program, layer, component,
+                                                     command_type)
+                else:
+                    stack = "{0};{1};{2}".format(program, layer, command_type)
+                folded[stack] = folded.get(stack, 0.0) + time
+                layer_times[layer] = layer_times.get(layer, 0.0) + time
+
+    with open("{0}/profile.folded".format(output_dir), 'w') as f:
+        for stack in sorted(folded.keys()):
+            usecs = int(round(folded[stack] * 1.0e+06))
+            if usecs > 0:
+                print("{0} {1}".format(stack, usecs), file=f)
+
+    total_time = sum([x[1] for x in command_types.values()])
+    iters = sorted(iter_layer_times.keys())
+    num_stages = min(num_stages, len(iters))
+    with open("{0}/profile.txt".format(output_dir), 'w') as f:
+        print("# Profile of {0} training logs ({1} iterations, {2} to {3}); "
+              "total time in profiled commands: {4:.2f} seconds\n".format(
+                  len(results), len(iters), iters[0], iters[-1], total_time),
+              file=f)
+        write_table(f, "Time per command type", command_types, total_time)
+        write_table(f, "Time per layer", layers, total_time)
+        write_table(f, "Time per component and command type (top {0})"
+                    "".format(max_components), components, total_time,
+                    max_rows=max_components)
+
+        # Percentage of the time of each stage of training spent in each layer.
+        stages = []
+        for s in range(num_stages):
+            stage_iters = iters[s * len(iters) // num_stages:
+                                (s + 1) * len(iters) // num_stages]
+            stage_times = {}
+            for iter in stage_iters:
+                for layer, time in iter_layer_times[iter].items():
+                    stage_times[layer] = stage_times.get(layer, 0.0) + time
+            stages.append((stage_iters[0], stage_iters[-1], stage_times))
+        print("# Percentage of time per layer over training", file=f)
+        print("{0:<32s} ".format("layer") + " ".join(
+            ["{0:>12s}".format("{0}-{1}".format(first, last))
+             for first, last, _ in stages]), file=f)
+        for layer, _ in sorted(layers.items(), key=lambda x: x[1][1],
+                               reverse=True):
+            percentages = []
+            for _, _, stage_times in stages:
+                stage_total = sum(stage_times.values())
+                percentages.append("{0:>12.2f}".format(
+                    100.0 * stage_times.get(layer, 0.0) / stage_total
+                    if stage_total > 0 else 0.0))
+            print("{0:<32s} ".format(layer) + " ".join(percentages), file=f)
+
+
+def main():
+    args = get_args()
+
+    logs = log_parse.get_train_log_files(args.exp_dir)
+    if len(logs) == 0:
+        raise Exception("No training logs found in {0}/log".format(
+            args.exp_dir))
+
+    if args.num_jobs > 1:
+        pool = multiprocessing.Pool(args.num_jobs)
+        results = pool.map(parse_log, logs)
+        pool.close()
+        pool.join()
+    else:
+        results = [parse_log(log) for log in logs]
+
+    results = [x for x in results if len(x[3]) > 0]
+    if len(results) == 0:
+        raise Exception("No timing information found in the training logs "
+                        "in {0}/log; were they run with "
+                        "--computation.debug=true?".format(args.exp_dir))
+    logger.info("Found timing information in {0} of {1} training logs".format(
+        len(results), len(logs)))
+
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+    write_reports(args.output_dir, results, args.num_stages,
+                  args.max_components)
+    logger.info("Wrote {0}/profile.txt, {0}/profile.csv and "
+                "{0}/profile.folded".format(args.output_dir))
+
+
+if __name__ == "__main__":
+    main()
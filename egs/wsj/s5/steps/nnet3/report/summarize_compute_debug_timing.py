@@ -15,6 +15,8 @@ import argparse
 # expects the output of nnet3*train with --computation-debug=true
 # will run faster if just the lines with "DebugAfterExecute" are provided
 # <train-command> |grep DebugAfterExecute | steps/nnet3/report/summarize_compute_debug_timing.py
+# To aggregate this information over all the training logs of an experiment,
+# see steps/nnet3/report/generate_profile_report.py.
 
 def GetArgs():
     parser = argparse.ArgumentParser(description="Summarizes the timing info from nnet3-*-train --computation.debug=true commands ")
@@ -22,6 +22,8 @@ import libs.nnet3.train.common as common_train_lib
 import libs.common as common_lib
 import libs.nnet3.train.frame_level_objf as train_lib
 import libs.nnet3.report.log_parse as nnet3_log_parse
+import libs.nnet3.train.egs_staging as egs_staging_lib
+import libs.nnet3.train.load_balancing as load_balancing_lib
 
 
 logger = logging.getLogger('libs')
@@ -392,6 +394,17 @@ def train(args, run_opts):
     logger.info("Training will run for {0} epochs = "
                 "{1} iterations".format(args.num_epochs, num_iters))
 
+    # optionally stage the egs archives of the next iteration to local disk
+    # while the current one is training.
+    egs_stager = egs_staging_lib.get_egs_stager(
+        egs_dir, args.egs_staging_dir, args.egs_staging_max_size,
+        args.command)
+
+    job_tracker = None
+    if args.balance_jobs:
+        job_tracker = load_balancing_lib.JobThroughputTracker(
+            args.dir, min_proportion=args.balance_min_proportion)
+
     for iter in range(num_iters):
         if (args.exit_stage is not None) and (iter == args.exit_stage):
             logger.info("Exiting early due to --exit-stage {0}".format(iter))
@@ -437,11 +450,32 @@ def train(args, run_opts):
                                                     percent,
                                                     lrate, shrink_info_str))
 
+            if egs_stager is not None:
+                next_num_jobs = 0
+                if iter + 1 < num_iters:
+                    next_num_jobs = common_train_lib.get_current_num_jobs(
+                        iter + 1, num_iters, args.num_jobs_initial,
+                        args.num_jobs_step, args.num_jobs_final)
+                egs_stager.prefetch_next_iteration(
+                    "egs.", num_archives_processed, current_num_jobs,
+                    next_num_jobs, num_archives)
+
+            keep_proportions = None
+            if job_tracker is not None and iter > 0:
+                keep_proportions = job_tracker.get_keep_proportions(
+                    current_num_jobs)
+                if keep_proportions is not None:
+                    logger.info("Proportions of archives processed by the "
+                                "jobs: {0}".format(" ".join(
+                                    [str(p) for p in keep_proportions])))
+
             train_lib.common.train_one_iteration(
                 dir=args.dir,
                 iter=iter,
                 srand=args.srand,
                 egs_dir=egs_dir,
+                egs_stager=egs_stager,
+                keep_proportions=keep_proportions,
                 num_jobs=current_num_jobs,
                 num_archives_processed=num_archives_processed,
                 num_archives=num_archives,
@@ -463,6 +497,9 @@ def train(args, run_opts):
                 backstitch_training_interval=args.backstitch_training_interval,
                 compute_per_dim_accuracy=args.compute_per_dim_accuracy)
 
+            if job_tracker is not None:
+                job_tracker.update(iter, current_num_jobs, keep_proportions)
+
             if args.cleanup:
                 # do a clean up everythin but the last 2 models, under certain
                 # conditions
@@ -483,6 +520,9 @@ def train(args, run_opts):
 
         num_archives_processed = num_archives_processed + current_num_jobs
 
+    if egs_stager is not None:
+        egs_stager.close()
+
     if args.stage <= num_iters:
         if args.do_final_combination:
             logger.info("Doing final combination to produce final.mdl")
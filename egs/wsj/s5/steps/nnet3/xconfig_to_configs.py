@@ -17,6 +17,8 @@ sys.path.insert(0, 'steps/')
 sys.path.insert(0, os.path.realpath(os.path.dirname(sys.argv[0])) + '/')
 
 import libs.nnet3.xconfig.parser as xparser
+import libs.nnet3.xconfig.utils as xutils
+import libs.nnet3.train.common as common_train_lib
 import libs.common as common_lib
 
 
@@ -50,6 +52,31 @@ def get_args():
                         new-name=output' if node xxx plays the role of the
                         output node in this network.  This is only used for
                         computing the left/right context.""")
+    parser.add_argument('--print-cost-report', type=str, default=False,
+                        action=common_lib.StrToBoolAction,
+                        choices=["true", "false"],
+                        help="If true, print a report of the number of "
+                        "parameters, multiply-adds and activation memory of "
+                        "each layer and of the whole network, for chunks of "
+                        "--frames-per-chunk frames.  It is also written to "
+                        "<config-dir>/cost_report.")
+    parser.add_argument('--frames-per-chunk', type=str, default='150',
+                        help="Chunk width(s) used in training or decoding "
+                        "(e.g. chunk_width or frames_per_chunk); only the "
+                        "principal (first) one is used in the cost report.")
+    parser.add_argument('--frame-subsampling-factor', type=int, default=1,
+                        help="Frame subsampling factor of the output, used in "
+                        "the cost report.")
+    parser.add_argument('--extra-left-context', type=int, default=0,
+                        help="Extra left context, used in the cost report "
+                        "(relevant for recurrent networks).")
+    parser.add_argument('--extra-right-context', type=int, default=0,
+                        help="Extra right context, used in the cost report "
+                        "(relevant for recurrent networks).")
+    parser.add_argument('--frames-per-second', type=float, default=100.0,
+                        help="Input frame rate, used to express the "
+                        "multiply-adds per second of audio in the cost "
+                        "report.")
 
     print(' '.join(sys.argv), file=sys.stderr)
 
@@ -314,6 +341,55 @@ def check_model_contexts(config_dir, nnet_edits=None, existing_model=None):
 
 
 
+def write_cost_report(config_dir, all_layers, frames_per_chunk,
+                      frame_subsampling_factor=1, extra_left_context=0,
+                      extra_right_context=0, frames_per_second=100.0):
+    """Prints a report of the number of parameters, the multiply-adds and the
+    activation memory of each layer and of the whole network to the standard
+    output, and writes it to config_dir/cost_report.  See
+    xutils.get_network_cost() for how these are computed.
+    """
+    cost = xutils.get_network_cost(
+        all_layers, frames_per_chunk,
+        frame_subsampling_factor=frame_subsampling_factor,
+        extra_left_context=extra_left_context,
+        extra_right_context=extra_right_context)
+
+    lines = []
+    lines.append('# Cost of the network for chunks of {0} frames, with '
+                 'frame-subsampling-factor={1}, extra-left-context={2} and '
+                 'extra-right-context={3}'.format(
+                     frames_per_chunk, frame_subsampling_factor,
+                     extra_left_context, extra_right_context))
+    lines.append('# {0:<24s} {1:<28s} {2:>12s} {3:>14s} {4:>12s}'.format(
+        'layer', 'type', 'params', 'MMACs/chunk', 'act-MB/chunk'))
+    for layer in cost['layers']:
+        if layer['num-params'] == 0 and layer['macs'] == 0:
+            continue
+        lines.append('  {0:<24s} {1:<28s} {2:>12d} {3:>14.2f} {4:>12.2f}'.format(
+            layer['name'], layer['layer-type'], layer['num-params'],
+            layer['macs'] / 1.0e+06, layer['activations'] * 4 / 1.0e+06))
+    seconds_per_chunk = frames_per_chunk / frames_per_second
+    lines.append('num-params: {0}'.format(cost['num-params']))
+    lines.append('left-context: {0}'.format(cost['left-context']))
+    lines.append('right-context: {0}'.format(cost['right-context']))
+    lines.append('MMACs-per-chunk: {0:.2f}'.format(cost['macs'] / 1.0e+06))
+    lines.append('MMACs-per-output-frame: {0:.3f}'.format(
+        cost['macs'] / 1.0e+06 / cost['num-output-frames']))
+    lines.append('MMACs-per-input-frame: {0:.3f}'.format(
+        cost['macs'] / 1.0e+06 / frames_per_chunk))
+    lines.append('GMACs-per-second: {0:.3f}'.format(
+        cost['macs'] / 1.0e+09 / seconds_per_chunk))
+    lines.append('activation-MB-per-chunk: {0:.2f}'.format(
+        cost['activations'] * 4 / 1.0e+06))
+
+    with open('{0}/cost_report'.format(config_dir), 'w') as f:
+        for line in lines:
+            print(line, file=f)
+    for line in lines:
+        print(line)
+
+
 def main():
     args = get_args()
     backup_xconfig_file(args.xconfig_file, args.config_dir)
@@ -323,6 +399,14 @@ def main():
     all_layers = xparser.read_xconfig_file(args.xconfig_file, existing_layers)
     write_expanded_xconfig_files(args.config_dir, all_layers)
     write_config_files(args.config_dir, all_layers)
+    if args.print_cost_report:
+        write_cost_report(args.config_dir, all_layers,
+                          common_train_lib.principal_chunk_width(
+                              args.frames_per_chunk),
+                          frame_subsampling_factor=args.frame_subsampling_factor,
+                          extra_left_context=args.extra_left_context,
+                          extra_right_context=args.extra_right_context,
+                          frames_per_second=args.frames_per_second)
     check_model_contexts(args.config_dir, args.nnet_edits,
                          existing_model=args.existing_model)
     add_nnet_context_info(args.config_dir, args.nnet_edits,
@@ -194,9 +194,9 @@ EOF
 
   $cmd $graph_dir/log/make_graph.log \
     steps/segmentation/internal/prepare_sad_graph.py $graph_opts \
-      --frame-shift=$(perl -e "print $frame_shift * $frame_subsampling_factor") - \| \
-    fstcompile --isymbols=$graph_dir/words.txt --osymbols=$graph_dir/words.txt '>' \
-      $graph_dir/HCLG.fst
+      --frame-shift=$(perl -e "print $frame_shift * $frame_subsampling_factor") \
+      --binary-output=true --isymbols=$graph_dir/words.txt \
+      --osymbols=$graph_dir/words.txt $graph_dir/HCLG.fst
 fi
 
 ###############################################################################
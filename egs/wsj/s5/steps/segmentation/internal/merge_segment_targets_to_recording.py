@@ -19,6 +19,7 @@ import sys
 
 sys.path.insert(0, 'steps')
 import libs.common as common_lib
+import libs.data_dir as data_dir_lib
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -79,48 +80,25 @@ def get_args():
 
 def read_reco2utt_file(reco2utt_file):
     # Read reco2utt file
-    reco2utt = {}
-    with common_lib.smart_open(reco2utt_file) as fh:
-        for line in fh:
-            parts = line.strip().split()
-            if len(parts) < 2:
-                raise ValueError("Could not parse line {0} in reco2utt "
-                                 "file {1}".format(line, reco2utt_file))
-            reco2utt[parts[0]] = parts[1:]
-    return reco2utt
+    return data_dir_lib.read_table(reco2utt_file, 'reco2utt').to_dict('utts')
 
 
 def read_reco2num_frames_file(reco2num_frames_file):
     # Read reco2num_frames file
-    reco2num_frames = {}
-    with common_lib.smart_open(reco2num_frames_file) as fh:
-        for line in fh:
-            parts = line.strip().split()
-            if len(parts) != 2:
-                raise ValueError("Could not parse line {0} in "
-                                 "reco2num-frames file {1}".format(
-                                     line, reco2num_frames_file))
-            reco2num_frames[parts[0]] = int(parts[1])
-    return reco2num_frames
+    return data_dir_lib.read_table(reco2num_frames_file,
+                                   'reco2num_frames').to_dict('num_frames')
 
 
 def read_segments_file(segments_file, reco2utt):
-    # Read segments from segments file
-    segments = {}
-    with common_lib.smart_open(segments_file) as fh:
-        for line in fh:
-            parts = line.strip().split()
-            if len(parts) not in [4, 5]:
-                raise ValueError("Could not parse line {0} in "
-                                 "segments file {1}".format(line, segments))
-            utt = parts[0]
-            reco = parts[1]
-            if reco not in reco2utt:
-                continue
-            start_time = float(parts[2])
-            end_time = float(parts[3])
-            segments[utt] = [reco, start_time, end_time]
-    return segments
+    # Read segments from segments file, keeping only those of the recordings
+    # in reco2utt.
+    segments = data_dir_lib.read_table(segments_file, 'segments')
+    segments = segments.subset(
+        segments.column('reco').isin(list(reco2utt.keys())))
+    return dict(zip(segments.decode_keys(),
+                    [list(x) for x in zip(segments.decode_column('reco'),
+                                          segments.decode_column('start'),
+                                          segments.decode_column('end'))]))
 
 
 def read_targets_scp(targets_scp, segments):
@@ -6,7 +6,8 @@
 """Prepares a graph with a simple HMM topology for segmentation
 with minimum and maximum speech duration constraints and minimum silence
 duration constraint. The graph is written to the 'output_graph', which
-can be file or "-" for stdout.
+can be file or "-" for stdout, in text form or, with --binary-output=true,
+in the OpenFst binary format.
 """
 
 from __future__ import print_function
@@ -18,7 +19,9 @@ import sys
 import traceback
 
 sys.path.insert(0, 'steps')
+sys.path.insert(0, 'utils/lang/internal')
 import libs.common as common_lib
+from vector_fst import add_binary_output_options, make_fst, write_fst
 
 
 logger = logging.getLogger(__name__)
@@ -64,6 +67,8 @@ def get_args():
                         help="Transition probability for silence to speech "
                         "or vice-versa")
 
+    add_binary_output_options(parser)
+
     parser.add_argument("output_graph", type=str,
                         help="Output graph")
     args = parser.parse_args()
@@ -78,10 +83,12 @@ def get_args():
     return args
 
 
-def print_states(args, file_handle):
+def print_states(args, fst):
+    """Adds the arcs and final-probs of the graph to 'fst', as returned by
+    make_fst() (in text mode, this prints them)."""
     # Initial transition to silence
-    print ("0 1 silence silence {0}".format(-math.log(args.edge_silence_probability)),
-           file=file_handle)
+    fst.add_arc(0, 1, "silence", "silence",
+                -math.log(args.edge_silence_probability))
     silence_start_state = 1
 
     # Silence min duration transitions
@@ -89,73 +96,61 @@ def print_states(args, file_handle):
     # (1 + min_states_silence - 2) -> (1 + min_states_silence - 1)  ...
     for state in range(silence_start_state,
                        silence_start_state + args.min_states_silence - 1):
-        print ("{state} {next_state} silence silence {cost}".format(
-                    state=state, next_state=state + 1, cost=0.0),
-               file=file_handle)
+        fst.add_arc(state, state + 1, "silence", "silence", 0.0)
     silence_last_state = silence_start_state + args.min_states_silence - 1
 
     # Silence self-loop
-    print ("{state} {state} silence silence {cost}".format(
-                state=silence_last_state, cost=0.0),
-           file=file_handle)
+    fst.add_arc(silence_last_state, silence_last_state, "silence", "silence",
+                0.0)
 
     speech_start_state = silence_last_state + 1
     # Initial transition to speech
-    print ("0 {state} speech speech {cost}".format(
-                state=speech_start_state,
-                cost=-math.log(1.0 - args.edge_silence_probability)),
-           file=file_handle)
+    fst.add_arc(0, speech_start_state, "speech", "speech",
+                -math.log(1.0 - args.edge_silence_probability))
 
     # Silence to speech transition
-    print ("{sil_state} {speech_state} speech speech {cost}".format(
-                sil_state=silence_last_state,
-                speech_state=speech_start_state,
-                cost=-math.log(args.transition_probability)),
-           file=file_handle)
+    fst.add_arc(silence_last_state, speech_start_state, "speech", "speech",
+                -math.log(args.transition_probability))
 
     # Speech min duration
     for state in range(speech_start_state,
                        speech_start_state + args.min_states_speech - 1):
-        print ("{state} {next_state} speech speech {cost}".format(
-                    state=state, next_state=state + 1, cost=0.0),
-               file=file_handle)
+        fst.add_arc(state, state + 1, "speech", "speech", 0.0)
 
     # Speech max duration
     for state in range(speech_start_state + args.min_states_speech - 1,
                        speech_start_state + args.max_states_speech - 1):
-        print ("{state} {next_state} speech speech {cost}".format(
-                    state=state, next_state=state + 1, cost=0.0),
-               file=file_handle)
-
-        print ("{state} {sil_state} silence silence {cost}".format(
-                    state=state, sil_state=silence_start_state,
-                    cost=-math.log(args.transition_probability)),
-               file=file_handle)
+        fst.add_arc(state, state + 1, "speech", "speech", 0.0)
+
+        fst.add_arc(state, silence_start_state, "silence", "silence",
+                    -math.log(args.transition_probability))
     speech_last_state = speech_start_state + args.max_states_speech - 1
 
     # Transition to silence after max duration of speech
-    print ("{state} {sil_state} silence silence {cost}".format(
-                state=speech_last_state, sil_state=silence_start_state,
-                cost=0.0),
-           file=file_handle)
+    fst.add_arc(speech_last_state, silence_start_state, "silence", "silence",
+                0.0)
 
     for state in range(1, speech_start_state):
-        print ("{state} {cost}".format(
-                    state=state, cost=-math.log(args.edge_silence_probability)),
-               file=file_handle)
+        fst.set_final(state, -math.log(args.edge_silence_probability))
 
     for state in range(speech_start_state, speech_last_state + 1):
-        print ("{state} {cost}".format(
-                    state=state,
-                    cost=-math.log(1.0 - args.edge_silence_probability)),
-               file=file_handle)
+        fst.set_final(state, -math.log(1.0 - args.edge_silence_probability))
 
 
 def main():
     try:
         args = get_args()
-        with common_lib.smart_open(args.output_graph, 'w') as f:
-            print_states(args, f)
+        if args.binary_output == "true":
+            fst = make_fst(args)
+            print_states(args, fst)
+            if args.output_graph == "-":
+                write_fst(fst, args)
+            else:
+                with open(args.output_graph, 'wb') as f:
+                    write_fst(fst, args, f)
+        else:
+            with common_lib.smart_open(args.output_graph, 'w') as f:
+                print_states(args, make_fst(args, f, separator=' '))
     except Exception:
         raise
 
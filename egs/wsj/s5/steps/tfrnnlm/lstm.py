@@ -48,6 +48,10 @@ flags.DEFINE_string("save_path", None,
                     "Model output directory.")
 flags.DEFINE_bool("use_fp16", False,
                   "Train using 16-bit floats instead of 32bit floats")
+flags.DEFINE_bool("use_memmap", False,
+                  "Convert the data to word-ids once, store them in memory-mapped "
+                  "files next to the wordlist and feed batches from them, "
+                  "instead of loading the whole corpus into memory")
 
 FLAGS = flags.FLAGS
 
@@ -74,9 +78,19 @@ class RnnlmInput(object):
   def __init__(self, config, data, name=None):
     self.batch_size = batch_size = config.batch_size
     self.num_steps = num_steps = config.num_steps
-    self.epoch_size = ((len(data) // batch_size) - 1) // num_steps
-    self.input_data, self.targets = reader.rnnlm_producer(
-        data, batch_size, num_steps, name=name)
+    if FLAGS.use_memmap:
+      self.iterator = reader.RnnlmBatchIterator(data, batch_size, num_steps)
+      self.epoch_size = self.iterator.epoch_size
+      with tf.name_scope(name, "RNNLMInput"):
+        self.input_data = tf.placeholder(tf.int32, [batch_size, num_steps],
+                                         name="input_data")
+        self.targets = tf.placeholder(tf.int32, [batch_size, num_steps],
+                                      name="targets")
+    else:
+      self.iterator = None
+      self.epoch_size = ((len(data) // batch_size) - 1) // num_steps
+      self.input_data, self.targets = reader.rnnlm_producer(
+          data, batch_size, num_steps, name=name)
 
 
 class RnnlmModel(object):
@@ -251,8 +265,16 @@ def run_epoch(session, model, eval_op=None, verbose=False):
   if eval_op is not None:
     fetches["eval_op"] = eval_op
 
+  batches = None
+  if model.input.iterator is not None:
+    batches = iter(model.input.iterator)
+
   for step in range(model.input.epoch_size):
     feed_dict = {}
+    if batches is not None:
+      x, y = next(batches)
+      feed_dict[model.input.input_data] = x
+      feed_dict[model.input.targets] = y
     for i, (c, h) in enumerate(model.initial_state):
       feed_dict[c] = state[i].c
       feed_dict[h] = state[i].h
@@ -279,7 +301,10 @@ def main(_):
   if not FLAGS.data_path:
     raise ValueError("Must set --data_path to RNNLM data directory")
 
-  raw_data = reader.rnnlm_raw_data(FLAGS.data_path, FLAGS.vocab_path)
+  if FLAGS.use_memmap:
+    raw_data = reader.rnnlm_memmap_data(FLAGS.data_path, FLAGS.vocab_path)
+  else:
+    raw_data = reader.rnnlm_raw_data(FLAGS.data_path, FLAGS.vocab_path)
   train_data, valid_data, _, word_map = raw_data
 
   config = get_config()
@@ -21,10 +21,18 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import io
 import os
+import threading
 
+import numpy as np
 import tensorflow as tf
 
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
 def _read_words(filename):
   with tf.gfile.GFile(filename, "r") as f:
     return f.read().decode("utf-8").split()
@@ -61,6 +69,115 @@ def rnnlm_raw_data(data_path, vocab_path):
   return train_data, valid_data, vocabulary, word_to_id
 
 
+def _word_ids_path(vocab_path, name):
+  return "%s.%s.ids.npy" % (vocab_path, name)
+
+
+def rnnlm_write_word_ids(text_path, word_to_id, ids_path):
+  """Converts a text file to word-ids and writes them to a uint32 .npy file.
+
+  The text is read line by line twice (once to count the tokens and once to
+  fill in the ids), so memory use does not depend on the size of the corpus.
+  Words that are not in word_to_id are skipped, as in _file_to_word_ids.
+  """
+  def _line_ids(f):
+    for line in f:
+      ids = [word_to_id[word] for word in line.split() if word in word_to_id]
+      if ids:
+        yield ids
+
+  with io.open(text_path, "r", encoding="utf-8") as f:
+    num_tokens = sum(len(ids) for ids in _line_ids(f))
+
+  tmp_path = ids_path + ".tmp"
+  out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint32,
+                                  shape=(num_tokens,))
+  pos = 0
+  with io.open(text_path, "r", encoding="utf-8") as f:
+    for ids in _line_ids(f):
+      out[pos : pos + len(ids)] = ids
+      pos += len(ids)
+  assert pos == num_tokens
+  out.flush()
+  del out
+  os.rename(tmp_path, ids_path)
+
+
+def rnnlm_memmap_data(data_path, vocab_path):
+  """Like rnnlm_raw_data, but returns the train/valid data as memory-mapped
+  uint32 arrays.
+
+  The word-ids are written once to <vocab_path>.train.ids.npy and
+  <vocab_path>.valid.ids.npy, and rewritten only if the text or vocabulary
+  file is newer than them, so the corpus is never held in memory.
+
+  Returns:
+    tuple (train_data, valid_data, vocabulary, word_to_id)
+    where each of the data objects can be passed to RnnlmBatchIterator.
+  """
+  word_to_id = _build_vocab(vocab_path)
+  data = []
+  for name in ["train", "valid"]:
+    text_path = os.path.join(data_path, name)
+    ids_path = _word_ids_path(vocab_path, name)
+    if (not os.path.exists(ids_path)
+        or os.path.getmtime(ids_path) < os.path.getmtime(text_path)
+        or os.path.getmtime(ids_path) < os.path.getmtime(vocab_path)):
+      rnnlm_write_word_ids(text_path, word_to_id, ids_path)
+    data.append(np.load(ids_path, mmap_mode="r"))
+  return data[0], data[1], len(word_to_id), word_to_id
+
+
+class RnnlmBatchIterator(object):
+  """Iterates over batches of (memory-mapped) RNNLM data on the host.
+
+  This produces the same batches as rnnlm_producer, but as numpy arrays to be
+  fed to placeholders, so that the data never has to be converted into one
+  large tensor. Only the current batch is copied out of raw_data; if prefetch
+  is True the next batch is read in a background thread while the current
+  one is being used.
+  """
+
+  def __init__(self, raw_data, batch_size, num_steps, prefetch=True):
+    raw_data = np.asarray(raw_data)
+    batch_len = len(raw_data) // batch_size
+    self._data = raw_data[0 : batch_size * batch_len].reshape(
+        [batch_size, batch_len])
+    self.batch_size = batch_size
+    self.num_steps = num_steps
+    self.epoch_size = (batch_len - 1) // num_steps
+    if self.epoch_size <= 0:
+      raise ValueError("epoch_size == 0, decrease batch_size or num_steps")
+    self.prefetch = prefetch
+
+  def _batch(self, i):
+    n = self.num_steps
+    x = np.array(self._data[:, i * n : (i + 1) * n], dtype=np.int32)
+    y = np.array(self._data[:, i * n + 1 : (i + 1) * n + 1], dtype=np.int32)
+    return x, y
+
+  def __iter__(self):
+    if not self.prefetch:
+      for i in range(self.epoch_size):
+        yield self._batch(i)
+      return
+
+    batches = queue.Queue(maxsize=1)
+    def _fill():
+      for i in range(self.epoch_size):
+        batches.put(self._batch(i))
+      batches.put(None)
+    thread = threading.Thread(target=_fill)
+    thread.daemon = True
+    thread.start()
+    while True:
+      batch = batches.get()
+      if batch is None:
+        break
+      yield batch
+    thread.join()
+
+
 def rnnlm_producer(raw_data, batch_size, num_steps, name=None):
   """Iterate on the raw RNNLM data.
 
@@ -6,10 +6,15 @@
 
 from __future__ import print_function
 import argparse
+import itertools
 import logging
+import re
 import sys
 import textwrap
 
+import numpy as np
+
+
 def get_args():
     parser = argparse.ArgumentParser(
         description=textwrap.dedent("""
@@ -27,7 +32,24 @@ def get_args():
 
         The output is written to stdout. The resulting file can be
         passed to utils/data/subsegment_data_dir.sh to sub-segment
-        the data directory."""),
+        the data directory.
+
+        With --output-feats-scp, the feats.scp of the sub-segmented
+        data directory is also written, with the rows of the features
+        of the utterances selected by ranges as in
+        utils/data/subsegment_data_dir.sh, which can then use it
+        instead of working it out again; e.g.:
+
+        get_uniform_subsegments.py --feats-scp data/dev/feats.scp \\
+            --utt2num-frames data/dev/utt2num_frames \\
+            --frame-shift $(utils/data/get_frame_shift.sh data/dev) \\
+            --output-feats-scp data/dev_uniform_segments/sub_feats.scp \\
+            data/dev/segments > data/dev_uniform_segments/sub_segments
+
+        utils/data/subsegment_data_dir.sh \\
+            --subsegment-feats-scp data/dev_uniform_segments/sub_feats.scp \\
+            data/dev data/dev_uniform_segments/sub_segments \\
+            data/dev_uniform_segments"""),
         formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument("--max-segment-duration", type=float,
                         default=30, help="""Maximum duration of the
@@ -44,55 +66,276 @@ def get_args():
                         a start time max-segment-duration before the
                         end to force a constant segment duration. This
                         overrides the max-remaining-duration parameter""")
+    parser.add_argument("--feats-scp", type=str,
+                        help="""The feats.scp of the data directory of the
+                        segments file; required with --output-feats-scp""")
+    parser.add_argument("--utt2num-frames", type=str,
+                        help="""The utt2num_frames of the data directory; if
+                        given, the ranges are limited to the number of frames
+                        of the utterances""")
+    parser.add_argument("--frame-shift", type=float, default=0.01,
+                        help="""Frame shift of the features (in seconds)""")
+    parser.add_argument("--output-feats-scp", type=argparse.FileType('w'),
+                        help="""If given, the feats.scp of the subsegments
+                        is written to this file""")
     parser.add_argument("segments_file", type=argparse.FileType('r'),
                         help="""Input kaldi segments file""")
 
     args = parser.parse_args()
+
+    if args.output_feats_scp is not None and args.feats_scp is None:
+        raise ValueError("--feats-scp is required with --output-feats-scp")
     return args
 
 
-def run(args):
+def read_segments(segments_file, chunk_size=100000):
+    """Yields tuples (utt_ids, start_times, end_times) for chunks of up to
+    chunk_size lines of the segments file."""
+    utt_ids = []
+    start_times = []
+    end_times = []
+    for line in segments_file:
+        parts = line.strip().split()
+        utt_ids.append(parts[0])
+        start_times.append(float(parts[2]))
+        end_times.append(float(parts[3]))
+        if len(utt_ids) == chunk_size:
+            yield utt_ids, np.array(start_times), np.array(end_times)
+            utt_ids = []
+            start_times = []
+            end_times = []
+    if len(utt_ids) > 0:
+        yield utt_ids, np.array(start_times), np.array(end_times)
+
+
+def get_subsegments(start_times, end_times, args):
+    """Returns the subsegments of the segments with times 'start_times'
+    and 'end_times' as a tuple of arrays (segment index, start time in the
+    subsegment-id, end time in the subsegment-id, start time, end time), in
+    the order they are written.  The times are relative to the starts of the
+    segments, and the times in the subsegment-ids are in centiseconds.
+
+    The windows of all the segments are computed together.  The start time
+    and the remaining duration are accumulated one window at a time, as in
+    a loop over the windows, so that the times are the same to the last bit
+    as those of earlier versions of this script."""
+    step = args.max_segment_duration - args.overlap_duration
+    if step <= 0:
+        raise ValueError("--overlap-duration must be less than "
+                         "--max-segment-duration")
     if (args.constant_duration):
         dur_threshold = args.max_segment_duration
     else:
         dur_threshold = args.max_segment_duration + args.max_remaining_duration
 
-    for line in args.segments_file:
-        parts = line.strip().split()
-        utt_id = parts[0]
-        start_time = float(parts[2])
-        end_time = float(parts[3])
-
-        dur = end_time - start_time
-
-        start = start_time
-        while (dur > dur_threshold):
-            end = start + args.max_segment_duration
-            start_relative = start - start_time
-            end_relative = end - start_time
-            new_utt = "{utt_id}-{s:08d}-{e:08d}".format(
-                utt_id=utt_id, s=int(100 * start_relative),
-                e=int(100 * end_relative))
-            print ("{new_utt} {utt_id} {s:.3f} {e:.3f}".format(
-                new_utt=new_utt, utt_id=utt_id, s=start_relative,
-                e=start_relative + args.max_segment_duration))
-            start += args.max_segment_duration - args.overlap_duration
-            dur -= args.max_segment_duration - args.overlap_duration
-
-        if (args.constant_duration):
-            if (dur < 0):
-              continue
-            if (dur < args.max_remaining_duration):
-              start = max(end_time - args.max_segment_duration, start_time)
-            end = min(start + args.max_segment_duration, end_time)
-        else:
-            end = end_time
-        new_utt = "{utt_id}-{s:08d}-{e:08d}".format(
-            utt_id=utt_id, s=int(round(100 * (start - start_time))),
-            e=int(round(100 * (end - start_time))))
-        print ("{new_utt} {utt_id} {s:.3f} {e:.3f}".format(
-            new_utt=new_utt, utt_id=utt_id, s=start - start_time,
-            e=end - start_time))
+    num_segments = len(start_times)
+    durs = end_times - start_times
+    num_windows = np.zeros(num_segments, dtype=np.int64)
+    final_starts = start_times.copy()
+    final_durs = durs.copy()
+    window_segments = []
+    window_indexes = []
+    window_starts = []
+
+    # The segments are grouped by the (estimated) number of windows before
+    # the final one, so that their windows can be computed as a matrix.
+    est_num_windows = np.maximum(
+        np.ceil((durs - dur_threshold) / step), 0).astype(np.int64)
+    order = np.argsort(est_num_windows, kind='mergesort')
+    values, group_starts = np.unique(est_num_windows[order],
+                                     return_index=True)
+    group_ends = np.append(group_starts[1:], num_segments)
+    for n, group_start, group_end in zip(values, group_starts, group_ends):
+        segments = order[group_start:group_end]
+        rows = np.arange(len(segments))
+        shifts = np.full((len(segments), n + 2), step, dtype=np.float64)
+        shifts[:, 0] = start_times[segments]
+        starts = np.add.accumulate(shifts, axis=1)
+        shifts[:, 0] = durs[segments]
+        shifts[:, 1:] = -step
+        remaining = np.add.accumulate(shifts, axis=1)
+        num = np.sum(remaining > dur_threshold, axis=1)
+        if np.any(num > n + 1):
+            raise Exception("Unexpected number of windows; this is a bug.")
+        num_windows[segments] = num
+        final_starts[segments] = starts[rows, num]
+        final_durs[segments] = remaining[rows, num]
+        window_rows, window_cols = np.nonzero(
+            np.arange(n + 1)[np.newaxis, :] < num[:, np.newaxis])
+        window_segments.append(segments[window_rows])
+        window_indexes.append(window_cols)
+        window_starts.append(starts[window_rows, window_cols])
+    window_segments = np.concatenate(window_segments)
+    window_indexes = np.concatenate(window_indexes)
+    window_starts = np.concatenate(window_starts)
+
+    if (args.constant_duration):
+        keep = ~(final_durs < 0)
+        final_starts = np.where(
+            final_durs < args.max_remaining_duration,
+            np.maximum(end_times - args.max_segment_duration, start_times),
+            final_starts)
+        final_ends = np.minimum(final_starts + args.max_segment_duration,
+                                end_times)
+    else:
+        keep = np.ones(num_segments, dtype=bool)
+        final_ends = end_times
+
+    # Work out where each subsegment goes in the output, so that the
+    # subsegments of a segment are together and in order.
+    num_subsegments = num_windows + keep
+    offsets = np.cumsum(num_subsegments) - num_subsegments
+    total = int(np.sum(num_subsegments))
+    segment_index = np.zeros(total, dtype=np.int64)
+    start_ids = np.zeros(total, dtype=np.int64)
+    end_ids = np.zeros(total, dtype=np.int64)
+    subsegment_starts = np.zeros(total)
+    subsegment_ends = np.zeros(total)
+
+    pos = offsets[window_segments] + window_indexes
+    start_relative = window_starts - start_times[window_segments]
+    end_relative = ((window_starts + args.max_segment_duration)
+                    - start_times[window_segments])
+    segment_index[pos] = window_segments
+    start_ids[pos] = np.trunc(100 * start_relative)
+    end_ids[pos] = np.trunc(100 * end_relative)
+    subsegment_starts[pos] = start_relative
+    subsegment_ends[pos] = start_relative + args.max_segment_duration
+
+    kept = np.nonzero(keep)[0]
+    pos = offsets[kept] + num_windows[kept]
+    start_relative = final_starts[kept] - start_times[kept]
+    end_relative = final_ends[kept] - start_times[kept]
+    segment_index[pos] = kept
+    start_ids[pos] = np.round(100 * start_relative)
+    end_ids[pos] = np.round(100 * end_relative)
+    subsegment_starts[pos] = start_relative
+    subsegment_ends[pos] = end_relative
+
+    return (segment_index, start_ids, end_ids, subsegment_starts,
+            subsegment_ends)
+
+
+def write_subsegments(out_file, utt_ids, segment_index, start_ids, end_ids,
+                      starts, ends):
+    if len(segment_index) == 0:
+        return
+    # A single formatting operation for all the lines is a lot faster than
+    # formatting them one by one.
+    utts = [utt_ids[i] for i in segment_index.tolist()]
+    values = zip(utts, start_ids.tolist(), end_ids.tolist(), utts,
+                 starts.tolist(), ends.tolist())
+    out_file.write(("%s-%08d-%08d %s %.3f %.3f\n" * len(utts))
+                   % tuple(itertools.chain.from_iterable(values)))
+
+
+def round_as_printed(times):
+    """Returns 'times' rounded to milliseconds, exactly as they are when
+    printed with '%.3f' and read back."""
+    millisecs = times * 1000
+    rounded = np.round(millisecs)
+    # millisecs is not exact, so the few times that are close to halfway
+    # between two milliseconds are rounded as they are printed.
+    for i in np.nonzero(np.abs(millisecs - np.floor(millisecs) - 0.5)
+                        < 1e-6)[0]:
+        rounded[i] = int(("%.3f" % times[i]).replace('.', ''))
+    return rounded / 1000
+
+
+def read_feats_scp(feats_scp, utt2num_frames=None):
+    """Reads the feats.scp 'feats_scp' and returns a dict from utterance-id to
+    a tuple (rxfilename without its row range, first row of the range,
+    last row of the range, column range).  The last row is limited to the
+    number of frames from 'utt2num_frames', if given, minus one; it is
+    infinite if there is neither.  The column range is a string ',a:b' or
+    ''."""
+    num_frames = {}
+    if utt2num_frames is not None:
+        with open(utt2num_frames) as f:
+            for line in f:
+                parts = line.split()
+                num_frames[parts[0]] = int(parts[1])
+
+    feats = {}
+    with open(feats_scp) as f:
+        for line in f:
+            parts = line.split()
+            utt_id = parts[0]
+            rxfilename = " ".join(parts[1:])
+            first_row = 0
+            last_row = num_frames.get(utt_id, np.inf) - 1
+            col_range = ""
+            m = re.search(r"\[([^][]*)\]$", rxfilename)
+            if m is not None:
+                if re.search(r"concat-feats ", rxfilename):
+                    raise Exception("Cannot add a range to a concat-feats "
+                                    "command: {0}".format(line.strip()))
+                m2 = re.match(r"^((\d+):(\d+)|)(,\d+:\d+|)$", m.group(1))
+                if m2 is None:
+                    raise Exception("Could not make sense of the range in "
+                                    "line {0}".format(line.strip()))
+                rxfilename = rxfilename[:m.start()]
+                col_range = m2.group(4)
+                if m2.group(1) != "":
+                    first_row = int(m2.group(2))
+                    last_row = min(first_row + last_row,
+                                   int(m2.group(3)))
+            feats[utt_id] = (rxfilename, first_row, last_row, col_range)
+    return feats
+
+
+def write_subsegment_feats(out_file, feats, frame_shift, utt_ids,
+                           segment_index, start_ids, end_ids, starts, ends):
+    """Writes the lines <subsegment-id> <rxfilename>[<first>:<last>] of the
+    feats.scp of the subsegments, with the same ranges that
+    utils/data/subsegment_data_dir.sh would work out from the subsegments
+    file."""
+    if len(segment_index) == 0:
+        return
+    feats_index = {}
+    rxfilenames = []
+    ranges = []
+    for utt_id in utt_ids:
+        if utt_id not in feats_index:
+            if utt_id not in feats:
+                raise Exception("No features for {0}".format(utt_id))
+            feats_index[utt_id] = len(rxfilenames)
+            rxfilename, first_row, last_row, col_range = feats[utt_id]
+            rxfilenames.append(rxfilename.replace("%", "%%")
+                               + "[%d:%d" + col_range + "]\n")
+            ranges.append((first_row, last_row))
+    segment_feats = np.array([feats_index[u] for u in utt_ids])
+    ranges = np.array(ranges, dtype=np.float64)
+
+    index = segment_feats[segment_index]
+    first_rows = ranges[index, 0]
+    last_rows = ranges[index, 1]
+    first = (np.trunc(round_as_printed(starts) / frame_shift + 0.5)
+             + first_rows)
+    last = np.minimum(
+        np.trunc(round_as_printed(ends) / frame_shift - 0.5) + first_rows,
+        last_rows)
+
+    fmts = [rxfilenames[i] for i in index.tolist()]
+    values = zip(segment_index.tolist(), start_ids.tolist(),
+                 end_ids.tolist(), first.astype(np.int64).tolist(),
+                 last.astype(np.int64).tolist())
+    out_file.write("".join(
+        ("%s-%08d-%08d " % (utt_ids[i], s, e)) + (fmt % (f, l))
+        for fmt, (i, s, e, f, l) in zip(fmts, values)))
+
+
+def run(args):
+    feats = None
+    if args.output_feats_scp is not None:
+        feats = read_feats_scp(args.feats_scp, args.utt2num_frames)
+
+    for utt_ids, start_times, end_times in read_segments(args.segments_file):
+        subsegments = get_subsegments(start_times, end_times, args)
+        write_subsegments(sys.stdout, utt_ids, *subsegments)
+        if feats is not None:
+            write_subsegment_feats(args.output_feats_scp, feats,
+                                   args.frame_shift, utt_ids, *subsegments)
 
 
 def main():
@@ -104,6 +347,8 @@ def main():
         raise SystemExit(1)
     finally:
         args.segments_file.close()
+        if args.output_feats_scp is not None:
+            args.output_feats_scp.close()
 
 
 if __name__ == '__main__':
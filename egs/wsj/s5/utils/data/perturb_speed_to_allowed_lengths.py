@@ -17,6 +17,7 @@ import logging
 
 sys.path.insert(0, 'steps')
 import libs.common as common_lib
+import libs.data_dir as data_dir_lib
 
 logger = logging.getLogger('libs')
 logger.setLevel(logging.INFO)
@@ -85,7 +86,8 @@ class Utterance(object):
 
 def read_kaldi_datadir(dir):
     """ Read a data directory like
-        data/train as a list of utterances
+        data/train as a list of utterances, sorted by utterance-id.
+        Raises an exception if any of the files has a duplicate key.
     """
 
     # check to make sure that no segments file exists as this script won't work
@@ -99,19 +101,21 @@ def read_kaldi_datadir(dir):
         sys.exit(1)
 
     logger.info("Loading the data from {}...".format(dir))
-    utterances = []
-    wav_scp = read_kaldi_mapfile(os.path.join(dir, 'wav.scp'))
-    text = read_kaldi_mapfile(os.path.join(dir, 'text'))
-    utt2dur = read_kaldi_mapfile(os.path.join(dir, 'utt2dur'))
-    utt2spk = read_kaldi_mapfile(os.path.join(dir, 'utt2spk'))
-
-    num_fail = 0
-    for utt in wav_scp:
-        if utt in text and utt in utt2dur and utt in utt2spk:
-            utterances.append(Utterance(utt, wav_scp[utt], utt2spk[utt],
-                                  text[utt], utt2dur[utt]))
-        else:
-            num_fail += 1
+    data = data_dir_lib.DataDir(dir, encoding='latin-1')
+    wav_scp = data['wav.scp']
+    text = data['text']
+    utt2dur = data['utt2dur']
+    utt2spk = data['utt2spk']
+
+    _, (wav_index, text_index, dur_index, spk_index) = data_dir_lib.join(
+        wav_scp, text, utt2dur, utt2spk)
+    utterances = [Utterance(*x) for x in zip(
+        wav_scp.subset(wav_index).decode_keys(),
+        wav_scp.subset(wav_index).decode_column('rxfile'),
+        utt2spk.subset(spk_index).decode_column('spk'),
+        text.subset(text_index).decode_column('text'),
+        utt2dur.column('dur')[dur_index].tolist())]
+    num_fail = len(wav_scp) - len(utterances)
 
     if float(len(utterances)) / len(wav_scp) < 0.5:
         logger.info("More than half your data is problematic. Try "
@@ -123,20 +127,6 @@ def read_kaldi_datadir(dir):
     return utterances
 
 
-def read_kaldi_mapfile(path):
-    """ Read any Kaldi mapping file - like text, .scp files, etc.
-    """
-
-    m = {}
-    with open(path, 'r', encoding='latin-1') as f:
-        for line in f:
-            line = line.strip(" \t\r\n")
-            sp_pos = line.find(' ')
-            key = line[:sp_pos]
-            val = line[sp_pos+1:]
-            m[key] = val
-    return m
-
 def generate_kaldi_data_files(utterances, outdir):
     """ Write out a list of utterances as Kaldi data files into an
         output data directory.
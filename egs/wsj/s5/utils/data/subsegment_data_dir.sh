@@ -23,6 +23,7 @@
 segment_end_padding=0.0
 cmd=run.pl
 nj=1
+subsegment_feats_scp=
 
 . utils/parse_options.sh
 
@@ -44,6 +45,10 @@ if [ $# != 4 ] && [ $# != 3 ]; then
   echo "                                             # not just applied to the input segments file, is that"
   echo "                                             # for purposes of computing the num-frames of the parts of"
   echo "                                             # matrices in feats.scp, the padding should not be done."
+  echo "  --subsegment-feats-scp <feats-scp>         # If provided, the feats.scp of <destdir>, with the"
+  echo "                                             # frame ranges already worked out, e.g. by"
+  echo "                                             # utils/data/get_uniform_subsegments.py --output-feats-scp;"
+  echo "                                             # it is copied instead of being created here."
   echo "  See also: resolve_ctm_overlaps.py"
   exit 1;
 fi
@@ -183,20 +188,32 @@ if [ -f $srcdir/feats.scp ]; then
 
   # Here, we computes the maximum 'end' frame allowed for each <new-utt-id>.
   # This is equal to the number of frames in the feature archive for <old-utt-id>.
-  if [ ! -f $srcdir/utt2num_frames ]; then
-    echo "$0: WARNING: Could not find $srcdir/utt2num_frames. It might take a long time to run get_utt2num_frames.sh."
-    echo "Increase the number of jobs or write this file while extracting features by passing --write-utt2num-frames true to steps/make_mfcc.sh etc."
+  # It is not needed if the feats.scp is given with --subsegment-feats-scp
+  # (and there is no vad.scp).
+  if [ -z "$subsegment_feats_scp" ] || [ -f $srcdir/vad.scp ]; then
+    if [ ! -f $srcdir/utt2num_frames ]; then
+      echo "$0: WARNING: Could not find $srcdir/utt2num_frames. It might take a long time to run get_utt2num_frames.sh."
+      echo "Increase the number of jobs or write this file while extracting features by passing --write-utt2num-frames true to steps/make_mfcc.sh etc."
+    fi
+    utils/data/get_utt2num_frames.sh --cmd "$cmd" --nj $nj $srcdir
+    awk '{print $1" "$2}' $subsegments | \
+      utils/apply_map.pl -f 2 $srcdir/utt2num_frames > \
+      $dir/utt2max_frames
+  fi
+
+  if [ -n "$subsegment_feats_scp" ]; then
+    if ! cmp <(awk '{print $1}' <$subsegments) <(awk '{print $1}' <$subsegment_feats_scp); then
+      echo "$0: expected the first fields of the files $subsegments and $subsegment_feats_scp to be identical"
+      exit 1
+    fi
+    cp $subsegment_feats_scp $dir/feats.scp
+  else
+    awk -v s=$frame_shift '{print $1, $2, int(($3/s)+0.5), int(($4/s)-0.5);}' <$subsegments| \
+      utils/apply_map.pl -f 2 $srcdir/feats.scp | \
+      awk '{p=NF-1; for (n=1;n<NF-2;n++) printf("%s ", $n); k=NF-2; l=NF-1; printf("%s[%d:%d]\n", $k, $l, $NF)}' | \
+      utils/data/fix_subsegment_feats.pl $dir/utt2max_frames | \
+      utils/data/normalize_data_range.pl >$dir/feats.scp || { echo "Failed to create $dir/feats.scp" && exit; }
   fi
-  utils/data/get_utt2num_frames.sh --cmd "$cmd" --nj $nj $srcdir
-  awk '{print $1" "$2}' $subsegments | \
-    utils/apply_map.pl -f 2 $srcdir/utt2num_frames > \
-    $dir/utt2max_frames
-
-  awk -v s=$frame_shift '{print $1, $2, int(($3/s)+0.5), int(($4/s)-0.5);}' <$subsegments| \
-    utils/apply_map.pl -f 2 $srcdir/feats.scp | \
-    awk '{p=NF-1; for (n=1;n<NF-2;n++) printf("%s ", $n); k=NF-2; l=NF-1; printf("%s[%d:%d]\n", $k, $l, $NF)}' | \
-    utils/data/fix_subsegment_feats.pl $dir/utt2max_frames | \
-    utils/data/normalize_data_range.pl >$dir/feats.scp || { echo "Failed to create $dir/feats.scp" && exit; }
 
   # Parse the frame ranges from feats.scp, which is in the form of [first-frame:last-frame]
   # and write the number-of-frames = last-frame - first-frame + 1 for the utterance.
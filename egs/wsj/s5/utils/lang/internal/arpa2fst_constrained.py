@@ -9,6 +9,7 @@ import sys
 import argparse
 import math
 from collections import defaultdict
+from vector_fst import add_binary_output_options, make_fst, write_fst
 
 # note, this was originally based
 
@@ -22,7 +23,8 @@ This is useful for phone-level language models in order to keep
 graphs small and impose things like linguistic constraints on
 allowable phone sequences.
 This script writes its output to the stdout.  It is a text-form FST,
-suitable for compilation by fstcompile.
+suitable for compilation by fstcompile (or, with --binary-output=true,
+the FST compiled as fstcompile would do it).
 """)
 
 
@@ -38,6 +40,7 @@ parser.add_argument('allowed_bigrams_in', type = str,
                     "pairs like 'foo bar'.")
 parser.add_argument('--verbose', type = int, default = 0,
                     choices=[0,1,2,3,4,5], help = 'Verbose level')
+add_binary_output_options(parser)
 
 args = parser.parse_args()
 
@@ -234,12 +237,15 @@ class ArpaModel(object):
 
         return (hist_to_state, state_to_hist)
 
-    # This function prints the estimated language model as an FST.
+    # This function prints the estimated language model as an FST, or rather
+    # adds its arcs and final-probs to 'fst', as returned by make_fst() (in text
+    # mode, this prints them).  The costs are rounded to 3 decimals in either
+    # case.
     # disambig_symbol will be something like '#0' (a symbol introduced
     # to make the result determinizable).
     # bigram_map represent the allowed bigrams (left-word, right-word): it's a map
     # from left-word to a set of right-words (both are strings).
-    def PrintAsFst(self, disambig_symbol, bigram_map):
+    def PrintAsFst(self, disambig_symbol, bigram_map, fst):
         # History will map from history (as a tuple) to integer FST-state.
         (hist_to_state, state_to_hist) = self.GetHistToStateMap()
 
@@ -275,12 +281,12 @@ class ArpaModel(object):
                             sys.argv[0], cost, context_word, word), file=sys.stderr)
                     if word == '</s>':
                         # print the final-prob of this state.
-                        print("%d %.3f" % (state, cost))
+                        fst.set_final(state, float("%.3f" % cost))
                     else:
                         next_state = self.GetStateForHist(hist_to_state,
                                                           (context_word, word))
-                        print("%d %d %s %s %.3f" %
-                              (state, next_state, word, word, cost))
+                        fst.add_arc(state, next_state, word, word,
+                                    float("%.3f" % cost))
             else:  # it's a higher-order than bigram state.
                 assert hist in self.orders[hist_len]
                 hist_state = self.orders[hist_len][hist]
@@ -299,12 +305,12 @@ class ArpaModel(object):
                         continue
                     if word == '</s>':
                         # print the final-prob of this state.
-                        print("%d %.3f" % (state, cost))
+                        fst.set_final(state, float("%.3f" % cost))
                     else:
                         next_state = self.GetStateForHist(hist_to_state,
                                                           (hist) + (word,))
-                        print("%d %d %s %s %.3f" %
-                              (state, next_state, word, word, cost))
+                        fst.add_arc(state, next_state, word, word,
+                                    float("%.3f" % cost))
                 # Now deal with the backoff probability of this state (back off
                 # to the lower-order state).
                 assert hist in self.orders[hist_len]
@@ -321,8 +327,8 @@ class ArpaModel(object):
                 # For hist-states that completely back off (they have no words coming out of them),
                 # there is no need to disambiguate, we can print an epsilon that will later be removed.
                 this_disambig_symbol = disambig_symbol if len(hist_state.word_to_prob) != 0 else '<eps>'
-                print("%d %d %s <eps> %.3f" %
-                      (state, backoff_state, this_disambig_symbol, cost))
+                fst.add_arc(state, backoff_state, this_disambig_symbol, '<eps>',
+                            float("%.3f" % cost))
         if args.verbose >= 1:
             for hist_len in range(1, len(self.orders)):
                 num_states = normalization_stats[hist_len][0]
@@ -392,4 +398,6 @@ bigrams_map = ReadBigramMap(args.allowed_bigrams_in)
 if len(args.disambig_symbol.split()) != 1:
     sys.exit("{0}: invalid option --disambig-symbol={1}".format(
         sys.argv[0], args.disambig_symbol))
-arpa_model.PrintAsFst(args.disambig_symbol, bigrams_map)
+fst = make_fst(args, separator = ' ', weight_format = '{0:.3f}')
+arpa_model.PrintAsFst(args.disambig_symbol, bigrams_map, fst)
+write_fst(fst, args)
@@ -0,0 +1,599 @@
+# Copyright 2018  Johns Hopkins University
+# Apache 2.0.
+
+""" This module is used by the scripts that create FSTs in python (e.g.
+utils/lang/make_lexicon_fst.py) to write them directly in the OpenFst binary
+format, instead of printing the text form of the FST to be compiled by
+fstcompile.
+
+The scripts add the arcs and final-probs to a VectorFst (or, in text mode, to a
+TextFst that prints them in the old way), in the same order in which they
+would print the lines of the text form.  The binary FST that is written is the
+same, byte for byte, as the one fstcompile would write from that text (with
+the default options, i.e. states renumbered in order of appearance and no
+symbol tables kept), and if a sort type is given, as the one fstarcsort would
+then write.  (Like fstarcsort in OpenFst 1.7 and later, we break ties on the
+other label; older versions may order the arcs with the same label
+differently, which gives an equivalent FST).
+"""
+
+from __future__ import print_function
+import struct
+import sys
+from array import array
+
+
+# The FST properties, as in OpenFst's fst/properties.h.
+EXPANDED = 0x1
+MUTABLE = 0x2
+ERROR = 0x4
+ACCEPTOR = 0x10000
+NOT_ACCEPTOR = 0x20000
+I_DETERMINISTIC = 0x40000
+NON_I_DETERMINISTIC = 0x80000
+O_DETERMINISTIC = 0x100000
+NON_O_DETERMINISTIC = 0x200000
+EPSILONS = 0x400000
+NO_EPSILONS = 0x800000
+I_EPSILONS = 0x1000000
+NO_I_EPSILONS = 0x2000000
+O_EPSILONS = 0x4000000
+NO_O_EPSILONS = 0x8000000
+I_LABEL_SORTED = 0x10000000
+NOT_I_LABEL_SORTED = 0x20000000
+O_LABEL_SORTED = 0x40000000
+NOT_O_LABEL_SORTED = 0x80000000
+WEIGHTED = 0x100000000
+UNWEIGHTED = 0x200000000
+CYCLIC = 0x400000000
+ACYCLIC = 0x800000000
+INITIAL_CYCLIC = 0x1000000000
+INITIAL_ACYCLIC = 0x2000000000
+TOP_SORTED = 0x4000000000
+NOT_TOP_SORTED = 0x8000000000
+ACCESSIBLE = 0x10000000000
+NOT_ACCESSIBLE = 0x20000000000
+COACCESSIBLE = 0x40000000000
+NOT_COACCESSIBLE = 0x80000000000
+STRING = 0x100000000000
+NOT_STRING = 0x200000000000
+WEIGHTED_CYCLES = 0x400000000000
+UNWEIGHTED_CYCLES = 0x800000000000
+
+NULL_PROPERTIES = (ACCEPTOR | I_DETERMINISTIC | O_DETERMINISTIC | NO_EPSILONS |
+                   NO_I_EPSILONS | NO_O_EPSILONS | I_LABEL_SORTED |
+                   O_LABEL_SORTED | UNWEIGHTED | ACYCLIC | INITIAL_ACYCLIC |
+                   TOP_SORTED | ACCESSIBLE | COACCESSIBLE | STRING |
+                   UNWEIGHTED_CYCLES)
+COPY_PROPERTIES = 0xffffffff0004
+# The properties that are kept by the operations on mutable FSTs (see
+# fst/properties.h).
+SET_START_PROPERTIES = 0xcccfffff0007
+SET_FINAL_PROPERTIES = 0xc3fcffff0007
+ADD_STATE_PROPERTIES = 0xeaffffff0007
+ADD_ARC_PROPERTIES = 0x4595a56a0007
+ARC_SORT_PROPERTIES = 0xffff0fff0007
+
+FST_MAGIC_NUMBER = 2125659606
+FILE_VERSION = 2
+NO_STATE_ID = -1
+# The weights of the tropical semiring: One() and Zero().
+WEIGHT_ONE = 0.0
+WEIGHT_ZERO = float('inf')
+
+
+def read_symbol_table(filename):
+    """Reads a symbol table (e.g. words.txt) in the text format of OpenFst,
+    with lines of the form 'symbol integer-id', and returns it as a dict
+    from symbol to integer id.  See the comment at the top of
+    utils/lang/make_lexicon_fst.py regarding the latin-1 encoding."""
+    symbols = dict()
+    with open(filename, 'rb') as f:
+        for line in f:
+            a = line.decode('latin-1').split()
+            if len(a) == 0:
+                continue
+            if len(a) != 2:
+                raise RuntimeError("Bad line '{0}' in symbol table {1}".format(
+                    line.decode('latin-1').strip(), filename))
+            try:
+                i = int(a[1])
+            except ValueError:
+                raise RuntimeError("Bad line '{0}' in symbol table {1}".format(
+                    line.decode('latin-1').strip(), filename))
+            if i < 0:
+                raise RuntimeError("Negative symbol-id in line '{0}' of symbol "
+                                   "table {1}".format(line.decode('latin-1').strip(),
+                                                      filename))
+            # As in OpenFst, the first id given to a symbol is the one used.
+            symbols.setdefault(a[0], i)
+    return symbols
+
+
+class VectorFst(object):
+    """An FST in the tropical semiring (the 'standard' arc type), built up by
+    calling add_arc() and set_final() in the order in which the lines of its
+    text form would be printed, and written in the OpenFst binary format by
+    write().  The state-ids given to add_arc() and set_final() are like the
+    ones in the text form: the states are renumbered in order of appearance,
+    and the first one is the start state.  The labels are symbols to be
+    looked up in 'isymbols' and 'osymbols' (dicts from symbol to integer id, as
+    returned by read_symbol_table()) if they are given, and integers
+    otherwise.  The weights are costs (e.g. -log(prob)); None means no
+    weight, i.e. 0.0.
+
+    The arcs and states are stored in arrays; adding an arc only appends to
+    them, and the properties that fstcompile would have stored in the FST
+    are worked out when it is written.
+    """
+
+    def __init__(self, isymbols=None, osymbols=None):
+        self.isymbols = isymbols
+        self.osymbols = osymbols
+        self.start = NO_STATE_ID
+        # map from the state-ids of the caller to our state-ids.
+        self.state_ids = dict()
+        # The final-probs of the states, indexed by our state-id.
+        self.finals = array('f')
+        # The arcs, in the order in which they were added.
+        self.arc_states = array('i')
+        self.ilabels = array('i')
+        self.olabels = array('i')
+        self.weights = array('f')
+        self.nextstates = array('i')
+        # The following relate to the 'weighted' property, which depends on
+        # the order of the calls (setting the final-prob of a state that had a
+        # non-trivial final-prob makes OpenFst forget that the FST is
+        # weighted): 'weighted_final' is true if a non-trivial final-prob was
+        # set since it last happened, 'weighted_arcs_begin' is the index of the
+        # first arc added since, and 'ever_weighted_final' is true if a
+        # non-trivial final-prob was ever set.
+        self.weighted_final = False
+        self.weighted_arcs_begin = 0
+        self.ever_weighted_final = False
+
+    def num_states(self):
+        return len(self.finals)
+
+    def _state_id(self, state):
+        s = self.state_ids.get(state)
+        if s is None:
+            s = len(self.finals)
+            self.state_ids[state] = s
+            self.finals.append(WEIGHT_ZERO)
+            if self.start == NO_STATE_ID:
+                # The first state to appear is the start state.
+                self.start = s
+        return s
+
+    def _label(self, label, symbols):
+        if symbols is None:
+            ans = int(label)
+            if ans < 0:
+                raise ValueError("Negative label {0}".format(ans))
+            return ans
+        key = label if isinstance(label, str) else str(label)
+        try:
+            return symbols[key]
+        except KeyError:
+            raise ValueError("Symbol '{0}' is not in the symbol "
+                             "table".format(key))
+
+    def add_arc(self, src, dest, ilabel, olabel, weight=None):
+        state_ids = self.state_ids
+        s = state_ids.get(src)
+        if s is None:
+            s = self._state_id(src)
+        d = state_ids.get(dest)
+        if d is None:
+            d = self._state_id(dest)
+        i = None if self.isymbols is None else self.isymbols.get(ilabel)
+        if i is None:
+            i = self._label(ilabel, self.isymbols)
+        o = None if self.osymbols is None else self.osymbols.get(olabel)
+        if o is None:
+            o = self._label(olabel, self.osymbols)
+        self.arc_states.append(s)
+        self.ilabels.append(i)
+        self.olabels.append(o)
+        self.weights.append(WEIGHT_ONE if weight is None else weight)
+        self.nextstates.append(d)
+
+    def set_final(self, state, weight=None):
+        s = self._state_id(state)
+        old_weight = self.finals[s]
+        self.finals[s] = WEIGHT_ONE if weight is None else weight
+        weight = self.finals[s]  # rounded to float.
+        if old_weight != WEIGHT_ZERO and old_weight != WEIGHT_ONE:
+            self.weighted_final = False
+            self.weighted_arcs_begin = len(self.weights)
+        if weight != WEIGHT_ZERO and weight != WEIGHT_ONE:
+            self.weighted_final = True
+            self.ever_weighted_final = True
+
+    def _num_trivial_weights(self, begin=0):
+        weights = self.weights[begin:] if begin > 0 else self.weights
+        return weights.count(WEIGHT_ONE) + weights.count(WEIGHT_ZERO)
+
+    def _stored_properties(self, offsets, order):
+        """Returns the properties that fstcompile would store in the FST, as
+        worked out by OpenFst while the states and arcs were added (see
+        SetStartProperties(), AddArcProperties() and so on in
+        fst/properties.h).  'offsets' and 'order' are as returned by
+        _arc_order()."""
+        props = NULL_PROPERTIES | EXPANDED | MUTABLE
+        if self.start == NO_STATE_ID:
+            return props
+        props = (props & ADD_STATE_PROPERTIES & SET_START_PROPERTIES) | \
+            INITIAL_ACYCLIC
+        ilabels, olabels = self.ilabels, self.olabels
+        num_arcs = len(ilabels)
+        if num_arcs > 0:
+            props &= ~(I_DETERMINISTIC | O_DETERMINISTIC | ACYCLIC |
+                       INITIAL_ACYCLIC | UNWEIGHTED_CYCLES)
+            if ilabels != olabels:
+                props = (props | NOT_ACCEPTOR) & ~ACCEPTOR
+            if 0 in ilabels:
+                props = (props | I_EPSILONS) & ~NO_I_EPSILONS
+                if 0 in olabels and any(
+                        i == 0 and o == 0 for i, o in zip(ilabels, olabels)):
+                    props = (props | EPSILONS) & ~NO_EPSILONS
+            if 0 in olabels:
+                props = (props | O_EPSILONS) & ~NO_O_EPSILONS
+            i_sorted = o_sorted = True
+            for s in range(len(self.finals)):
+                begin, end = offsets[s], offsets[s + 1]
+                for k in range(begin + 1, end):
+                    if ilabels[order[k - 1]] > ilabels[order[k]]:
+                        i_sorted = False
+                    if olabels[order[k - 1]] > olabels[order[k]]:
+                        o_sorted = False
+            if not i_sorted:
+                props = (props | NOT_I_LABEL_SORTED) & ~I_LABEL_SORTED
+            if not o_sorted:
+                props = (props | NOT_O_LABEL_SORTED) & ~O_LABEL_SORTED
+            if any(d <= s for s, d in zip(self.arc_states, self.nextstates)):
+                props = (props | NOT_TOP_SORTED) & ~TOP_SORTED
+            else:
+                props |= ACYCLIC | INITIAL_ACYCLIC
+        if self.ever_weighted_final or self._num_trivial_weights() != num_arcs:
+            props &= ~UNWEIGHTED
+            if self.weighted_final or self._num_trivial_weights(
+                    self.weighted_arcs_begin) != num_arcs - self.weighted_arcs_begin:
+                props |= WEIGHTED
+        return props
+
+    def _arc_order(self):
+        """Returns (offsets, order), where order[offsets[s]:offsets[s+1]] are
+        the indexes of the arcs of state s, in the order in which they were
+        added."""
+        num_states = len(self.finals)
+        num_arcs = array('l', [0]) * num_states
+        for s in self.arc_states:
+            num_arcs[s] += 1
+        offsets = array('l', [0]) * (num_states + 1)
+        for s in range(num_states):
+            offsets[s + 1] = offsets[s] + num_arcs[s]
+        position = array('l', offsets)
+        order = array('l', [0]) * len(self.arc_states)
+        for i, s in enumerate(self.arc_states):
+            order[position[s]] = i
+            position[s] += 1
+        return offsets, order
+
+    def _sort_arcs(self, offsets, order, sort_type):
+        """Sorts the arcs of each state in 'order' (as returned by
+        _arc_order()) on (ilabel, olabel) if sort_type is 'ilabel' and on
+        (olabel, ilabel) if it is 'olabel'."""
+        if sort_type == 'ilabel':
+            labels, other_labels = self.ilabels, self.olabels
+        else:
+            labels, other_labels = self.olabels, self.ilabels
+        key = lambda i: (labels[i], other_labels[i])
+        for s in range(len(self.finals)):
+            begin, end = offsets[s], offsets[s + 1]
+            if end - begin > 1:
+                # sorted() is stable, like the sort in fstarcsort.
+                order[begin:end] = array('l', sorted(order[begin:end], key=key))
+
+    def _compute_properties(self, offsets, ilabels, olabels, weights,
+                            nextstates):
+        """Computes the properties of the FST from scratch, like OpenFst's
+        ComputeProperties(); this is what is stored in const FSTs."""
+        num_states = len(self.finals)
+        start = self.start
+        props = (ACYCLIC | INITIAL_ACYCLIC | ACCESSIBLE | COACCESSIBLE |
+                 EXPANDED | MUTABLE)
+
+        # Depth-first search for the strongly connected components (Tarjan's
+        # algorithm), as in OpenFst's SccVisitor, starting from the start state
+        # and then from each unvisited state in order.
+        scc = [-1] * num_states
+        dfnumber = [-1] * num_states
+        lowlink = [0] * num_states
+        onstack = [False] * num_states
+        coaccess = [False] * num_states
+        finished = [False] * num_states
+        scc_stack = []
+        num_visited = 0
+        num_sccs = 0
+        if start != NO_STATE_ID:
+            roots = [start] + [s for s in range(num_states) if s != start]
+        else:
+            roots = []
+        for root in roots:
+            if dfnumber[root] != -1:
+                continue
+            if root != start:
+                props = (props | NOT_ACCESSIBLE) & ~ACCESSIBLE
+            dfnumber[root] = lowlink[root] = num_visited
+            num_visited += 1
+            onstack[root] = True
+            scc_stack.append(root)
+            # the stack of (state, index of the next arc to look at).
+            dfs_stack = [[root, offsets[root]]]
+            while dfs_stack:
+                top = dfs_stack[-1]
+                s, a = top
+                if a < offsets[s + 1]:
+                    top[1] = a + 1
+                    t = nextstates[a]
+                    if dfnumber[t] == -1:  # tree arc
+                        dfnumber[t] = lowlink[t] = num_visited
+                        num_visited += 1
+                        onstack[t] = True
+                        scc_stack.append(t)
+                        dfs_stack.append([t, offsets[t]])
+                    elif not finished[t]:  # back arc
+                        if t == start:
+                            props = (props | INITIAL_CYCLIC) & ~INITIAL_ACYCLIC
+                        props = (props | CYCLIC) & ~ACYCLIC
+                        if dfnumber[t] < lowlink[s]:
+                            lowlink[s] = dfnumber[t]
+                        if coaccess[t]:
+                            coaccess[s] = True
+                    else:  # forward or cross arc
+                        if (dfnumber[t] < dfnumber[s] and onstack[t] and
+                                dfnumber[t] < lowlink[s]):
+                            lowlink[s] = dfnumber[t]
+                        if coaccess[t]:
+                            coaccess[s] = True
+                    continue
+                # finish state s.
+                dfs_stack.pop()
+                finished[s] = True
+                if self.finals[s] != WEIGHT_ZERO:
+                    coaccess[s] = True
+                if dfnumber[s] == lowlink[s]:  # s is the root of an SCC.
+                    i = len(scc_stack)
+                    scc_coaccess = False
+                    while True:
+                        i -= 1
+                        if coaccess[scc_stack[i]]:
+                            scc_coaccess = True
+                        if scc_stack[i] == s:
+                            break
+                    for t in scc_stack[i:]:
+                        scc[t] = num_sccs
+                        if scc_coaccess:
+                            coaccess[t] = True
+                        onstack[t] = False
+                    del scc_stack[i:]
+                    if not scc_coaccess:
+                        props = (props | NOT_COACCESSIBLE) & ~COACCESSIBLE
+                    num_sccs += 1
+                if dfs_stack:
+                    p = dfs_stack[-1][0]
+                    if coaccess[s]:
+                        coaccess[p] = True
+                    if lowlink[s] < lowlink[p]:
+                        lowlink[p] = lowlink[s]
+
+        props |= (ACCEPTOR | NO_EPSILONS | NO_I_EPSILONS | NO_O_EPSILONS |
+                  I_LABEL_SORTED | O_LABEL_SORTED | UNWEIGHTED | TOP_SORTED |
+                  STRING | I_DETERMINISTIC | O_DETERMINISTIC |
+                  UNWEIGHTED_CYCLES)
+        num_finals = 0
+        for s in range(num_states):
+            seen_ilabels = set()
+            seen_olabels = set()
+            for a in range(offsets[s], offsets[s + 1]):
+                ilabel = ilabels[a]
+                olabel = olabels[a]
+                t = nextstates[a]
+                if ilabel in seen_ilabels:
+                    props = (props | NON_I_DETERMINISTIC) & ~I_DETERMINISTIC
+                if olabel in seen_olabels:
+                    props = (props | NON_O_DETERMINISTIC) & ~O_DETERMINISTIC
+                if ilabel != olabel:
+                    props = (props | NOT_ACCEPTOR) & ~ACCEPTOR
+                if ilabel == 0 and olabel == 0:
+                    props = (props | EPSILONS) & ~NO_EPSILONS
+                if ilabel == 0:
+                    props = (props | I_EPSILONS) & ~NO_I_EPSILONS
+                if olabel == 0:
+                    props = (props | O_EPSILONS) & ~NO_O_EPSILONS
+                if a > offsets[s]:
+                    if ilabel < ilabels[a - 1]:
+                        props = (props | NOT_I_LABEL_SORTED) & ~I_LABEL_SORTED
+                    if olabel < olabels[a - 1]:
+                        props = (props | NOT_O_LABEL_SORTED) & ~O_LABEL_SORTED
+                weight = weights[a]
+                if weight != WEIGHT_ONE and weight != WEIGHT_ZERO:
+                    props = (props | WEIGHTED) & ~UNWEIGHTED
+                    if (props & UNWEIGHTED_CYCLES) and scc[s] == scc[t]:
+                        props = (props | WEIGHTED_CYCLES) & ~UNWEIGHTED_CYCLES
+                if t <= s:
+                    props = (props | NOT_TOP_SORTED) & ~TOP_SORTED
+                if t != s + 1:
+                    props = (props | NOT_STRING) & ~STRING
+                seen_ilabels.add(ilabel)
+                seen_olabels.add(olabel)
+            if num_finals > 0:
+                props = (props | NOT_STRING) & ~STRING
+            final = self.finals[s]
+            if final != WEIGHT_ZERO:
+                if final != WEIGHT_ONE:
+                    props = (props | WEIGHTED) & ~UNWEIGHTED
+                num_finals += 1
+            elif offsets[s + 1] - offsets[s] != 1:
+                props = (props | NOT_STRING) & ~STRING
+        if start != NO_STATE_ID and start != 0:
+            props = (props | NOT_STRING) & ~STRING
+        return props
+
+    def write(self, stream, fst_type='vector', sort_type=None):
+        """Writes the FST in the OpenFst binary format to 'stream' (a binary
+        file object).  fst_type is 'vector' or 'const'; sort_type may be
+        'ilabel' or 'olabel' to sort the arcs of each state on that label,
+        as fstarcsort would."""
+        if fst_type not in ['vector', 'const']:
+            raise ValueError("Invalid FST type '{0}'".format(fst_type))
+        if sort_type not in [None, 'ilabel', 'olabel']:
+            raise ValueError("Invalid sort type '{0}'".format(sort_type))
+        offsets, order = self._arc_order()
+        if fst_type == 'vector':
+            props = self._stored_properties(offsets, order)
+        if sort_type is not None:
+            self._sort_arcs(offsets, order, sort_type)
+        ilabels = array('i', [self.ilabels[i] for i in order])
+        olabels = array('i', [self.olabels[i] for i in order])
+        weights = array('f', [self.weights[i] for i in order])
+        nextstates = array('i', [self.nextstates[i] for i in order])
+        num_states = len(self.finals)
+        num_arcs = len(order)
+
+        # The arcs, as (ilabel, olabel, weight, nextstate) records.
+        arcs = array('i', [0]) * (4 * num_arcs)
+        arcs[0::4] = ilabels
+        arcs[1::4] = olabels
+        arcs[2::4] = array('i', _tobytes(weights))
+        arcs[3::4] = nextstates
+        arcs = _tobytes(arcs)
+
+        if fst_type == 'vector':
+            if sort_type is not None and self.start != NO_STATE_ID:
+                # This is what ArcSort() sets the properties to.
+                label_sorted = (I_LABEL_SORTED if sort_type == 'ilabel'
+                                else O_LABEL_SORTED)
+                if props & ACCEPTOR:
+                    label_sorted = I_LABEL_SORTED | O_LABEL_SORTED
+                props = (props & ARC_SORT_PROPERTIES) | label_sorted
+            props = (props & COPY_PROPERTIES) | EXPANDED | MUTABLE
+            # the number of arcs is not written in the header of vector FSTs.
+            output = [self._header('vector', props, num_states, 0)]
+            state = struct.Struct('=fq')
+            for s in range(num_states):
+                output.append(state.pack(self.finals[s],
+                                         offsets[s + 1] - offsets[s]))
+                output.append(arcs[16 * offsets[s]:16 * offsets[s + 1]])
+        else:
+            props = self._compute_properties(offsets, ilabels, olabels,
+                                             weights, nextstates)
+            props = (props & COPY_PROPERTIES) | EXPANDED
+            output = [self._header('const', props, num_states, num_arcs)]
+            state = struct.Struct('=fIIII')
+            for s in range(num_states):
+                begin, end = offsets[s], offsets[s + 1]
+                output.append(state.pack(
+                    self.finals[s], begin, end - begin,
+                    ilabels[begin:end].count(0), olabels[begin:end].count(0)))
+            output.append(arcs)
+        stream.write(b''.join(output))
+
+    def _header(self, fst_type, props, num_states, num_arcs):
+        return b''.join([struct.pack('=i', FST_MAGIC_NUMBER),
+                         _string(fst_type), _string('standard'),
+                         struct.pack('=iiQqqq', FILE_VERSION, 0, props,
+                                     self.start, num_states, num_arcs)])
+
+
+def _tobytes(a):
+    # array.tobytes() is called tostring() in python 2.
+    return a.tobytes() if hasattr(a, 'tobytes') else a.tostring()
+
+
+def _string(s):
+    s = s.encode('ascii')
+    return struct.pack('=i', len(s)) + s
+
+
+class TextFst(object):
+    """This has the same interface as VectorFst, but prints the lines of the
+    text form of the FST to 'stream' as they are added, separated by
+    'separator' and with the weights formatted with 'weight_format'.  This is
+    how the scripts write the FST when not in binary mode."""
+
+    def __init__(self, stream=None, separator='\t', weight_format='{0}'):
+        self.stream = stream
+        self.separator = separator
+        self.weight_format = weight_format
+
+    def add_arc(self, src, dest, ilabel, olabel, weight=None):
+        fields = [str(src), str(dest), str(ilabel), str(olabel)]
+        if weight is not None:
+            fields.append(self.weight_format.format(weight))
+        print(self.separator.join(fields),
+              file=(sys.stdout if self.stream is None else self.stream))
+
+    def set_final(self, state, weight=None):
+        fields = [str(state)]
+        if weight is not None:
+            fields.append(self.weight_format.format(weight))
+        print(self.separator.join(fields),
+              file=(sys.stdout if self.stream is None else self.stream))
+
+    def write(self, stream, fst_type='vector', sort_type=None):
+        pass
+
+
+def add_binary_output_options(parser, symbol_tables=True):
+    """Adds the options --binary-output, --fst-type and --arc-sort-type (and,
+    if symbol_tables is True, --isymbols and --osymbols) to the argparse
+    parser of a script that creates an FST; see make_fst()."""
+    parser.add_argument('--binary-output', type=str, default='false',
+                        choices=['true', 'false'],
+                        help="If true, write the FST in the OpenFst binary "
+                        "format (as fstcompile would), instead of its text "
+                        "form.")
+    parser.add_argument('--fst-type', type=str, default='vector',
+                        choices=['vector', 'const'],
+                        help="Type of the FST written if --binary-output=true.")
+    parser.add_argument('--arc-sort-type', type=str, default='none',
+                        choices=['none', 'ilabel', 'olabel'],
+                        help="If --binary-output=true, sort the arcs on this "
+                        "label (as fstarcsort would).")
+    if symbol_tables:
+        parser.add_argument('--isymbols', type=str,
+                            help="Input symbol table (e.g. phones.txt); "
+                            "required if --binary-output=true.")
+        parser.add_argument('--osymbols', type=str,
+                            help="Output symbol table (e.g. words.txt); "
+                            "required if --binary-output=true.")
+
+
+def make_fst(args, stream=None, separator='\t', weight_format='{0}'):
+    """Returns the FST to add the arcs to, given the options added by
+    add_binary_output_options(): a VectorFst if --binary-output=true (which
+    write_fst() will write out), or else a TextFst that prints to 'stream'
+    (default: the standard output)."""
+    if args.binary_output != 'true':
+        return TextFst(stream, separator, weight_format)
+    isymbols = getattr(args, 'isymbols', None)
+    osymbols = getattr(args, 'osymbols', None)
+    if hasattr(args, 'isymbols') and (isymbols is None or osymbols is None):
+        raise ValueError("--isymbols and --osymbols are required with "
+                         "--binary-output=true")
+    return VectorFst(None if isymbols is None else read_symbol_table(isymbols),
+                     None if osymbols is None else read_symbol_table(osymbols))
+
+
+def write_fst(fst, args, stream=None):
+    """Writes 'fst', as returned by make_fst(), to 'stream' (default: the
+    standard output) if it is a binary FST; text FSTs were already printed."""
+    if stream is None:
+        sys.stdout.flush()
+        stream = getattr(sys.stdout, 'buffer', sys.stdout)
+    sort_type = None if args.arc_sort_type == 'none' else args.arc_sort_type
+    fst.write(stream, args.fst_type, sort_type)
+    stream.flush()
@@ -10,6 +10,10 @@ import sys
 import math
 import re
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'internal'))
+from vector_fst import add_binary_output_options, make_fst, write_fst
+
 # The use of latin-1 encoding does not preclude reading utf-8.  latin-1
 # encoding means "treat words as sequences of bytes", and it is compatible
 # with utf-8 encoding as well as other encodings such as gbk, as long as the
@@ -23,7 +27,9 @@ def get_args():
        text form of a lexicon FST, to be compiled by fstcompile using the
        appropriate symbol tables (phones.txt and words.txt) .  It will mostly
        be invoked indirectly via utils/prepare_lang.sh.  The output goes to
-       the stdout.""")
+       the stdout.  With --binary-output=true it writes the compiled FST
+       instead, as fstcompile (and, with --arc-sort-type, fstarcsort) would,
+       using the symbol tables given by --isymbols and --osymbols.""")
 
     parser.add_argument('--sil-phone', dest='sil_phone', type=str,
                         help="""Text form of optional-silence phone, e.g. 'SIL'.  See also
@@ -53,6 +59,7 @@ def get_args():
                         help="""Filename of lexicon with pronunciation probabilities
                         (normally lexiconp.txt), with lines of the form 'word prob p1 p2...',
                         e.g. 'a   1.0    ay'""")
+    add_binary_output_options(parser)
     args = parser.parse_args()
     return args
 
@@ -116,14 +123,15 @@ def read_lexiconp(filename):
     return ans
 
 
-def write_nonterminal_arcs(start_state, loop_state, next_state,
+def write_nonterminal_arcs(fst, start_state, loop_state, next_state,
                            nonterminals, left_context_phones):
     """This function relates to the grammar-decoding setup, see
     kaldi-asr.org/doc/grammar.html.  It is called from write_fst_no_silence
-    and write_fst_silence, and writes to the stdout some extra arcs
+    and write_fst_silence, and adds to 'fst' some extra arcs
     in the lexicon FST that relate to nonterminal symbols.
     See the section "Special symbols in L.fst,
     kaldi-asr.org/doc/grammar.html#grammar_special_l.
+       fst: the FST to add the arcs to, as returned by make_fst().
        start_state: the start-state of L.fst.
        loop_state:  the state of high out-degree in L.fst where words leave
                   and enter.
@@ -139,16 +147,16 @@ def write_nonterminal_arcs(start_state, loop_state, next_state,
     final_state = next_state
     next_state += 1
 
-    print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+    fst.add_arc(
         src=start_state, dest=shared_state,
-        phone='#nonterm_begin', word='#nonterm_begin',
-        cost=0.0))
+        ilabel='#nonterm_begin', olabel='#nonterm_begin',
+        weight=0.0)
 
     for nonterminal in nonterminals:
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+        fst.add_arc(
             src=loop_state, dest=shared_state,
-            phone=nonterminal, word=nonterminal,
-            cost=0.0))
+            ilabel=nonterminal, olabel=nonterminal,
+            weight=0.0)
     # this_cost equals log(len(left_context_phones)) but the expression below
     # better captures the meaning.  Applying this cost to arcs keeps the FST
     # stochatic (sum-to-one, like an HMM), so that if we do weight pushing
@@ -157,22 +165,23 @@ def write_nonterminal_arcs(start_state, loop_state, next_state,
     this_cost = -math.log(1.0 / len(left_context_phones))
 
     for left_context_phone in left_context_phones:
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+        fst.add_arc(
             src=shared_state, dest=loop_state,
-            phone=left_context_phone, word='<eps>', cost=this_cost))
+            ilabel=left_context_phone, olabel='<eps>', weight=this_cost)
     # arc from loop-state to a final-state with #nonterm_end as ilabel and olabel
-    print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+    fst.add_arc(
         src=loop_state, dest=final_state,
-        phone='#nonterm_end', word='#nonterm_end', cost=0.0))
-    print("{state}\t{final_cost}".format(
-        state=final_state, final_cost=0.0))
+        ilabel='#nonterm_end', olabel='#nonterm_end', weight=0.0)
+    fst.set_final(state=final_state, weight=0.0)
     return next_state
 
 
 
-def write_fst_no_silence(lexicon, nonterminals=None, left_context_phones=None):
-    """Writes the text format of L.fst to the standard output.  This version is for
-    when --sil-prob=0.0, meaning there is no optional silence allowed.
+def write_fst_no_silence(fst, lexicon, nonterminals=None, left_context_phones=None):
+    """Adds the arcs and final-probs of L.fst to 'fst', as returned by make_fst()
+    (in text mode, this writes the text format of L.fst to the standard output).
+    This version is for when --sil-prob=0.0, meaning there is no optional silence
+    allowed.
 
       'lexicon' is a list of 3-tuples (word, pron-prob, prons) as returned by
         read_lexiconp().
@@ -190,37 +199,36 @@ def write_fst_no_silence(lexicon, nonterminals=None, left_context_phones=None):
         cost = -math.log(pronprob)
         cur_state = loop_state
         for i in range(len(pron) - 1):
-            print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+            fst.add_arc(
                 src=cur_state,
                 dest=next_state,
-                phone=pron[i],
-                word=(word if i == 0 else '<eps>'),
-                cost=(cost if i == 0 else 0.0)))
+                ilabel=pron[i],
+                olabel=(word if i == 0 else '<eps>'),
+                weight=(cost if i == 0 else 0.0))
             cur_state = next_state
             next_state += 1
 
         i = len(pron) - 1  # note: i == -1 if pron is empty.
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+        fst.add_arc(
             src=cur_state,
             dest=loop_state,
-            phone=(pron[i] if i >= 0 else '<eps>'),
-            word=(word if i <= 0 else '<eps>'),
-            cost=(cost if i <= 0 else 0.0)))
+            ilabel=(pron[i] if i >= 0 else '<eps>'),
+            olabel=(word if i <= 0 else '<eps>'),
+            weight=(cost if i <= 0 else 0.0))
 
     if nonterminals is not None:
         next_state = write_nonterminal_arcs(
-            loop_state, loop_state, next_state,
+            fst, loop_state, loop_state, next_state,
             nonterminals, left_context_phones)
 
-    print("{state}\t{final_cost}".format(
-        state=loop_state,
-        final_cost=0.0))
+    fst.set_final(state=loop_state, weight=0.0)
 
 
-def write_fst_with_silence(lexicon, sil_prob, sil_phone, sil_disambig,
+def write_fst_with_silence(fst, lexicon, sil_prob, sil_phone, sil_disambig,
                            nonterminals=None, left_context_phones=None):
-    """Writes the text format of L.fst to the standard output.  This version is for
-       when --sil-prob != 0.0, meaning there is optional silence
+    """Adds the arcs and final-probs of L.fst to 'fst', as returned by make_fst()
+       (in text mode, this writes the text format of L.fst to the standard output).
+       This version is for when --sil-prob != 0.0, meaning there is optional silence
      'lexicon' is a list of 3-tuples (word, pron-prob, prons)
          as returned by read_lexiconp().
      'sil_prob', which is expected to be strictly between 0.. and 1.0, is the
@@ -246,61 +254,59 @@ def write_fst_with_silence(lexicon, sil_prob, sil_phone, sil_disambig,
     next_state = 3  # the next un-allocated state, will be incremented as we go.
 
 
-    print('{src}\t{dest}\t{phone}\t{word}\t{cost}'.format(
+    fst.add_arc(
         src=start_state, dest=loop_state,
-        phone='<eps>', word='<eps>', cost=no_sil_cost))
-    print('{src}\t{dest}\t{phone}\t{word}\t{cost}'.format(
+        ilabel='<eps>', olabel='<eps>', weight=no_sil_cost)
+    fst.add_arc(
         src=start_state, dest=sil_state,
-        phone='<eps>', word='<eps>', cost=sil_cost))
+        ilabel='<eps>', olabel='<eps>', weight=sil_cost)
     if sil_disambig is None:
-        print('{src}\t{dest}\t{phone}\t{word}\t{cost}'.format(
+        fst.add_arc(
             src=sil_state, dest=loop_state,
-            phone=sil_phone, word='<eps>', cost=0.0))
+            ilabel=sil_phone, olabel='<eps>', weight=0.0)
     else:
         sil_disambig_state = next_state
         next_state += 1
-        print('{src}\t{dest}\t{phone}\t{word}\t{cost}'.format(
+        fst.add_arc(
             src=sil_state, dest=sil_disambig_state,
-            phone=sil_phone, word='<eps>', cost=0.0))
-        print('{src}\t{dest}\t{phone}\t{word}\t{cost}'.format(
+            ilabel=sil_phone, olabel='<eps>', weight=0.0)
+        fst.add_arc(
             src=sil_disambig_state, dest=loop_state,
-            phone=sil_disambig, word='<eps>', cost=0.0))
+            ilabel=sil_disambig, olabel='<eps>', weight=0.0)
 
 
     for (word, pronprob, pron) in lexicon:
         pron_cost = -math.log(pronprob)
         cur_state = loop_state
         for i in range(len(pron) - 1):
-            print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+            fst.add_arc(
                 src=cur_state, dest=next_state,
-                phone=pron[i],
-                word=(word if i == 0 else '<eps>'),
-                cost=(pron_cost if i == 0 else 0.0)))
+                ilabel=pron[i],
+                olabel=(word if i == 0 else '<eps>'),
+                weight=(pron_cost if i == 0 else 0.0))
             cur_state = next_state
             next_state += 1
 
         i = len(pron) - 1  # note: i == -1 if pron is empty.
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+        fst.add_arc(
             src=cur_state,
             dest=loop_state,
-            phone=(pron[i] if i >= 0 else '<eps>'),
-            word=(word if i <= 0 else '<eps>'),
-            cost=no_sil_cost + (pron_cost if i <= 0 else 0.0)))
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+            ilabel=(pron[i] if i >= 0 else '<eps>'),
+            olabel=(word if i <= 0 else '<eps>'),
+            weight=no_sil_cost + (pron_cost if i <= 0 else 0.0))
+        fst.add_arc(
             src=cur_state,
             dest=sil_state,
-            phone=(pron[i] if i >= 0 else '<eps>'),
-            word=(word if i <= 0 else '<eps>'),
-            cost=sil_cost + (pron_cost if i <= 0 else 0.0)))
+            ilabel=(pron[i] if i >= 0 else '<eps>'),
+            olabel=(word if i <= 0 else '<eps>'),
+            weight=sil_cost + (pron_cost if i <= 0 else 0.0))
 
     if nonterminals is not None:
         next_state = write_nonterminal_arcs(
-            start_state, loop_state, next_state,
+            fst, start_state, loop_state, next_state,
             nonterminals, left_context_phones)
 
-    print("{state}\t{final_cost}".format(
-        state=loop_state,
-        final_cost=0.0))
+    fst.set_final(state=loop_state, weight=0.0)
 
 
 
@@ -375,8 +381,9 @@ def main():
         nonterminals = read_nonterminals(args.nonterminals)
         left_context_phones = read_left_context_phones(args.left_context_phones)
 
+    fst = make_fst(args)
     if args.sil_prob == 0.0:
-          write_fst_no_silence(lexicon,
+          write_fst_no_silence(fst, lexicon,
                                nonterminals=nonterminals,
                                left_context_phones=left_context_phones)
     else:
@@ -395,10 +402,11 @@ def main():
             print("{0}: invalid value --sil-disambig='{1}' was specified."
                   "".format(sys.argv[0], args.sil_disambig), file=sys.stderr)
             sys.exit(1)
-        write_fst_with_silence(lexicon, args.sil_prob, args.sil_phone,
+        write_fst_with_silence(fst, lexicon, args.sil_prob, args.sil_phone,
                                args.sil_disambig,
                                nonterminals=nonterminals,
                                left_context_phones=left_context_phones)
+    write_fst(fst, args)
 
 
 
@@ -10,6 +10,10 @@ import sys
 import math
 import re
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'internal'))
+from vector_fst import add_binary_output_options, make_fst, write_fst
+
 # The use of latin-1 encoding does not preclude reading utf-8.  latin-1
 # encoding means "treat words as sequences of bytes", and it is compatible
 # with utf-8 encoding as well as other encodings such as gbk, as long as the
@@ -29,7 +33,9 @@ def get_args():
 
        This version is for a lexicon with word-specific silence probabilities,
        see http://www.danielpovey.com/files/2015_interspeech_silprob.pdf
-       for an explanation""")
+       for an explanation.  With --binary-output=true it writes the compiled
+       FST instead, as fstcompile (and, with --arc-sort-type, fstarcsort)
+       would, using the symbol tables given by --isymbols and --osymbols.""")
 
     parser.add_argument('--sil-phone', dest='sil_phone', type=str,
                         help="Text form of optional-silence phone, e.g. 'SIL'.")
@@ -62,6 +68,7 @@ def get_args():
                         help="""If supplied, --left-context-phones must also be supplied.
                         List of user-defined nonterminal symbols such as #nonterm:contact_list,
                         one per line.  E.g. data/local/dict/nonterminals.txt.""")
+    add_binary_output_options(parser)
 
     args = parser.parse_args()
     return args
@@ -181,16 +188,17 @@ def read_lexiconp(filename):
     return ans
 
 
-def write_nonterminal_arcs(start_state, sil_state, non_sil_state,
+def write_nonterminal_arcs(fst, start_state, sil_state, non_sil_state,
                            next_state, sil_phone,
                            nonterminals, left_context_phones):
     """This function relates to the grammar-decoding setup, see
-    kaldi-asr.org/doc/grammar.html.  It is called from write_fst, and writes to
-    the stdout some extra arcs in the lexicon FST that relate to nonterminal
+    kaldi-asr.org/doc/grammar.html.  It is called from write_lexicon_fst, and adds to
+    'fst' some extra arcs in the lexicon FST that relate to nonterminal
     symbols.
 
     See the section "Special symbols in L.fst,
     kaldi-asr.org/doc/grammar.html#grammar_special_l.
+       fst: the FST to add the arcs to, as returned by make_fst().
        start_state: the start-state of L.fst.
        sil_state:  the state of high out-degree in L.fst where words leave
                    when preceded by optional silence
@@ -209,10 +217,10 @@ def write_nonterminal_arcs(start_state, sil_state, non_sil_state,
     final_state = next_state
     next_state += 1
 
-    print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+    fst.add_arc(
         src=start_state, dest=shared_state,
-        phone='#nonterm_begin', word='#nonterm_begin',
-        cost=0.0))
+        ilabel='#nonterm_begin', olabel='#nonterm_begin',
+        weight=0.0)
 
     for nonterminal in nonterminals:
         # What we are doing here could be viewed as a little lazy, by going to
@@ -223,10 +231,10 @@ def write_nonterminal_arcs(start_state, sil_state, non_sil_state,
         # word-position-dependent phones are not used and some words end
         # in the optional-silence phone.
         for src in [sil_state, non_sil_state]:
-            print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+            fst.add_arc(
                 src=src, dest=shared_state,
-                phone=nonterminal, word=nonterminal,
-                cost=0.0))
+                ilabel=nonterminal, olabel=nonterminal,
+                weight=0.0)
 
     # this_cost equals log(len(left_context_phones)) but the expression below
     # better captures the meaning.  Applying this cost to arcs keeps the FST
@@ -244,9 +252,9 @@ def write_nonterminal_arcs(start_state, sil_state, non_sil_state,
         # you have words that end in the optional-silence phone.
         dest = (sil_state if left_context_phone == sil_phone else non_sil_state)
 
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+        fst.add_arc(
             src=shared_state, dest=dest,
-            phone=left_context_phone, word='<eps>', cost=this_cost))
+            ilabel=left_context_phone, olabel='<eps>', weight=this_cost)
 
     # arc from sil_state and non_sil_state to a final-state with #nonterm_end as
     # ilabel and olabel.  The costs on these arcs are zero because if you take
@@ -256,16 +264,17 @@ def write_nonterminal_arcs(start_state, sil_state, non_sil_state,
     # lines above this, after reaching 'shared_state' because it saw the
     # user-defined nonterminal.
     for src in [sil_state, non_sil_state]:
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+        fst.add_arc(
             src=src, dest=final_state,
-            phone='#nonterm_end', word='#nonterm_end', cost=0.0))
-    print("{state}\t{final_cost}".format(
-        state=final_state, final_cost=0.0))
+            ilabel='#nonterm_end', olabel='#nonterm_end', weight=0.0)
+    fst.set_final(state=final_state, weight=0.0)
     return next_state
 
-def write_fst(lexicon, silprobs, sil_phone, sil_disambig,
-              nonterminals = None, left_context_phones = None):
-    """Writes the text format of L.fst (or L_disambig.fst)  to the standard output.
+def write_lexicon_fst(fst, lexicon, silprobs, sil_phone, sil_disambig,
+                      nonterminals = None, left_context_phones = None):
+    """Adds the arcs and final-probs of L.fst (or L_disambig.fst) to 'fst', as
+     returned by make_fst() (in text mode, this writes the text format of the FST
+     to the standard output).
      'lexicon' is a list of 5-tuples
      (word, pronprob, wordsilprob, silwordcorrection, nonsilwordcorrection, pron)
          as returned by read_lexiconp().
@@ -294,12 +303,12 @@ def write_fst(lexicon, silprobs, sil_phone, sil_disambig,
     # The one to the nonsilence state has the silence disambiguation symbol
     # (We always use that symbol on the *non*-silence-containing arcs, which
     # avoids having to introduce extra arcs).
-    print('{src}\t{dest}\t{phone}\t{word}\t{cost}'.format(
+    fst.add_arc(
         src=start_state, dest=non_sil_state,
-        phone=sil_disambig, word='<eps>', cost=initial_non_sil_cost))
-    print('{src}\t{dest}\t{phone}\t{word}\t{cost}'.format(
+        ilabel=sil_disambig, olabel='<eps>', weight=initial_non_sil_cost)
+    fst.add_arc(
         src=start_state, dest=sil_state,
-        phone=sil_phone, word='<eps>', cost=initial_sil_cost))
+        ilabel=sil_phone, olabel='<eps>', weight=initial_sil_cost)
 
     for (word, pronprob, wordsilprob, silwordcorrection, nonsilwordcorrection, pron) in lexicon:
         pron_cost = -math.log(pronprob)
@@ -316,42 +325,42 @@ def write_fst(lexicon, silprobs, sil_phone, sil_disambig,
         next_state += 1
         # Create transitions from both non_sil_state and sil_state to 'new_state',
         # with the word label and the word's first phone on them
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+        fst.add_arc(
             src=non_sil_state, dest=new_state,
-            phone=pron[0], word=word, cost=(pron_cost + non_sil_to_word_cost)))
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+            ilabel=pron[0], olabel=word, weight=(pron_cost + non_sil_to_word_cost))
+        fst.add_arc(
             src=sil_state, dest=new_state,
-            phone=pron[0], word=word, cost=(pron_cost + sil_to_word_cost)))
+            ilabel=pron[0], olabel=word, weight=(pron_cost + sil_to_word_cost))
         cur_state = new_state
 
         # add states and arcs for all but the first phone.
         for i in range(1, len(pron)):
             new_state = next_state
             next_state += 1
-            print("{src}\t{dest}\t{phone}\t<eps>".format(
-                src=cur_state, dest=new_state, phone=pron[i]))
+            fst.add_arc(src=cur_state, dest=new_state,
+                        ilabel=pron[i], olabel='<eps>')
             cur_state = new_state
 
         # ... and from there we return via two arcs to the silence and
         # nonsilence state.  the silence-disambig symbol, if used,q
         # goes on the nonsilence arc; this saves us having to insert an epsilon.
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+        fst.add_arc(
             src=cur_state,  dest=non_sil_state,
-            phone=sil_disambig, word='<eps>',
-            cost=word_to_non_sil_cost))
-        print("{src}\t{dest}\t{phone}\t{word}\t{cost}".format(
+            ilabel=sil_disambig, olabel='<eps>',
+            weight=word_to_non_sil_cost)
+        fst.add_arc(
             src=cur_state, dest=sil_state,
-            phone=sil_phone, word='<eps>',
-            cost=word_to_sil_cost))
+            ilabel=sil_phone, olabel='<eps>',
+            weight=word_to_sil_cost)
 
     if nonterminals is not None:
         next_state = write_nonterminal_arcs(
-            start_state, sil_state, non_sil_state,
+            fst, start_state, sil_state, non_sil_state,
             next_state, sil_phone,
             nonterminals, left_context_phones)
 
-    print('{src}\t{cost}'.format(src=sil_state, cost=sil_end_correction_cost))
-    print('{src}\t{cost}'.format(src=non_sil_state, cost=non_sil_end_correction_cost))
+    fst.set_final(state=sil_state, weight=sil_end_correction_cost)
+    fst.set_final(state=non_sil_state, weight=non_sil_end_correction_cost)
 
 def read_nonterminals(filename):
     """Reads the user-defined nonterminal symbols in 'filename', checks that
@@ -400,8 +409,10 @@ def main():
         nonterminals = read_nonterminals(args.nonterminals)
         left_context_phones = read_left_context_phones(args.left_context_phones)
 
-    write_fst(lexicon, silprobs, args.sil_phone, args.sil_disambig,
-              nonterminals, left_context_phones)
+    fst = make_fst(args)
+    write_lexicon_fst(fst, lexicon, silprobs, args.sil_phone, args.sil_disambig,
+                      nonterminals, left_context_phones)
+    write_fst(fst, args)
 
 
 if __name__ == '__main__':
@@ -8,8 +8,13 @@ from __future__ import division
 import sys
 import argparse
 import math
+import os
 from collections import defaultdict
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'internal'))
+from vector_fst import add_binary_output_options, make_fst, write_fst
+
 # note, this was originally based
 
 parser = argparse.ArgumentParser(description="""
@@ -28,7 +33,8 @@ backs off the statistics of pruned n-grams to lower-order states.
 This script reads lines from its standard input, each
 consisting of a sequence of integer symbol-ids (which should be > 0),
 representing the phone sequences of a sentence or dictionary entry.
-This script outputs a backoff language model in FST format""",
+This script outputs a backoff language model in FST format (in text form,
+or, with --binary-output=true, as fstcompile would write it)""",
                                  epilog="See also utils/lang/make_phone_bigram_lang.sh")
 
 
@@ -58,6 +64,7 @@ parser.add_argument("--print-as-arpa", type = str, default = "false",
                     "this is not allowed.")
 parser.add_argument("--verbose", type = int, default = 0,
                     choices=[0,1,2,3,4,5], help = "Verbose level")
+add_binary_output_options(parser, symbol_tables = False)
 
 args = parser.parse_args()
 
@@ -335,8 +342,10 @@ class NgramCounts(object):
 
 
 
-    # This function prints the estimated language model as an FST.
-    def PrintAsFst(self, word_disambig_symbol):
+    # This function prints the estimated language model as an FST, or rather
+    # adds its arcs and final-probs to 'fst', as returned by make_fst() (in text
+    # mode, this prints them).
+    def PrintAsFst(self, word_disambig_symbol, fst):
         # n is the history-length (== order + 1).  We iterate over the
         # history-length in the order 1, 0, 2, 3, and then iterate over the
         # histories of each order in sorted order.  Putting order 1 first
@@ -364,16 +373,16 @@ class NgramCounts(object):
                         while not next_hist in hist_to_state:
                             next_hist = next_hist[1:]
                         next_fst_state = hist_to_state[next_hist]
-                        print(this_fst_state, next_fst_state, word, word,
-                              this_cost)
+                        fst.add_arc(this_fst_state, next_fst_state, word, word,
+                                    this_cost)
                     elif word == self.eos_symbol:
                         # print final-prob for this state.
-                        print(this_fst_state, this_cost)
+                        fst.set_final(this_fst_state, this_cost)
                     else:
                         assert word == self.backoff_symbol
                         backoff_fst_state = hist_to_state[hist[1:len(hist)]]
-                        print(this_fst_state, backoff_fst_state,
-                              word_disambig_symbol, 0, this_cost)
+                        fst.add_arc(this_fst_state, backoff_fst_state,
+                                    word_disambig_symbol, 0, this_cost)
 
     # This function returns a set of n-grams that cannot currently be pruned
     # away, either because a higher-order form of the same n-gram already exists,
@@ -799,7 +808,9 @@ else:
     if args.phone_disambig_symbol == None:
         sys.exit("make_phone_lm.py: --phone-disambig-symbol must be provided (unless "
                  "you are writing as ARPA")
-    ngram_counts.PrintAsFst(args.phone_disambig_symbol)
+    fst = make_fst(args, separator = ' ')
+    ngram_counts.PrintAsFst(args.phone_disambig_symbol, fst)
+    write_fst(fst, args)
 
 
 ## Below are some little test commands that can be used to look at the detailed stats
@@ -6,8 +6,13 @@
 from make_lexicon_fst import read_lexiconp
 import argparse
 import math
+import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'internal'))
+from vector_fst import add_binary_output_options, make_fst, write_fst
+
 # see get_args() below for usage mesage
 def get_args():
     parser = argparse.ArgumentParser(description="""This script creates the
@@ -17,7 +22,10 @@ def get_args():
         goes to the stdout. This script is the subword version of make_lexicon_fst.py.
         It only allows optional silence to appear after end-subword or singleton-subword,
         (i.e., subwords without separator). In this version we do not support
-        pronunciation probability. (i.e., pron-prob = 1.0)""")
+        pronunciation probability. (i.e., pron-prob = 1.0)
+        With --binary-output=true it writes the compiled FST instead, as fstcompile
+        (and, with --arc-sort-type, fstarcsort) would, using the symbol tables given
+        by --isymbols and --osymbols.""")
 
     parser.add_argument('--sil-phone', type=str, help="""Text form of
         optional-silence phone, e.g. 'SIL'. See also the --sil-prob option.""")
@@ -42,6 +50,7 @@ def get_args():
     parser.add_argument('lexiconp', type=str, help="""Filename of lexicon with
         pronunciation probabilities (normally lexiconp.txt), with lines of the
         form 'subword prob p1 p2...', e.g. 'a, 1.0 ay'""")
+    add_binary_output_options(parser)
     args = parser.parse_args()
     return args
 
@@ -52,9 +61,6 @@ def contain_disambig_symbol(phones):
     symbol for each phone sequence"""
     return True if phones[-1].startswith("#") else False
 
-def print_arc(src, dest, phone, word, cost):
-    print('{}\t{}\t{}\t{}\t{}'.format(src, dest, phone, word, cost))
-
 def is_end(word, separator):
     """Return true if the subword can appear at the end of a word (i.e., the subword
     does not end with separator). Return false otherwise."""
@@ -68,9 +74,11 @@ def get_suffix(phone):
         sys.exit(1)
     return phone[-2:]
 
-def write_fst_no_silence(lexicon, position_dependent, separator):
-    """Writes the text format of L.fst to the standard output.  This version is for
-    when --sil-prob=0.0, meaning there is no optional silence allowed.
+def write_fst_no_silence(fst, lexicon, position_dependent, separator):
+    """Adds the arcs and final-probs of L.fst to 'fst', as returned by make_fst()
+    (in text mode, this writes the text format of L.fst to the standard output).
+    This version is for when --sil-prob=0.0, meaning there is no optional silence
+    allowed.
     loop_state here is the start and final state of the fst. It goes to word_start_state
     via epsilon transition.
     In position-independent case, there is no difference between beginning word and 
@@ -106,7 +114,7 @@ def write_fst_no_silence(lexicon, position_dependent, separator):
     word_start_state = 1
     next_state = 2
 
-    print_arc(loop_state, word_start_state, "<eps>", "<eps>", 0.0)
+    fst.add_arc(loop_state, word_start_state, "<eps>", "<eps>", 0.0)
 
     # optional setting for word_internal_state
     if position_dependent:
@@ -141,27 +149,28 @@ def write_fst_no_silence(lexicon, position_dependent, separator):
             current_state = word_start_state
             end_state = loop_state if is_end(word, separator) else word_start_state
 
-        # print arcs (except the last one) for the subword
+        # add arcs (except the last one) for the subword
         for i in range(phones_len - 1):
             word = word if i == 0 else "<eps>"
             cost = pron_cost if i == 0 else 0.0
-            print_arc(current_state, next_state, phones[i], word, cost)
+            fst.add_arc(current_state, next_state, phones[i], word, cost)
             current_state = next_state
             next_state += 1
 
-        # print the last arc
+        # add the last arc
         i = phones_len - 1
         phone = phones[i] if i >=0 else "<eps>"
         word = word if i <= 0 else "<eps>"
         cost = pron_cost if i <= 0 else 0.0
-        print_arc(current_state, end_state, phone, word, cost)
+        fst.add_arc(current_state, end_state, phone, word, cost)
 
     # set the final state
-    print("{state}\t{final_cost}".format(state=loop_state, final_cost=0.0))
+    fst.set_final(loop_state, 0.0)
 
-def write_fst_with_silence(lexicon, sil_phone, sil_prob, sil_disambig, position_dependent, separator):
-    """Writes the text format of L.fst to the standard output.  This version is for
-    when --sil-prob=0.0, meaning there is no optional silence allowed.
+def write_fst_with_silence(fst, lexicon, sil_phone, sil_prob, sil_disambig, position_dependent, separator):
+    """Adds the arcs and final-probs of L.fst to 'fst', as returned by make_fst()
+    (in text mode, this writes the text format of L.fst to the standard output).
+    This version is for when --sil-prob!=0.0, meaning there is optional silence.
     loop_state here is the start and final state of the fst. It goes to word_start_state
     via epsilon transition.
 
@@ -211,18 +220,18 @@ def write_fst_with_silence(lexicon, sil_phone, sil_prob, sil_disambig, position_
     word_start_state = 3   # subword leave from here
     next_state = 4         # the next un-allocated state, will be incremented as we go
 
-    print_arc(start_state, loop_state, "<eps>", "<eps>", no_sil_cost)
-    print_arc(start_state, sil_state, "<eps>", "<eps>", sil_cost)
-    print_arc(loop_state, word_start_state, "<eps>", "<eps>", 0.0)
+    fst.add_arc(start_state, loop_state, "<eps>", "<eps>", no_sil_cost)
+    fst.add_arc(start_state, sil_state, "<eps>", "<eps>", sil_cost)
+    fst.add_arc(loop_state, word_start_state, "<eps>", "<eps>", 0.0)
 
     # optional setting for disambig_state
     if sil_disambig is None:
-        print_arc(sil_state, loop_state, sil_phone, "<eps>", 0.0)
+        fst.add_arc(sil_state, loop_state, sil_phone, "<eps>", 0.0)
     else:
         disambig_state = next_state
         next_state += 1
-        print_arc(sil_state, disambig_state, sil_phone, "<eps>", 0.0)
-        print_arc(disambig_state, loop_state, sil_disambig, "<eps>", 0.0)
+        fst.add_arc(sil_state, disambig_state, sil_phone, "<eps>", 0.0)
+        fst.add_arc(disambig_state, loop_state, sil_disambig, "<eps>", 0.0)
 
     # optional setting for word_internal_state
     if position_dependent:
@@ -265,24 +274,24 @@ def write_fst_with_silence(lexicon, sil_phone, sil_prob, sil_disambig, position_
                 end_state_list = [word_start_state]
                 end_cost_list = [0.0]
 
-        # print arcs (except the last one) for the subword
+        # add arcs (except the last one) for the subword
         for i in range(phones_len - 1):
             word = word if i == 0 else "<eps>"
             cost = pron_cost if i == 0 else 0.0
-            print_arc(current_state, next_state, phones[i], word, cost)
+            fst.add_arc(current_state, next_state, phones[i], word, cost)
             current_state = next_state
             next_state += 1
 
-        # print the last arc
+        # add the last arc
         i = phones_len - 1
         phone = phones[i] if i >= 0 else "<eps>"
         word = word if i <= 0 else "<eps>"
         cost = pron_cost if i <= 0 else 0.0
         for (end_state, end_cost) in zip(end_state_list, end_cost_list):
-            print_arc(current_state, end_state, phone, word, cost + end_cost)
+            fst.add_arc(current_state, end_state, phone, word, cost + end_cost)
 
     # set the final state
-    print("{state}\t{final_cost}".format(state=loop_state, final_cost=0.0))
+    fst.set_final(loop_state, 0.0)
 
 def main():
     args = get_args()
@@ -291,11 +300,13 @@ def main():
               sys.argv[0], args.sil_prob), file=sys.stderr)
         sys.exit(1)
     lexicon = read_lexiconp(args.lexiconp)
+    fst = make_fst(args)
     if args.sil_prob == 0.0:
-        write_fst_no_silence(lexicon, args.position_dependent, args.separator)
+        write_fst_no_silence(fst, lexicon, args.position_dependent, args.separator)
     else:
-        write_fst_with_silence(lexicon, args.sil_phone, args.sil_prob, 
+        write_fst_with_silence(fst, lexicon, args.sil_phone, args.sil_prob, 
             args.sil_disambig, args.position_dependent, args.separator)
+    write_fst(fst, args)
 
 if __name__ == "__main__":
     main()
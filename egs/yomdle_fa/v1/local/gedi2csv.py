@@ -20,6 +20,7 @@ ID,name,col1,row1,col2,row2,col3,row3,col4,row4,confidence,truth,pgrot,bbrot,qua
 """
 
 import logging
+import multiprocessing
 import os
 import sys
 import time
@@ -37,11 +38,23 @@ sin = np.sin
 cos = np.cos
 pi = np.pi
 
+GEDI_NS = "http://lamp.cfar.umd.edu/media/projects/GEDI/"
+
 def Rotate2D(pts, cnt, ang=90):
-    M = np.array([[cos(ang),-sin(ang)],[sin(ang),cos(ang)]])
-    res = np.dot(pts-cnt,M)+cnt
+    """ ang can also be an array of N angles, with pts of shape (N, k, 2)
+    and cnt of shape (N, 1, 2), to rotate N groups of points at once """
+    ang = np.asarray(ang)
+    M = np.stack([np.stack([cos(ang),-sin(ang)],-1),np.stack([sin(ang),cos(ang)],-1)],-2)
+    res = np.matmul(pts-cnt,M)+cnt
     return M, res
 
+def polygon2array(poly_val):
+    """ the points of a polygon, "col,row" strings, as an array """
+    try:
+        return np.array([[int(v) for v in i.split(',')] for i in poly_val])
+    except ValueError:
+        return np.asarray([eval(i) for i in poly_val])
+
 def npbox2string(npar):
     if np.shape(npar)[0] != 1:
         print('Error during CSV conversion\n')
@@ -85,25 +98,26 @@ class GEDI2CSV(object):
             
         strPos = writePath + baseName
 
-        """ for each group of coordinates """
-        for i in coords:
-
-            [id,x,y,w,h,degrees,text,qual,script,text_type] = i
-                    
-            contour = np.array([(x,y),(x+w,y),(x+w,y+h),(x,y+h)])
+        """ the corners of all the groups of coordinates """
+        if len(coords) > 0:
+            x, y, w, h = np.array([i[1:5] for i in coords]).T
+            contours = np.stack([np.stack([x,y],-1),np.stack([x+w,y],-1),
+                                 np.stack([x+w,y+h],-1),np.stack([x,y+h],-1)],1)
+            degrees = np.array([i[5] for i in coords])
 
             """
             First rotate around upper left corner based on orientationD keyword
             """
-            M, rot = Rotate2D(contour, np.array([x,y]), degrees*pi/180)
-            rot = np.int0(rot)
-
+            M, rots = Rotate2D(contours, contours[:,:1,:], degrees*pi/180)
             # rot is the 8 points rotated by degrees
             # pgrot is the rotation after extraction, so save
+            rots = rots.astype(np.intp).reshape(len(coords),8).tolist()
 
-            # save rotated points to list or array
-            rot = np.reshape(rot,(-1,1)).T
-            c1,r1,c2,r2,c3,r3,c4,r4 = npbox2string(rot)
+        """ for each group of coordinates """
+        for i, rot in zip(coords, rots if len(coords) > 0 else []):
+
+            [id,x,y,w,h,degrees,text,qual,script,text_type] = i
+            c1,r1,c2,r2,c3,r3,c4,r4 = rot
             
             text = text.replace(u'\ufeff','')
 
@@ -112,16 +126,12 @@ class GEDI2CSV(object):
 
         # if there are polygons, first save the text
         for j in polys:
-            arr = []
             [id,poly_val,text,qual,script,text_type] = j
-            for i in poly_val:
-                arr.append(eval(i))
-
-            contour = np.asarray(arr)
+            contour = polygon2array(poly_val)
             convex = cv2.convexHull(contour)
             rect = cv2.minAreaRect(convex)
             box = cv2.boxPoints(rect)
-            box = np.int0(box)
+            box = box.astype(np.intp)
             box = np.reshape(box,(-1,1)).T
             c1,r1,c2,r2,c3,r3,c4,r4 = npbox2string(box)
             
@@ -140,9 +150,81 @@ class GEDI2CSV(object):
         return write_ctr
     
 
+def read_gedi(fullName, fileTypeStr, qualset, messages):
+    """
+    Read the zones of the pages of the first document of a GEDI file, with
+    iterparse so that each zone is dropped as soon as it has been read.
+    Returns the coordinates, the polygons and the rotation of the last page.
+    """
+    docTag = '{%s}DL_DOCUMENT' % GEDI_NS
+    pageTag = '{%s}DL_PAGE' % GEDI_NS
+    zoneTag = '{%s}DL_ZONE' % GEDI_NS
+    coordinates=[]
+    polygons = []
+    pageRot = None
+    depth = 0
+    docSeen = inDoc = inPage = False
+    for event, elem in ET.iterparse(fullName, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2 and elem.tag == docTag and not docSeen:
+                docSeen = inDoc = True
+                totalpages = int(elem.attrib['NrOfPages'])
+            elif inDoc and depth == 3 and elem.tag == pageTag:
+                inPage = True
+                if 'GEDI_orientation' not in elem.attrib:
+                    pageRot=0
+                else:
+                    pageRot = int(elem.attrib['GEDI_orientation'])
+                    messages.append(('log', ' PAGE ROTATION %s, %s' % (fullName, str(pageRot))))
+            continue
+
+        if inPage and depth == 4 and elem.tag == zoneTag:
+            zone = elem
+            if zone.attrib['gedi_type']=='Text' and zone.attrib['Type'] in \
+                ('Machine_Print','Confusable_Allograph','Handwriting') and zone.attrib['Quality'] in qualset:
+                if zone.get('polygon'):
+                    polygons.append([zone.attrib['id'],zone.get('polygon').split(';'),
+                                     zone.get('Text_Content'),zone.get('Quality'),zone.get('Script'),zone.get('Type')])
+                elif zone.get(fileTypeStr) != None:
+                    coord = [zone.attrib['id'],int(zone.attrib['col']),int(zone.attrib['row']),
+                                        int(zone.attrib['width']), int(zone.attrib['height']),
+                                        float(zone.get('orientationD',0.0)),
+                                        zone.get('Text_Content'),zone.get('Quality'),zone.get('Script'),zone.get('Type')]
+                    coordinates.append(coord)
+        elif inPage and depth == 3:
+            inPage = False
+        elif inDoc and depth == 2:
+            inDoc = False
+        if depth >= 3:
+            elem.clear()
+        depth -= 1
+
+    if not docSeen:
+        raise IndexError('No DL_DOCUMENT in %s' % fullName)
+    return coordinates, polygons, pageRot
+
+
+def convert_file(job):
+    """
+    Convert one GEDI file to CSV (this is run by the worker processes).
+    Returns the number of lines written and the messages to print or log.
+    """
+    fullName, args, fileTypeStr, qualset = job
+    messages = []
+    coordinates, polygons, pageRot = read_gedi(fullName, fileTypeStr, qualset, messages)
+    write_ctr = 0
+    if len(coordinates) > 0 or len(polygons) > 0:
+        gtconverter = GEDI2CSV(logging.getLogger(__name__), args)
+        write_ctr = gtconverter.csvfile(coordinates, polygons, os.path.splitext(os.path.basename(fullName))[0], pageRot)
+    else:
+        messages.append(('print', '...%s has no applicable content' % (os.path.splitext(fullName)[0])))
+    return write_ctr, messages
+
+
 def main(args):
 
-    startTime = time.clock()
+    startTime = time.time()
 
     writePath = args.outputDir
     if os.path.isdir(writePath) != True:
@@ -158,84 +240,58 @@ def main(args):
         handler.setFormatter(formatter)
         logger.addHandler(handler)
         
-    gtconverter = GEDI2CSV(logger, args)
-    namespaces = {"gedi" : "http://lamp.cfar.umd.edu/media/projects/GEDI/"}
-    keyCnt=0
-
     fileCnt = 0
     line_write_ctr = 0
     line_error_ctr = 0
+
+    if args.ftype == 'boxed':
+        fileTypeStr = 'col'
+    elif args.ftype == 'transcribed':
+        fileTypeStr = 'Text_Content'
+    else:
+        print('Filetype must be either boxed or transcribed!')
+        logger.info('Filetype must be either boxed or transcribed!')
+        sys.exit(-1)
+
+    if args.quality == 'both':
+        qualset = {'Regular','Low-Quality'}
+    elif args.quality == 'low':
+        qualset = {'Low-Quality'}
+    elif args.quality == 'regular':
+        qualset = {'Regular'}
+    else:
+        print('Quality must be both, low or regular!')
+        logger.info('Quality must be both, low or regular!')
+        sys.exit(-1)
     
     """
     Get all XML files in the directory and sub folders
     """
+    jobs = []
     for root, dirnames, filenames in os.walk(args.inputDir, followlinks=True):
         for file in filenames:
             if file.lower().endswith('.xml'):
-                fullName = os.path.join(root,file)
-                baseName = os.path.splitext(fullName)
-
-                fileCnt += 1
-
-                """ read the XML file """
-                tree = ET.parse(fullName)
-                gedi_root = tree.getroot()
-                child = gedi_root.findall('gedi:DL_DOCUMENT',namespaces)[0]
-                totalpages = int(child.attrib['NrOfPages'])
-                coordinates=[]
-                polygons = []
-                if args.ftype == 'boxed':
-                    fileTypeStr = 'col'
-                elif args.ftype == 'transcribed':
-                    fileTypeStr = 'Text_Content'
-                else:
-                    print('Filetype must be either boxed or transcribed!')
-                    logger.info('Filetype must be either boxed or transcribed!')
-                    sys.exit(-1)
-                
-                if args.quality == 'both':
-                    qualset = {'Regular','Low-Quality'}
-                elif args.quality == 'low':
-                    qualset = {'Low-Quality'}
-                elif args.quality == 'regular':
-                    qualset = {'Regular'}
-                else:
-                    print('Quality must be both, low or regular!')
-                    logger.info('Quality must be both, low or regular!')
-                    sys.exit(-1)
-                    
-                    
-
-                """ and for each page """
-                for i, pgs in enumerate(child.iterfind('gedi:DL_PAGE',namespaces)):
-                        
-                    if 'GEDI_orientation' not in pgs.attrib:
-                        pageRot=0
-                    else:
-                        pageRot = int(pgs.attrib['GEDI_orientation'])
-                        logger.info(' PAGE ROTATION %s, %s' % (fullName, str(pageRot)))
-
-                    """ find children for each page """
-                    for zone in pgs.findall('gedi:DL_ZONE',namespaces):
-
-                        if zone.attrib['gedi_type']=='Text' and zone.attrib['Type'] in \
-                            ('Machine_Print','Confusable_Allograph','Handwriting') and zone.attrib['Quality'] in qualset:
-                            if zone.get('polygon'):
-                                keyCnt+=1
-                                polygons.append([zone.attrib['id'],zone.get('polygon').split(';'),
-                                                 zone.get('Text_Content'),zone.get('Quality'),zone.get('Script'),zone.get('Type')])
-                            elif zone.get(fileTypeStr) != None:
-                                keyCnt+=1
-                                coord = [zone.attrib['id'],int(zone.attrib['col']),int(zone.attrib['row']),
-                                                    int(zone.attrib['width']), int(zone.attrib['height']),
-                                                    float(zone.get('orientationD',0.0)),
-                                                    zone.get('Text_Content'),zone.get('Quality'),zone.get('Script'),zone.get('Type')]
-                                coordinates.append(coord)
-
-                if len(coordinates) > 0 or len(polygons) > 0:
-                    line_write_ctr += gtconverter.csvfile(coordinates, polygons, os.path.splitext(file)[0], pageRot)
-                else:
-                    print('...%s has no applicable content' % (baseName[0]))
+                jobs.append((os.path.join(root,file), args, fileTypeStr, qualset))
+    fileCnt = len(jobs)
+
+    """ convert the files in parallel; the results come back in order """
+    if args.nj > 1:
+        pool = multiprocessing.Pool(args.nj)
+        results = pool.imap(convert_file, jobs, chunksize=16)
+    else:
+        results = map(convert_file, jobs)
+
+    for write_ctr, messages in results:
+        for kind, message in messages:
+            if kind == 'print':
+                print(message)
+            else:
+                logger.info(message)
+        line_write_ctr += write_ctr
+
+    if args.nj > 1:
+        pool.close()
+        pool.join()
 
     print('complete...total files %d, lines written %d' % (fileCnt, line_write_ctr))
 
@@ -249,6 +305,7 @@ def parse_arguments(argv):
     parser.add_argument('--ftype', type=str, help='GEDI file type (either "boxed" or "transcribed")', default='transcribed')
     parser.add_argument('--quality', type=str, help='GEDI file quality (either "both" or "low" or "regular")', default='regular')
     parser.add_argument('--log', type=str, help='Log directory', default='./GEDI2CSV_enriched.log')
+    parser.add_argument('--nj', type=int, help='Number of files to convert in parallel', default=1)
 
     return parser.parse_args(argv)
 
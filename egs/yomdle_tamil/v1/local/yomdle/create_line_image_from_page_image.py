@@ -19,6 +19,7 @@
 
 import argparse
 import csv
+import multiprocessing
 import itertools
 import sys
 import os
@@ -28,7 +29,6 @@ from collections import namedtuple
 
 from scipy.spatial import ConvexHull
 from PIL import Image
-from scipy.misc import toimage
 from pathlib import Path
 from glob import glob
 parser = argparse.ArgumentParser(description="Creates line images from page image")
@@ -40,6 +40,7 @@ parser.add_argument('--padding', type=int, default=100, help='Padding so BBox do
 parser.add_argument('--ext', type=str, default='.jpg', help='Extention of the line images')
 parser.add_argument("--filter", action="store_true",
                    help="If true, filter height/width<10 pixels minimum area rectangles")
+parser.add_argument('--num-jobs', type=int, default=1, help='Number of page images to process in parallel')
 args = parser.parse_args()
 
 """
@@ -65,18 +66,6 @@ bounding_box_tuple = namedtuple('bounding_box_tuple', 'area '
                          )
 
 
-def unit_vector(pt0, pt1):
-    """ Given two points pt0 and pt1, return a unit vector that
-        points in the direction of pt0 to pt1.
-    Returns
-    -------
-    (float, float): unit vector
-    """
-    dis_0_to_1 = sqrt((pt0[0] - pt1[0])**2 + (pt0[1] - pt1[1])**2)
-    return (pt1[0] - pt0[0]) / dis_0_to_1, \
-           (pt1[1] - pt0[1]) / dis_0_to_1
-
-
 def orthogonal_vector(vector):
     """ Given a vector, returns a orthogonal/perpendicular vector of equal length.
     Returns
@@ -86,15 +75,15 @@ def orthogonal_vector(vector):
     return -1 * vector[1], vector[0]
 
 
-def bounding_area(index, hull):
-    """ Given index location in an array and convex hull, it gets two points
-        hull[index] and hull[index+1]. From these two points, it returns a named
-        tuple that mainly contains area of the box that bounds the hull. This
-        bounding box orintation is same as the orientation of the lines formed
-        by the point hull[index] and hull[index+1].
+def bounding_areas(hull):
+    """ Given the points of a convex hull in order, returns the boxes that
+        bound the hull, one for each edge of the hull, i.e. for the line formed
+        by the points hull[index] and hull[index+1] (and hull[-1] and hull[0]).
+        The orientation of each bounding box is same as that of its edge.
+        This is done for all the edges at once (rotating calipers).
     Returns
     -------
-    a named tuple that contains:
+    a dict of arrays, with one element (or row) per edge, that contains:
     area: area of the rectangle
     length_parallel: length of the side that is parallel to unit_vector
     length_orthogonal: length of the side that is orthogonal to unit_vector
@@ -102,21 +91,25 @@ def bounding_area(index, hull):
     unit_vector: direction of the length_parallel side.
     (it's orthogonal vector can be found with the orthogonal_vector function)
     """
-    unit_vector_p = unit_vector(hull[index], hull[index+1])
-    unit_vector_o = orthogonal_vector(unit_vector_p)
+    hull = np.asarray(hull, dtype=np.float64)
+    edges = np.roll(hull, -1, axis=0) - hull
+    dis_0_to_1 = np.sqrt(edges[:, 0]**2 + edges[:, 1]**2)
+    unit_vector_p = edges / dis_0_to_1[:, np.newaxis]
+    unit_vector_o = np.stack(orthogonal_vector(unit_vector_p.T), axis=1)
 
-    dis_p = tuple(np.dot(unit_vector_p, pt) for pt in hull)
-    dis_o = tuple(np.dot(unit_vector_o, pt) for pt in hull)
+    # dis_p[i, j] is the projection of the point hull[j] on the edge i
+    dis_p = np.dot(unit_vector_p, hull.T)
+    dis_o = np.dot(unit_vector_o, hull.T)
 
-    min_p = min(dis_p)
-    min_o = min(dis_o)
-    len_p = max(dis_p) - min_p
-    len_o = max(dis_o) - min_o
+    min_p = dis_p.min(axis=1)
+    min_o = dis_o.min(axis=1)
+    len_p = dis_p.max(axis=1) - min_p
+    len_o = dis_o.max(axis=1) - min_o
 
     return {'area': len_p * len_o,
             'length_parallel': len_p,
             'length_orthogonal': len_o,
-            'rectangle_center': (min_p + float(len_p) / 2, min_o + float(len_o) / 2),
+            'rectangle_center': np.stack((min_p + len_p / 2, min_o + len_o / 2), axis=1),
             'unit_vector': unit_vector_p,
             }
 
@@ -192,14 +185,16 @@ def minimum_bounding_box(points):
     if len(points) <= 2: raise ValueError('More than two points required.')
 
     hull_ordered = [points[index] for index in ConvexHull(points).vertices]
-    hull_ordered.append(hull_ordered[0])
-    hull_ordered = tuple(hull_ordered)
 
-    min_rectangle = bounding_area(0, hull_ordered)
-    for i in range(1, len(hull_ordered)-1):
-        rectangle = bounding_area(i, hull_ordered)
-        if rectangle['area'] < min_rectangle['area']:
-            min_rectangle = rectangle
+    rectangles = bounding_areas(hull_ordered)
+    # the first of the rectangles with the smallest area
+    index = np.argmin(rectangles['area'])
+    min_rectangle = {'area': float(rectangles['area'][index]),
+                     'length_parallel': float(rectangles['length_parallel'][index]),
+                     'length_orthogonal': float(rectangles['length_orthogonal'][index]),
+                     'rectangle_center': tuple(rectangles['rectangle_center'][index].tolist()),
+                     'unit_vector': tuple(rectangles['unit_vector'][index].tolist()),
+                     }
 
     min_rectangle['unit_vector_angle'] = atan2(min_rectangle['unit_vector'][1], min_rectangle['unit_vector'][0])
     min_rectangle['rectangle_center'] = to_xy_coordinates(min_rectangle['unit_vector_angle'], min_rectangle['rectangle_center'])
@@ -288,18 +283,34 @@ def rotated_points(bounding_box, center):
     return x_dash_1, y_dash_1, x_dash_2, y_dash_2, x_dash_3, y_dash_3, x_dash_4, y_dash_4
 
 
-def pad_image(image):
-    """ Given an image, returns a padded image around the border.
-        This routine save the code from crashing if bounding boxes that are
-        slightly outside the page boundary.
+def crop_padded_image(image, box):
+    """ Given a page image and a box, returns the region of the page image
+        padded around the border (by args.padding // 2 on the top and left
+        side and the rest on the bottom and right side, in white) that is in the
+        box. Padding saves the code from crashing if bounding boxes that are
+        slightly outside the page boundary. Only the region is padded, so that
+        many lines can be cropped from one decoded page image without making
+        a padded copy of the whole page. Like Image.crop(), the parts of the box
+        outside the padded page image are black.
     Returns
     -------
-    image: page image
+    image: region of the padded page image
     """
     offset = int(args.padding // 2)
-    padded_image = Image.new('L', (image.size[0] + int(args.padding), image.size[1] + int(args.padding)), "white")
-    padded_image.paste(im = image, box = (offset, offset))
-    return padded_image
+    padded_width = image.size[0] + int(args.padding)
+    padded_height = image.size[1] + int(args.padding)
+    region = Image.new('L', (box[2] - box[0], box[3] - box[1]))
+    padded_box = (max(box[0], 0), max(box[1], 0),
+                  min(box[2], padded_width), min(box[3], padded_height))
+    if padded_box[0] < padded_box[2] and padded_box[1] < padded_box[3]:
+        region.paste("white", (padded_box[0] - box[0], padded_box[1] - box[1],
+                               padded_box[2] - box[0], padded_box[3] - box[1]))
+    page_box = (max(box[0] - offset, 0), max(box[1] - offset, 0),
+                min(box[2] - offset, image.size[0]), min(box[3] - offset, image.size[1]))
+    if page_box[0] < page_box[2] and page_box[1] < page_box[3]:
+        region.paste(im = image.crop(page_box),
+                     box = (page_box[0] + offset - box[0], page_box[1] + offset - box[1]))
+    return region
 
 def update_minimum_bounding_box_input(bounding_box_input):
     """ Given list of 2D points, returns list of 2D points shifted by an offset.
@@ -319,22 +330,27 @@ def update_minimum_bounding_box_input(bounding_box_input):
     return updated_minimum_bounding_box_input
 
 
-### main ###
-globvar = 0
-text_fh = open(args.output_file, 'w', encoding='utf-8')
-file_list = list(Path(args.csv_dir).rglob("*.[cC][sS][vV]"))
-for filename in sorted(file_list):
-    filename = str(filename)
+def get_line_images_from_page_image(filename):
+    """ Given the name of a csv file, extracts the line images from the
+        corresponding page image and writes them to the output directory.
+        The page image is decoded once and each line is cropped from it.
+        This is run by the worker processes.
+    Returns
+    -------
+    ([string], int, [string]): ids of the line images, number of lines that
+                               are skipped and error messages.
+    """
+    line_ids = []
+    num_skipped = 0
+    messages = []
     with open(str(filename), 'r', encoding='utf-8') as f:
         base_name = os.path.basename(filename)
         image_file = os.path.join(args.image_dir, base_name.split('.')[0] + args.ext)
         try:
             im = Image.open(image_file).convert('L')
         except Exception as e:
-            print("Error: No such Image " + row[1])
-            globvar += 1
-            continue
-        im = pad_image(im)
+            messages.append("Error: No such Image " + image_file)
+            return line_ids, num_skipped + 1, messages
         for row in itertools.islice(csv.reader(f), 1, None):
             points = []
             points.append((int(row[2]), int(row[3])))
@@ -349,7 +365,7 @@ for filename in sorted(file_list):
                 updated_mbb_input = update_minimum_bounding_box_input(points)
                 bounding_box = minimum_bounding_box(updated_mbb_input)
             except Exception as e:
-                globvar += 1
+                num_skipped += 1
                 continue
             p1, p2, p3, p4 = bounding_box.corner_points
             x1, y1 = p1
@@ -361,7 +377,7 @@ for filename in sorted(file_list):
             max_x = int(max(x1, x2, x3, x4))
             max_y = int(max(y1, y2, y3, y4))
             box = (min_x, min_y, max_x, max_y)
-            region_initial = im.crop(box)
+            region_initial = crop_padded_image(im, box)
             rot_points = []
             p1_new = (x1 - min_x, y1 - min_y)
             p2_new = (x2 - min_x, y2 - min_y)
@@ -391,16 +407,48 @@ for filename in sorted(file_list):
             width, height = region_final.size
             if args.filter:
               if height > (width * 2):
-                  globvar += 1
+                  num_skipped += 1
                   continue
               if height < 10:
-                  globvar += 1
+                  num_skipped += 1
                   continue
               if width < 10:
-                  globvar += 1
+                  num_skipped += 1
                   continue
             fname = row[1].split('.')[0]
-            text_fh.write(fname + '\n')
+            line_ids.append(fname)
             image_out_file = os.path.join(args.out_dir, row[1])
             region_final.save(image_out_file)
-print(globvar)
+    return line_ids, num_skipped, messages
+
+
+### main ###
+def main():
+    text_fh = open(args.output_file, 'w', encoding='utf-8')
+    file_list = list(Path(args.csv_dir).rglob("*.[cC][sS][vV]"))
+    file_list = [str(filename) for filename in sorted(file_list)]
+
+    # The pages are processed in parallel and the ids of the line images
+    # are written in the order of the pages. Returns the number of skipped
+    # line images.
+    def write_results(results):
+        total_skipped = 0
+        for line_ids, num_skipped, messages in results:
+            for message in messages:
+                print(message)
+            for fname in line_ids:
+                text_fh.write(fname + '\n')
+            total_skipped += num_skipped
+        return total_skipped
+
+    if args.num_jobs > 1:
+        with multiprocessing.Pool(args.num_jobs) as pool:
+            num_skipped = write_results(pool.imap(get_line_images_from_page_image, file_list))
+    else:
+        num_skipped = write_results(map(get_line_images_from_page_image, file_list))
+    text_fh.close()
+    print(num_skipped)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,7 @@ cangjie_url=https://raw.githubusercontent.com/wanleung/libcangjie/master/tables/
 download_dir=download
 slam_dir=$download_dir/slam_farsi
 yomdle_dir=$download_dir/yomdle_farsi
+nj=4
 
 . ./cmd.sh
 . ./path.sh
@@ -22,6 +23,7 @@ mkdir -p ${slam_dir}/{truth_csv,truth_csv_raw,truth_line_image}
 local/gedi2csv.py \
     --inputDir ${database_slam} \
     --outputDir ${slam_dir}/truth_csv_raw \
+    --nj $nj \
     --log ${slam_dir}/GEDI2CSV_enriched.log
 local/create_line_image_from_page_image.py \
     ${database_slam} \
@@ -34,6 +36,7 @@ mkdir -p ${yomdle_dir}/{truth_csv,truth_csv_raw,truth_line_image}
 local/yomdle2csv.py \
     --inputDir ${database_yomdle} \
     --outputDir ${yomdle_dir}/truth_csv_raw/ \
+    --nj $nj \
     --log ${yomdle_dir}/YOMDLE2CSV.log
 local/create_line_image_from_page_image.py \
     --im-format "jpg" \
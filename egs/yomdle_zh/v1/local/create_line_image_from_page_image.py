@@ -16,6 +16,7 @@
 
 import argparse
 import csv
+import multiprocessing
 import itertools
 import sys
 import os
@@ -25,7 +26,6 @@ from collections import namedtuple
 
 from scipy.spatial import ConvexHull
 from PIL import Image
-from scipy.misc import toimage
 
 parser = argparse.ArgumentParser(description="Creates line images from page image")
 parser.add_argument('image_dir', type=str, help='Path to full page images')
@@ -34,6 +34,7 @@ parser.add_argument('out_dir', type=str, help='Path to output directory')
 parser.add_argument('--im-format', type=str, default='png', help='What file format are the images')
 parser.add_argument('--padding', type=int, default=100, help='Padding so BBox does not exceed image area')
 parser.add_argument('--head', type=int, default=-1, help='Number of csv files to process')
+parser.add_argument('--num-jobs', type=int, default=1, help='Number of page images to process in parallel')
 args = parser.parse_args()
 
 """
@@ -59,18 +60,6 @@ bounding_box_tuple = namedtuple('bounding_box_tuple', 'area '
                          )
 
 
-def unit_vector(pt0, pt1):
-    """ Given two points pt0 and pt1, return a unit vector that
-        points in the direction of pt0 to pt1.
-    Returns
-    -------
-    (float, float): unit vector
-    """
-    dis_0_to_1 = sqrt((pt0[0] - pt1[0])**2 + (pt0[1] - pt1[1])**2)
-    return (pt1[0] - pt0[0]) / dis_0_to_1, \
-           (pt1[1] - pt0[1]) / dis_0_to_1
-
-
 def orthogonal_vector(vector):
     """ Given a vector, returns a orthogonal/perpendicular vector of equal length.
     Returns
@@ -80,15 +69,15 @@ def orthogonal_vector(vector):
     return -1 * vector[1], vector[0]
 
 
-def bounding_area(index, hull):
-    """ Given index location in an array and convex hull, it gets two points
-        hull[index] and hull[index+1]. From these two points, it returns a named
-        tuple that mainly contains area of the box that bounds the hull. This
-        bounding box orintation is same as the orientation of the lines formed
-        by the point hull[index] and hull[index+1].
+def bounding_areas(hull):
+    """ Given the points of a convex hull in order, returns the boxes that
+        bound the hull, one for each edge of the hull, i.e. for the line formed
+        by the points hull[index] and hull[index+1] (and hull[-1] and hull[0]).
+        The orientation of each bounding box is same as that of its edge.
+        This is done for all the edges at once (rotating calipers).
     Returns
     -------
-    a named tuple that contains:
+    a dict of arrays, with one element (or row) per edge, that contains:
     area: area of the rectangle
     length_parallel: length of the side that is parallel to unit_vector
     length_orthogonal: length of the side that is orthogonal to unit_vector
@@ -96,21 +85,25 @@ def bounding_area(index, hull):
     unit_vector: direction of the length_parallel side.
     (it's orthogonal vector can be found with the orthogonal_vector function)
     """
-    unit_vector_p = unit_vector(hull[index], hull[index+1])
-    unit_vector_o = orthogonal_vector(unit_vector_p)
+    hull = np.asarray(hull, dtype=np.float64)
+    edges = np.roll(hull, -1, axis=0) - hull
+    dis_0_to_1 = np.sqrt(edges[:, 0]**2 + edges[:, 1]**2)
+    unit_vector_p = edges / dis_0_to_1[:, np.newaxis]
+    unit_vector_o = np.stack(orthogonal_vector(unit_vector_p.T), axis=1)
 
-    dis_p = tuple(np.dot(unit_vector_p, pt) for pt in hull)
-    dis_o = tuple(np.dot(unit_vector_o, pt) for pt in hull)
+    # dis_p[i, j] is the projection of the point hull[j] on the edge i
+    dis_p = np.dot(unit_vector_p, hull.T)
+    dis_o = np.dot(unit_vector_o, hull.T)
 
-    min_p = min(dis_p)
-    min_o = min(dis_o)
-    len_p = max(dis_p) - min_p
-    len_o = max(dis_o) - min_o
+    min_p = dis_p.min(axis=1)
+    min_o = dis_o.min(axis=1)
+    len_p = dis_p.max(axis=1) - min_p
+    len_o = dis_o.max(axis=1) - min_o
 
     return {'area': len_p * len_o,
             'length_parallel': len_p,
             'length_orthogonal': len_o,
-            'rectangle_center': (min_p + float(len_p) / 2, min_o + float(len_o) / 2),
+            'rectangle_center': np.stack((min_p + len_p / 2, min_o + len_o / 2), axis=1),
             'unit_vector': unit_vector_p,
             }
 
@@ -245,15 +238,16 @@ def minimum_bounding_box(points):
     if len(points) <= 2: raise ValueError('More than two points required.')
 
     hull_ordered = [points[index] for index in ConvexHull(points).vertices]
-    hull_ordered.append(hull_ordered[0])
-    #hull_ordered = compute_hull(points)
-    hull_ordered = tuple(hull_ordered)
 
-    min_rectangle = bounding_area(0, hull_ordered)
-    for i in range(1, len(hull_ordered)-1):
-        rectangle = bounding_area(i, hull_ordered)
-        if rectangle['area'] < min_rectangle['area']:
-            min_rectangle = rectangle
+    rectangles = bounding_areas(hull_ordered)
+    # the first of the rectangles with the smallest area
+    index = np.argmin(rectangles['area'])
+    min_rectangle = {'area': float(rectangles['area'][index]),
+                     'length_parallel': float(rectangles['length_parallel'][index]),
+                     'length_orthogonal': float(rectangles['length_orthogonal'][index]),
+                     'rectangle_center': tuple(rectangles['rectangle_center'][index].tolist()),
+                     'unit_vector': tuple(rectangles['unit_vector'][index].tolist()),
+                     }
 
     min_rectangle['unit_vector_angle'] = atan2(min_rectangle['unit_vector'][1], min_rectangle['unit_vector'][0])
     min_rectangle['rectangle_center'] = to_xy_coordinates(min_rectangle['unit_vector_angle'], min_rectangle['rectangle_center'])
@@ -342,18 +336,34 @@ def rotated_points(bounding_box, center):
     return x_dash_1, y_dash_1, x_dash_2, y_dash_2, x_dash_3, y_dash_3, x_dash_4, y_dash_4
 
 
-def pad_image(image):
-    """ Given an image, returns a padded image around the border.
-        This routine save the code from crashing if bounding boxes that are
-        slightly outside the page boundary.
+def crop_padded_image(image, box):
+    """ Given a page image and a box, returns the region of the page image
+        padded around the border (by args.padding // 2 on the top and left
+        side and the rest on the bottom and right side, in white) that is in the
+        box. Padding saves the code from crashing if bounding boxes that are
+        slightly outside the page boundary. Only the region is padded, so that
+        many lines can be cropped from one decoded page image without making
+        a padded copy of the whole page. Like Image.crop(), the parts of the box
+        outside the padded page image are black.
     Returns
     -------
-    image: page image
+    image: region of the padded page image
     """
     offset = int(args.padding // 2)
-    padded_image = Image.new('RGB', (image.size[0] + int(args.padding), image.size[1] + int(args.padding)), "white")
-    padded_image.paste(im = image, box = (offset, offset))
-    return padded_image
+    padded_width = image.size[0] + int(args.padding)
+    padded_height = image.size[1] + int(args.padding)
+    region = Image.new('RGB', (box[2] - box[0], box[3] - box[1]))
+    padded_box = (max(box[0], 0), max(box[1], 0),
+                  min(box[2], padded_width), min(box[3], padded_height))
+    if padded_box[0] < padded_box[2] and padded_box[1] < padded_box[3]:
+        region.paste("white", (padded_box[0] - box[0], padded_box[1] - box[1],
+                               padded_box[2] - box[0], padded_box[3] - box[1]))
+    page_box = (max(box[0] - offset, 0), max(box[1] - offset, 0),
+                min(box[2] - offset, image.size[0]), min(box[3] - offset, image.size[1]))
+    if page_box[0] < page_box[2] and page_box[1] < page_box[3]:
+        region.paste(im = image.crop(page_box),
+                     box = (page_box[0] + offset - box[0], page_box[1] + offset - box[1]))
+    return region
 
 def update_minimum_bounding_box_input(bounding_box_input):
     """ Given list of 2D points, returns list of 2D points shifted by an offset.
@@ -373,86 +383,115 @@ def update_minimum_bounding_box_input(bounding_box_input):
     return updated_minimum_bounding_box_input
 
 
-### main ###
-csv_count = 0
-for filename in sorted(os.listdir(args.csv_dir)):
-    if filename.endswith('.csv') and (csv_count < args.head or args.head < 0):
-        csv_count = csv_count + 1
-        with open(os.path.join(args.csv_dir, filename), 'r', encoding='utf-8') as f:
-            image_file = os.path.join(args.image_dir, os.path.splitext(filename)[0] + '.' + args.im_format)
-            if not os.path.isfile(image_file):
+def get_line_images_from_page_image(filename):
+    """ Given the name of a csv file, extracts the line images from the
+        corresponding page image and writes the line images and the csv rows of
+        the lines to the output directory. The page image is decoded once and each
+        line is cropped from it. This is run by the worker processes.
+    Returns
+    -------
+    [string]: error messages for the lines that are skipped.
+    """
+    messages = []
+    with open(os.path.join(args.csv_dir, filename), 'r', encoding='utf-8') as f:
+        image_file = os.path.join(args.image_dir, os.path.splitext(filename)[0] + '.' + args.im_format)
+        if not os.path.isfile(image_file):
+            return messages
+        csv_out_file = os.path.join(args.out_dir, 'truth_csv', filename)
+        csv_out_fh = open(csv_out_file, 'w', encoding='utf-8')
+        csv_out_writer = csv.writer(csv_out_fh)
+        im = Image.open(image_file)
+        im.load()
+        for row in itertools.islice(csv.reader(f), 1, None):
+            points = []
+            points.append((int(row[2]), int(row[3])))
+            points.append((int(row[4]), int(row[5])))
+            points.append((int(row[6]), int(row[7])))
+            points.append((int(row[8]), int(row[9])))
+
+            x = [int(row[2]), int(row[4]), int(row[6]), int(row[8])]
+            y = [int(row[3]), int(row[5]), int(row[7]), int(row[9])]
+            min_x, min_y = min(x), min(y)
+            max_x, max_y = max(x), max(y)
+            if min_x == max_x or min_y == max_y:
                 continue
-            csv_out_file = os.path.join(args.out_dir, 'truth_csv', filename)
-            csv_out_fh = open(csv_out_file, 'w', encoding='utf-8')
-            csv_out_writer = csv.writer(csv_out_fh)
-            im = Image.open(image_file)
-            im = pad_image(im)
-            count = 1
-            for row in itertools.islice(csv.reader(f), 0, None):
-                if count == 1:
-                    count = 0
-                    continue
-    
-                points = []
-                points.append((int(row[2]), int(row[3])))
-                points.append((int(row[4]), int(row[5])))
-                points.append((int(row[6]), int(row[7])))
-                points.append((int(row[8]), int(row[9])))
-    
-                x = [int(row[2]), int(row[4]), int(row[6]), int(row[8])]
-                y = [int(row[3]), int(row[5]), int(row[7]), int(row[9])]
-                min_x, min_y = min(x), min(y)
-                max_x, max_y = max(x), max(y)
-                if min_x == max_x or min_y == max_y:
-                    continue
-    
-                try:
-                    updated_mbb_input = update_minimum_bounding_box_input(points)
-                    bounding_box = minimum_bounding_box(updated_mbb_input)
-                except Exception as e:
-                    print("Error: Skipping Image " + row[1])
-                    continue
-    
-                p1, p2, p3, p4 = bounding_box.corner_points
-                x1, y1 = p1
-                x2, y2 = p2
-                x3, y3 = p3
-                x4, y4 = p4
-                min_x = int(min(x1, x2, x3, x4))
-                min_y = int(min(y1, y2, y3, y4))
-                max_x = int(max(x1, x2, x3, x4))
-                max_y = int(max(y1, y2, y3, y4))
-                box = (min_x, min_y, max_x, max_y)
-                region_initial = im.crop(box)
-                rot_points = []
-                p1_new = (x1 - min_x, y1 - min_y)
-                p2_new = (x2 - min_x, y2 - min_y)
-                p3_new = (x3 - min_x, y3 - min_y)
-                p4_new = (x4 - min_x, y4 - min_y)
-                rot_points.append(p1_new)
-                rot_points.append(p2_new)
-                rot_points.append(p3_new)
-                rot_points.append(p4_new)
-    
-                cropped_bounding_box = bounding_box_tuple(bounding_box.area,
-                        bounding_box.length_parallel,
-                        bounding_box.length_orthogonal,
-                        bounding_box.length_orthogonal,
-                        bounding_box.unit_vector,
-                        bounding_box.unit_vector_angle,
-                        set(rot_points))
-    
-                rotation_angle_in_rad = get_smaller_angle(cropped_bounding_box)
-                img2 = region_initial.rotate(degrees(rotation_angle_in_rad), resample = Image.BICUBIC)
-                x_dash_1, y_dash_1, x_dash_2, y_dash_2, x_dash_3, y_dash_3, x_dash_4, y_dash_4 = rotated_points(
-                    cropped_bounding_box, get_center(region_initial))
-    
-                min_x = int(min(x_dash_1, x_dash_2, x_dash_3, x_dash_4))
-                min_y = int(min(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
-                max_x = int(max(x_dash_1, x_dash_2, x_dash_3, x_dash_4))
-                max_y = int(max(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
-                box = (min_x, min_y, max_x, max_y)
-                region_final = img2.crop(box)
-                csv_out_writer.writerow(row)
-                image_out_file = os.path.join(args.out_dir, 'truth_line_image', row[1])
-                region_final.save(image_out_file)
+
+            try:
+                updated_mbb_input = update_minimum_bounding_box_input(points)
+                bounding_box = minimum_bounding_box(updated_mbb_input)
+            except Exception as e:
+                messages.append("Error: Skipping Image " + row[1])
+                continue
+
+            p1, p2, p3, p4 = bounding_box.corner_points
+            x1, y1 = p1
+            x2, y2 = p2
+            x3, y3 = p3
+            x4, y4 = p4
+            min_x = int(min(x1, x2, x3, x4))
+            min_y = int(min(y1, y2, y3, y4))
+            max_x = int(max(x1, x2, x3, x4))
+            max_y = int(max(y1, y2, y3, y4))
+            box = (min_x, min_y, max_x, max_y)
+            region_initial = crop_padded_image(im, box)
+            rot_points = []
+            p1_new = (x1 - min_x, y1 - min_y)
+            p2_new = (x2 - min_x, y2 - min_y)
+            p3_new = (x3 - min_x, y3 - min_y)
+            p4_new = (x4 - min_x, y4 - min_y)
+            rot_points.append(p1_new)
+            rot_points.append(p2_new)
+            rot_points.append(p3_new)
+            rot_points.append(p4_new)
+
+            cropped_bounding_box = bounding_box_tuple(bounding_box.area,
+                    bounding_box.length_parallel,
+                    bounding_box.length_orthogonal,
+                    bounding_box.length_orthogonal,
+                    bounding_box.unit_vector,
+                    bounding_box.unit_vector_angle,
+                    set(rot_points))
+
+            rotation_angle_in_rad = get_smaller_angle(cropped_bounding_box)
+            img2 = region_initial.rotate(degrees(rotation_angle_in_rad), resample = Image.BICUBIC)
+            x_dash_1, y_dash_1, x_dash_2, y_dash_2, x_dash_3, y_dash_3, x_dash_4, y_dash_4 = rotated_points(
+                cropped_bounding_box, get_center(region_initial))
+
+            min_x = int(min(x_dash_1, x_dash_2, x_dash_3, x_dash_4))
+            min_y = int(min(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
+            max_x = int(max(x_dash_1, x_dash_2, x_dash_3, x_dash_4))
+            max_y = int(max(y_dash_1, y_dash_2, y_dash_3, y_dash_4))
+            box = (min_x, min_y, max_x, max_y)
+            region_final = img2.crop(box)
+            csv_out_writer.writerow(row)
+            image_out_file = os.path.join(args.out_dir, 'truth_line_image', row[1])
+            region_final.save(image_out_file)
+        csv_out_fh.close()
+    return messages
+
+
+### main ###
+def main():
+    csv_files = []
+    csv_count = 0
+    for filename in sorted(os.listdir(args.csv_dir)):
+        if filename.endswith('.csv') and (csv_count < args.head or args.head < 0):
+            csv_count = csv_count + 1
+            csv_files.append(filename)
+
+    # The pages are processed in parallel and the messages are printed
+    # in the order of the pages.
+    def print_messages(messages_of_pages):
+        for messages in messages_of_pages:
+            for message in messages:
+                print(message)
+
+    if args.num_jobs > 1:
+        with multiprocessing.Pool(args.num_jobs) as pool:
+            print_messages(pool.imap(get_line_images_from_page_image, csv_files))
+    else:
+        print_messages(map(get_line_images_from_page_image, csv_files))
+
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,7 @@ ID,name,col1,row1,col2,row2,col3,row3,col4,row4,confidence,truth,pgrot,bbrot,qua
 """
 
 import logging
+import multiprocessing
 import os
 import sys
 import time
@@ -37,11 +38,21 @@ sin = np.sin
 cos = np.cos
 pi = np.pi
 
+GEDI_NS = "http://lamp.cfar.umd.edu/media/projects/GEDI/"
+
 def Rotate2D(pts, cnt, ang=90):
     M = np.array([[cos(ang),-sin(ang)],[sin(ang),cos(ang)]])
     res = np.dot(pts-cnt,M)+cnt
     return M, res
 
+def polygon2array(poly_val):
+    """ the points of a polygon, "col,row" strings, as an array """
+    poly_val = [i for i in poly_val if len(i.strip()) > 0]
+    try:
+        return np.array([[int(v) for v in i.split(',')] for i in poly_val])
+    except ValueError:
+        return np.asarray([eval(i) for i in poly_val])
+
 def npbox2string(npar):
     if np.shape(npar)[0] != 1:
         print('Error during CSV conversion\n')
@@ -65,7 +76,7 @@ class GEDI2CSV(object):
     """
     Segment image with GEDI bounding box information
     """
-    def csvfile(self, coords, polys, baseName, pgrot):
+    def csvfile(self, coords, polys, baseName, pgrot, messages):
 
         """ for writing the files """
         writePath = self._args.outputDir
@@ -91,21 +102,14 @@ class GEDI2CSV(object):
 
         for j in polys:
             try:
-                arr = []
                 [id,poly_val,text,qual,lang] = j
                 script=None
-                #print(j)
-                for i in poly_val:
-                    if len(i.strip()) > 0:
-                        #print(i)
-                        arr.append(eval(i))
-
-                contour = np.asarray(arr)
+                contour = polygon2array(poly_val)
                 #print(contour)
                 convex = cv2.convexHull(contour)
                 rect = cv2.minAreaRect(convex)
                 box = cv2.boxPoints(rect)
-                box = np.int0(box)
+                box = box.astype(np.intp)
                 box = np.reshape(box,(-1,1)).T
                 c1,r1,c2,r2,c3,r3,c4,r4 = npbox2string(box)
 
@@ -114,7 +118,7 @@ class GEDI2CSV(object):
                 rotlist.append([id,baseName + '_' + id + '.png',c1,r1,c2,r2,c3,r3,c4,r4,conf,text,pgrot,bbrot,qual,script,lang])
 
             except:
-                print('...polygon error %s, %s' % (j, baseName))
+                messages.append(('print', '...polygon error %s, %s' % (j, baseName)))
                 continue
 
         # then write out all of list to file
@@ -128,9 +132,81 @@ class GEDI2CSV(object):
         return write_ctr
 
 
+def read_yomdle(fullName, messages):
+    """
+    Read the text zones of the pages of the first document of a GEDI file,
+    with iterparse so that each zone is dropped as soon as it has been read.
+    Returns the polygons and the rotation of the last page.
+    """
+    docTag = '{%s}DL_DOCUMENT' % GEDI_NS
+    pageTag = '{%s}DL_PAGE' % GEDI_NS
+    zoneTag = '{%s}DL_ZONE' % GEDI_NS
+    polygons = []
+    pageRot = None
+    depth = 0
+    docSeen = inDoc = inPage = False
+    for event, elem in ET.iterparse(fullName, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2 and elem.tag == docTag and not docSeen:
+                docSeen = inDoc = True
+                totalpages = int(elem.attrib['NrOfPages'])
+            elif inDoc and depth == 3 and elem.tag == pageTag:
+                inPage = True
+                if 'GEDI_orientation' not in elem.attrib:
+                    pageRot=0
+                else:
+                    pageRot = int(elem.attrib['GEDI_orientation'])
+                    messages.append(('log', ' PAGE ROTATION %s, %s' % (fullName, str(pageRot))))
+            continue
+
+        if inPage and depth == 4 and elem.tag == zoneTag:
+            zone = elem
+            if zone.attrib['gedi_type']=='Text' :
+                if zone.get('polygon'):
+                    polygons.append([zone.attrib['id'],zone.get('polygon').split(';'),
+                                     zone.get('Text_Content'),zone.get('Illegible'),zone.get('Language')])
+                else:
+                    messages.append(('print', '...Not polygon'))
+        elif inPage and depth == 3:
+            inPage = False
+        elif inDoc and depth == 2:
+            inDoc = False
+        if depth >= 3:
+            elem.clear()
+        depth -= 1
+
+    if not docSeen:
+        raise IndexError('No DL_DOCUMENT in %s' % fullName)
+    return polygons, pageRot
+
+
+def convert_file(job):
+    """
+    Convert one GEDI file to CSV (this is run by the worker processes).
+    Returns the number of lines written, whether the file could not be
+    parsed, and the messages to print or log.
+    """
+    fullName, args = job
+    messages = []
+    try:
+        """ read the XML file """
+        polygons, pageRot = read_yomdle(fullName, messages)
+    except (ET.ParseError, EnvironmentError):
+        return 0, True, [('print', '...ERROR parsing %s' % (fullName))]
+
+    write_ctr = 0
+    if len(polygons) > 0:
+        gtconverter = GEDI2CSV(logging.getLogger(__name__), args)
+        write_ctr = gtconverter.csvfile([], polygons, os.path.splitext(os.path.basename(fullName))[0], pageRot, messages)
+    else:
+        messages.append(('print', '...%s has no text content' % (os.path.splitext(fullName)[0])))
+    return write_ctr, False, messages
+
+
 def main(args):
 
-    startTime = time.clock()
+    startTime = time.time()
 
     writePath = args.outputDir
     print('write to %s' % (writePath))
@@ -147,10 +223,6 @@ def main(args):
         handler.setFormatter(formatter)
         logger.addHandler(handler)
 
-    gtconverter = GEDI2CSV(logger, args)
-    namespaces = {"gedi" : "http://lamp.cfar.umd.edu/media/projects/GEDI/"}
-    keyCnt=0
-
     fileCnt = 0
     line_write_ctr = 0
     line_error_ctr = 0
@@ -159,54 +231,32 @@ def main(args):
     Get all XML files in the directory and sub folders
     """
     print('reading %s' % (args.inputDir))
+    jobs = []
     for root, dirnames, filenames in os.walk(args.inputDir, followlinks=True):
         for file in filenames:
             if file.lower().endswith('.xml'):
-                fullName = os.path.join(root,file)
-                baseName = os.path.splitext(fullName)
-
-                fileCnt += 1
-
-                try:
-                    """ read the XML file """
-                    tree = ET.parse(fullName)
-                except:
-                    print('...ERROR parsing %s' % (fullName))
-                    file_error_ctr += 1
-                    continue
-
-                gedi_root = tree.getroot()
-                child = gedi_root.findall('gedi:DL_DOCUMENT',namespaces)[0]
-                totalpages = int(child.attrib['NrOfPages'])
-                coordinates=[]
-                polygons = []
-
-                """ and for each page """
-                for i, pgs in enumerate(child.iterfind('gedi:DL_PAGE',namespaces)):
-
-                    if 'GEDI_orientation' not in pgs.attrib:
-                        pageRot=0
-                    else:
-                        pageRot = int(pgs.attrib['GEDI_orientation'])
-                        logger.info(' PAGE ROTATION %s, %s' % (fullName, str(pageRot)))
-
-                    """ find children for each page """
-                    for zone in pgs.findall('gedi:DL_ZONE',namespaces):
-
-                        if zone.attrib['gedi_type']=='Text' :
-                            if zone.get('polygon'):
-                                keyCnt+=1
-                                polygons.append([zone.attrib['id'],zone.get('polygon').split(';'),
-                                                 zone.get('Text_Content'),zone.get('Illegible'),zone.get('Language')])
-                            else:
-                                print('...Not polygon')
-
-
-                if len(coordinates) > 0 or len(polygons) > 0:
-                    line_write_ctr += gtconverter.csvfile(coordinates, polygons, os.path.splitext(file)[0], pageRot)
-                else:
-                    print('...%s has no text content' % (baseName[0]))
-
+                jobs.append((os.path.join(root,file), args))
+    fileCnt = len(jobs)
+
+    """ convert the files in parallel; the results come back in order """
+    if args.nj > 1:
+        pool = multiprocessing.Pool(args.nj)
+        results = pool.imap(convert_file, jobs, chunksize=16)
+    else:
+        results = map(convert_file, jobs)
+
+    for write_ctr, file_error, messages in results:
+        for kind, message in messages:
+            if kind == 'print':
+                print(message)
+            else:
+                logger.info(message)
+        line_write_ctr += write_ctr
+        file_error_ctr += file_error
+
+    if args.nj > 1:
+        pool.close()
+        pool.join()
 
     print('complete...total files %d, lines written %d, img errors %d, line error %d' % (fileCnt, line_write_ctr, file_error_ctr, line_error_ctr))
 
@@ -218,6 +268,7 @@ def parse_arguments(argv):
     parser.add_argument('--inputDir', type=str, help='Input directory', default='/data/YOMDLE/final_arabic/xml')
     parser.add_argument('--outputDir', type=str, help='Output directory', default='/exp/YOMDLE/final_arabic/csv_truth/')
     parser.add_argument('--log', type=str, help='Log directory', default='/exp/logs.txt')
+    parser.add_argument('--nj', type=int, help='Number of files to convert in parallel', default=1)
 
     return parser.parse_args(argv)
 